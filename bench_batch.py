@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Simulate a KOS + TikTok dashboard load over a mobile network: the
+sequential calls a dashboard makes today (/api/kos-seeding-sheets, one
+/api/kos-seeding-csv per month, /api/tiktok-data) against one /api/batch.
+
+The server's caches are seeded with synthetic data (no Google access), so
+this measures the wire: every response costs one simulated round trip plus
+its bytes over the link's bandwidth, on top of the real loopback time.
+
+Usage: python bench_batch.py [--months 4] [--profile 3g|4g|all]
+"""
+
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from functools import partial
+
+import server
+from bench_keepalive import Http11Handler
+from bench_static_assets import ROOT
+
+PROFILES = {'3g': (0.300, 1.6e6), '4g': (0.080, 10e6)}  # (rtt s, bits/s)
+
+
+def seed_caches(months, seed=3):
+    rng = random.Random(seed)
+    now = time.time()
+    names = server.MONTH_NAMES[1:1 + months]
+    for name in names:
+        lines = [f'Week,Timestamp,Nama KOS,Link 1 {name},Views {name},Likes,Comments,Shares']
+        lines += [f'Week {w},2026-03-0{w},KOS {k},https://www.tiktok.com/@kos{k}/video/{rng.randrange(10**18)},'
+                  f'{rng.randint(100, 90000)},{rng.randint(1, 900)},{rng.randint(0, 90)},{rng.randint(0, 40)}'
+                  for w in range(1, 5) for k in range(120)]
+        server.KOS_CACHE[name] = {'data': '\n'.join(lines), 'ts': now}
+    server.KOS_SHEETS_CACHE.put('names', {'data': names, 'ts': now})
+    rows = server.TikTokRows('Maret 2026')
+    for d in range(1, 31):
+        for t in ('15:00', '17:00', '19:00'):
+            rows.append('Senin', f'{d} Maret', t, 'Tiktok', 'Promo', f'Live {d}', f'SKU{rng.randint(1, 90)}',
+                        '1:00:00', rng.randint(100, 9000), rng.randint(1, 900), rng.randint(0, 90),
+                        rng.randint(0, 30), float(rng.randint(0, 900000)))
+    server.CACHE.put('tiktok-data', {'data': {'generated_at': '', 'dashboard': [], 'current_month': 'Maret 2026',
+                                              'months': [{'month': 'Maret 2026', 'rows': rows}]}, 'ts': now})
+    return names
+
+
+class Link:
+    """One keep-alive connection over a simulated link."""
+
+    def __init__(self, port, rtt, bps):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port)
+        self.rtt, self.bps = rtt, bps
+        self.bytes = self.requests = 0
+        time.sleep(rtt)  # TCP handshake
+
+    def call(self, method, url, body=None):
+        headers = {'Accept-Encoding': 'gzip'}
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        self.conn.request(method, url, body=body, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        wire = len(data) + len(body or b'') + 300
+        time.sleep(self.rtt + wire * 8 / self.bps)
+        self.bytes += wire
+        self.requests += 1
+        return data
+
+
+def sequential(link, months):
+    link.call('GET', '/api/kos-seeding-sheets')
+    for name in months:
+        link.call('GET', f'/api/kos-seeding-csv?sheet={name}')
+    link.call('GET', '/api/tiktok-data')
+
+
+def batched(link, months):
+    requests = [{'source': 'kos-seeding-sheets'}] + \
+               [{'key': name, 'source': 'kos-seeding-csv', 'sheet': name} for name in months] + \
+               [{'source': 'tiktok-data'}]
+    link.call('POST', '/api/batch', {'requests': requests})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--months', type=int, default=4)
+    parser.add_argument('--profile', choices=('all',) + tuple(PROFILES), default='all')
+    args = parser.parse_args()
+
+    months = seed_caches(args.months)
+    httpd = server.Server(('127.0.0.1', 0), partial(Http11Handler, directory=ROOT))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    port = httpd.server_address[1]
+    for profile in (PROFILES if args.profile == 'all' else (args.profile,)):
+        rtt, bps = PROFILES[profile]
+        print(f'\n📶 {profile}: rtt {rtt * 1000:.0f} ms, {bps / 1e6:g} Mbit/s, {len(months)} KOS months + TikTok data')
+        for label, load in (('sequential', sequential), ('/api/batch', batched)):
+            started = time.perf_counter()
+            link = Link(port, rtt, bps)
+            load(link, months)
+            elapsed = time.perf_counter() - started
+            print(f'   {label:11s} {link.requests:2d} requests {link.bytes / 1024:7.1f} KB  {elapsed * 1000:7.0f} ms')
+    httpd.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Users mashing refresh: C clients (one IP each via 127.0.0.x) hit
+/api/tiktok-data?bust=1 and /api/kos-seeding-csv?sheet=..&bust=1 for a few
+seconds, with and without the bust limiter.
+
+Google is simulated (no network here): each upstream sheet fetch sleeps
+--upstream ms and is counted. Reports upstream fetches and request latency.
+
+Usage: python bench_bust.py [--clients 10] [--seconds 3] [--upstream 400]
+"""
+
+import argparse
+import http.client
+import statistics
+import sys
+import threading
+import time
+from functools import partial
+
+import server
+from bench_keepalive import Http11Handler
+from bench_static_assets import ROOT
+
+UPSTREAM = {'fetches': 0, 'delay': 0.4}
+COUNT_LOCK = threading.Lock()
+
+
+def fake_gviz(sheet_name, query=None):
+    with COUNT_LOCK:
+        UPSTREAM['fetches'] += 1
+    time.sleep(UPSTREAM['delay'])
+    return {'table': {'rows': []}}
+
+
+def fake_kos_csv(sheet_name):
+    with COUNT_LOCK:
+        UPSTREAM['fetches'] += 1
+    time.sleep(UPSTREAM['delay'])
+    text = f'Week,{sheet_name}\n1,2'
+    server.KOS_CACHE[sheet_name] = {'data': text, 'ts': time.time()}
+    return text
+
+
+def client(port, n, seconds, latencies):
+    # Distinct source address per simulated user (Linux routes all of 127/8 to lo)
+    conn = http.client.HTTPConnection('127.0.0.1', port, source_address=(f'127.0.0.{n + 2}', 0))
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        for url in ('/api/tiktok-data?bust=1', '/api/kos-seeding-csv?sheet=Maret&bust=1'):
+            started = time.perf_counter()
+            conn.request('GET', url)
+            conn.getresponse().read()
+            latencies.append(time.perf_counter() - started)
+        time.sleep(0.2)
+    conn.close()
+
+
+def run(label, limiter, args, port):
+    server.BUSTS = limiter
+    server.CACHE.clear()
+    server.TIKTOK_SHEETS.clear()
+    server.KOS_CACHE.clear()
+    server.build_tiktok_data()
+    server.fetch_kos_csv('Maret')
+    # Primed a minute ago: within the TTL, but old enough for a bust
+    for entry in [server.CACHE.peek('tiktok-data'), server.KOS_CACHE.peek('Maret'), *server.TIKTOK_SHEETS.values()]:
+        entry['ts'] -= 60
+    UPSTREAM['fetches'] = 0
+    latencies = []
+    threads = [threading.Thread(target=client, args=(port, n, args.seconds, latencies))
+               for n in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    print(f'   {label:28s} {len(latencies):5d} reqs  {UPSTREAM["fetches"]:5d} upstream fetches  '
+          f'p50 {statistics.median(latencies) * 1000:6.1f} ms  p95 {latencies[int(len(latencies) * .95)] * 1000:6.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--upstream', type=float, default=400, help='simulated Google latency per sheet, ms')
+    args = parser.parse_args()
+
+    UPSTREAM['delay'] = args.upstream / 1000
+    server.fetch_gviz = fake_gviz
+    server.download_kos_csv = fake_kos_csv
+    httpd = server.Server(('127.0.0.1', 0), partial(Http11Handler, directory=ROOT))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    port = httpd.server_address[1]
+
+    print(f'\n🔄 {args.clients} users busting TikTok + one KOS month every ~0.2 s for {args.seconds:g}s, '
+          f'upstream {args.upstream:g} ms/sheet')
+    run('unlimited (every bust)', server.BustLimiter(1e9, 1e9, 0), args, port)
+    run('BUSTS (default limits)', server.BustLimiter(2, 3, 30), args, port)
+    httpd.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
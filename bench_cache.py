@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Memory under arbitrary query traffic: N distinct /api/kos-seeding-csv?sheet=
+names (typos, so negative results) and N distinct /api/sheet tq= queries
+(positive, ~50 KB each), with server.py's caches unbounded (as the old
+dicts were) and with their BoundedCache budgets.
+
+Google is simulated by a fake urlopen (no network here) so the real
+download / validation / caching code runs. Each mode runs in a fresh
+process; reports RSS growth and the caches' own stats.
+
+Usage: python bench_cache.py [--keys 5000]
+"""
+
+import argparse
+import io
+import json
+import subprocess
+import sys
+import time
+import urllib.parse
+
+import server
+
+SHEET_BODY = ('Date,Outlet,Sales,Qty\n' + '2026-03-01,Outlet 042,1234567,89\n' * 1400).encode()
+
+
+class FakeResponse(io.BytesIO):
+    headers = {'Content-Type': 'text/csv'}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def fake_urlopen(req, timeout=None):
+    qs = urllib.parse.parse_qs(urllib.parse.urlparse(req.full_url).query)
+    sheet = qs.get('sheet', [''])[0]
+    if 'tqx=out:csv' in req.full_url and 'tq' not in qs and sheet:
+        # KOS month: Google answers an unknown sheet name with the first sheet
+        name = sheet if sheet in server.MONTH_NAMES else 'Januari'
+        return FakeResponse(f'Week,Nama KOS,Views {name}\n1,KOS 1,100\n'.encode())
+    return FakeResponse(SHEET_BODY + qs.get('tq', [''])[0].encode())
+
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS'))
+
+
+def run(mode, keys):
+    if mode == 'unbounded':
+        for cache in server.CACHES:
+            cache.max_bytes = cache.negative_bytes = float('inf')
+    server.urllib.request.urlopen = fake_urlopen
+    sheet_id = next(iter(server.SHEET_PROXY_IDS))
+    before = rss_kb()
+    started = time.perf_counter()
+    for n in range(keys):
+        server.fetch_kos_csv(f'Maret{n}')
+        server.fetch_sheet(sheet_id, tq=f'select A, B where C > {n}')
+    elapsed = time.perf_counter() - started
+    stats = {cache.name: cache.stats() for cache in (server.KOS_CACHE, server.SHEET_CACHE)}
+    return {'rss_growth_kb': rss_kb() - before, 'seconds': elapsed, 'stats': stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--keys', type=int, default=5000)
+    parser.add_argument('--mode', choices=('unbounded', 'bounded'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode, args.keys)))
+        return 0
+    print(f'\n🧠 {args.keys:,} distinct KOS sheet names + {args.keys:,} distinct /api/sheet queries')
+    for mode in ('unbounded', 'bounded'):
+        out = subprocess.run([sys.executable, __file__, '--keys', str(args.keys), '--mode', mode],
+                             capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        kos, sheet = result['stats']['kos-seeding-csv'], result['stats']['sheet']
+        print(f'   {mode:9s} RSS +{result["rss_growth_kb"] / 1024:7.1f} MB  '
+              f'sheet {sheet["entries"]:5d} entries {sheet["bytes"] / 1024 ** 2:6.1f} MB  '
+              f'kos negatives {kos["negative_entries"]:5d} ({kos["negative_bytes"] / 1024:6.1f} KB)  '
+              f'evictions {sheet["evictions"] + kos["evictions"]:5d}  {result["seconds"]:.1f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
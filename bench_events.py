@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Hold N dashboards on /api/events and push refreshes to them.
+
+Opens N raw SSE connections to server.py's threading Server, then reports
+the server's thread count (the stream's handler threads return once the
+socket is handed to the event hub) and, for a few published TikTok
+version events, the time until every client has received it.
+
+Usage: python bench_events.py [--clients 500] [--events 5]
+"""
+
+import argparse
+import selectors
+import socket
+import statistics
+import sys
+import threading
+import time
+from functools import partial
+
+import server
+from bench_keepalive import Http11Handler
+from bench_static_assets import ROOT
+
+
+def open_stream(port):
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(b'GET /api/events?topics=tiktok-data HTTP/1.1\r\nHost: bench\r\n\r\n')
+    received = b''
+    while b'event: versions' not in received:
+        data = sock.recv(65536)
+        if not data:
+            raise RuntimeError('stream closed before the versions event')
+        received += data
+    sock.setblocking(False)
+    return sock
+
+
+def wait_for(socks, marker, timeout=10):
+    """Seconds until every socket has received `marker`."""
+    selector = selectors.DefaultSelector()
+    for sock in socks:
+        selector.register(sock, selectors.EVENT_READ, bytearray())
+    waiting, started = len(socks), time.perf_counter()
+    while waiting and time.perf_counter() - started < timeout:
+        for key, _ in selector.select(timeout):
+            key.data.extend(key.fileobj.recv(65536))
+            if marker in key.data:
+                selector.unregister(key.fileobj)
+                waiting -= 1
+    selector.close()
+    if waiting:
+        raise RuntimeError(f'{waiting} clients never got {marker!r}')
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--events', type=int, default=5)
+    args = parser.parse_args()
+
+    httpd = server.Server(('127.0.0.1', 0), partial(Http11Handler, directory=ROOT))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    port = httpd.server_address[1]
+    baseline = threading.active_count()
+
+    started = time.perf_counter()
+    socks = [open_stream(port) for _ in range(args.clients)]
+    print(f'\n📡 {args.clients} SSE clients connected in {time.perf_counter() - started:.2f}s')
+    time.sleep(0.5)
+    print(f'   server threads: {baseline} before, {threading.active_count()} with all clients open '
+          f'(hub: {server.EVENTS.stats()["clients"]} subscribers)')
+
+    fanout = []
+    for n in range(args.events):
+        version = int(time.time() * 1000) + n
+        server.EVENTS.publish('tiktok-data', {'version': version, 'changed': 1}, event_id=version)
+        fanout.append(wait_for(socks, f'id: {version}'.encode()))
+    print(f'   publish -> all {args.clients} clients: median {statistics.median(fanout) * 1000:.1f} ms, '
+          f'max {max(fanout) * 1000:.1f} ms over {args.events} events')
+
+    for sock in socks[:args.clients // 2]:
+        sock.close()
+    time.sleep(0.5)
+    print(f'   after closing half: hub {server.EVENTS.stats()["clients"]} subscribers, '
+          f'{threading.active_count()} threads')
+    for sock in socks[args.clients // 2:]:
+        sock.close()
+    httpd.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Load test server.py's connection handling: the old HTTP/1.0 handler on a
+single-threaded TCPServer (one TCP connection per request) against the
+HTTP/1.1 keep-alive Handler on the threading Server.
+
+C clients each load a dashboard (page + local assets + /api/aria-config)
+N times over one http.client connection, which reconnects whenever the
+server closes. --rtt adds a simulated network round trip per request and
+one more per new connection (the TCP handshake), as on a mobile network.
+Reports server-side connections accepted and request latency.
+
+Usage: python bench_keepalive.py [--clients 20] [--loads 5] [--rtt 80]
+"""
+
+import argparse
+import http.client
+import socketserver
+import statistics
+import sys
+import threading
+import time
+from functools import partial
+
+import server
+from bench_static_assets import ROOT, page_urls
+
+
+class Http10Handler(server.Handler):
+    """The old framing: HTTP/1.0, connection closed after every response."""
+    protocol_version = 'HTTP/1.0'
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class Http11Handler(server.Handler):
+    def log_message(self, fmt, *args):
+        pass
+
+
+def counting(server_class):
+    class Counting(server_class):
+        allow_reuse_address = True
+        connections = 0
+
+        def get_request(self):
+            request = super().get_request()
+            type(self).connections += 1
+            return request
+    return Counting
+
+
+class SimulatedConnection(http.client.HTTPConnection):
+    rtt = 0.0
+    connects = 0
+
+    def connect(self):
+        time.sleep(self.rtt)
+        self.connects += 1
+        super().connect()
+
+
+def client(port, urls, loads, rtt, latencies):
+    conn = SimulatedConnection('127.0.0.1', port, timeout=30)
+    conn.rtt = rtt
+    for _ in range(loads):
+        for url in urls:
+            started = time.perf_counter()
+            time.sleep(rtt)
+            conn.request('GET', url, headers={'Accept-Encoding': 'gzip'})
+            response = conn.getresponse()
+            response.read()
+            if response.will_close:
+                conn.close()
+            latencies.append(time.perf_counter() - started)
+    conn.close()
+
+
+def run(label, server_class, handler, args, urls):
+    server_class = counting(server_class)
+    httpd = server_class(('127.0.0.1', 0), partial(handler, directory=ROOT))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    port = httpd.server_address[1]
+    latencies = []
+    threads = [threading.Thread(target=client, args=(port, urls, args.loads, args.rtt / 1000, latencies))
+               for _ in range(args.clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    httpd.shutdown()
+    httpd.server_close()
+    latencies.sort()
+    print(f'   {label:34s} {server_class.connections:6,d} conns  {len(latencies):6,d} reqs  '
+          f'p50 {statistics.median(latencies) * 1000:6.1f} ms  p95 {latencies[int(len(latencies) * .95)] * 1000:6.1f} ms  '
+          f'total {elapsed:5.2f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--loads', type=int, default=5)
+    parser.add_argument('--rtt', type=float, default=80, help='simulated round trip in ms (0 = loopback only)')
+    parser.add_argument('--page', default='index.html')
+    args = parser.parse_args()
+
+    server.STATIC_ASSETS.warm(ROOT)
+    urls = page_urls(args.page) + ['/api/aria-config']
+    print(f'\n🔌 {args.clients} clients x {args.loads} loads of {args.page} ({len(urls)} requests each), rtt {args.rtt:g} ms')
+    run('before: HTTP/1.0, TCPServer', socketserver.TCPServer, Http10Handler, args, urls)
+    run('after:  HTTP/1.1 keep-alive, threads', server.Server, Http11Handler, args, urls)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
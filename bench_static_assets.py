@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark page loads through server.py's static layer against the old
+behaviour (SimpleHTTPRequestHandler + Cache-Control: no-store on everything).
+
+For each page, fetches the HTML plus the local scripts / stylesheets /
+images it references, as a browser would: a first visit, then a repeat
+visit that revalidates with the ETag / Last-Modified it was given.
+Reports bytes on the wire and time per load, measured on loopback and
+estimated for a 5 Mbit/s mobile link.
+
+Usage: python bench_static_assets.py [--pages index.html ppm-dashboard.html] [--repeat 5]
+"""
+
+import argparse
+import http.client
+import http.server
+import os
+import re
+import sys
+import threading
+import time
+from functools import partial
+
+import server
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+LINK_BPS = 5_000_000 / 8
+ASSET_REF = re.compile(r'''(?:src|href)\s*=\s*["']([^"':#?]+\.(?:js|css|png|jpg|svg|ico))["']''', re.I)
+
+
+class BaselineHandler(http.server.SimpleHTTPRequestHandler):
+    """The handler's static behaviour before the static layer."""
+
+    def end_headers(self):
+        self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        super().end_headers()
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class QuietHandler(server.Handler):
+    def log_message(self, fmt, *args):
+        pass
+
+
+def start(handler):
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), partial(handler, directory=ROOT))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def page_urls(page):
+    with open(os.path.join(ROOT, page), encoding='utf-8', errors='replace') as f:
+        html = f.read()
+    base = os.path.dirname(page)
+    assets = []
+    for ref in ASSET_REF.findall(html):
+        path = os.path.normpath(os.path.join(base, ref)).lstrip('./')
+        if os.path.isfile(os.path.join(ROOT, path)) and '/' + path not in assets:
+            assets.append('/' + path)
+    return ['/' + page] + assets
+
+
+def load(port, urls, validators):
+    """One page load; returns (wire bytes, seconds) and records validators for the next visit."""
+    total, started = 0, time.perf_counter()
+    for url in urls:
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        headers = {'Accept-Encoding': 'gzip, deflate, br'}
+        etag, modified = validators.get(url, (None, None))
+        if etag:
+            headers['If-None-Match'] = etag
+        if modified:
+            headers['If-Modified-Since'] = modified
+        conn.request('GET', url, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        total += len(body) + sum(len(k) + len(v) + 4 for k, v in response.getheaders()) + 17
+        cache_control = response.getheader('Cache-Control') or ''
+        if 'no-store' not in cache_control:
+            validators[url] = (response.getheader('ETag'), response.getheader('Last-Modified'))
+        conn.close()
+    return total, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', nargs='+', default=['index.html', 'ppm-dashboard.html', 'tiktok-performance.html'])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    server.STATIC_ASSETS.warm(ROOT)
+    servers = {'before': start(BaselineHandler), 'after': start(QuietHandler)}
+    for page in args.pages:
+        urls = page_urls(page)
+        print(f'\n📄 {page} ({len(urls)} requests)')
+        for label, httpd in servers.items():
+            port = httpd.server_address[1]
+            for visit in ('first', 'repeat'):
+                runs = []
+                for _ in range(args.repeat):
+                    validators = {}
+                    if visit == 'repeat':
+                        load(port, urls, validators)
+                    runs.append(load(port, urls, validators))
+                size = runs[0][0]
+                seconds = min(t for _, t in runs)
+                print(f'   {label:6s} {visit:6s} {size / 1024:9.1f} KB  {seconds * 1000:7.1f} ms loopback  '
+                      f'{size / LINK_BPS * 1000:8.0f} ms @ 5 Mbit/s')
+    for httpd in servers.values():
+        httpd.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+TikTok data as one dict per row (the old representation, duplicate sheets
+copied) against TikTokRows column blocks: memory held by the cached payload
+plus the version index, and /api/tiktok-data bytes in the default and
+?format=columnar shapes.
+
+Month sheets are synthetic gviz (no network here): --months sheets of
+--days days x 3 sessions, the last one a duplicate of the one before, as
+the Dashboard sometimes lists a month twice. Each representation is built
+in a fresh process; tracemalloc and RSS are taken around the refresh only
+(the synthetic sheets exist before). The dict rows reuse TikTokRows'
+interned strings, which flatters them a little.
+
+Usage: python bench_tiktok_rows.py [--months 12] [--days 30]
+"""
+
+import argparse
+import gc
+import gzip
+import json
+import random
+import subprocess
+import sys
+import tracemalloc
+
+import server
+
+DAYS = ['Senin', 'Selasa', 'Rabu', 'Kamis', 'Jumat', 'Sabtu', 'Minggu']
+THEMES = ['Promo Gajian', 'Flash Sale', 'New Arrival', 'Bundling']
+
+
+def month_gviz(month, days, rng):
+    rows = []
+    for d in range(1, days + 1):
+        for n, t in enumerate(('15:00:00', '17:00:00', '19:00:00')):
+            first = n == 0
+            cells = [{'v': DAYS[d % 7]} if first else None, {'v': f'{d} {month}'} if first else None,
+                     {'v': t}, {'v': 'Tiktok'}, {'v': THEMES[d % 4]} if first else None,
+                     {'v': f'Live {month} hari ke-{d}'} if first else None, None,
+                     {'v': f'SKU{rng.randint(1000, 1090)}'}, {'v': None, 'f': '1:00:00'},
+                     {'v': rng.randint(100, 90000)}, {'v': rng.randint(1, 900)}, {'v': rng.randint(0, 90)},
+                     {'v': rng.randint(0, 40)}, None, {'v': rng.randint(0, 9000000)}]
+            rows.append({'c': cells})
+    return {'table': {'rows': rows}}
+
+
+def simulate_sheets(months, days):
+    """Serve synthetic sheets to refresh_tiktok_data, the last month duplicating the one before."""
+    rng = random.Random(7)
+    names = [f'{m} 2026' for m in server.MONTH_NAMES[:months - 1]]
+    sheets = {name: month_gviz(name, days, rng) for name in names}
+    names.append(f'{server.MONTH_NAMES[months - 1]} 2026')
+    sheets[names[-1]] = sheets[names[-2]]
+    server.fetch_gviz = lambda sheet_name, query=None: sheets.get(sheet_name)
+    server.parse_dashboard = lambda gviz: [{'month': name, 'lives': 1, 'views': 1} for name in names]
+
+
+def as_dicts(data):
+    """The old representation: a dict per row, duplicate sheets relabeled copies, versions keyed to the dicts."""
+    months = [{'month': m['month'], 'rows': m['rows'].rows()} for m in data['months']]
+    keyed = {}
+    for month in months:
+        for row in month['rows']:
+            key = (row['sheet'], row['date'], row['time'], row['sku'], 0)
+            while key in keyed:
+                key = key[:4] + (key[4] + 1,)
+            keyed[key] = row
+    return {**data, 'months': months}, keyed
+
+
+def rss():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS')) * 1024
+
+
+def measure(shape, months, days):
+    """Memory retained by the payload + version index (sheets are generated before measuring)."""
+    simulate_sheets(months, days)
+    before = rss()
+    tracemalloc.start()
+    data = server.refresh_tiktok_data()
+    if shape == 'dicts':
+        data, server.TIKTOK_VERSIONS['rows'] = as_dicts(data)
+        server.CACHE.clear()
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    after = rss()
+    rows = sum(len(m['rows']) for m in data['months'])
+    return {'held': held, 'rss': after - before, 'rows': rows}
+
+
+def payloads(months, days):
+    simulate_sheets(months, days)
+    data = server.refresh_tiktok_data()
+    out = {}
+    for label, payload in (('default', data), ('columnar', server.tiktok_columnar(data))):
+        body = json.dumps(payload, ensure_ascii=False, default=server.json_default).encode()
+        out[label] = (len(body), len(gzip.compress(body, 6)))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--shape', choices=('dicts', 'columns'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.shape:
+        print(json.dumps(measure(args.shape, args.months, args.days)))
+        return 0
+    print(f'\n🎞  {args.months} month sheets x {args.days} days x 3 sessions (last sheet a duplicate)')
+    for shape in ('dicts', 'columns'):
+        out = subprocess.run([sys.executable, __file__, '--months', str(args.months), '--days', str(args.days),
+                              '--shape', shape], capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f'   {shape:8s} {result["rows"]:6,d} rows  held {result["held"] / 1024 ** 2:6.2f} MB  '
+              f'RSS +{result["rss"] / 1024 ** 2:6.2f} MB')
+    for label, (raw, gz) in payloads(args.months, args.days).items():
+        print(f'   /api/tiktok-data {label:8s} {raw / 1024:8.1f} KB  gzip {gz / 1024:7.1f} KB')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Bounded in-memory cache shared by server.py's source caches and static_assets.
+
+A BoundedCache is an LRU keyed like a dict, but bounded by the total size
+of what it holds rather than by its key count, so memory stays flat no
+matter how many distinct keys clients send:
+
+  - entries are sized once on insert (`sizeof`, default approx_size) and
+    the least recently used ones are evicted past `max_bytes`; an entry
+    bigger than the whole budget is not stored at all
+  - negative entries (`negative(value)` true, e.g. "sheet does not exist")
+    live in a separate LRU with its own `negative_bytes` budget, so a flood
+    of bad keys evicts other bad keys, never real data
+  - hits / misses / stale lookups / evictions / rejections are counted for
+    stats(); every operation takes the cache's lock
+
+Values are stored as given (server.py keeps its {'data', 'ts'} entries);
+TTLs stay with the caller, who passes `fresh` to get() so an expired entry
+counts as stale rather than as a hit.
+"""
+
+import sys
+import threading
+from collections import OrderedDict, deque
+
+# Per-entry bookkeeping (OrderedDict node, key, size record) on top of the value
+ENTRY_OVERHEAD = 200
+
+
+def approx_size(obj):
+    """Bytes held by obj and everything it references (shared objects counted once)."""
+    seen, stack, total = set(), [obj], 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            stack.extend(o)
+        elif hasattr(o, '__slots__'):
+            stack.extend(getattr(o, name) for name in o.__slots__ if hasattr(o, name))
+    return total
+
+
+class BoundedCache:
+    """LRU by total bytes, with a separate budget for negative entries."""
+
+    def __init__(self, name, max_bytes, negative_bytes=0, sizeof=approx_size, negative=None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.negative_bytes = negative_bytes
+        self.sizeof = sizeof
+        self.negative = negative
+        self.lock = threading.Lock()
+        self.entries = {False: OrderedDict(), True: OrderedDict()}   # negative? → key → (value, size)
+        self.bytes = {False: 0, True: 0}
+        self.hits = self.misses = self.stale = self.evictions = self.rejected = 0
+
+    def _find(self, key):
+        for neg, entries in self.entries.items():
+            if key in entries:
+                return neg, entries
+        return None, None
+
+    def get(self, key, fresh=None):
+        """The value (most recently used from now on), or None; `fresh(value)` false counts it as stale."""
+        with self.lock:
+            neg, entries = self._find(key)
+            if entries is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(key)
+            value = entries[key][0]
+            if fresh is None or fresh(value):
+                self.hits += 1
+            else:
+                self.stale += 1
+            return value
+
+    def peek(self, key):
+        """The value without touching LRU order or counters."""
+        with self.lock:
+            neg, entries = self._find(key)
+            return None if entries is None else entries[key][0]
+
+    def put(self, key, value):
+        """Store value under key, evicting least recently used entries of the same kind past the budget."""
+        neg = bool(self.negative and self.negative(value))
+        size = self.sizeof(value) + sys.getsizeof(key) + ENTRY_OVERHEAD
+        budget = self.negative_bytes if neg else self.max_bytes
+        with self.lock:
+            self._remove(key)
+            if size > budget:
+                self.rejected += 1
+                print(f'  [CACHE] {self.name}: {key!r} ({size:,} bytes) exceeds the {budget:,} byte budget',
+                      file=sys.stderr)
+                return False
+            entries = self.entries[neg]
+            entries[key] = (value, size)
+            self.bytes[neg] += size
+            while self.bytes[neg] > budget:
+                _, (_, evicted) = entries.popitem(last=False)
+                self.bytes[neg] -= evicted
+                self.evictions += 1
+            return True
+
+    __setitem__ = put
+
+    def _remove(self, key):
+        neg, entries = self._find(key)
+        if entries is None:
+            return None
+        value, size = entries.pop(key)
+        self.bytes[neg] -= size
+        return value
+
+    def pop(self, key, default=None):
+        with self.lock:
+            value = self._remove(key)
+        return default if value is None else value
+
+    def clear(self):
+        with self.lock:
+            for neg in self.entries:
+                self.entries[neg].clear()
+                self.bytes[neg] = 0
+
+    def __contains__(self, key):
+        with self.lock:
+            return self._find(key)[1] is not None
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(entries) for entries in self.entries.values())
+
+    def keys(self):
+        """Snapshot of the keys, least recently used first (positive entries, then negative)."""
+        with self.lock:
+            return [key for entries in self.entries.values() for key in entries]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def values(self):
+        with self.lock:
+            return [value for entries in self.entries.values() for value, _ in entries.values()]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries':          len(self.entries[False]),
+                'bytes':            self.bytes[False],
+                'max_bytes':        self.max_bytes,
+                'negative_entries': len(self.entries[True]),
+                'negative_bytes':   self.bytes[True],
+                'max_negative_bytes': self.negative_bytes,
+                'hits':             self.hits,
+                'misses':           self.misses,
+                'stale':            self.stale,
+                'evictions':        self.evictions,
+                'rejected':         self.rejected,
+            }
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Server-sent events fan-out for server.py (/api/events).
+
+A handler thread writes the response headers, hands its socket to the hub
+and returns, so an open dashboard costs a socket and a few bytes of state,
+not a thread. One hub thread runs a selector over every subscriber:
+
+  - publish() (any thread) queues an event and wakes the hub through a
+    socketpair; the hub frames it once as an SSE message in an HTTP/1.1
+    chunk and appends it to each subscribed client's output buffer
+  - writable sockets are flushed without blocking; a client whose buffer
+    grows past EVENT_CLIENT_BUFFER (not reading) is dropped
+  - a comment line every EVENT_HEARTBEAT seconds keeps proxies from timing
+    the stream out and finds dead peers; a readable socket that returns
+    EOF has gone away
+"""
+
+import json
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+EVENT_HEARTBEAT = float(os.environ.get('EVENT_HEARTBEAT', 20))
+EVENT_CLIENT_BUFFER = int(os.environ.get('EVENT_CLIENT_BUFFER', 256 * 1024))
+EVENT_MAX_CLIENTS = int(os.environ.get('EVENT_MAX_CLIENTS', 1000))
+
+
+def chunk(payload):
+    """One HTTP/1.1 chunk."""
+    return b'%x\r\n%s\r\n' % (len(payload), payload)
+
+
+def sse_message(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+class Client:
+    __slots__ = ('sock', 'topics', 'out', 'connected_at')
+
+    def __init__(self, sock, topics):
+        self.sock = sock
+        self.topics = topics
+        self.out = bytearray()
+        self.connected_at = time.time()
+
+
+class EventHub:
+    """Subscribers on detached sockets, served by one selector thread (started on first subscribe)."""
+
+    def __init__(self):
+        self.clients = {}       # hub thread only
+        self.detached = set()   # sockets owned by the hub (checked by the server before closing a request)
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.published = self.dropped = 0
+
+    def __contains__(self, sock):
+        with self.lock:
+            return sock in self.detached
+
+    def full(self):
+        with self.lock:
+            return len(self.detached) >= EVENT_MAX_CLIENTS
+
+    def _start(self):
+        self.selector = selectors.DefaultSelector()
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ, None)
+        self.thread = threading.Thread(target=self._run, name='event-hub', daemon=True)
+        self.thread.start()
+
+    def _wake(self):
+        try:
+            self.wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # already woken
+
+    def subscribe(self, sock, topics=None, first=b''):
+        """
+        Take over `sock` (response headers already sent) for topics (None = all).
+        `first` is body bytes to send right away (e.g. the current versions).
+        Returns False when the hub is full.
+        """
+        with self.lock:
+            if len(self.detached) >= EVENT_MAX_CLIENTS:
+                return False
+            if self.thread is None:
+                self._start()
+            self.detached.add(sock)
+            self.pending.append(('subscribe', Client(sock, topics), first))
+        self._wake()
+        return True
+
+    def publish(self, topic, data, event_id=None):
+        """Queue an event for every subscriber of `topic`; never blocks on clients."""
+        with self.lock:
+            if self.thread is None:
+                return
+            self.pending.append(('publish', topic, chunk(sse_message(topic, data, event_id))))
+        self._wake()
+
+    def stats(self):
+        with self.lock:
+            return {'clients': len(self.detached), 'published': self.published, 'dropped': self.dropped}
+
+    # ── hub thread ─────────────────────────────────────────────────────────
+
+    def _run(self):
+        heartbeat = chunk(b': ping\n\n')
+        next_beat = time.monotonic() + EVENT_HEARTBEAT
+        while True:
+            timeout = max(0.0, next_beat - time.monotonic())
+            for key, mask in self.selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while self.wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                client = key.data
+                if mask & selectors.EVENT_READ and not self._readable(client):
+                    continue
+                if mask & selectors.EVENT_WRITE:
+                    self._flush(client)
+            self._drain_pending()
+            if time.monotonic() >= next_beat:
+                for client in list(self.clients.values()):
+                    self._send(client, heartbeat)
+                next_beat = time.monotonic() + EVENT_HEARTBEAT
+
+    def _drain_pending(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    return
+                item = self.pending.popleft()
+            if item[0] == 'subscribe':
+                _, client, first = item
+                client.sock.setblocking(False)
+                self.clients[client.sock] = client
+                self.selector.register(client.sock, selectors.EVENT_READ, client)
+                if first:
+                    self._send(client, first)
+            else:
+                _, topic, payload = item
+                self.published += 1
+                for client in list(self.clients.values()):
+                    if client.topics is None or topic in client.topics:
+                        self._send(client, payload)
+
+    def _send(self, client, payload):
+        if len(client.out) + len(payload) > EVENT_CLIENT_BUFFER:
+            self.dropped += 1
+            self._close(client)
+            return
+        client.out += payload
+        self._flush(client)
+
+    def _flush(self, client):
+        if client.sock not in self.clients:
+            return
+        try:
+            while client.out:
+                sent = client.sock.send(client.out)
+                del client.out[:sent]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._close(client)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.out else 0)
+        self.selector.modify(client.sock, events, client)
+
+    def _readable(self, client):
+        """Clients send nothing on an event stream: data is ignored, EOF / errors close it."""
+        try:
+            if client.sock.recv(4096):
+                return True
+        except BlockingIOError:
+            return True
+        except OSError:
+            pass
+        self._close(client)
+        return False
+
+    def _close(self, client):
+        if self.clients.pop(client.sock, None) is None:
+            return
+        with self.lock:
+            self.detached.discard(client.sock)
+        try:
+            self.selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        try:
+            client.sock.close()
+        except OSError as ex:
+            print(f'  [EVENTS] close: {ex}', file=sys.stderr)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Temp-artifact store for the finance splitter backends.
+Each split run gets a directory under ARTIFACT_ROOT/<namespace>/<id>, tracked
+in an in-memory manifest (persisted to manifest.json) so downloads resolve an
+opaque artifact id in O(1) instead of trusting filesystem paths from the URL.
+A background sweeper deletes artifacts older than ARTIFACT_TTL and evicts the
+oldest ones while the total size exceeds ARTIFACT_MAX_BYTES. ARTIFACT_ROOT is
+created private and refused if another user owns it (upload_cache.private_root).
+
+The manifest is loaded and the sweeper started on first use (or at
+construction in the reloader's serving child), like email_queue's
+dispatcher: the Flask reloader's watcher process imports the app but never
+serves it, and a sweeper there would save its startup view of the manifest
+over the serving process's, orphaning every newer artifact.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from upload_cache import private_root
+
+ARTIFACT_ROOT = os.getenv('ARTIFACT_ROOT', os.path.join(tempfile.gettempdir(), 'alpro-finance-artifacts'))
+ARTIFACT_TTL = int(os.getenv('ARTIFACT_TTL', str(6 * 3600)))  # seconds
+ARTIFACT_MAX_BYTES = int(os.getenv('ARTIFACT_MAX_BYTES', str(2 * 1024 ** 3)))
+ARTIFACT_SWEEP_INTERVAL = int(os.getenv('ARTIFACT_SWEEP_INTERVAL', '300'))  # seconds
+
+
+class ArtifactStore:
+    """
+    Manifest entry per artifact:
+      {'created_at': ts, 'bytes': total, 'files': [[filename, size], ...]}
+    Files are listed in the order they were added (used for ZIP order).
+    """
+
+    def __init__(self, namespace, root=ARTIFACT_ROOT, ttl=ARTIFACT_TTL,
+                 max_bytes=ARTIFACT_MAX_BYTES, sweep_interval=ARTIFACT_SWEEP_INTERVAL):
+        self.root = os.path.join(root, namespace)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.manifest_path = os.path.join(self.root, 'manifest.json')
+        self.namespace = namespace
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._manifest = {}
+        self._total_bytes = 0
+        private_root(root)
+        os.makedirs(self.root, mode=0o700, exist_ok=True)
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            self._ensure_started()
+
+    def _ensure_started(self):
+        """Load the manifest and start the sweeper, once, in the process that uses the store."""
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            with self._lock:
+                self._load()
+            if self.sweep_interval > 0:
+                t = threading.Thread(target=self._sweeper, args=(self.sweep_interval,),
+                                     name=f'artifact-sweeper-{self.namespace}', daemon=True)
+                t.start()
+            self._started = True
+
+    # ── public API ──────────────────────────────────────────────────────────
+
+    def create(self):
+        """Reserve a new artifact; returns (artifact_id, directory)."""
+        self._ensure_started()
+        artifact_id = uuid.uuid4().hex
+        directory = os.path.join(self.root, artifact_id)
+        os.makedirs(directory)
+        with self._lock:
+            self._manifest[artifact_id] = {'created_at': time.time(), 'bytes': 0, 'files': [],
+                                           'pending': True}
+        return artifact_id, directory
+
+    def add_file(self, artifact_id, filename):
+        """Record a file written into the artifact directory."""
+        self._ensure_started()
+        size = os.path.getsize(os.path.join(self.root, artifact_id, filename))
+        with self._lock:
+            entry = self._manifest[artifact_id]
+            entry['files'].append([filename, size])
+            entry['bytes'] += size
+            self._total_bytes += size
+
+    def commit(self, artifact_id):
+        """Mark an artifact complete, then persist the manifest and enforce the quota."""
+        self._ensure_started()
+        with self._lock:
+            self._manifest[artifact_id].pop('pending', None)
+        self.sweep(keep=artifact_id)
+
+    def touch(self, artifact_id):
+        """
+        Re-account an artifact whose files were rewritten in place and restart
+        its TTL (it also becomes the newest for quota eviction). False if it
+        was already evicted.
+        """
+        self._ensure_started()
+        directory = os.path.join(self.root, artifact_id)
+        with self._lock:
+            entry = self._manifest.pop(artifact_id, None)
+            if entry is None:
+                return False
+            files = [[name, os.path.getsize(os.path.join(directory, name))] for name, _ in entry['files']]
+            size = sum(file_size for _, file_size in files)
+            self._total_bytes += size - entry['bytes']
+            entry.update(files=files, bytes=size, created_at=time.time())
+            self._manifest[artifact_id] = entry
+        self.sweep(keep=artifact_id)
+        return True
+
+    def directory(self, artifact_id):
+        """Directory of a live artifact, or None if unknown / evicted."""
+        self._ensure_started()
+        with self._lock:
+            if artifact_id not in self._manifest:
+                return None
+        return os.path.join(self.root, artifact_id)
+
+    def file_path(self, artifact_id, filename):
+        """Path of a file inside an artifact, or None if it is not in the manifest."""
+        self._ensure_started()
+        with self._lock:
+            entry = self._manifest.get(artifact_id)
+            if entry is None or not any(name == filename for name, _ in entry['files']):
+                return None
+        return os.path.join(self.root, artifact_id, filename)
+
+    def entries(self, artifact_id, extension='.xlsx'):
+        """List (filename, path) for an artifact's files, in the order they were added."""
+        self._ensure_started()
+        with self._lock:
+            entry = self._manifest.get(artifact_id)
+            if entry is None:
+                return []
+            names = [name for name, _ in entry['files'] if name.endswith(extension)]
+        directory = os.path.join(self.root, artifact_id)
+        return [(name, os.path.join(directory, name)) for name in names]
+
+    def stats(self):
+        self._ensure_started()
+        with self._lock:
+            return {
+                'artifacts': len(self._manifest),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+            }
+
+    def sweep(self, keep=None):
+        """
+        Evict expired artifacts, then the oldest complete ones until under the
+        byte quota. Artifacts still being written are only subject to the TTL.
+        """
+        self._ensure_started()
+        now = time.time()
+        with self._lock:
+            before = len(self._manifest)
+            for artifact_id, entry in list(self._manifest.items()):
+                if artifact_id != keep and now - entry['created_at'] > self.ttl:
+                    self._drop(artifact_id)
+            # dicts keep insertion order, which is creation order
+            for artifact_id in list(self._manifest):
+                if self._total_bytes <= self.max_bytes:
+                    break
+                if artifact_id != keep and not self._manifest[artifact_id].get('pending'):
+                    self._drop(artifact_id)
+            # Only write when something changed
+            if keep is not None or len(self._manifest) != before:
+                self._save()
+
+    # ── internals ───────────────────────────────────────────────────────────
+
+    def _drop(self, artifact_id):
+        entry = self._manifest.pop(artifact_id, None)
+        if entry is not None:
+            self._total_bytes -= entry['bytes']
+        shutil.rmtree(os.path.join(self.root, artifact_id), ignore_errors=True)
+
+    def _save(self):
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._manifest, f)
+        os.replace(tmp, self.manifest_path)
+
+    def _load(self):
+        """
+        Reload the manifest after a restart; delete untracked directories and
+        artifacts that were still being written when the process stopped.
+        """
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        manifest = dict(sorted(manifest.items(), key=lambda kv: kv[1]['created_at']))
+        self._manifest = {k: v for k, v in manifest.items()
+                          if not v.get('pending') and os.path.isdir(os.path.join(self.root, k))}
+        self._total_bytes = sum(e['bytes'] for e in self._manifest.values())
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.isdir(path) and name not in self._manifest:
+                shutil.rmtree(path, ignore_errors=True)
+        self._save()
+
+    def _sweeper(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Artifact sweep failed: {str(e)}")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark the server-side invoice matcher against the dataset tiers in
+docs/PERFORMANCE.md (processing time, memory, throughput).
+Generates synthetic Coretax (PKU / PRI / APD) and invoice exports with the
+column layout of the real files, matches them, and reports per tier.
+
+Usage: python bench_invoice_matching.py [--tiers 100000,1000000] [--format csv|xlsx] [--match-rate 0.8]
+Records per tier = Coretax rows; invoices are generated at the same count.
+Peak RSS is the process maximum, so run one tier per process for exact memory figures.
+"""
+
+import argparse
+import csv
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+import openpyxl
+
+from invoice_matching import CORETAX_HEADER_ROWS, INVOICE_HEADER_ROWS, run_matching
+
+# docs/PERFORMANCE.md: records -> (max seconds, max MB, min rec/s)
+TARGETS = {
+    1000: (5, 50, 200),
+    10000: (30, 200, 300),
+    100000: (5 * 60, 1024, 350),
+    1000000: (30 * 60, 4096, 500),
+}
+
+
+def faktur(n):
+    """Coretax-style faktur pajak number: 010.000-24.12345678"""
+    return f'0{n % 3}0.000-24.{n:08d}'
+
+
+def write_rows(path, rows, fmt):
+    if fmt == 'csv':
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+        return
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Data')
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+
+
+def generate(directory, records, fmt, match_rate, seed=7):
+    """Write the synthetic inputs; returns (coretax_files, invoice_paths)."""
+    rng = random.Random(seed)
+    companies = list(CORETAX_HEADER_ROWS)
+    coretax_files = []
+    numbers = []
+    for i, company in enumerate(companies):
+        count = records // len(companies) + (1 if i < records % len(companies) else 0)
+
+        def coretax_rows(company=company, count=count, offset=i * records):
+            for h in range(CORETAX_HEADER_ROWS[company]):
+                yield [f'Header {h + 1}']
+            for n in range(offset, offset + count):
+                dpp = rng.randint(100, 50000) * 1000
+                vendor = 'PT HERMED INDONESIA' if n % 500 == 0 else f'PT SUPPLIER {n % 2000}'
+                numbers.append((n, dpp * 11 // 100))
+                yield [vendor, f'01.234.567.8-{n % 1000:03d}.000', faktur(n), '2024-12-01', 12, 2024,
+                       '', '', '', dpp, dpp, dpp * 11 // 100, '', '']
+
+        path = os.path.join(directory, f'coretax_{company}.{fmt}')
+        write_rows(path, coretax_rows(), fmt)
+        coretax_files.append((company, path))
+
+    def invoice_rows():
+        for h in range(INVOICE_HEADER_ROWS):
+            yield [f'Header {h + 1}']
+        for n, ppn in numbers:
+            matched = rng.random() < match_rate
+            number = n if matched else n + 50 * records
+            yield ['PT PUTRA KURNIA USAHA', f'ALPRO-{n % 400:03d}', '', '', '', '', '', '', '2024-12-03',
+                   f'INV/{number}', faktur(number), '', '', f'PO/{number}', f'GR/{number}', '', '', ppn]
+
+    invoice_path = os.path.join(directory, f'invoices.{fmt}')
+    write_rows(invoice_path, invoice_rows(), fmt)
+    return coretax_files, [invoice_path]
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench(records, fmt, match_rate):
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.time()
+        coretax_files, invoice_paths = generate(directory, records, fmt, match_rate)
+        generated = time.time() - started
+        out_dir = os.path.join(directory, 'run')
+        os.makedirs(out_dir)
+
+        started = time.time()
+        summary = run_matching(coretax_files, invoice_paths, out_dir)
+        elapsed = time.time() - started
+
+    rate = summary['total'] / elapsed if elapsed else 0
+    memory = peak_rss_mb()
+    max_seconds, max_mb, min_rate = TARGETS.get(records, (None, None, None))
+    print(f"\n📊 {records:,} records ({fmt}, inputs generated in {generated:.1f}s)")
+    print(f"   matched {summary['matched']:,} / unmatched {summary['unmatched']:,} "
+          f"({summary['match_rate']}%), invoices indexed {summary['invoices']:,}")
+    print(f"   index {summary['timings']['index_seconds']:.1f}s + match {summary['timings']['match_seconds']:.1f}s")
+    ok = True
+    if max_seconds is None:
+        print(f"   time {elapsed:.1f}s, peak RSS {memory:.0f} MB, {rate:,.0f} rec/s (no target for this tier)")
+        return ok
+    for label, value, target, good in (
+            ('time', f'{elapsed:.1f}s', f'< {max_seconds}s', elapsed < max_seconds),
+            ('peak RSS', f'{memory:.0f} MB', f'< {max_mb} MB', memory < max_mb),
+            ('throughput', f'{rate:,.0f} rec/s', f'>= {min_rate} rec/s', rate >= min_rate)):
+        print(f"   {'✅' if good else '❌'} {label}: {value} (target {target})")
+        ok = ok and good
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tiers', default='100000,1000000', help='comma-separated record counts')
+    parser.add_argument('--format', choices=('csv', 'xlsx'), default='csv')
+    parser.add_argument('--match-rate', type=float, default=0.8)
+    args = parser.parse_args()
+
+    ok = True
+    for records in [int(t) for t in args.tiers.split(',')]:
+        ok = bench(records, args.format, args.match_rate) and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
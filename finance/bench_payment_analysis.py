@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark the payment analysis cubes on synthetic exports.
+Writes an invoice export and a payment export (CSV, same layout as the
+.xlsx exports) for N invoices, ingests them, times cube and drill-down
+queries, then appends a second export and checks that the incrementally
+updated cubes equal a full rebuild.
+
+Usage: python bench_payment_analysis.py [--invoices 200000] [--append 20000] [--queries 200]
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from payment_analysis import CUBES, PaymentAnalysis, read_invoices, read_payments
+
+STATUSES = ('Complete', 'Incomplete', 'Confirmed', 'Approved')
+
+
+def write_exports(directory, name, first, count, paid_share, seed):
+    """Invoice + payment CSVs for receiving numbers first..first+count; returns their paths."""
+    rng = random.Random(seed)
+    suppliers = [f'{n:010d} - PT SUPPLIER {n}' for n in range(20, 220)]
+    suppliers += ['0000000004 - PT. CENTURY FRANCHISINDO UTAMA', '0000000016 - PT HERMED']
+    stores = [f'JK{n:04d}' for n in range(600)]
+    invoice_path = os.path.join(directory, f'{name}-invoice.csv')
+    payment_path = os.path.join(directory, f'{name}-payment.csv')
+    with open(invoice_path, 'w', newline='') as fi, open(payment_path, 'w', newline='') as fp:
+        invoices, payments = csv.writer(fi), csv.writer(fp)
+        for _ in range(5):
+            invoices.writerow(['Invoice Export'] + [''] * 19)
+        payments.writerow(['Doc'] + [''] * 19)
+        for n in range(first, first + count):
+            created = date(2026, 1, 1) + timedelta(days=rng.randrange(180))
+            confirmed = created + timedelta(days=rng.randrange(12))
+            status = rng.choice(STATUSES)
+            faktur = '' if rng.random() < 0.3 else f'010.000-26.{n:08d}'
+            row = ['PT ALPRO', rng.choice(stores), f'M{n}', rng.choice(suppliers), '', '', status,
+                   created.isoformat(), confirmed.isoformat(), f'INV{n}', faktur, '', '', '', str(n),
+                   '', '', '', '', str(rng.randint(-3000, 3000))]
+            invoices.writerow(row)
+            if rng.random() < paid_share:
+                payments.writerow(['', '', '', '', '', '', f'Receiving Number {n}'] + [''] * 12 + [f'PAY{n}'])
+    return invoice_path, payment_path
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--invoices', type=int, default=200000)
+    parser.add_argument('--append', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        base = write_exports(directory, 'base', 0, args.invoices, 0.6, seed=1)
+        # Half re-exports of existing receiving numbers, half new ones; payments for older invoices too
+        extra = write_exports(directory, 'append', args.invoices - args.append // 2, args.append, 0.9, seed=2)
+
+        started = time.time()
+        analysis = PaymentAnalysis.from_files(*base)
+        print(f"\n📊 {args.invoices:,} invoices ingested in {time.time() - started:.2f}s "
+              f"({', '.join(f'{name}: {len(cube):,} cells' for name, cube in analysis.cubes.items())})")
+
+        summary = analysis.summary()
+        supplier, month = summary['dimensions']['supplier'][5], summary['dimensions']['month'][2]
+        queries = {
+            'summary': lambda: analysis.summary(),
+            'supplier x month (status=Incomplete)': lambda: analysis.query(
+                'supplier_month_status', {'status': ['Incomplete']}, ['supplier', 'month']),
+            'one supplier by status': lambda: analysis.query('supplier_month_status', {'supplier': [supplier]}, ['status']),
+            'outlet totals': lambda: analysis.query('outlet_week', None, ['outlet']),
+            'drill-down page': lambda: analysis.records({'supplier': [supplier], 'month': [month]}, 1, 100),
+        }
+        for label, query in queries.items():
+            print(f"   {label:40s} {timed(query, args.queries):7.2f} ms")
+        print(f"   {'full re-aggregation (for comparison)':40s} "
+              f"{timed(lambda: [PaymentAnalysis(analysis.facts.copy(), analysis.payments)], 3):7.2f} ms")
+
+        started = time.time()
+        delta = analysis.append(*extra)
+        print(f"   append {args.append:,} invoices in {time.time() - started:.2f}s: {delta}")
+
+        facts = read_invoices(base[0])
+        appended = read_invoices(extra[0])
+        facts = facts.drop(appended.index, errors='ignore')
+        rebuilt = PaymentAnalysis(__import__('pandas').concat([facts, appended]),
+                                  {**read_payments(base[1]), **read_payments(extra[1])})
+        for name, dims in CUBES.items():
+            left = analysis.cubes[name].sort_index()
+            right = rebuilt.cubes[name].sort_index()
+            same = left.index.equals(right.index) and (left.round(6) == right.round(6)).all().all()
+            print(f"   {name:40s} incremental == rebuild: {same}")
+            if not same:
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark the streaming rekon splitter on synthetic statements.
+Writes an ACMM transaction summary, a BRI statement and a BCA statement as
+CSV (plus the master files) for N outlets over D days, splits each one and
+reports rows/s, output files and peak RSS.
+
+Usage: python bench_rekon_splitting.py [--outlets 500] [--days 31] [--bank all|acmm|bri|bca]
+Peak RSS is the process maximum, so run one size per process and compare:
+it should stay flat as --days grows, since rows are never held in memory.
+"""
+
+import argparse
+import csv
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from rekon_splitting import split_statement
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+
+def generate(directory, outlets, days, seed=5):
+    """Write statements and masters; returns {bank: {field: path}}, each built row by row."""
+    rng = random.Random(seed)
+    codes = [f'JK{n:05d}' for n in range(outlets)]
+    bri_mids = {code: f'1999{n:06d}' for n, code in enumerate(codes)}
+    bca_mids = {code: f'88{n:07d}' for n, code in enumerate(codes)}
+    cards = {code: f'{147000100000000 + n}' for n, code in enumerate(codes)}
+    paths = {name: os.path.join(directory, name) for name in
+             ('acmm.csv', 'bri.csv', 'bca.csv', 'bri_mid.csv', 'bca_mid.csv', 'kartu.csv')}
+
+    with open(paths['acmm.csv'], 'w', newline='') as fa, open(paths['bri.csv'], 'w', newline='') as fb, \
+            open(paths['bca.csv'], 'w', newline='') as fc:
+        acmm, bri, bca = csv.writer(fa), csv.writer(fb), csv.writer(fc)
+        acmm.writerow(['Tanggal', 'Store', 'Store Name', 'Description'] + [''] * 7 + ['Type', 'GL', 'Amount'])
+        bri.writerow(['NO', 'REK', 'TGL_TRAN', 'JAM', 'X', 'Y', 'DESK_TRAN', 'DB', 'CR', 'BAL', 'TELLER', 'GLSIGN',
+                      '', '', '', 'REMARK'])
+        bca.writerow(['Tanggal Transaksi', 'Keterangan', 'Cabang', 'Jumlah'])
+        for day in range(1, days + 1):
+            date = f'2026-{(day - 1) // 28 + 1:02d}-{(day - 1) % 28 + 1:02d}'
+            dmy = f'{(day - 1) % 28 + 1}/{(day - 1) // 28 + 1}/2026'
+            for code in codes:
+                for gl, desc, kind in (('11201100', 'CASH', 'Debit'), ('11201010', 'QRIS BCA', 'Debit'),
+                                       ('11201013', 'DEBIT CARD BRI', 'Debit'), ('41100000', 'SALES', 'Credit')):
+                    acmm.writerow([date, code, f'Apotek Alpro ({code})', desc] + [''] * 7
+                                  + [kind, f'{gl} - COA', f'{rng.randint(10, 900) * 1000:,}'])
+                amount = rng.randint(10, 900) * 1000
+                qris = rng.random() < 0.5
+                bri.writerow(['', '', dmy, '', '', '', f'SETL 00{bri_mids[code]} AMT:' + f'{amount:,}'.replace(',', '.') + ',00',
+                              '', '', '', '', 'Cr', '', '', '', 'QRIS' if qris else ''])
+                bri.writerow(['', '', dmy, '', '', '', 'BIAYA ADM', '', '', '', '', 'Db', '', '', '', ''])
+                cash = rng.randint(20, 400) * 5000
+                bca.writerow([dmy, f'SETORAN VIA CDM 0{cards[code]}', '', f'{cash:,.2f} CR'])
+                bca.writerow([dmy, f'KR OTOMATIS MID : {bca_mids[code]} TGH:  {amount}.00', '', f'{amount:,.2f} CR'])
+                bca.writerow([dmy, f'TRSF QR : {amount}.00 MID : {bca_mids[code]}', '', f'{amount:,.2f} CR'])
+            bca.writerow([dmy, 'TRSF E-BANKING CR 1234 PT SUPPLIER', '', '1,000,000.00 CR'])
+            bca.writerow([dmy, 'BIAYA ADM', '', '5,000.00 DB'])
+
+    write_csv(paths['bri_mid.csv'], [['MID', 'OUTCODE']] + [[bri_mids[c], c] for c in codes])
+    write_csv(paths['bca_mid.csv'], [['', '', 'LAST7', 'OUTCODE']] + [['', '', bca_mids[c][-7:], c] for c in codes])
+    write_csv(paths['kartu.csv'], [['CARD', 'KODE TOKO', 'OUTCODE']] + [[cards[c], '', c] for c in codes])
+    return {
+        'acmm': {'statement': paths['acmm.csv']},
+        'bri': {'statement': paths['bri.csv'], 'mid': paths['bri_mid.csv']},
+        'bca': {'statement': paths['bca.csv'], 'mid': paths['bca_mid.csv'], 'kartu': paths['kartu.csv']},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--outlets', type=int, default=500)
+    parser.add_argument('--days', type=int, default=31)
+    parser.add_argument('--bank', choices=('all', 'acmm', 'bri', 'bca'), default='all')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.time()
+        inputs = generate(directory, args.outlets, args.days)
+        print(f"\n📊 {args.outlets} outlets x {args.days} days (inputs generated in {time.time() - started:.1f}s)")
+        for bank in (('acmm', 'bri', 'bca') if args.bank == 'all' else (args.bank,)):
+            output = os.path.join(directory, f'out-{bank}')
+            os.makedirs(output)
+            size = os.path.getsize(inputs[bank]['statement'])
+            started = time.time()
+            result = split_statement(bank, inputs[bank], output)
+            elapsed = time.time() - started
+            rows = result['statistics']['rows']
+            print(f"   {bank:4s} {size / 1024 ** 2:7.1f} MB, {rows:,} rows in {elapsed:.2f}s "
+                  f"({rows / elapsed:,.0f} rows/s) -> {len(result['files'])} files")
+    print(f"   peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
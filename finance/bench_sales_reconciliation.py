@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark the server-side sales reconciliation engine on synthetic
+statements. Generates an ACMM transaction summary, BCA and BRI statements
+and the master files with the column layout the page reads, for N outlets
+over D days, then runs both matching modes and reports per-stage timings.
+
+Usage: python bench_sales_reconciliation.py [--outlets 300] [--days 31] [--format csv|xlsx]
+Peak RSS is the process maximum, so run one size per process for exact memory figures.
+"""
+
+import argparse
+import csv
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+import openpyxl
+
+from sales_reconciliation import reconcile
+
+COA = {
+    'BCA': '11201010 - PIUTANG KARTU KREDIT - BCA',
+    'BRI': '11201013 - PIUTANG KARTU KREDIT - BRI',
+    'CASH': '11201100 - PIUTANG PENJUALAN CASH',
+}
+
+
+def write_rows(path, rows, fmt):
+    if fmt == 'csv':
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+        return
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Sheet1')
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+
+
+def generate(directory, outlets, days, fmt, seed=11):
+    """Write the eight-file upload set; returns ({file number: path}, statement row counts)."""
+    rng = random.Random(seed)
+    codes = [f'T{n:04d}' for n in range(outlets)]
+    cards = {code: f'{5000000000000000 + n:016d}' for n, code in enumerate(codes)}
+    mids = {code: f'88{n:06d}' for n, code in enumerate(codes)}
+    bri_mids = {code: f'1999{n:06d}' for n, code in enumerate(codes)}
+    cabang = {code: f'C{n:04d}' for n, code in enumerate(codes)}
+
+    acmm = [['Date', '', 'Store', '', '', 'Method', '', 'Bank', '', '', '', 'D/C', 'COA', 'Amount']]
+    bca = [['Tanggal', 'Keterangan', 'Cabang', 'Jumlah']]
+    bri = [[''] * 18]
+    for day in range(1, days + 1):
+        date = f'2026-01-{(day - 1) % 28 + 1:02d}'
+        short = f'{(day - 1) % 28 + 1:02d}/01'
+        for code in codes:
+            store = f'Apotek Alpro ({code})'
+            cash = rng.randint(20, 400) * 5000
+            card = rng.randint(10, 200) * 1000
+            qris = rng.randint(5, 100) * 1000
+            bri_card = rng.randint(5, 100) * 1000
+            for method, bank, amount in (('CASH', '', cash), ('DEBIT CARD', 'BCA', card),
+                                         ('QRIS', 'BCA', qris), ('CREDIT CARD', 'BRI', bri_card)):
+                acmm.append([date, '', store, '', '', method, '', bank, '', '', '', 'DEBIT',
+                             COA['CASH' if method == 'CASH' else bank], amount])
+            if rng.random() < 0.02:
+                cash += rng.randint(1, 50) * 1000  # mismatches / sisa
+            bca.append([short, f'SETORAN VIA CDM {cards[code]}', '', f'{cash:,.2f} CR'])
+            bca.append([short, f'KR OTOMATIS MID : {mids[code]} *DEBIT*: {card:.2f}', '', f'{card:,.2f} CR'])
+            bca.append([short, f'TRSF QR : {qris:.2f} MID : {mids[code]}', '', f'{qris:,.2f} CR'])
+            bri.append([''] * 2 + [date, '', '', '', f'VISA SETTLEMENT 00{bri_mids[code]}', '', 0, bri_card]
+                       + [''] * 6 + [f'AMT:{bri_card:,.0f},00'.replace(',', '.', 1), ''])
+        bri.append([''] * 2 + [date, '', '', '', 'BIAYA ADM', '', 5000, 0] + [''] * 8)
+        bca.append([short, 'BI-FAST CR TRANSFER', '', '1,000.00 CR'])
+
+    masters = {
+        3: [['', '', '', 'MID', 'Outlet']] + [['', '', '', mids[c], c] for c in codes],
+        4: [['', '', '', '', '', 'Card', 'Outlet']] + [['', '', '', '', '', cards[c], c] for c in codes],
+        5: [['Cabang', 'Outlet']] + [[cabang[c], c] for c in codes],
+        7: [['MID', 'Outlet']] + [[bri_mids[c], c] for c in codes],
+    }
+    paths = {}
+    for number, rows in [(1, acmm), (2, bca), (6, bri)] + list(masters.items()):
+        path = os.path.join(directory, f'file{number}.{fmt}')
+        write_rows(path, rows, fmt)
+        paths[number] = path
+    return paths, {'acmm': len(acmm) - 1, 'bca': len(bca) - 1, 'bri': len(bri) - 1}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--outlets', type=int, default=300)
+    parser.add_argument('--days', type=int, default=31)
+    parser.add_argument('--format', choices=('csv', 'xlsx'), default='csv')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.time()
+        paths, rows = generate(directory, args.outlets, args.days, args.format)
+        generated = time.time() - started
+        started = time.time()
+        result = reconcile(paths)
+        elapsed = time.time() - started
+
+    total_rows = sum(rows.values())
+    timings = result['timings']
+    print(f"\n📊 {args.outlets} outlets x {args.days} days ({args.format}, inputs generated in {generated:.1f}s)")
+    print(f"   rows: ACMM {rows['acmm']:,}, BCA {rows['bca']:,}, BRI {rows['bri']:,}")
+    print(f"   read {timings['read_seconds']:.2f}s + parse {timings['parse_seconds']:.2f}s "
+          f"+ match (both modes) {timings['match_seconds']:.2f}s")
+    print(f"   total {elapsed:.2f}s, {total_rows / elapsed:,.0f} rows/s, peak RSS "
+          f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    for mode in ('period', 'daily'):
+        s = result[mode]['statistics']
+        print(f"   {mode}: cash {s['cashMatched']}/{s['cashTotal']}, non-cash "
+              f"{s['nonCashTotalMatched']}/{s['nonCashTotalCount']}, grand {s['grandTotalMatched']}/{s['grandTotalCount']}")
+    print(f"   exceptions {len(result['exceptions'])}, petty cash {len(result['pettyCash'])}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Bulk SMTP sender shared by the finance splitter backends.
+A small pool of worker threads each keeps one authenticated SMTP session
+open and sends many messages over it, instead of connecting, STARTTLS-ing
+and logging in once per email. Sends are paced by a shared rate limit and
+transient (4xx / dropped connection) failures are retried with backoff.
+
+Works against any SMTP server - for local testing run a stand-in such as
+`python -m aiosmtpd -n -l localhost:1025` with SMTP_SERVER=localhost,
+SMTP_PORT=1025 and SMTP_STARTTLS=0.
+"""
+
+import os
+import queue
+import smtplib
+import threading
+import time
+
+MAIL_WORKERS = int(os.getenv('MAIL_WORKERS', '3'))
+MAIL_RATE_PER_SEC = float(os.getenv('MAIL_RATE_PER_SEC', '5'))  # 0 = unlimited
+MAIL_MAX_RETRIES = int(os.getenv('MAIL_MAX_RETRIES', '3'))
+MAIL_RETRY_BACKOFF = float(os.getenv('MAIL_RETRY_BACKOFF', '2'))  # seconds, doubled per attempt
+# Reconnect after this many messages; some providers cap messages per session
+MAIL_MESSAGES_PER_CONNECTION = int(os.getenv('MAIL_MESSAGES_PER_CONNECTION', '50'))
+MAIL_TIMEOUT = float(os.getenv('MAIL_TIMEOUT', '60'))
+
+
+class _RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads."""
+
+    def __init__(self, rate_per_sec):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _is_transient(exc):
+    """4xx replies and dropped connections are worth retrying; 5xx are not."""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return True
+    # Socket-level failures (timeouts, resets); other SMTPExceptions are OSErrors too
+    return isinstance(exc, OSError) and not isinstance(exc, smtplib.SMTPException)
+
+
+class BulkMailer:
+    """
+    Send many messages over a few persistent SMTP sessions.
+
+    config: the splitter's EMAIL_CONFIG dict (smtp_server, smtp_port,
+    sender_email, sender_password, starttls).
+    """
+
+    def __init__(self, config, workers=MAIL_WORKERS, rate_per_sec=MAIL_RATE_PER_SEC,
+                 max_retries=MAIL_MAX_RETRIES, backoff=MAIL_RETRY_BACKOFF,
+                 messages_per_connection=MAIL_MESSAGES_PER_CONNECTION):
+        self.config = config
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.messages_per_connection = messages_per_connection
+        self._limiter = _RateLimiter(rate_per_sec)
+
+    def send_all(self, messages, on_result=None):
+        """
+        Send [(recipient, message), ...] where message is an email.message
+        object. Returns one result dict per message, in input order:
+          {'to', 'status': 'sent'|'failed', 'attempts', 'error', 'smtp_code'}
+        on_result(index, result) is called as each message completes.
+        """
+        results = [None] * len(messages)
+        pending = queue.Queue()
+        for i, item in enumerate(messages):
+            pending.put((i, item))
+
+        def worker():
+            session = _Session(self.config)
+            try:
+                while True:
+                    try:
+                        i, (to, msg) = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    results[i] = self._deliver(session, to, msg)
+                    if on_result:
+                        on_result(i, results[i])
+            finally:
+                session.close()
+
+        threads = [threading.Thread(target=worker, name=f'mail-worker-{n}', daemon=True)
+                   for n in range(max(1, min(self.workers, len(messages))))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def _deliver(self, session, to, msg):
+        attempts = 0
+        while True:
+            attempts += 1
+            self._limiter.wait()
+            try:
+                if session.sent >= self.messages_per_connection:
+                    session.close()
+                session.send(msg)
+                return {'to': to, 'status': 'sent', 'attempts': attempts,
+                        'error': None, 'smtp_code': None}
+            except Exception as e:
+                # smtplib resets the session after a rejected reply; anything
+                # else (disconnects, socket errors) needs a fresh connection
+                if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                    session.close()
+                code = getattr(e, 'smtp_code', None)
+                if not _is_transient(e) or attempts > self.max_retries:
+                    print(f"Error sending email to {to}: {str(e)}")
+                    return {'to': to, 'status': 'failed', 'attempts': attempts,
+                            'error': str(e), 'smtp_code': code}
+                time.sleep(self.backoff * (2 ** (attempts - 1)))
+
+
+class _Session:
+    """One lazily-opened, authenticated SMTP connection."""
+
+    def __init__(self, config):
+        self.config = config
+        self.server = None
+        self.sent = 0
+
+    def send(self, msg):
+        if self.server is None:
+            self._open()
+        self.server.send_message(msg)
+        self.sent += 1
+
+    def _open(self):
+        cfg = self.config
+        server = smtplib.SMTP(cfg['smtp_server'], cfg['smtp_port'], timeout=MAIL_TIMEOUT)
+        try:
+            if cfg.get('starttls', True):
+                server.starttls()
+            server.ehlo_or_helo_if_needed()
+            # Local stand-in servers don't advertise AUTH; skip login there
+            if cfg.get('sender_password') and server.has_extn('auth'):
+                server.login(cfg['sender_email'], cfg['sender_password'])
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        self.sent = 0
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                self.server.close()
+            self.server = None
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Durable email dispatch queue shared by the finance splitter backends.
+/api/send-emails only records the batch in a local SQLite database and
+returns a job id; a background dispatcher drains queued emails through the
+BulkMailer and records each recipient's outcome, which the client polls via
+/api/email-jobs/<id>.
+
+The dispatcher thread starts with the first enqueue / status poll (or at
+construction in the reloader's serving child, to resume leftover rows), so
+the Flask reloader's watcher process, which imports the app but never
+serves it, does not drain the queue with an artifact manifest that lacks
+the serving process's splits.
+
+Each email gets an idempotency key (artifact, recipient, subject, files).
+Re-submitting a batch re-queues only emails that previously failed - emails
+already sent or still queued are linked to the new job, not sent twice.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+EMAIL_QUEUE_DIR = os.getenv('EMAIL_QUEUE_DIR', os.path.dirname(os.path.abspath(__file__)))
+EMAIL_QUEUE_BATCH = int(os.getenv('EMAIL_QUEUE_BATCH', '50'))
+EMAIL_QUEUE_POLL = float(os.getenv('EMAIL_QUEUE_POLL', '1'))  # seconds between idle checks
+EMAIL_QUEUE_STALE = float(os.getenv('EMAIL_QUEUE_STALE', '900'))  # seconds before a 'sending' row is retried
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_items (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    idem_key    TEXT UNIQUE NOT NULL,
+    artifact_id TEXT NOT NULL,
+    to_addr     TEXT NOT NULL,
+    subject     TEXT NOT NULL,
+    body        TEXT NOT NULL,
+    files       TEXT NOT NULL,
+    status      TEXT NOT NULL,          -- queued / sending / sent / failed
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    smtp_code   INTEGER,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_email_items_status ON email_items(status, id);
+CREATE TABLE IF NOT EXISTS email_jobs (
+    id          TEXT PRIMARY KEY,
+    created_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS email_job_items (
+    job_id      TEXT NOT NULL,
+    item_id     INTEGER NOT NULL,
+    position    INTEGER NOT NULL,
+    PRIMARY KEY (job_id, item_id)
+);
+"""
+
+
+def idempotency_key(artifact_id, email):
+    """Stable key for 'this email with these attachments from this split'."""
+    files = sorted(f.get('filename', '') for f in email.get('files', []))
+    raw = json.dumps([artifact_id, email['to'].strip().lower(), email['subject'], files])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class EmailQueue:
+    """
+    build_message(item) turns a queued row (dict with to, subject, body,
+    files, artifact_id) into an email message; mailer is a BulkMailer.
+    """
+
+    def __init__(self, namespace, mailer, build_message, directory=EMAIL_QUEUE_DIR):
+        self.mailer = mailer
+        self.build_message = build_message
+        self.path = os.path.join(directory, f'email_queue_{namespace}.db')
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+        # Emails stuck mid-send by a crash go back to the queue. Only stale ones:
+        # another process on the same database (e.g. the Flask reloader) may
+        # legitimately be sending right now.
+        self._db.execute("UPDATE email_items SET status = 'queued' WHERE status = 'sending' AND updated_at < ?",
+                         (time.time() - EMAIL_QUEUE_STALE,))
+        self.namespace = namespace
+        self._thread = None
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            self._ensure_dispatcher()
+
+    def _ensure_dispatcher(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatcher, daemon=True,
+                                                name=f'email-dispatcher-{self.namespace}')
+                self._thread.start()
+
+    def enqueue(self, artifact_id, emails):
+        """
+        Record a batch of {to, subject, body, files} emails; returns the job id.
+        Previously failed emails are re-queued, sent/queued ones are reused.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.execute('INSERT INTO email_jobs (id, created_at) VALUES (?, ?)', (job_id, now))
+                for position, email in enumerate(emails):
+                    key = idempotency_key(artifact_id, email)
+                    self._db.execute(
+                        "INSERT INTO email_items (idem_key, artifact_id, to_addr, subject, body, files, status, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, 'queued', ?) "
+                        "ON CONFLICT(idem_key) DO UPDATE SET status = 'queued', error = NULL, updated_at = excluded.updated_at "
+                        "WHERE email_items.status = 'failed'",
+                        (key, artifact_id, email['to'], email['subject'], email['body'],
+                         json.dumps(email.get('files', [])), now))
+                    item_id = self._db.execute('SELECT id FROM email_items WHERE idem_key = ?', (key,)).fetchone()[0]
+                    self._db.execute(
+                        'INSERT OR IGNORE INTO email_job_items (job_id, item_id, position) VALUES (?, ?, ?)',
+                        (job_id, item_id, position))
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+        self._ensure_dispatcher()
+        self._wake.set()
+        return job_id
+
+    def job_status(self, job_id):
+        """Per-recipient status for a job, or None if the job id is unknown."""
+        self._ensure_dispatcher()
+        with self._lock:
+            if self._db.execute('SELECT 1 FROM email_jobs WHERE id = ?', (job_id,)).fetchone() is None:
+                return None
+            rows = self._db.execute(
+                'SELECT i.to_addr, i.status, i.attempts, i.error, i.smtp_code, i.files '
+                'FROM email_job_items j JOIN email_items i ON i.id = j.item_id '
+                'WHERE j.job_id = ? ORDER BY j.position', (job_id,)).fetchall()
+
+        recipients = [{
+            'to': r['to_addr'],
+            'status': r['status'],
+            'attempts': r['attempts'],
+            'error': r['error'],
+            'smtp_code': r['smtp_code'],
+            'files_count': len(json.loads(r['files'])),
+        } for r in rows]
+        sent = [r for r in recipients if r['status'] == 'sent']
+        failed = [r for r in recipients if r['status'] == 'failed']
+        pending = len(recipients) - len(sent) - len(failed)
+        return {
+            'job_id': job_id,
+            'status': 'pending' if pending else 'done',
+            'total': len(recipients),
+            'sent': len(sent),
+            'failed': len(failed),
+            'pending': pending,
+            'success': not pending and not failed,
+            'recipients': recipients,
+            'results': sent,
+            'errors': failed,
+        }
+
+    # ── dispatcher ──────────────────────────────────────────────────────────
+
+    def _claim_batch(self):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._db.execute(
+                    "SELECT id, artifact_id, to_addr, subject, body, files FROM email_items "
+                    "WHERE status = 'queued' ORDER BY id LIMIT ?", (EMAIL_QUEUE_BATCH,)).fetchall()
+                self._db.executemany(
+                    "UPDATE email_items SET status = 'sending', updated_at = ? WHERE id = ?",
+                    [(time.time(), r['id']) for r in rows])
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+        return [{
+            'id': r['id'],
+            'artifact_id': r['artifact_id'],
+            'to': r['to_addr'],
+            'subject': r['subject'],
+            'body': r['body'],
+            'files': json.loads(r['files']),
+        } for r in rows]
+
+    def _record(self, item_id, status, attempts, error=None, smtp_code=None):
+        with self._lock:
+            self._db.execute(
+                'UPDATE email_items SET status = ?, attempts = attempts + ?, error = ?, smtp_code = ?, '
+                'updated_at = ? WHERE id = ?',
+                (status, attempts, error, smtp_code, time.time(), item_id))
+
+    def _dispatch(self, items):
+        messages = []
+        sendable = []
+        for item in items:
+            try:
+                messages.append((item['to'], self.build_message(item)))
+                sendable.append(item)
+            except Exception as e:
+                self._record(item['id'], 'failed', 0, error=str(e))
+
+        def on_result(i, result):
+            self._record(sendable[i]['id'], result['status'], result['attempts'],
+                         result['error'], result['smtp_code'])
+
+        if messages:
+            self.mailer.send_all(messages, on_result=on_result)
+
+    def _dispatcher(self):
+        while True:
+            try:
+                items = self._claim_batch()
+                if items:
+                    self._dispatch(items)
+                    continue
+            except Exception as e:
+                print(f"Email dispatcher error: {str(e)}")
+            self._wake.wait(EMAIL_QUEUE_POLL)
+            self._wake.clear()
@@ -5,28 +5,36 @@ Handles Excel file processing, column deletion, supplier-based splitting,
 and WhatsApp link generation for file distribution.
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import openpyxl
 from openpyxl.utils import get_column_letter
 import os
 import tempfile
-import zipfile
-from io import BytesIO
 import re
 from datetime import datetime
 import urllib.parse
-import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
+from zip_stream import iter_zip, resolve_zip_mode
+from split_jobs import JobQueue, QueueFullError
+from artifact_store import ArtifactStore
+from bulk_mailer import BulkMailer
+from email_queue import EmailQueue
+from mapping_index import MappingIndex
+from mapping_registry import MappingRegistry, load_mapping
+from upload_cache import load_upload, upload_cache
 
 app = Flask(__name__)
 CORS(app)
 
-# Global storage for temp directories
-temp_dirs = {}
+# Split outputs, addressed by opaque artifact id (ARTIFACT_TTL / ARTIFACT_MAX_BYTES)
+artifacts = ArtifactStore('im-split')
+
+# Worker pool for split jobs (SPLIT_WORKERS / SPLIT_QUEUE_SIZE)
+split_jobs = JobQueue()
 
 # Email Configuration
 EMAIL_CONFIG = {
@@ -34,9 +42,20 @@ EMAIL_CONFIG = {
     'smtp_port': int(os.getenv('SMTP_PORT', '587')),
     'sender_email': os.getenv('SENDER_EMAIL', ''),
     'sender_password': os.getenv('SENDER_PASSWORD', ''),
-    'sender_name': os.getenv('SENDER_NAME', 'Apotek Alpro Finance Team')
+    'sender_name': os.getenv('SENDER_NAME', 'Apotek Alpro Finance Team'),
+    'starttls': os.getenv('SMTP_STARTTLS', '1') != '0'
 }
 
+# Reuses authenticated SMTP sessions across messages (MAIL_WORKERS / MAIL_RATE_PER_SEC)
+mailer = BulkMailer(EMAIL_CONFIG)
+
+# Mapping files uploaded once and referenced by version id (MAPPING_REGISTRY_DIR)
+mappings = MappingRegistry('im-split', kinds=('wa', 'email'))
+
+# Durable send queue drained in the background (EMAIL_QUEUE_DIR)
+email_queue = EmailQueue('im-split', mailer, lambda item: build_email(
+    item['to'], item['subject'], item['body'], item['files'], item['artifact_id']))
+
 
 def extract_supplier_name(full_supplier_text):
     """
@@ -83,20 +102,22 @@ def extract_date_from_cell(cell_value):
     return datetime.now().strftime('%Y%m%d')
 
 
-def copy_cell_with_style(source_cell, target_cell):
-    """Copy cell value and style from source to target."""
-    target_cell.value = source_cell.value
+def copy_cell_with_style(value, style, target_cell):
+    """Copy a cached cell's value and style (see CachedSheet.style) to target."""
+    target_cell.value = value
     
-    if source_cell.has_style:
-        target_cell.font = source_cell.font.copy()
-        target_cell.border = source_cell.border.copy()
-        target_cell.fill = source_cell.fill.copy()
-        target_cell.number_format = source_cell.number_format
-        target_cell.protection = source_cell.protection.copy()
-        target_cell.alignment = source_cell.alignment.copy()
+    if style is not None:
+        font, border, fill, number_format, protection, alignment = style
+        # Cached style objects are plain values (not cell proxies), so no copy is needed
+        target_cell.font = font
+        target_cell.border = border
+        target_cell.fill = fill
+        target_cell.number_format = number_format
+        target_cell.protection = protection
+        target_cell.alignment = alignment
 
 
-def delete_columns_and_split(file_path, wa_mapping, email_mapping=None):
+def delete_columns_and_split(file_path, wa_mapping, email_mapping=None, progress=None):
     """
     Main processing function:
     1. Read original file (NEW: Header at row 5, data starts row 6)
@@ -112,9 +133,14 @@ def delete_columns_and_split(file_path, wa_mapping, email_mapping=None):
     - Data starts: Row 6
     - New column M: Invoice Receive Date (KEEP)
     - Columns shift: Old M→N, N→O, O→P, P→Q, etc.
+    
+    progress: optional callback taking counters as keyword arguments
+    (rows_read, suppliers_total, suppliers_written, bytes_written).
     """
     if email_mapping is None:
-        email_mapping = {}
+        email_mapping = MappingIndex()
+    if progress is None:
+        progress = lambda **counters: None
     
     # NEW Columns to delete (by original position, 1-indexed)
     # B=2 (Store), C=3 (Match No.), E=5 (Supplier Contract), F=6 (Credit Term), 
@@ -122,24 +148,23 @@ def delete_columns_and_split(file_path, wa_mapping, email_mapping=None):
     # U=21 (Tolerance Amount), V=22 (Total Prepaid Tax), W=23+ (any additional)
     columns_to_delete = [22, 21, 16, 15, 9, 8, 6, 5, 3, 2]  # Reverse order for deletion
     
-    # Load workbook
-    wb = openpyxl.load_workbook(file_path)
-    sheet = wb.active
+    # Load the active sheet from the shared upload cache: values, formulas
+    # and styles are parsed once per distinct file, so re-splitting the same
+    # upload (e.g. after fixing a mapping) skips the Excel parse entirely
+    sheet = load_upload(file_path, styles=True).active
     
     # Extract date from G3 BEFORE deletion (Printed Date: '2025-12-04 19:30:39')
-    date_str = extract_date_from_cell(sheet['G3'].value)
-    
-    # Get all rows as list
-    all_rows = list(sheet.iter_rows())
+    date_str = extract_date_from_cell(sheet.cell(3, 7))
     
-    # Close original workbook
-    wb.close()
+    # Get all rows as lists of values
+    all_rows = sheet.rows()
+    progress(rows_read=len(all_rows))
     
     # Group data by supplier
-    # First, identify header row and data rows
+    # First, identify header row and data rows (1-based row numbers)
     header_row_idx = None
     for idx, row in enumerate(all_rows):
-        if row[3].value == 'Supplier':  # Column D (index 3) = Supplier header
+        if row[3] == 'Supplier':  # Column D (index 3) = Supplier header
             header_row_idx = idx
             break
     
@@ -148,19 +173,21 @@ def delete_columns_and_split(file_path, wa_mapping, email_mapping=None):
     
     # Group rows by supplier
     supplier_groups = {}
-    header_rows = all_rows[:header_row_idx + 1]  # Include all rows up to and including header
-    data_rows = all_rows[header_row_idx + 1:]  # Data rows after header
+    header_rows = range(1, header_row_idx + 2)  # Include all rows up to and including header
+    data_rows = range(header_row_idx + 2, sheet.max_row + 1)  # Data rows after header
     
     for row in data_rows:
-        supplier = row[3].value  # Column D (index 3)
+        supplier = all_rows[row - 1][3]  # Column D (index 3)
         if supplier and str(supplier).strip():
             if supplier not in supplier_groups:
                 supplier_groups[supplier] = []
             supplier_groups[supplier].append(row)
     
-    # Create temp directory for split files
-    temp_dir = tempfile.mkdtemp()
+    # Create artifact directory for split files
+    artifact_id, temp_dir = artifacts.create()
     split_files = []
+    bytes_written = 0
+    progress(suppliers_total=len(supplier_groups), suppliers_written=0, bytes_written=0)
     
     # Process each supplier group
     for supplier, rows in supplier_groups.items():
@@ -170,8 +197,8 @@ def delete_columns_and_split(file_path, wa_mapping, email_mapping=None):
         new_sheet = new_wb.create_sheet(sheet.title)
         
         # Copy header rows
-        for src_row_idx, src_row in enumerate(header_rows, 1):
-            for src_col_idx, src_cell in enumerate(src_row, 1):
+        for src_row_idx in header_rows:
+            for src_col_idx in range(1, sheet.max_column + 1):
                 # Skip columns that will be deleted (NEW: B=2, C=3, E=5, F=6, H=8, I=9, O=15, P=16, U=21, V=22)
                 if src_col_idx in [2, 3, 5, 6, 8, 9, 15, 16, 21, 22]:
                     continue
@@ -183,12 +210,13 @@ def delete_columns_and_split(file_path, wa_mapping, email_mapping=None):
                         target_col_idx -= 1
                 
                 target_cell = new_sheet.cell(row=src_row_idx, column=target_col_idx)
-                copy_cell_with_style(src_cell, target_cell)
+                copy_cell_with_style(all_rows[src_row_idx - 1][src_col_idx - 1],
+                                     sheet.style(src_row_idx, src_col_idx), target_cell)
         
         # Copy data rows for this supplier
         target_row_idx = len(header_rows) + 1
         for src_row in rows:
-            for src_col_idx, src_cell in enumerate(src_row, 1):
+            for src_col_idx in range(1, sheet.max_column + 1):
                 # Skip columns that will be deleted (NEW: B=2, C=3, E=5, F=6, H=8, I=9, O=15, P=16, U=21, V=22)
                 if src_col_idx in [2, 3, 5, 6, 8, 9, 15, 16, 21, 22]:
                     continue
@@ -200,7 +228,8 @@ def delete_columns_and_split(file_path, wa_mapping, email_mapping=None):
                         target_col_idx -= 1
                 
                 target_cell = new_sheet.cell(row=target_row_idx, column=target_col_idx)
-                copy_cell_with_style(src_cell, target_cell)
+                copy_cell_with_style(all_rows[src_row - 1][src_col_idx - 1],
+                                     sheet.style(src_row, src_col_idx), target_cell)
             
             target_row_idx += 1
         
@@ -233,37 +262,14 @@ def delete_columns_and_split(file_path, wa_mapping, email_mapping=None):
         # Save file
         new_wb.save(filepath)
         new_wb.close()
+        artifacts.add_file(artifact_id, filename)
+        bytes_written += os.path.getsize(filepath)
         
-        # Get WhatsApp group/contact from mapping
-        # Try multiple matching strategies
-        wa_target = None
-        
-        # Strategy 1: Exact match with full supplier string
-        wa_target = wa_mapping.get(supplier, None)
-        
-        # Strategy 2: Try matching just the company name part (after dash)
-        if not wa_target and ' - ' in str(supplier):
-            company_only = str(supplier).split(' - ', 1)[1].strip()
-            wa_target = wa_mapping.get(company_only, None)
-        
-        # Strategy 3: Try matching with cleaned supplier name
-        if not wa_target:
-            wa_target = wa_mapping.get(supplier_name, None)
-        
-        # Get Email from mapping (same matching strategies)
-        email_address = None
-        
-        # Strategy 1: Exact match with full supplier string
-        email_address = email_mapping.get(supplier, None)
-        
-        # Strategy 2: Try matching just the company name part (after dash)
-        if not email_address and ' - ' in str(supplier):
-            company_only = str(supplier).split(' - ', 1)[1].strip()
-            email_address = email_mapping.get(company_only, None)
-        
-        # Strategy 3: Try matching with cleaned supplier name
-        if not email_address:
-            email_address = email_mapping.get(supplier_name, None)
+        # Get WhatsApp group/contact and Email from the mappings:
+        # full supplier string, company part after the dash, cleaned name
+        company_only = str(supplier).split(' - ', 1)[1].strip() if ' - ' in str(supplier) else None
+        wa_target, wa_match = wa_mapping.lookup(supplier, company_only, supplier_name)
+        email_address, email_match = email_mapping.lookup(supplier, company_only, supplier_name)
         
         split_files.append({
             'filename': filename,
@@ -271,27 +277,88 @@ def delete_columns_and_split(file_path, wa_mapping, email_mapping=None):
             'supplier_clean': supplier_name,
             'row_count': len(rows),
             'wa_target': wa_target,
+            'wa_match': wa_match,
             'email': email_address,
-            'filepath': filepath
+            'email_match': email_match
         })
+        progress(suppliers_written=len(split_files), bytes_written=bytes_written)
     
-    return temp_dir, split_files, date_str
+    return artifact_id, split_files, date_str
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
-    return jsonify({'status': 'healthy', 'service': 'IM Splitter API'}), 200
+    return jsonify({'status': 'healthy', 'service': 'IM Splitter API', 'artifacts': artifacts.stats(),
+                    'upload_cache': upload_cache().stats()}), 200
+
+
+def save_upload(field):
+    """Save an optional uploaded file to a temp path; return None if absent."""
+    if field not in request.files or request.files[field].filename == '':
+        return None
+    temp = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
+    request.files[field].save(temp.name)
+    temp.close()
+    return temp.name
+
+
+def registered_mapping(kind, ref):
+    """(version, MappingIndex) for a mapping id form field, or None if not given."""
+    if not ref:
+        return None
+    return mappings.resolve(kind, ref)
+
+
+def run_im_split(job, input_path, wa_source, email_source):
+    """
+    Job body: resolve mappings, split by supplier, return the result payload.
+    Mapping sources are registry versions or uploaded file paths (see load_mapping).
+    """
+    try:
+        # Uploaded workbooks are parsed once per distinct content (MAPPING_CACHE_SIZE)
+        wa_mapping, wa_version = load_mapping(wa_source, 'WhatsApp')
+        email_mapping, email_version = load_mapping(email_source, 'Email')
+        
+        # Process the file
+        artifact_id, split_files, date_str = delete_columns_and_split(
+            input_path, wa_mapping, email_mapping, progress=job.update)
+    finally:
+        # Clean up uploaded files
+        for path in (input_path, wa_source, email_source):
+            if isinstance(path, str):
+                os.unlink(path)
+    
+    artifacts.commit(artifact_id)
+    
+    # ZIP is built on the fly when downloaded (see download_zip)
+    zip_filename = f'IM_Split_{date_str}.zip'
+    
+    return {
+        'success': True,
+        'date': date_str,
+        'artifact_id': artifact_id,
+        'zip_filename': zip_filename,
+        'files': split_files,
+        'total_suppliers': len(split_files),
+        'wa_mapping_id': wa_version,
+        'email_mapping_id': email_version
+    }
 
 
 @app.route('/api/split-im-excel', methods=['POST'])
 def split_im_excel():
     """
-    Process uploaded Excel file:
+    Queue an uploaded Excel file for processing and return a job id (202).
+    The job will:
     1. Delete specified columns
     2. Split by supplier
     3. Generate WhatsApp links (optional)
     4. Generate email mappings (optional)
+    Poll /api/jobs/<job_id> for progress; the finished job's result holds
+    the split file list.
+    Mappings come from wa_mapping_id / email_mapping_id (a registered version
+    id or 'latest', see /api/mappings) or from wa_mapping / email_mapping uploads.
     """
     try:
         if 'file' not in request.files:
@@ -302,107 +369,27 @@ def split_im_excel():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        # Save uploaded files temporarily
-        temp_input = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-        file.save(temp_input.name)
-        temp_input.close()
-        
-        # Read WhatsApp mapping (optional)
-        wa_mapping = {}
-        if 'wa_mapping' in request.files and request.files['wa_mapping'].filename != '':
-            wa_file = request.files['wa_mapping']
-            temp_wa = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-            wa_file.save(temp_wa.name)
-            temp_wa.close()
-            
-            try:
-                wb_wa = openpyxl.load_workbook(temp_wa.name)
-                sheet_wa = wb_wa.active
-                
-                for row in sheet_wa.iter_rows(min_row=2, values_only=True):  # Skip header
-                    if row[0] and row[1]:  # Column A = Supplier, Column B = WA Group
-                        supplier_name = str(row[0]).strip()
-                        wa_group = str(row[1]).strip()
-                        
-                        # Store both exact match and just the company name part
-                        wa_mapping[supplier_name] = wa_group
-                        
-                        # Also create a mapping for full format with numbers
-                        # In case the mapping file has format: 0000000008 - PT. INDOCORE PERKASA
-                        if ' - ' in supplier_name:
-                            company_only = supplier_name.split(' - ', 1)[1].strip()
-                            wa_mapping[company_only] = wa_group
-                
-                wb_wa.close()
-            except Exception as e:
-                return jsonify({"error": f"Error reading WhatsApp mapping: {str(e)}"}), 400
-            finally:
-                os.unlink(temp_wa.name)
-        
-        # Read Email mapping (optional)
-        email_mapping = {}
-        if 'email_mapping' in request.files and request.files['email_mapping'].filename != '':
-            email_file = request.files['email_mapping']
-            temp_email = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-            email_file.save(temp_email.name)
-            temp_email.close()
-            
-            try:
-                wb_email = openpyxl.load_workbook(temp_email.name)
-                sheet_email = wb_email.active
-                
-                for row in sheet_email.iter_rows(min_row=2, values_only=True):  # Skip header
-                    if row[0] and row[1]:  # Column A = Supplier, Column B = Email
-                        supplier_name = str(row[0]).strip()
-                        email_addr = str(row[1]).strip()
-                        
-                        # Store both exact match and just the company name part
-                        email_mapping[supplier_name] = email_addr
-                        
-                        # Also create a mapping for full format with numbers
-                        if ' - ' in supplier_name:
-                            company_only = supplier_name.split(' - ', 1)[1].strip()
-                            email_mapping[company_only] = email_addr
-                
-                wb_email.close()
-            except Exception as e:
-                return jsonify({"error": f"Error reading Email mapping: {str(e)}"}), 400
-            finally:
-                os.unlink(temp_email.name)
-        
-        # Process the file
-        temp_dir, split_files, date_str = delete_columns_and_split(temp_input.name, wa_mapping, email_mapping)
-        
-        # Clean up input file
-        os.unlink(temp_input.name)
+        # Registered mappings are already parsed; no upload needed
+        try:
+            wa_source = registered_mapping('wa', request.form.get('wa_mapping_id'))
+            email_source = registered_mapping('email', request.form.get('email_mapping_id'))
+        except KeyError as e:
+            return jsonify({'error': e.args[0]}), 404
         
-        # Store temp directory reference
-        temp_dirs[temp_dir] = True
+        # Save uploaded files temporarily - the request body is gone once we return
+        input_path = save_upload('file')
+        wa_source = wa_source or save_upload('wa_mapping')
+        email_source = email_source or save_upload('email_mapping')
         
-        # Create ZIP file
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for file_info in split_files:
-                zip_file.write(file_info['filepath'], file_info['filename'])
+        try:
+            job = split_jobs.submit('im-split', run_im_split, input_path, wa_source, email_source)
+        except QueueFullError as e:
+            for path in (input_path, wa_source, email_source):
+                if isinstance(path, str):
+                    os.unlink(path)
+            return jsonify({'error': str(e)}), 503
         
-        zip_buffer.seek(0)
-        zip_filename = f'IM_Split_{date_str}.zip'
-        zip_path = os.path.join(temp_dir, zip_filename)
-        
-        with open(zip_path, 'wb') as f:
-            f.write(zip_buffer.getvalue())
-        
-        # Prepare response
-        result = {
-            'success': True,
-            'date': date_str,
-            'temp_dir': temp_dir,
-            'zip_filename': zip_filename,
-            'files': split_files,
-            'total_suppliers': len(split_files)
-        }
-        
-        return jsonify(result), 200
+        return jsonify({'success': True, 'job_id': job.id, 'status': job.status}), 202
         
     except Exception as e:
         import traceback
@@ -411,40 +398,83 @@ def split_im_excel():
         return jsonify({'error': str(e), 'trace': error_trace}), 500
 
 
-@app.route('/api/download-zip/<path:temp_dir>/<filename>', methods=['GET'])
-def download_zip(temp_dir, filename):
-    """Download the ZIP file containing all split files."""
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report job status, progress counters and (when done) the result."""
+    job = split_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@app.route('/api/mappings', methods=['POST'])
+def register_mapping():
+    """
+    Register a mapping workbook once (form fields: file, kind=wa|email).
+    Returns its version (201), or the existing version (200) if the same
+    file was registered before. Split with wa_mapping_id / email_mapping_id.
+    """
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({'error': 'No file uploaded'}), 400
     try:
-        # Reconstruct full path
-        if not temp_dir.startswith('/'):
-            temp_dir = '/' + temp_dir
-        
-        filepath = os.path.join(temp_dir, filename)
-        
-        if not os.path.exists(filepath):
+        version, created = mappings.register(request.form.get('kind', ''), request.files['file'].filename,
+                                             request.files['file'].read())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'success': True, 'created': created, 'mapping': version}), 201 if created else 200
+
+
+@app.route('/api/mappings', methods=['GET'])
+def list_mappings():
+    """List registered mapping versions, newest first (optional ?kind=wa|email)."""
+    try:
+        return jsonify({'mappings': mappings.versions(request.args.get('kind'))}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/mappings/<version_id>', methods=['GET'])
+def get_mapping(version_id):
+    """Metadata of one registered mapping version."""
+    version = mappings.version(version_id)
+    if version is None:
+        return jsonify({'error': 'Mapping version not found'}), 404
+    return jsonify(version), 200
+
+
+@app.route('/api/download-zip/<artifact_id>/<filename>', methods=['GET'])
+def download_zip(artifact_id, filename):
+    """
+    Stream a ZIP of all split files, built on the fly from the artifact.
+    Optional ?mode=stored|deflated (default stored - .xlsx is already compressed).
+    """
+    try:
+        entries = artifacts.entries(artifact_id)
+        if not entries:
             return jsonify({'error': 'File not found'}), 404
         
-        return send_file(
-            filepath,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/zip'
+        mode = request.args.get('mode')
+        try:
+            resolve_zip_mode(mode)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return Response(
+            stream_with_context(iter_zip(entries, mode)),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
         )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/download-file/<path:temp_dir>/<filename>', methods=['GET'])
-def download_file(temp_dir, filename):
+@app.route('/api/download-file/<artifact_id>/<filename>', methods=['GET'])
+def download_file(artifact_id, filename):
     """Download individual split file."""
     try:
-        # Reconstruct full path
-        if not temp_dir.startswith('/'):
-            temp_dir = '/' + temp_dir
-        
-        filepath = os.path.join(temp_dir, filename)
+        filepath = artifacts.file_path(artifact_id, filename)
         
-        if not os.path.exists(filepath):
+        if filepath is None or not os.path.exists(filepath):
             return jsonify({'error': 'File not found'}), 404
         
         return send_file(
@@ -457,8 +487,8 @@ def download_file(temp_dir, filename):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/generate-wa-link/<path:temp_dir>/<filename>', methods=['POST'])
-def generate_wa_link(temp_dir, filename):
+@app.route('/api/generate-wa-link/<artifact_id>/<filename>', methods=['POST'])
+def generate_wa_link(artifact_id, filename):
     """
     Generate WhatsApp Web link with text message.
     File must be downloaded separately and attached manually.
@@ -497,13 +527,17 @@ def generate_wa_link(temp_dir, filename):
 @app.route('/api/send-emails', methods=['POST'])
 def send_emails():
     """
-    Send emails with file attachments automatically
-    Expects: {emails: [{to, subject, body, files}], temp_dir}
+    Queue emails with file attachments for automatic sending
+    Expects: {emails: [{to, subject, body, files}], artifact_id}
+    Returns a job id (202); poll /api/email-jobs/<job_id> for per-recipient status
     """
     try:
         data = request.json
         emails_to_send = data.get('emails', [])
-        temp_dir = data.get('temp_dir', '')
+        artifact_id = data.get('artifact_id', '')
+        
+        if artifacts.directory(artifact_id) is None:
+            return jsonify({'error': 'Split files not found or expired. Please split the file again.'}), 404
         
         # Check if email is configured
         if not EMAIL_CONFIG['sender_email'] or not EMAIL_CONFIG['sender_password']:
@@ -512,95 +546,69 @@ def send_emails():
                 'configured': False
             }), 400
         
-        results = []
-        errors = []
-        
+        # Validate before queueing anything
         for email_data in emails_to_send:
-            try:
-                # Send individual email
-                success = send_single_email(
-                    to_email=email_data['to'],
-                    subject=email_data['subject'],
-                    body=email_data['body'],
-                    files=email_data.get('files', []),
-                    temp_dir=temp_dir
-                )
-                
-                if success:
-                    results.append({
-                        'to': email_data['to'],
-                        'status': 'sent',
-                        'files_count': len(email_data.get('files', []))
-                    })
-                else:
-                    errors.append({
-                        'to': email_data['to'],
-                        'error': 'Failed to send email'
-                    })
-                    
-            except Exception as e:
-                errors.append({
-                    'to': email_data.get('to', 'unknown'),
-                    'error': str(e)
-                })
+            missing = [k for k in ('to', 'subject', 'body') if not email_data.get(k)]
+            if missing:
+                return jsonify({
+                    'error': f"Email to {email_data.get('to', 'unknown')} is missing: {', '.join(missing)}"
+                }), 400
+        
+        # Queue for the background dispatcher (see email_queue.py); re-sent
+        # batches only re-queue emails that previously failed
+        job_id = email_queue.enqueue(artifact_id, emails_to_send)
         
         return jsonify({
-            'success': len(errors) == 0,
-            'sent': len(results),
-            'failed': len(errors),
-            'results': results,
-            'errors': errors
-        })
+            'success': True,
+            'job_id': job_id,
+            'queued': len(emails_to_send)
+        }), 202
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-def send_single_email(to_email, subject, body, files, temp_dir):
+@app.route('/api/email-jobs/<job_id>', methods=['GET'])
+def email_job_status(job_id):
+    """Per-recipient status of a queued email batch."""
+    status = email_queue.job_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Email job not found'}), 404
+    return jsonify(status), 200
+
+
+def build_email(to_email, subject, body, files, artifact_id):
     """
-    Send a single email with attachments using SMTP
+    Build a single email with attachments (sent by the bulk mailer)
     """
-    try:
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = f"{EMAIL_CONFIG['sender_name']} <{EMAIL_CONFIG['sender_email']}>"
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # Add body
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Reconstruct temp_dir path if needed
-        if not temp_dir.startswith('/'):
-            temp_dir = '/' + temp_dir
-        
-        # Attach files
-        for file_info in files:
-            filename = file_info.get('filename', '')
-            file_path = os.path.join(temp_dir, filename)
-            
-            if os.path.exists(file_path):
-                with open(file_path, 'rb') as f:
-                    part = MIMEBase('application', 'octet-stream')
-                    part.set_payload(f.read())
-                    encoders.encode_base64(part)
-                    part.add_header(
-                        'Content-Disposition',
-                        f'attachment; filename= {filename}'
-                    )
-                    msg.attach(part)
-        
-        # Connect to SMTP server and send
-        with smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port']) as server:
-            server.starttls()
-            server.login(EMAIL_CONFIG['sender_email'], EMAIL_CONFIG['sender_password'])
-            server.send_message(msg)
-        
-        return True
-        
-    except Exception as e:
-        print(f"Error sending email to {to_email}: {str(e)}")
-        return False
+    # Create message
+    msg = MIMEMultipart()
+    msg['From'] = f"{EMAIL_CONFIG['sender_name']} <{EMAIL_CONFIG['sender_email']}>"
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    
+    # Add body
+    msg.attach(MIMEText(body, 'plain'))
+    
+    # Attach files (only files recorded in the artifact manifest)
+    for file_info in files:
+        filename = file_info.get('filename', '')
+        file_path = artifacts.file_path(artifact_id, filename)
+        
+        if not file_path or not os.path.exists(file_path):
+            # Never send without a listed attachment: the item is recorded as failed
+            raise FileNotFoundError(f'Attachment {filename!r} not found in split {artifact_id}')
+        with open(file_path, 'rb') as f:
+            part = MIMEBase('application', 'octet-stream')
+            part.set_payload(f.read())
+            encoders.encode_base64(part)
+            part.add_header(
+                'Content-Disposition',
+                f'attachment; filename= {filename}'
+            )
+            msg.attach(part)
+    
+    return msg
 
 
 @app.route('/api/test-email-config', methods=['GET'])
@@ -625,11 +633,15 @@ if __name__ == '__main__':
     print("IM Splitter API Server Starting...")
     print("=" * 60)
     print("Endpoints:")
-    print("  POST /api/split-im-excel - Process and split Excel file")
-    print("  GET  /api/download-zip/<temp_dir>/<filename> - Download ZIP")
-    print("  GET  /api/download-file/<temp_dir>/<filename> - Download single file")
-    print("  POST /api/generate-wa-link/<temp_dir>/<filename> - Generate WhatsApp link")
-    print("  POST /api/send-emails - Send emails with attachments")
+    print("  POST /api/split-im-excel - Queue Excel file for splitting (returns job id)")
+    print("  GET  /api/jobs/<job_id> - Split job progress and result")
+    print("  POST /api/mappings - Register a WA/email mapping file once (returns version id)")
+    print("  GET  /api/mappings - List registered mapping versions")
+    print("  GET  /api/download-zip/<artifact_id>/<filename> - Download ZIP")
+    print("  GET  /api/download-file/<artifact_id>/<filename> - Download single file")
+    print("  POST /api/generate-wa-link/<artifact_id>/<filename> - Generate WhatsApp link")
+    print("  POST /api/send-emails - Queue emails with attachments (returns job id)")
+    print("  GET  /api/email-jobs/<job_id> - Per-recipient email status")
     print("  GET  /api/test-email-config - Test email configuration")
     print("  GET  /health - Health check")
     print("=" * 60)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Invoice Matching Backend API
+Matches Coretax faktur pajak exports (PKU / PRI / APD) against invoice
+exports on the server for invoice-matching.html, so 100K+ row files don't
+have to be parsed and matched in the browser. Results are paged from disk.
+"""
+
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
+from flask_cors import CORS
+import openpyxl
+import csv
+import io
+import os
+import tempfile
+import threading
+import uuid
+from datetime import datetime
+from split_jobs import JobQueue, QueueFullError
+from artifact_store import ArtifactStore
+from invoice_matching import COMPANIES, KINDS, MatchResults, run_matching
+from upload_cache import upload_cache
+
+app = Flask(__name__)
+CORS(app)
+
+# Match runs (results.db + summary.json), addressed by run id (ARTIFACT_TTL / ARTIFACT_MAX_BYTES)
+artifacts = ArtifactStore('invoice-match')
+
+# Worker pool for matching jobs (SPLIT_WORKERS / SPLIT_QUEUE_SIZE)
+match_jobs = JobQueue()
+
+UPLOAD_EXTENSIONS = ('.xlsx', '.xlsm', '.csv')
+
+# Excel exports being built, one job per (run id, export file)
+export_jobs = {}
+export_lock = threading.Lock()
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint."""
+    return jsonify({'status': 'healthy', 'service': 'Invoice Matching API', 'artifacts': artifacts.stats(),
+                    'upload_cache': upload_cache().stats()}), 200
+
+
+def save_upload(file):
+    """Save an uploaded file to a temp path, keeping its extension (.xlsx / .csv)."""
+    extension = os.path.splitext(file.filename)[1].lower()
+    temp = tempfile.NamedTemporaryFile(delete=False, suffix=extension)
+    file.save(temp.name)
+    temp.close()
+    return temp.name
+
+
+def load_run(run_id):
+    """MatchResults of a finished run, or None if unknown / expired."""
+    directory = artifacts.directory(run_id)
+    if directory is None or not os.path.exists(os.path.join(directory, 'summary.json')):
+        return None
+    return MatchResults(directory)
+
+
+def run_invoice_matching(job, coretax_files, invoice_paths):
+    """Job body: stream the uploads through the matcher into a new run directory."""
+    run_id, directory = artifacts.create()
+    try:
+        summary = run_matching(coretax_files, invoice_paths, directory, progress=job.update)
+    finally:
+        for path in [path for _, path in coretax_files] + invoice_paths:
+            os.unlink(path)
+    for filename in ('results.db', 'summary.json'):
+        artifacts.add_file(run_id, filename)
+    artifacts.commit(run_id)
+    return {'success': True, 'run_id': run_id, 'summary': summary}
+
+
+def run_export(job, run_id, kind, company, filename):
+    """Job body: write a run's matched / unmatched records to an .xlsx kept next to the results."""
+    results = load_run(run_id)
+    if results is None:
+        raise ValueError('Run not found or expired')
+    path = os.path.join(results.out_dir, filename)
+    temp = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(kind.capitalize())
+        for n, row in enumerate(results.export_rows(kind, company), 1):
+            ws.append(row)
+            if n % 10000 == 0:
+                job.update(rows_written=n)
+        wb.save(temp)
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.unlink(temp)
+    with export_lock:
+        if artifacts.file_path(run_id, filename) is None:
+            artifacts.add_file(run_id, filename)
+    return {'success': True, 'run_id': run_id, 'filename': filename}
+
+
+def queue_export(run_id, kind, company, filename):
+    """The job building this export: the one already queued / running, else a new one."""
+    key = (run_id, filename)
+    with export_lock:
+        job = export_jobs.get(key)
+        if job is None or job.status in ('done', 'error'):
+            for finished in [k for k, j in export_jobs.items() if j.status in ('done', 'error')]:
+                del export_jobs[finished]
+            job = export_jobs[key] = match_jobs.submit('invoice-export', run_export, run_id, kind, company, filename)
+    return job
+
+
+@app.route('/api/invoice-matching', methods=['POST'])
+def match_invoices():
+    """
+    Queue a matching run and return a job id (202).
+    Form fields: pku, pri, apd (Coretax exports, at least one) and
+    invoices (one or more invoice exports); .xlsx or .csv.
+    Poll /api/jobs/<job_id>; the finished job's result holds run_id and the
+    summary. Pages come from /api/invoice-matching/<run_id>/matched|unmatched.
+    """
+    try:
+        uploads = [(company, request.files.get(company.lower())) for company in COMPANIES]
+        uploads = [(company, f) for company, f in uploads if f and f.filename]
+        invoices = [f for f in request.files.getlist('invoices') if f.filename]
+        if not uploads:
+            return jsonify({'error': 'Upload at least one Coretax file (pku, pri, apd)'}), 400
+        if not invoices:
+            return jsonify({'error': 'Upload at least one invoice file (invoices)'}), 400
+        for f in [f for _, f in uploads] + invoices:
+            if not f.filename.lower().endswith(UPLOAD_EXTENSIONS):
+                return jsonify({'error': f"Unsupported file type: {f.filename} (expected .xlsx or .csv)"}), 400
+
+        # Save uploaded files temporarily - the request body is gone once we return
+        coretax_files = [(company, save_upload(f)) for company, f in uploads]
+        invoice_paths = [save_upload(f) for f in invoices]
+
+        try:
+            job = match_jobs.submit('invoice-match', run_invoice_matching, coretax_files, invoice_paths)
+        except QueueFullError as e:
+            for path in [path for _, path in coretax_files] + invoice_paths:
+                os.unlink(path)
+            return jsonify({'error': str(e)}), 503
+
+        return jsonify({'success': True, 'job_id': job.id, 'status': job.status}), 202
+
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"Error in match_invoices: {error_trace}")
+        return jsonify({'error': str(e), 'trace': error_trace}), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report job status, progress counters and (when done) the result."""
+    job = match_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@app.route('/api/invoice-matching/<run_id>/summary', methods=['GET'])
+def run_summary(run_id):
+    """Totals, match rate and per-company stats of a run."""
+    results = load_run(run_id)
+    if results is None:
+        return jsonify({'error': 'Run not found'}), 404
+    return jsonify({'run_id': run_id, 'summary': results.summary}), 200
+
+
+def page_args():
+    """(kind-independent) company / page / page_size query arguments, validated."""
+    company = request.args.get('company', '').upper() or None
+    if company == 'ALL':
+        company = None
+    if company and company not in COMPANIES:
+        raise ValueError(f"Unknown company '{company}' (expected one of: {', '.join(COMPANIES)})")
+    try:
+        page = int(request.args.get('page', '1'))
+        page_size = int(request.args.get('page_size', '100'))
+    except ValueError:
+        raise ValueError('page and page_size must be integers')
+    return company, page, page_size
+
+
+@app.route('/api/invoice-matching/<run_id>/<kind>', methods=['GET'])
+def run_page(run_id, kind):
+    """
+    One page of matched or unmatched records.
+    Query: page (1-based), page_size (max 1000, default 100), company=PKU|PRI|APD.
+    """
+    if kind not in KINDS:
+        return jsonify({'error': 'Not found'}), 404
+    results = load_run(run_id)
+    if results is None:
+        return jsonify({'error': 'Run not found'}), 404
+    try:
+        company, page, page_size = page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(results.page(kind, company, page, page_size)), 200
+
+
+@app.route('/api/invoice-matching/<run_id>/<kind>/export', methods=['GET', 'POST'])
+def export_run(run_id, kind):
+    """
+    Download matched / unmatched records with the browser export's columns.
+    Query: company=PKU|PRI|APD (default all), format=xlsx|csv (default xlsx).
+    CSV is streamed. A workbook is built once per run by a match_jobs job:
+    until it exists the response is 202 + job id (poll /api/jobs/<job_id>),
+    then GET downloads it; POST only queues it (200 once built).
+    """
+    if kind not in KINDS:
+        return jsonify({'error': 'Not found'}), 404
+    results = load_run(run_id)
+    if results is None:
+        return jsonify({'error': 'Run not found'}), 404
+    try:
+        company, _, _ = page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    label = f"{company or 'All'}_{kind.capitalize()}"
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    if request.args.get('format') == 'csv':
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in results.export_rows(kind, company):
+                writer.writerow(row)
+                if buffer.tell() > 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename="Invoice_Matching_{label}_{date_str}.csv"'}
+        )
+
+    # Workbooks are written once per run and kept next to the results
+    filename = f'export_{label}.xlsx'
+    path = artifacts.file_path(run_id, filename)
+    if path is None:
+        try:
+            job = queue_export(run_id, kind, company, filename)
+        except QueueFullError as e:
+            return jsonify({'error': str(e)}), 503
+        return jsonify({'success': True, 'job_id': job.id, 'status': job.status}), 202
+    if request.method == 'POST':
+        return jsonify({'success': True, 'ready': True}), 200
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=f'Invoice_Matching_{label}_{date_str}.xlsx',
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Invoice Matching API Server Starting...")
+    print("=" * 60)
+    print("Endpoints:")
+    print("  POST /api/invoice-matching - Queue Coretax + invoice files for matching (returns job id)")
+    print("  GET  /api/jobs/<job_id> - Matching job progress and result")
+    print("  GET  /api/invoice-matching/<run_id>/summary - Totals and per-company stats")
+    print("  GET  /api/invoice-matching/<run_id>/matched - Page of matched records")
+    print("  GET  /api/invoice-matching/<run_id>/unmatched - Page of unmatched records")
+    print("  POST /api/invoice-matching/<run_id>/<kind>/export - Build the Excel export (returns job id)")
+    print("  GET  /api/invoice-matching/<run_id>/<kind>/export - Download as Excel / CSV")
+    print("  GET  /health - Health check")
+    print("=" * 60)
+    app.run(host='0.0.0.0', port=5003, debug=True)
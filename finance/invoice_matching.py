@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Invoice matching engine behind invoice-matcher.py.
+Implements the rules of invoice-matching.html (processCoretaxData,
+processInvoiceData, performMatching) for exports too large for the browser:
+
+- Coretax exports (PKU / PRI / APD) and invoice exports are read row by row
+  (the csv module, or the shared columnar upload cache, which packs an .xlsx
+  ROW_BLOCK rows at a time and keeps only its distinct strings in memory).
+- Invoices go into a hash index on the cleaned faktur pajak number (last 8
+  digits, as cleanFakturPajak / getLast8Digits) and on (number, tax amount).
+  A Coretax row whose PPN equals the invoice tax amount is matched to that
+  invoice; otherwise to the last invoice with the number, like the browser.
+- Matched / unmatched rows are written to a SQLite file as they are produced,
+  numbered per company, so any page is fetched by key range.
+"""
+
+import csv
+import datetime
+import json
+import os
+import re
+import sqlite3
+import time
+
+from upload_cache import load_upload
+
+COMPANIES = ('PKU', 'PRI', 'APD')
+# Rows above the data in each Coretax export (processCoretaxData headerRow)
+CORETAX_HEADER_ROWS = {'PKU': 1, 'PRI': 2, 'APD': 1}
+INVOICE_HEADER_ROWS = 3
+KINDS = ('matched', 'unmatched')
+WRITE_BATCH = 5000
+MAX_PAGE_SIZE = 1000
+
+INVOICE_FIELDS = ('invoiceCompany', 'store', 'confirmDate', 'invoiceNumber', 'fakturPajak',
+                  'orderNumber', 'receivingNumber', 'totalInvoiceTaxAmount')
+
+# Column headings of the browser's Excel exports
+CORETAX_EXPORT_COLUMNS = [
+    ('Company', 'company'), ('Vendor Name', 'vendorName'), ('NPWP', 'npwp'),
+    ('Faktur Pajak', 'fakturPajak'), ('Date', 'date'), ('Masa Pajak', 'masaPajak'),
+    ('Tahun', 'tahun'), ('Harga DPP', 'hargaDPP'), ('DPP Nilai Lain', 'dppNilaiLain'),
+    ('PPN', 'ppn'), ('Kode Diganti', 'kodeDiganti'),
+]
+INVOICE_EXPORT_COLUMNS = [
+    ('Invoice Company', 'invoiceCompany'), ('Store', 'store'), ('Confirm Date', 'confirmDate'),
+    ('Invoice Number', 'invoiceNumber'), ('Order Number', 'orderNumber'),
+    ('Receiving Number', 'receivingNumber'), ('Total Invoice Tax Amount', 'totalInvoiceTaxAmount'),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    kind        TEXT NOT NULL,          -- matched / unmatched
+    seq         INTEGER NOT NULL,       -- 1.. within kind
+    company     TEXT NOT NULL,
+    company_seq INTEGER NOT NULL,       -- 1.. within kind and company
+    data        TEXT NOT NULL,          -- JSON record, as the browser builds it
+    PRIMARY KEY (kind, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_records_company ON records(kind, company, company_seq);
+"""
+
+_ID_THOUSANDS = re.compile(r'^-?\d{1,3}(\.\d{3})+(,\d+)?$')  # 1.234.567,89
+
+
+# ── reading ────────────────────────────────────────────────────────────────
+
+def iter_rows(path):
+    """Rows of the first sheet (.xlsx, from the shared upload cache) or of a .csv file, one list at a time."""
+    if path.lower().endswith('.csv'):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            yield from csv.reader(f)
+        return
+    for row in load_upload(path).sheet(0).iter_rows():
+        yield [_plain(v) for v in row]
+
+
+def _plain(value):
+    """Cell value as JSON-friendly data; dates as ISO strings."""
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat() if value.time() == datetime.time() else value.isoformat(sep=' ')
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _col(row, index, default=''):
+    """row[index] || default, as the browser reads columns."""
+    value = row[index] if index < len(row) else None
+    return value if value else default
+
+
+def clean_faktur_pajak(value):
+    """cleanFakturPajak: drop dots and dashes."""
+    if not value:
+        return ''
+    return str(value).replace('.', '').replace('-', '')
+
+
+def last8_digits(value):
+    """getLast8Digits"""
+    return clean_faktur_pajak(value)[-8:]
+
+
+def parse_amount(value):
+    """Numeric amount from a number or a '1,234,567.89' / '1.234.567,89' string; None if not numeric."""
+    if isinstance(value, (int, float)):
+        return round(float(value), 2)
+    if not value:
+        return None
+    text = str(value).strip().replace(' ', '')
+    if _ID_THOUSANDS.match(text):
+        text = text.replace('.', '').replace(',', '.')
+    else:
+        text = text.replace(',', '')
+    try:
+        return round(float(text), 2)
+    except ValueError:
+        return None
+
+
+def coretax_records(path, company):
+    """processCoretaxData: skip header rows and HERMED vendors, keep rows with a faktur number."""
+    for index, row in enumerate(iter_rows(path)):
+        if index < CORETAX_HEADER_ROWS[company]:
+            continue
+        if 'HERMED' in str(_col(row, 0)).upper():
+            continue
+        last8 = last8_digits(_col(row, 2))
+        if not last8:
+            continue
+        yield {
+            'company': company,
+            'vendorName': _col(row, 0),
+            'npwp': _col(row, 1),
+            'fakturPajak': _col(row, 2),
+            'date': _col(row, 3),
+            'masaPajak': _col(row, 4),
+            'tahun': _col(row, 5),
+            'hargaDPP': _col(row, 9, 0),
+            'dppNilaiLain': _col(row, 10, 0),
+            'ppn': _col(row, 11, 0),
+            'kodeDiganti': _col(row, 13),
+            'last8Digits': last8,
+        }
+
+
+def invoice_rows(path):
+    """processInvoiceData, as compact tuples: (last8, amount, INVOICE_FIELDS values...)."""
+    for index, row in enumerate(iter_rows(path)):
+        if index < INVOICE_HEADER_ROWS:
+            continue
+        last8 = last8_digits(_col(row, 10))
+        if not last8:
+            continue
+        tax = _col(row, 17)
+        yield (last8, parse_amount(tax),
+               _col(row, 0), _col(row, 1), _col(row, 8), _col(row, 9), _col(row, 10),
+               _col(row, 13), _col(row, 14), tax)
+
+
+# ── matching ───────────────────────────────────────────────────────────────
+
+class InvoiceIndex:
+    """Hash indexes on faktur number and on (faktur number, tax amount)."""
+
+    def __init__(self):
+        self.by_number = {}
+        self.by_number_amount = {}
+        self.count = 0
+
+    def add(self, row):
+        # Later invoices win, as Map.set did in the browser
+        self.by_number[row[0]] = row
+        if row[1] is not None:
+            self.by_number_amount[(row[0], row[1])] = row
+        self.count += 1
+
+    def match(self, record):
+        """(invoice dict or None, amount_match)"""
+        row = self.by_number_amount.get((record['last8Digits'], parse_amount(record['ppn'])))
+        amount_match = row is not None
+        if row is None:
+            row = self.by_number.get(record['last8Digits'])
+        if row is None:
+            return None, False
+        return dict(zip(INVOICE_FIELDS, row[2:])), amount_match
+
+
+def run_matching(coretax_files, invoice_paths, out_dir, progress=None):
+    """
+    Match Coretax exports against invoice exports; results go to
+    out_dir/results.db and the summary (also returned) to out_dir/summary.json.
+    coretax_files: [(company, path)]; progress: callback taking counters
+    (invoices_read, coretax_read, matched, unmatched).
+    """
+    if progress is None:
+        progress = lambda **counters: None
+    started = time.time()
+
+    index = InvoiceIndex()
+    for path in invoice_paths:
+        for row in invoice_rows(path):
+            index.add(row)
+            if index.count % 10000 == 0:
+                progress(invoices_read=index.count)
+    progress(invoices_read=index.count)
+    indexed = time.time()
+
+    stats = {company: {'total': 0, 'matched': 0, 'unmatched': 0, 'amount_matched': 0} for company in COMPANIES}
+    seq = {kind: 0 for kind in KINDS}
+    batch = []
+    with ResultWriter(out_dir) as writer:
+        for company, path in coretax_files:
+            for record in coretax_records(path, company):
+                invoice, amount_match = index.match(record)
+                company_stats = stats[company]
+                company_stats['total'] += 1
+                if invoice is not None:
+                    kind = 'matched'
+                    record['matchingInvoice'] = invoice
+                    record['amountMatch'] = amount_match
+                    company_stats['amount_matched'] += amount_match
+                else:
+                    kind = 'unmatched'
+                company_stats[kind] += 1
+                seq[kind] += 1
+                batch.append((kind, seq[kind], company, company_stats[kind], json.dumps(record, default=str)))
+                if len(batch) >= WRITE_BATCH:
+                    writer.write(batch)
+                    batch = []
+                    progress(coretax_read=seq['matched'] + seq['unmatched'],
+                             matched=seq['matched'], unmatched=seq['unmatched'])
+        writer.write(batch)
+    progress(coretax_read=seq['matched'] + seq['unmatched'], matched=seq['matched'], unmatched=seq['unmatched'])
+
+    total = seq['matched'] + seq['unmatched']
+    summary = {
+        'total': total,
+        'matched': seq['matched'],
+        'unmatched': seq['unmatched'],
+        'match_rate': round(seq['matched'] / total * 100, 2) if total else 0.0,
+        'invoices': index.count,
+        'companies': stats,
+        'timings': {'index_seconds': round(indexed - started, 3),
+                    'match_seconds': round(time.time() - indexed, 3)},
+    }
+    with open(os.path.join(out_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f)
+    return summary
+
+
+# ── results ────────────────────────────────────────────────────────────────
+
+class ResultWriter:
+    """Bulk inserts into results.db in one transaction."""
+
+    def __init__(self, out_dir):
+        self.db = sqlite3.connect(os.path.join(out_dir, 'results.db'), isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=OFF')
+        self.db.execute('PRAGMA synchronous=OFF')
+        self.db.executescript(SCHEMA)
+        self.db.execute('BEGIN')
+
+    def write(self, rows):
+        if rows:
+            self.db.executemany('INSERT INTO records (kind, seq, company, company_seq, data) VALUES (?, ?, ?, ?, ?)',
+                                rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        self.db.close()
+
+
+class MatchResults:
+    """Read side of a finished run's directory."""
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        with open(os.path.join(out_dir, 'summary.json')) as f:
+            self.summary = json.load(f)
+
+    def _connect(self):
+        db = sqlite3.connect(f"file:{os.path.join(self.out_dir, 'results.db')}?mode=ro", uri=True)
+        return db
+
+    def count(self, kind, company=None):
+        if company:
+            return self.summary['companies'].get(company, {}).get(kind, 0)
+        return self.summary[kind]
+
+    def page(self, kind, company=None, page=1, page_size=100):
+        """One page of records; pages are 1-based and resolved by key range."""
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        page = max(1, page)
+        first = (page - 1) * page_size + 1
+        last = first + page_size - 1
+        db = self._connect()
+        try:
+            if company:
+                rows = db.execute('SELECT data FROM records WHERE kind = ? AND company = ? '
+                                  'AND company_seq BETWEEN ? AND ? ORDER BY company_seq',
+                                  (kind, company, first, last)).fetchall()
+            else:
+                rows = db.execute('SELECT data FROM records WHERE kind = ? AND seq BETWEEN ? AND ? ORDER BY seq',
+                                  (kind, first, last)).fetchall()
+        finally:
+            db.close()
+        total = self.count(kind, company)
+        return {
+            'kind': kind,
+            'company': company,
+            'page': page,
+            'page_size': page_size,
+            'total': total,
+            'pages': (total + page_size - 1) // page_size,
+            'items': [json.loads(r[0]) for r in rows],
+        }
+
+    def iter_records(self, kind, company=None):
+        db = self._connect()
+        try:
+            if company:
+                cursor = db.execute('SELECT data FROM records WHERE kind = ? AND company = ? ORDER BY company_seq',
+                                    (kind, company))
+            else:
+                cursor = db.execute('SELECT data FROM records WHERE kind = ? ORDER BY seq', (kind,))
+            for (data,) in cursor:
+                yield json.loads(data)
+        finally:
+            db.close()
+
+    def export_rows(self, kind, company=None):
+        """Header row, then one row per record, with the browser export's columns."""
+        columns = CORETAX_EXPORT_COLUMNS + (INVOICE_EXPORT_COLUMNS if kind == 'matched' else [])
+        yield [title for title, _ in columns] + ([] if kind == 'matched' else ['Status'])
+        for record in self.iter_records(kind, company):
+            invoice = record.get('matchingInvoice') or {}
+            row = [record.get(key, '') for _, key in CORETAX_EXPORT_COLUMNS]
+            if kind == 'matched':
+                row += [invoice.get(key) or '' for _, key in INVOICE_EXPORT_COLUMNS]
+            else:
+                row.append('Unmatched - Requires Follow-up')
+            yield row
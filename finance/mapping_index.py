@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Supplier / company mapping index shared by the finance splitter backends.
+A mapping workbook (Column A = Supplier or Company, Column B = WA group or
+email) is parsed once and cached by the SHA-256 of its content, so the same
+file uploaded again is not re-read.
+
+lookup() resolves a recipient only by
+  exact       the raw key (plus the part after ' - ' and a whitespace-
+              collapsed copy, as the splitters always stored)
+  normalized  case, punctuation, accents, leading supplier codes and
+              Tbk / Persero ignored; the legal form (PT, CV, ...) is kept,
+              so 'PT X' and 'CV X' stay different companies. A side that
+              names no form matches the other unless that is ambiguous.
+and reports which strategy matched. The best trigram (Dice) similarity on
+the normalized key, if it reaches MAPPING_FUZZY_THRESHOLD, is not a tie and
+has the same numbers, is only returned as a suggestion: near-identical
+names are often different companies ('MITRA SEHAT' / 'MITRA SEHATI'), so
+the user has to confirm it before anything is sent there.
+"""
+
+import hashlib
+import heapq
+import io
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+
+import openpyxl
+
+MAPPING_FUZZY_THRESHOLD = float(os.getenv('MAPPING_FUZZY_THRESHOLD', '0.8'))
+MAPPING_CACHE_SIZE = int(os.getenv('MAPPING_CACHE_SIZE', '16'))
+
+_SUPPLIER_CODE = re.compile(r'^\s*\d{3,}\s*-\s*')  # '0000000008 - PT. X'
+_BRACKETED_CODE = re.compile(r'\(\s*\d+\s*\)')  # 'PT. X (10023)'
+_DOTTED_PT = re.compile(r'\bP\s*\.\s*T\s*\.', re.I)  # 'P.T.'
+_PUNCTUATION = re.compile(r'[\W_]+')
+_LEGAL_PREFIX = re.compile(r'^(?:PT|CV|UD|PD|FA)\s+')
+_LEGAL_SUFFIX = re.compile(r'\s+(TBK|PERSERO)$')
+_NUMBERS = re.compile(r'\d+')
+
+
+def normalize_key(text):
+    """
+    'PT. Indocore Perkasa, Tbk' / '0000000008 - PT INDOCORE PERKASA' ->
+    'PT INDOCORE PERKASA'
+    """
+    if text is None:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = _SUPPLIER_CODE.sub('', text)
+    text = _BRACKETED_CODE.sub(' ', text)
+    text = _DOTTED_PT.sub('PT ', text)
+    text = _PUNCTUATION.sub(' ', text).upper().strip()
+    text = _LEGAL_SUFFIX.sub('', text)
+    return text
+
+
+def strip_legal_form(norm):
+    """'PT INDOCORE PERKASA' -> 'INDOCORE PERKASA' (normalized keys only)."""
+    return _LEGAL_PREFIX.sub('', norm)
+
+
+def _trigrams(key):
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MappingIndex:
+    """
+    Built from (key, target) pairs. Normalized keys that map to different
+    targets are ambiguous and only ever matched exactly; so are names
+    without their legal form when 'PT X' and 'CV X' map to different targets.
+    """
+
+    def __init__(self, entries=()):
+        self.exact = {}
+        self.normalized = {}
+        self.bare = {}   # normalized key without its legal form → target
+        self._ambiguous = set()
+        self._ambiguous_bare = set()
+        for key, target in entries:
+            self._add(key, target)
+        self._build_trigrams()
+
+    @staticmethod
+    def _index(table, ambiguous, key, target):
+        if not key or key in ambiguous:
+            return
+        if key in table and table[key] != target:
+            del table[key]
+            ambiguous.add(key)
+        else:
+            table[key] = target
+
+    def _add(self, key, target):
+        key = str(key).strip()
+        self.exact[key] = target
+        # In case the mapping file has format: 0000000008 - PT. INDOCORE PERKASA
+        if ' - ' in key:
+            self.exact[key.split(' - ', 1)[1].strip()] = target
+        self.exact[' '.join(key.split())] = target
+
+        norm = normalize_key(key)
+        self._index(self.normalized, self._ambiguous, norm, target)
+        self._index(self.bare, self._ambiguous_bare, strip_legal_form(norm), target)
+
+    def _build_trigrams(self):
+        self._postings = {}
+        self._sizes = {}
+        self._numbers = {}
+        for norm in self.normalized:
+            grams = _trigrams(norm)
+            self._sizes[norm] = len(grams)
+            self._numbers[norm] = _NUMBERS.findall(norm)
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(norm)
+
+    def __len__(self):
+        return len(self.exact)
+
+    def lookup(self, *candidates, threshold=MAPPING_FUZZY_THRESHOLD):
+        """
+        Resolve the first candidate spelling that matches.
+        Returns (target, match) where match is
+          {'strategy': 'exact'|'normalized'|None, 'key': ..., 'score': ...}
+        With no match, target is None and match may carry
+          'suggestion': {'key', 'target', 'score'}   (fuzzy; to be confirmed by the user)
+        """
+        candidates = [str(c).strip() for c in candidates if c]
+        for candidate in candidates:
+            if candidate in self.exact:
+                return self.exact[candidate], {'strategy': 'exact', 'key': candidate, 'score': 1.0}
+
+        normalized = [normalize_key(c) for c in candidates]
+        for norm in normalized:
+            target, key = self._normalized(norm)
+            if target is not None:
+                return target, {'strategy': 'normalized', 'key': key, 'score': 1.0}
+
+        miss = {'strategy': None, 'key': None, 'score': 0.0}
+        best = None
+        for norm in normalized:
+            match = self._fuzzy(norm, threshold)
+            if match and (best is None or match[1] > best[1]):
+                best = match
+        if best:
+            key, score = best
+            miss['suggestion'] = {'key': key, 'target': self.normalized[key], 'score': round(score, 3)}
+        return None, miss
+
+    def _normalized(self, norm):
+        """(target, key) for a normalized candidate, or (None, None)."""
+        if norm in self.normalized:
+            return self.normalized[norm], norm
+        bare = strip_legal_form(norm)
+        if bare != norm:
+            # 'PT X' against a mapping row that names no form ('X')
+            if bare in self.normalized:
+                return self.normalized[bare], bare
+        elif bare in self.bare:
+            # 'X' against 'PT X' (only when no other form of X maps elsewhere)
+            return self.bare[bare], bare
+        return None, None
+
+    def _fuzzy(self, norm, threshold):
+        """Best (key, Dice score) above threshold, or None when nothing or a tie qualifies."""
+        if not norm:
+            return None
+        grams = _trigrams(norm)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))  # counted in C
+        # Numbers tell suppliers apart ('APOTEK 2' vs 'APOTEK 3'); they must agree
+        numbers = _NUMBERS.findall(norm)
+        scored = heapq.nlargest(2, ((2.0 * n / (len(grams) + self._sizes[key]), key)
+                                    for key, n in shared.items()
+                                    if self._numbers[key] == numbers))
+        if not scored or scored[0][0] < threshold:
+            return None
+        if len(scored) > 1 and scored[1][0] == scored[0][0] \
+                and self.normalized[scored[1][1]] != self.normalized[scored[0][1]]:
+            return None
+        return scored[0][1], scored[0][0]
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def read_mapping_rows(data):
+    """(key, target) pairs from a mapping workbook: Column A / Column B, header skipped."""
+    wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        for row in wb.active.iter_rows(min_row=2, max_col=2, values_only=True):
+            if len(row) >= 2 and row[0] and row[1]:
+                yield str(row[0]).strip(), str(row[1]).strip()
+    finally:
+        wb.close()
+
+
+def load_mapping_index(path, label):
+    """
+    MappingIndex for a mapping workbook, reusing the cached index when a file
+    with the same content was loaded before.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        with _cache_lock:
+            if digest in _cache:
+                _cache.move_to_end(digest)
+                return _cache[digest]
+        index = MappingIndex(read_mapping_rows(data))
+    except Exception as e:
+        raise ValueError(f"Error reading {label} mapping: {str(e)}")
+
+    with _cache_lock:
+        _cache[digest] = index
+        while len(_cache) > MAPPING_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
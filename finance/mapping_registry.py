@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Server-side registry of WA-group / email mapping files.
+A mapping workbook is uploaded once to /api/mappings, parsed into rows and
+stored as a numbered version in a local SQLite database. Split requests then
+pass wa_mapping_id / email_mapping_id (a version id, or 'latest') instead of
+re-uploading the workbook, so no Excel parsing happens on the split path.
+Indexes are built from the stored rows on first use and kept in memory,
+the MAPPING_CACHE_SIZE most recently used ones.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from mapping_index import MAPPING_CACHE_SIZE, MappingIndex, load_mapping_index, read_mapping_rows
+
+MAPPING_REGISTRY_DIR = os.getenv('MAPPING_REGISTRY_DIR', os.path.dirname(os.path.abspath(__file__)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mapping_versions (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,          -- wa / email
+    version     INTEGER NOT NULL,       -- 1, 2, ... per kind
+    name        TEXT NOT NULL,          -- uploaded filename
+    sha256      TEXT NOT NULL,
+    rows        INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    UNIQUE (kind, version),
+    UNIQUE (kind, sha256)
+);
+CREATE TABLE IF NOT EXISTS mapping_rows (
+    version_id  TEXT NOT NULL,
+    position    INTEGER NOT NULL,
+    key         TEXT NOT NULL,
+    target      TEXT NOT NULL,
+    PRIMARY KEY (version_id, position)
+);
+"""
+
+
+class MappingRegistry:
+    """Versioned mapping files for one splitter service, per kind ('wa', 'email')."""
+
+    def __init__(self, namespace, kinds, directory=MAPPING_REGISTRY_DIR, max_indexes=MAPPING_CACHE_SIZE):
+        self.kinds = set(kinds)
+        self.path = os.path.join(directory, f'mapping_registry_{namespace}.db')
+        self.max_indexes = max_indexes
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()  # version id -> MappingIndex, least recently used first
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+        # Warm the newest version of each kind so the first split doesn't build it
+        for kind in self.kinds:
+            try:
+                self.resolve(kind, 'latest')
+            except KeyError:
+                pass
+
+    def register(self, kind, name, data):
+        """
+        Store a mapping workbook as the newest version of `kind`.
+        Returns (version, created); uploading identical content again returns
+        the existing version with created=False.
+        """
+        self._check_kind(kind)
+        digest = hashlib.sha256(data).hexdigest()
+        existing = self._fetch_one('SELECT * FROM mapping_versions WHERE kind = ? AND sha256 = ?', (kind, digest))
+        if existing:
+            return existing, False
+
+        try:
+            rows = list(read_mapping_rows(data))
+        except Exception as e:
+            raise ValueError(f"Error reading {kind} mapping: {str(e)}")
+        if not rows:
+            raise ValueError(f"{kind} mapping has no rows (Column A = key, Column B = target, row 1 = header)")
+
+        version_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                number = self._db.execute('SELECT COALESCE(MAX(version), 0) + 1 FROM mapping_versions WHERE kind = ?',
+                                          (kind,)).fetchone()[0]
+                self._db.execute(
+                    'INSERT INTO mapping_versions (id, kind, version, name, sha256, rows, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (version_id, kind, number, name, digest, len(rows), time.time()))
+                self._db.executemany(
+                    'INSERT INTO mapping_rows (version_id, position, key, target) VALUES (?, ?, ?, ?)',
+                    [(version_id, i, key, target) for i, (key, target) in enumerate(rows)])
+                self._db.execute('COMMIT')
+                created = True
+            except sqlite3.IntegrityError:
+                # The same file was registered concurrently (e.g. a double-click)
+                self._db.execute('ROLLBACK')
+                created = False
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+            if created:
+                self._remember(version_id, MappingIndex(rows))
+        if not created:
+            return self._fetch_one('SELECT * FROM mapping_versions WHERE kind = ? AND sha256 = ?', (kind, digest)), False
+        return self.version(version_id), True
+
+    def version(self, version_id):
+        """Metadata of one version, or None."""
+        return self._fetch_one('SELECT * FROM mapping_versions WHERE id = ?', (version_id,))
+
+    def versions(self, kind=None):
+        """Metadata of all versions, newest first."""
+        if kind:
+            self._check_kind(kind)
+            rows = self._fetch_all('SELECT * FROM mapping_versions WHERE kind = ? ORDER BY version DESC', (kind,))
+        else:
+            rows = self._fetch_all('SELECT * FROM mapping_versions ORDER BY kind, version DESC', ())
+        return rows
+
+    def resolve(self, kind, ref):
+        """
+        (version, MappingIndex) for a version id or 'latest'.
+        Raises KeyError if there is no such version of this kind.
+        """
+        self._check_kind(kind)
+        if ref == 'latest':
+            meta = self._fetch_one('SELECT * FROM mapping_versions WHERE kind = ? ORDER BY version DESC LIMIT 1',
+                                   (kind,))
+        else:
+            meta = self.version(ref)
+        if meta is None or meta['kind'] != kind:
+            raise KeyError(f"No {kind} mapping version '{ref}'")
+        return meta, self._index(meta['id'])
+
+    def _index(self, version_id):
+        with self._lock:
+            index = self._indexes.get(version_id)
+            if index is not None:
+                self._indexes.move_to_end(version_id)
+                return index
+            rows = self._db.execute('SELECT key, target FROM mapping_rows WHERE version_id = ? ORDER BY position',
+                                    (version_id,)).fetchall()
+            index = MappingIndex((r['key'], r['target']) for r in rows)
+            self._remember(version_id, index)
+        return index
+
+    def _remember(self, version_id, index):
+        """Cache an index (lock held), dropping the least recently used past max_indexes."""
+        self._indexes[version_id] = index
+        while len(self._indexes) > self.max_indexes:
+            self._indexes.popitem(last=False)
+
+    def _check_kind(self, kind):
+        if kind not in self.kinds:
+            raise ValueError(f"Unknown mapping kind '{kind}' (expected one of: {', '.join(sorted(self.kinds))})")
+
+    def _fetch_one(self, sql, params):
+        rows = self._fetch_all(sql, params)
+        return rows[0] if rows else None
+
+    def _fetch_all(self, sql, params):
+        with self._lock:
+            return [dict(r) for r in self._db.execute(sql, params).fetchall()]
+
+
+def load_mapping(source, label):
+    """
+    MappingIndex for a split job's mapping source: None (no mapping), a
+    (version, MappingIndex) pair from MappingRegistry.resolve, or the path of
+    an uploaded workbook. Returns (index, version id or None).
+    """
+    if source is None:
+        return MappingIndex(), None
+    if isinstance(source, tuple):
+        meta, index = source
+        return index, meta['id']
+    return load_mapping_index(source, label), None
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Payment Analysis Backend API
+Ingests the invoice + payment exports of payment-analysis.html once, keeps
+pre-aggregated cubes (supplier x month x status, outlet x week) and answers
+dashboard, filter and drill-down queries from them. New exports are appended
+to a dataset incrementally instead of re-processing everything.
+"""
+
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+import os
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from split_jobs import JobQueue, QueueFullError
+from artifact_store import ArtifactStore
+from payment_analysis import CUBES, RECORD_FILTERS, PaymentAnalysis
+from upload_cache import upload_cache
+
+app = Flask(__name__)
+CORS(app)
+
+# Datasets (facts.json + payments.json), addressed by dataset id (ARTIFACT_TTL / ARTIFACT_MAX_BYTES);
+# every append re-accounts the dataset and restarts its TTL (artifacts.touch)
+artifacts = ArtifactStore('payment-analysis')
+
+# Worker pool for ingest / append jobs (SPLIT_WORKERS / SPLIT_QUEUE_SIZE)
+analysis_jobs = JobQueue()
+
+# .xls is not read by the shared upload cache (openpyxl), so it is refused up front
+UPLOAD_EXTENSIONS = ('.xlsx', '.csv')
+
+# Datasets kept in memory with their cubes (PAYMENT_ANALYSIS_DATASETS most recently used)
+MAX_LOADED = int(os.getenv('PAYMENT_ANALYSIS_DATASETS', '4'))
+loaded = OrderedDict()
+loaded_lock = threading.Lock()
+
+# One lock per dataset while anyone holds it: a load from disk and an append + save run under it
+dataset_locks = weakref.WeakValueDictionary()
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint."""
+    return jsonify({'status': 'healthy', 'service': 'Payment Analysis API', 'artifacts': artifacts.stats(),
+                    'upload_cache': upload_cache().stats(), 'datasets_loaded': len(loaded)}), 200
+
+
+def save_upload(file):
+    """Save an uploaded file to a temp path, keeping its extension (.xlsx / .csv)."""
+    extension = os.path.splitext(file.filename)[1].lower()
+    temp = tempfile.NamedTemporaryFile(delete=False, suffix=extension)
+    file.save(temp.name)
+    temp.close()
+    return temp.name
+
+
+def remember(dataset_id, analysis):
+    with loaded_lock:
+        loaded[dataset_id] = analysis
+        loaded.move_to_end(dataset_id)
+        while len(loaded) > MAX_LOADED:
+            loaded.popitem(last=False)
+
+
+def dataset_lock(dataset_id):
+    with loaded_lock:
+        lock = dataset_locks.get(dataset_id)
+        if lock is None:
+            lock = dataset_locks[dataset_id] = threading.RLock()
+        return lock
+
+
+def load_dataset(dataset_id):
+    """PaymentAnalysis of a dataset (from memory, else rebuilt from its files), or None if unknown / expired."""
+    if artifacts.directory(dataset_id) is None:
+        # Evicted from the store: don't keep answering from the in-memory copy
+        with loaded_lock:
+            loaded.pop(dataset_id, None)
+        return None
+    with loaded_lock:
+        analysis = loaded.get(dataset_id)
+        if analysis is not None:
+            loaded.move_to_end(dataset_id)
+            return analysis
+    # Concurrent loads of the same dataset must end up with one instance, or
+    # an append to one of them would be lost when the other is saved
+    with dataset_lock(dataset_id):
+        with loaded_lock:
+            analysis = loaded.get(dataset_id)
+        if analysis is not None:
+            return analysis
+        directory = artifacts.directory(dataset_id)
+        if directory is None or not os.path.exists(os.path.join(directory, 'facts.json')):
+            return None
+        analysis = PaymentAnalysis.load(directory)
+        remember(dataset_id, analysis)
+        return analysis
+
+
+def run_ingest(job, invoice_path, payment_path):
+    """Job body: parse both exports, build the cubes and persist the dataset."""
+    dataset_id, directory = artifacts.create()
+    try:
+        analysis = PaymentAnalysis.from_files(invoice_path, payment_path)
+    finally:
+        os.unlink(invoice_path)
+        os.unlink(payment_path)
+    job.update(invoices=len(analysis.facts), payments=len(analysis.payments))
+    for filename in analysis.save(directory):
+        artifacts.add_file(dataset_id, filename)
+    artifacts.commit(dataset_id)
+    remember(dataset_id, analysis)
+    return {'success': True, 'dataset_id': dataset_id, 'summary': analysis.summary()}
+
+
+def run_append(job, dataset_id, invoice_path, payment_path):
+    """Job body: merge new exports into a dataset and re-save it (one append per dataset at a time)."""
+    try:
+        with dataset_lock(dataset_id):
+            analysis = load_dataset(dataset_id)
+            if analysis is None:
+                raise ValueError('Dataset not found or expired')
+            delta = analysis.append(invoice_path, payment_path)
+            directory = artifacts.directory(dataset_id)
+            if directory is None:
+                raise ValueError('Dataset expired while appending')
+            analysis.save(directory)
+            artifacts.touch(dataset_id)
+    finally:
+        for path in (invoice_path, payment_path):
+            if path:
+                os.unlink(path)
+    job.update(**delta)
+    return {'success': True, 'dataset_id': dataset_id, 'delta': delta, 'summary': analysis.summary()}
+
+
+def uploads(*fields):
+    """Uploaded files for `fields` (None when missing); ValueError on unsupported types."""
+    files = [request.files.get(field) for field in fields]
+    files = [f if f and f.filename else None for f in files]
+    for f in files:
+        if f and not f.filename.lower().endswith(UPLOAD_EXTENSIONS):
+            raise ValueError(f"Unsupported file type: {f.filename} (expected .xlsx or .csv)")
+    return files
+
+
+@app.route('/api/payment-analysis', methods=['POST'])
+def ingest():
+    """
+    Queue a new dataset and return a job id (202).
+    Form fields: invoice (invoice export) and payment (payment export), .xlsx or .csv.
+    The finished job's result holds dataset_id and the dashboard summary.
+    """
+    try:
+        try:
+            invoice, payment = uploads('invoice', 'payment')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not invoice or not payment:
+            return jsonify({'error': 'Upload both the invoice file (invoice) and the payment file (payment)'}), 400
+
+        invoice_path, payment_path = save_upload(invoice), save_upload(payment)
+        try:
+            job = analysis_jobs.submit('payment-analysis', run_ingest, invoice_path, payment_path)
+        except QueueFullError as e:
+            os.unlink(invoice_path)
+            os.unlink(payment_path)
+            return jsonify({'error': str(e)}), 503
+
+        return jsonify({'success': True, 'job_id': job.id, 'status': job.status}), 202
+
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"Error in ingest: {error_trace}")
+        return jsonify({'error': str(e), 'trace': error_trace}), 500
+
+
+@app.route('/api/payment-analysis/<dataset_id>/append', methods=['POST'])
+def append(dataset_id):
+    """
+    Append a new invoice and/or payment export to a dataset (202 + job id).
+    Re-exported invoices replace their earlier row; only the affected
+    invoices are re-aggregated.
+    """
+    try:
+        if artifacts.directory(dataset_id) is None:
+            return jsonify({'error': 'Dataset not found'}), 404
+        try:
+            invoice, payment = uploads('invoice', 'payment')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not invoice and not payment:
+            return jsonify({'error': 'Upload an invoice file (invoice) and/or a payment file (payment)'}), 400
+
+        invoice_path = save_upload(invoice) if invoice else None
+        payment_path = save_upload(payment) if payment else None
+        try:
+            job = analysis_jobs.submit('payment-analysis-append', run_append, dataset_id, invoice_path, payment_path)
+        except QueueFullError as e:
+            for path in (invoice_path, payment_path):
+                if path:
+                    os.unlink(path)
+            return jsonify({'error': str(e)}), 503
+
+        return jsonify({'success': True, 'job_id': job.id, 'status': job.status}), 202
+
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"Error in append: {error_trace}")
+        return jsonify({'error': str(e), 'trace': error_trace}), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report job status, progress counters and (when done) the result."""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+
+def filter_args(names):
+    """{dimension: [values]} from comma-separated query arguments (e.g. status=Incomplete,Complete)."""
+    return {name: request.args[name].split(',') for name in names if request.args.get(name)}
+
+
+@app.route('/api/payment-analysis/<dataset_id>/summary', methods=['GET'])
+def dataset_summary(dataset_id):
+    """Dashboard statistics, status counts and the values of every dimension."""
+    analysis = load_dataset(dataset_id)
+    if analysis is None:
+        return jsonify({'error': 'Dataset not found'}), 404
+    return jsonify({'dataset_id': dataset_id, 'summary': analysis.summary()}), 200
+
+
+@app.route('/api/payment-analysis/<dataset_id>/cube/<cube>', methods=['GET'])
+def dataset_cube(dataset_id, cube):
+    """
+    Aggregate a cube.
+    Query: one comma-separated filter per dimension (supplier, month, status
+    or outlet, week) and group_by=<dims> (default all dimensions of the cube).
+    """
+    if cube not in CUBES:
+        return jsonify({'error': 'Not found'}), 404
+    analysis = load_dataset(dataset_id)
+    if analysis is None:
+        return jsonify({'error': 'Dataset not found'}), 404
+    group_by = request.args.get('group_by')
+    group_by = [d for d in group_by.split(',') if d] if group_by is not None else None
+    try:
+        result = analysis.query(cube, filter_args(CUBES[cube]), group_by)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'dataset_id': dataset_id, **result}), 200
+
+
+@app.route('/api/payment-analysis/<dataset_id>/records', methods=['GET'])
+def dataset_records(dataset_id):
+    """
+    Drill-down: one page of the invoices behind a filter.
+    Query: supplier, month, status, outlet, week, company, paymentStatus,
+    slaCategory (comma-separated), page (1-based), page_size (max 1000, default 100).
+    """
+    analysis = load_dataset(dataset_id)
+    if analysis is None:
+        return jsonify({'error': 'Dataset not found'}), 404
+    try:
+        page = int(request.args.get('page', '1'))
+        page_size = int(request.args.get('page_size', '100'))
+    except ValueError:
+        return jsonify({'error': 'page and page_size must be integers'}), 400
+    return jsonify({'dataset_id': dataset_id, **analysis.records(filter_args(RECORD_FILTERS), page, page_size)}), 200
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Payment Analysis API Server Starting...")
+    print("=" * 60)
+    print("Endpoints:")
+    print("  POST /api/payment-analysis - Queue invoice + payment exports (returns job id)")
+    print("  POST /api/payment-analysis/<dataset_id>/append - Append new exports incrementally")
+    print("  GET  /api/jobs/<job_id> - Job progress and result")
+    print("  GET  /api/payment-analysis/<dataset_id>/summary - Dashboard statistics")
+    print("  GET  /api/payment-analysis/<dataset_id>/cube/<cube> - Filter / group a cube")
+    print("  GET  /api/payment-analysis/<dataset_id>/records - Drill-down page of invoices")
+    print("  GET  /health - Health check")
+    print("=" * 60)
+    app.run(host='0.0.0.0', port=5005, debug=True)
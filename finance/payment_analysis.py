@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Payment analysis engine behind payment-analyzer.py.
+Implements the rules of payment-analysis.html (processInvoiceData,
+processPaymentData, matchInvoicePayments, generateDashboard) once per
+export, and keeps the result as pre-aggregated cubes so filter and
+drill-down queries never rescan the invoices:
+
+  supplier_month_status  supplier x month (of Create Date) x status
+  outlet_week            outlet (store) x week (Monday of Create Date)
+
+Every cube cell holds the dashboard measures (MEASURES). Appending a new
+export only re-aggregates the invoices it touches: their old contribution
+is subtracted from the cubes and the new one added.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from upload_cache import load_upload
+
+# processInvoiceData(): header on row 5, data from row 6
+INVOICE_FIRST_ROW = 5
+INVOICE_COLUMNS = {
+    'company': 0, 'store': 1, 'matchNo': 2, 'supplier': 3, 'status': 6,
+    'createDate': 7, 'confirmDate': 8, 'invoiceNumber': 9, 'fakturPajak': 10,
+    'receivingNumber': 14, 'toleranceAmount': 19,
+}
+SKIPPED_SUPPLIER = '0000000016 - PT HERMED'
+NO_SLA_SUPPLIER = '0000000004 - PT. CENTURY FRANCHISINDO UTAMA'
+TOLERANCE_LIMIT = 1000
+
+_RECEIVING = re.compile(r'Number\s+(\d+)', re.I)
+
+CUBES = {
+    'supplier_month_status': ('supplier', 'month', 'status'),
+    'outlet_week': ('outlet', 'week'),
+}
+MEASURES = ('invoices', 'incomplete', 'paid', 'belumDilanjut', 'toleranceIssues', 'slaGreen',
+            'slaYellow', 'slaRed', 'slaNA', 'completionDays', 'completionCount', 'toleranceAmount')
+RECORD_FILTERS = ('supplier', 'month', 'status', 'outlet', 'week', 'company', 'paymentStatus', 'slaCategory')
+RECORD_COLUMNS = ('company', 'store', 'matchNo', 'supplier', 'status', 'createDate', 'confirmDate',
+                  'invoiceNumber', 'fakturPajak', 'receivingNumber', 'toleranceAmount', 'completionDays',
+                  'slaCategory', 'paymentStatus', 'paymentReference')
+MAX_PAGE_SIZE = 1000
+
+
+# ── reading ────────────────────────────────────────────────────────────────
+
+def _text(value):
+    """Cell as the page's `row[i] || ''` string: integral floats without '.0'."""
+    if value is None or value == '':
+        return ''
+    if isinstance(value, float):
+        if value != value:
+            return ''
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+def iter_sheets(path):
+    """(sheet name, rows) of every sheet of an .xlsx (shared upload cache), or the one sheet of a .csv."""
+    if path.lower().endswith('.csv'):
+        frame = pd.read_csv(path, header=None, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+        yield os.path.basename(path), frame.values.tolist()
+        return
+    upload = load_upload(path)
+    for name in upload.sheetnames:
+        yield name, upload.sheet(name).iter_rows()
+
+
+def read_invoices(path):
+    """
+    Invoice export -> fact frame indexed by receiving number (later rows
+    replace earlier ones, like invoiceData.set), PT HERMED left out.
+    """
+    _, rows = next(iter_sheets(path))
+    width = max(INVOICE_COLUMNS.values()) + 1
+    data = [list(row[:width]) + [None] * (width - len(row)) for i, row in enumerate(rows) if i >= INVOICE_FIRST_ROW]
+    raw = pd.DataFrame(data, columns=range(width), dtype=object) if data else pd.DataFrame(columns=range(width), dtype=object)
+    facts = pd.DataFrame({name: raw[i].map(_text) for name, i in INVOICE_COLUMNS.items()
+                          if name not in ('createDate', 'confirmDate', 'toleranceAmount')})
+    facts = facts[~facts['supplier'].str.contains(SKIPPED_SUPPLIER, regex=False)]
+    raw = raw.loc[facts.index]
+
+    created = _dates(raw[INVOICE_COLUMNS['createDate']])
+    confirmed = _dates(raw[INVOICE_COLUMNS['confirmDate']])
+    facts['createDate'] = raw[INVOICE_COLUMNS['createDate']].map(_text)
+    facts['confirmDate'] = raw[INVOICE_COLUMNS['confirmDate']].map(_text)
+    facts['toleranceAmount'] = pd.to_numeric(raw[INVOICE_COLUMNS['toleranceAmount']].map(_text), errors='coerce').fillna(0.0)
+    facts['outlet'] = facts['store']
+    facts['month'] = created.dt.strftime('%Y-%m').fillna('')
+    facts['week'] = (created.dt.normalize() - pd.to_timedelta(created.dt.weekday, unit='D')).dt.strftime('%Y-%m-%d').fillna('')
+
+    # SLA only for complete invoices with both dates; PT CENTURY is exempt
+    days = np.ceil((confirmed - created).abs() / pd.Timedelta(days=1))
+    dated = facts['status'].ne('Incomplete') & days.notna()
+    exempt = facts['supplier'].str.contains(NO_SLA_SUPPLIER, regex=False)
+    with_sla = dated & ~exempt
+    facts['completionDays'] = days.where(with_sla)
+    facts['slaCategory'] = np.select(
+        [facts['status'].eq('Incomplete') | (dated & exempt), with_sla & (days < 4), with_sla & (days <= 7), with_sla],
+        ['N/A', 'Green', 'Yellow', 'Red'], default='')
+    facts['paymentStatus'] = 'Unpaid'
+    facts['paymentReference'] = ''
+    return facts.drop_duplicates('receivingNumber', keep='last').set_index('receivingNumber', drop=False)
+
+
+def _dates(values):
+    """new Date(...) of the page: datetimes as they are, text parsed, anything else NaT."""
+    texts = values.map(lambda v: v if isinstance(v, str) else (v.isoformat() if hasattr(v, 'isoformat') else None))
+    return pd.to_datetime(texts, errors='coerce', format='mixed')
+
+
+def read_payments(path):
+    """Payment export -> {receiving number: column T}, over every sheet (later sheets win)."""
+    payments = {}
+    for _, rows in iter_sheets(path):
+        for i, row in enumerate(rows):
+            if i == 0 or len(row) < 7:
+                continue
+            match = _RECEIVING.search(_text(row[6]))
+            if match:
+                payments[match.group(1)] = _text(row[19]) if len(row) > 19 else ''
+    return payments
+
+
+# ── measures and cubes ─────────────────────────────────────────────────────
+
+def apply_payments(facts, payments):
+    """matchInvoicePayments(): Paid + reference for receiving numbers found in the payments."""
+    reference = facts['receivingNumber'].map(payments)
+    paid = reference.notna()
+    facts['paymentStatus'] = np.where(paid, 'Paid', 'Unpaid')
+    facts['paymentReference'] = reference.fillna('')
+    return facts
+
+
+def measures(facts):
+    """Per-invoice measure columns (MEASURES) of generateDashboard()."""
+    incomplete = facts['status'].eq('Incomplete')
+    tolerance = facts['toleranceAmount']
+    return pd.DataFrame({
+        'invoices': 1,
+        'incomplete': incomplete.astype(np.int64),
+        'paid': facts['paymentStatus'].eq('Paid').astype(np.int64),
+        'belumDilanjut': (incomplete & facts['fakturPajak'].eq('')).astype(np.int64),
+        'toleranceIssues': (incomplete & facts['fakturPajak'].ne('') & (tolerance.abs() > TOLERANCE_LIMIT)).astype(np.int64),
+        'slaGreen': facts['slaCategory'].eq('Green').astype(np.int64),
+        'slaYellow': facts['slaCategory'].eq('Yellow').astype(np.int64),
+        'slaRed': facts['slaCategory'].eq('Red').astype(np.int64),
+        'slaNA': facts['slaCategory'].eq('N/A').astype(np.int64),
+        'completionDays': facts['completionDays'].fillna(0).astype(np.int64),
+        'completionCount': facts['completionDays'].notna().astype(np.int64),
+        'toleranceAmount': tolerance.astype(np.float64),
+    }, index=facts.index)
+
+
+def aggregate(facts, dims):
+    """Cube cells for `dims`, indexed by the dimension values."""
+    values = measures(facts)
+    for dim in dims:
+        values[dim] = facts[dim]
+    return values.groupby(list(dims), sort=False)[list(MEASURES)].sum()
+
+
+def _derived(row):
+    row['paymentCoverage'] = round(row['paid'] / row['invoices'] * 100) if row['invoices'] else 0
+    row['avgCompletionDays'] = round(row['completionDays'] / row['completionCount'], 2) if row['completionCount'] else None
+    row['toleranceAmount'] = round(row['toleranceAmount'], 2)
+    return row
+
+
+def _int_measures(cube):
+    counts = [m for m in MEASURES if m != 'toleranceAmount']
+    cube[counts] = cube[counts].round().astype(np.int64)
+    return cube
+
+
+def _write_json(path, value):
+    with open(path, 'w') as f:
+        json.dump(value, f)
+
+
+def _replace(path, write):
+    """write(temp path) next to `path`, then atomically rename it into place."""
+    temp = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        write(temp)
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.unlink(temp)
+
+
+# ── dataset ────────────────────────────────────────────────────────────────
+
+class PaymentAnalysis:
+    """
+    Invoice facts, the payment lookup and the cubes built from them.
+    Queries read self.cubes, which append() replaces as a whole, so they
+    need no lock; appends to one dataset are serialized.
+    """
+
+    def __init__(self, facts, payments):
+        self.facts = apply_payments(facts, payments)
+        self.payments = payments
+        self.cubes = {name: aggregate(self.facts, dims) for name, dims in CUBES.items()}
+        self.updated_at = time.time()
+        self.appends = 0
+        self._summary = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_files(cls, invoice_path, payment_path):
+        return cls(read_invoices(invoice_path), read_payments(payment_path))
+
+    def append(self, invoice_path=None, payment_path=None):
+        """
+        Merge a new invoice and/or payment export. Invoices with a receiving
+        number already seen replace the old row; only the replaced, added
+        and newly paid invoices are re-aggregated into the cubes.
+        """
+        started = time.time()
+        with self._lock:
+            new_facts = read_invoices(invoice_path) if invoice_path else self.facts.iloc[:0]
+            new_payments = read_payments(payment_path) if payment_path else {}
+            payments = {**self.payments, **new_payments}
+
+            newly_paid = self.facts.index.intersection(pd.Index(list(new_payments), dtype=object))
+            removed = self.facts.loc[self.facts.index.intersection(new_facts.index).union(newly_paid)]
+            kept = self.facts.drop(new_facts.index, errors='ignore')
+            repaid = apply_payments(kept.loc[newly_paid.difference(new_facts.index)].copy(), payments)
+            added = pd.concat([apply_payments(new_facts.copy(), payments), repaid])
+            facts = kept.copy()
+            facts.loc[repaid.index, ['paymentStatus', 'paymentReference']] = repaid[['paymentStatus', 'paymentReference']]
+            facts = pd.concat([facts, added.loc[new_facts.index]])
+
+            cubes = {}
+            for name, dims in CUBES.items():
+                cube = self.cubes[name].sub(aggregate(removed, dims), fill_value=0).add(aggregate(added, dims), fill_value=0)
+                cubes[name] = _int_measures(cube[cube['invoices'] > 0])
+            self.facts, self.payments, self.cubes = facts, payments, cubes
+            self.updated_at = time.time()
+            self.appends += 1
+        return {
+            'invoicesAdded': len(new_facts.index.difference(removed.index)),
+            'invoicesReplaced': len(new_facts.index.intersection(removed.index)),
+            'newlyPaid': len(repaid),
+            'payments': len(new_payments),
+            'seconds': round(time.time() - started, 3),
+        }
+
+    # ── queries ─────────────────────────────────────────────────────────────
+
+    def query(self, cube, filters=None, group_by=None):
+        """
+        Sum the measures of the cells matching `filters` ({dim: [values]}),
+        grouped by `group_by` (dims of the cube, default all of them).
+        """
+        if cube not in CUBES:
+            raise ValueError(f"Unknown cube '{cube}' (expected one of: {', '.join(CUBES)})")
+        dims = CUBES[cube]
+        group_by = list(group_by or dims)
+        unknown = [d for d in list(filters or {}) + group_by if d not in dims]
+        if unknown:
+            raise ValueError(f"Unknown dimension(s) for {cube}: {', '.join(unknown)} (expected: {', '.join(dims)})")
+        cells = self.cubes[cube]
+        mask = np.ones(len(cells), dtype=bool)
+        for dim, values in (filters or {}).items():
+            mask &= cells.index.get_level_values(dim).isin(values) if len(dims) > 1 else cells.index.isin(values)
+        cells = cells[mask]
+        grouped = cells.groupby(level=group_by, sort=True).sum() if group_by else cells.sum().to_frame().T
+        rows = []
+        for key, values in zip(grouped.index, grouped.to_dict('records')):
+            key = key if isinstance(key, tuple) else (key,)
+            rows.append(_derived({**dict(zip(group_by, key)), **values}))
+        total = _derived({m: (cells[m].sum().item() if len(cells) else 0) for m in MEASURES})
+        return {'cube': cube, 'groupBy': group_by, 'rows': rows, 'total': total}
+
+    def summary(self):
+        """generateDashboard() statistics, status counts and the available dimension values (cached per cube set)."""
+        cubes = self.cubes
+        if self._summary is not None and self._summary[0] is cubes:
+            return self._summary[1]
+        cells = cubes['supplier_month_status']
+        total = _derived({m: (cells[m].sum().item() if len(cells) else 0) for m in MEASURES})
+        status_counts = cells['invoices'].groupby(level='status', sort=False).sum()
+        summary = {
+            'total': total['invoices'],
+            'incomplete': total['incomplete'],
+            'paid': total['paid'],
+            'belumDilanjut': total['belumDilanjut'],
+            'toleranceIssues': total['toleranceIssues'],
+            'slaRed': total['slaRed'],
+            'slaYellow': total['slaYellow'],
+            'slaGreen': total['slaGreen'],
+            'paymentCoverage': total['paymentCoverage'],
+            'paymentRecords': len(self.payments),
+            'statusCounts': {k: int(v) for k, v in status_counts.items()},
+            'dimensions': {dim: sorted(set(cells.index.get_level_values(dim))) for dim in ('supplier', 'month', 'status')}
+                          | {dim: sorted(set(cubes['outlet_week'].index.get_level_values(dim))) for dim in ('outlet', 'week')},
+            'appends': self.appends,
+            'updatedAt': self.updated_at,
+        }
+        self._summary = (cubes, summary)
+        return summary
+
+    def records(self, filters=None, page=1, page_size=100):
+        """Drill-down: one page of the invoices behind a cube cell (any RECORD_FILTERS)."""
+        unknown = [d for d in (filters or {}) if d not in RECORD_FILTERS]
+        if unknown:
+            raise ValueError(f"Unknown filter(s): {', '.join(unknown)} (expected: {', '.join(RECORD_FILTERS)})")
+        page = max(1, page)
+        page_size = min(max(1, page_size), MAX_PAGE_SIZE)
+        facts = self.facts
+        mask = np.ones(len(facts), dtype=bool)
+        for dim, values in (filters or {}).items():
+            mask &= facts[dim].isin(values).to_numpy()
+        matched = facts[mask]
+        rows = matched.iloc[(page - 1) * page_size:page * page_size][list(RECORD_COLUMNS)]
+        rows = rows.astype(object).where(rows.notna(), None)
+        return {
+            'page': page,
+            'page_size': page_size,
+            'total': len(matched),
+            'pages': math.ceil(len(matched) / page_size),
+            'rows': rows.to_dict('records'),
+        }
+
+    # ── persistence ─────────────────────────────────────────────────────────
+
+    def save(self, directory):
+        """
+        facts.json + payments.json; cubes are rebuilt from the facts on load.
+        Plain JSON (columns + dtypes), never pickle: the dataset directory
+        lives under the artifact root and is read back from disk. Each file is
+        written beside its target and renamed over it, so a reader (or a
+        crash) never sees a half-written dataset file.
+        """
+        with self._lock:
+            facts, payments = self.facts, self.payments
+        table = {
+            'dtypes': {name: str(dtype) for name, dtype in facts.dtypes.items()},
+            'columns': {name: column.astype(object).where(column.notna(), None).tolist()
+                        for name, column in facts.items()},
+        }
+        _replace(os.path.join(directory, 'facts.json'), lambda path: _write_json(path, table))
+        _replace(os.path.join(directory, 'payments.json'), lambda path: _write_json(path, payments))
+        return ['facts.json', 'payments.json']
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, 'facts.json')) as f:
+            table = json.load(f)
+        with open(os.path.join(directory, 'payments.json')) as f:
+            payments = json.load(f)
+        facts = pd.DataFrame(table['columns'], columns=list(table['dtypes'])).astype(table['dtypes'])
+        return cls(facts.set_index('receivingNumber', drop=False), payments)
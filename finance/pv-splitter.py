@@ -4,26 +4,34 @@ PV Splitter Backend Service
 Splits Excel files with multiple sheets into individual files
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
-import openpyxl
 from openpyxl.utils import get_column_letter
-import io
-import zipfile
 import os
 import json
 from datetime import datetime
 import tempfile
-import shutil
-import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
+from zip_stream import iter_zip, resolve_zip_mode
+from split_jobs import JobQueue, QueueFullError
+from artifact_store import ArtifactStore
+from bulk_mailer import BulkMailer
+from email_queue import EmailQueue
+from mapping_registry import MappingRegistry, load_mapping
+from pv_split_engine import resolve_split_mode, split_pv_workbook
 
 app = Flask(__name__)
 CORS(app)
 
+# Worker pool for split jobs (SPLIT_WORKERS / SPLIT_QUEUE_SIZE)
+split_jobs = JobQueue()
+
+# Split outputs, addressed by opaque artifact id (ARTIFACT_TTL / ARTIFACT_MAX_BYTES)
+artifacts = ArtifactStore('pv-split')
+
 # Email Configuration
 # These should be set via environment variables or config file
 EMAIL_CONFIG = {
@@ -31,24 +39,83 @@ EMAIL_CONFIG = {
     'smtp_port': int(os.getenv('SMTP_PORT', '587')),
     'sender_email': os.getenv('SENDER_EMAIL', ''),
     'sender_password': os.getenv('SENDER_PASSWORD', ''),
-    'sender_name': os.getenv('SENDER_NAME', 'Apotek Alpro Finance Team')
+    'sender_name': os.getenv('SENDER_NAME', 'Apotek Alpro Finance Team'),
+    'starttls': os.getenv('SMTP_STARTTLS', '1') != '0'
 }
 
+# Reuses authenticated SMTP sessions across messages (MAIL_WORKERS / MAIL_RATE_PER_SEC)
+mailer = BulkMailer(EMAIL_CONFIG)
+
+# Email mapping files uploaded once and referenced by version id (MAPPING_REGISTRY_DIR)
+mappings = MappingRegistry('pv-split', kinds=('email',))
+
+# Durable send queue drained in the background (EMAIL_QUEUE_DIR)
+email_queue = EmailQueue('pv-split', mailer, lambda item: build_email(
+    item['to'], item['subject'], item['body'], item['files'], item['artifact_id']))
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
         'service': 'pv-splitter',
-        'timestamp': datetime.now().isoformat()
+        'timestamp': datetime.now().isoformat(),
+        'artifacts': artifacts.stats()
     })
 
+def split_workbook(input_path, email_mapping, progress, mode=None):
+    """
+    Split every sheet of the workbook into its own file in a new artifact
+    progress: callback taking counters (sheets_total, sheets_written, bytes_written)
+    Sheets are exported in parallel worker processes (PV_SPLIT_PROCESSES)
+    mode: 'openpyxl' or 'package' (copy sheet XML parts directly), default PV_SPLIT_MODE
+    """
+    # Create an artifact directory to store split files
+    artifact_id, temp_dir = artifacts.create()
+    split_files_info = split_pv_workbook(
+        input_path, temp_dir, email_mapping, progress,
+        on_file=lambda filename: artifacts.add_file(artifact_id, filename), mode=mode)
+    return artifact_id, split_files_info
+
+def run_pv_split(job, input_path, email_source, mode=None):
+    """
+    Job body: resolve the email mapping, split sheets, return the result payload
+    email_source is a registry version or an uploaded file path (see load_mapping)
+    """
+    try:
+        # Uploaded workbooks are parsed once per distinct content (MAPPING_CACHE_SIZE)
+        email_mapping, email_version = load_mapping(email_source, 'Email')
+        artifact_id, split_files_info = split_workbook(input_path, email_mapping, job.update, mode)
+    finally:
+        # Clean up uploaded files
+        for path in (input_path, email_source):
+            if isinstance(path, str):
+                os.unlink(path)
+    
+    artifacts.commit(artifact_id)
+    
+    # ZIP is built on the fly when downloaded (see download_zip)
+    zip_filename = f"pv_split_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    
+    # Return file information - files are addressed by artifact id, never by path
+    return {
+        'success': True,
+        'files': split_files_info,
+        'total_files': len(split_files_info),
+        'zip_filename': zip_filename,
+        'artifact_id': artifact_id,
+        'email_mapping_id': email_version
+    }
+
 @app.route('/api/split-excel', methods=['POST'])
 def split_excel():
     """
-    Split an Excel file with multiple sheets into individual files
-    Returns metadata about the split files for download
-    Now supports optional email mapping file (Column A=Company, B=Email)
+    Queue an Excel file with multiple sheets for splitting into individual files
+    Returns a job id (202); poll /api/jobs/<job_id> for progress, the finished
+    job's result holds metadata about the split files for download
+    Supports optional email mapping file (Column A=Company, B=Email), or
+    email_mapping_id: a registered version id or 'latest' (see /api/mappings)
+    Optional split_mode=openpyxl|package field (default PV_SPLIT_MODE)
     """
     try:
         if 'file' not in request.files:
@@ -62,173 +129,39 @@ def split_excel():
         if not file.filename.endswith(('.xlsx', '.xls')):
             return jsonify({'error': 'File must be an Excel file (.xlsx or .xls)'}), 400
         
-        # Read Email mapping (optional)
-        email_mapping = {}
-        if 'email_mapping' in request.files and request.files['email_mapping'].filename != '':
-            email_file = request.files['email_mapping']
-            temp_email = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-            email_file.save(temp_email.name)
-            temp_email.close()
-            
-            try:
-                wb_email = openpyxl.load_workbook(temp_email.name)
-                sheet_email = wb_email.active
-                
-                for row in sheet_email.iter_rows(min_row=2, values_only=True):  # Skip header
-                    if row[0] and row[1]:  # Column A = Company, Column B = Email
-                        company_name = str(row[0]).strip()
-                        email_addr = str(row[1]).strip()
-                        
-                        # Store both exact match and cleaned version
-                        email_mapping[company_name] = email_addr
-                        
-                        # Also create mapping without extra spaces/formatting
-                        cleaned_company = ' '.join(company_name.split())
-                        email_mapping[cleaned_company] = email_addr
-                
-                wb_email.close()
-            except Exception as e:
-                return jsonify({"error": f"Error reading Email mapping: {str(e)}"}), 400
-            finally:
-                os.unlink(temp_email.name)
-        
-        # Read the uploaded Excel file
-        file_content = file.read()
-        workbook = openpyxl.load_workbook(io.BytesIO(file_content))
+        try:
+            split_mode = resolve_split_mode(request.form.get('split_mode'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Create a temporary directory to store split files
-        temp_dir = tempfile.mkdtemp()
-        split_files_info = []
-        
-        # Process each sheet
-        for sheet_name in workbook.sheetnames:
-            sheet = workbook[sheet_name]
-            
-            # Extract company name from D9
-            company_name = sheet['D9'].value
-            if company_name is None:
-                company_name = f"Sheet_{sheet_name}"
-            else:
-                company_name = str(company_name).strip()
-            
-            # Extract PV number from R9
-            pv_number = sheet['R9'].value
-            if pv_number is None:
-                pv_number = "NO_PV"
-            else:
-                pv_number = str(pv_number).strip()
-            
-            # Get email from mapping file (prioritize) or fallback to D12
-            email = None
-            
-            # Strategy 1: Exact match with company name
-            email = email_mapping.get(company_name, None)
-            
-            # Strategy 2: Try with cleaned company name
-            if not email:
-                cleaned_company = ' '.join(company_name.split())
-                email = email_mapping.get(cleaned_company, None)
-            
-            # Strategy 3: Fallback to D12 (legacy support)
-            if not email:
-                d12_value = sheet['D12'].value
-                if d12_value is not None:
-                    email = str(d12_value).strip()
-                else:
-                    email = ""
-            
-            # Ensure email is string
-            if not email:
-                email = ""
-            
-            # Create safe filename
-            # Replace invalid filename characters (including /)
-            safe_company = "".join(c for c in company_name if c.isalnum() or c in (' ', '-', '_')).strip()
-            safe_pv = "".join(c if (c.isalnum() or c in (' ', '-', '_')) else '-' for c in pv_number).strip()
-            
-            # Create filename: "CompanyName PV_Number.xlsx"
-            filename = f"{safe_company} {safe_pv}.xlsx"
-            
-            # Create a new workbook with only this sheet
-            new_workbook = openpyxl.Workbook()
-            new_workbook.remove(new_workbook.active)  # Remove default sheet
-            
-            # Copy the sheet to the new workbook
-            new_sheet = new_workbook.create_sheet(sheet_name)
-            
-            # Copy all cells with their values, styles, and formatting
-            for row in sheet.iter_rows():
-                for cell in row:
-                    new_cell = new_sheet[cell.coordinate]
-                    new_cell.value = cell.value
-                    
-                    # Copy cell formatting
-                    if cell.has_style:
-                        new_cell.font = cell.font.copy()
-                        new_cell.border = cell.border.copy()
-                        new_cell.fill = cell.fill.copy()
-                        new_cell.number_format = cell.number_format
-                        new_cell.protection = cell.protection.copy()
-                        new_cell.alignment = cell.alignment.copy()
-            
-            # Copy column dimensions
-            for col in sheet.column_dimensions:
-                if col in sheet.column_dimensions:
-                    new_sheet.column_dimensions[col].width = sheet.column_dimensions[col].width
-            
-            # Copy row dimensions
-            for row in sheet.row_dimensions:
-                if row in sheet.row_dimensions:
-                    new_sheet.row_dimensions[row].height = sheet.row_dimensions[row].height
-            
-            # Copy merged cells
-            for merged_cell in sheet.merged_cells.ranges:
-                new_sheet.merge_cells(str(merged_cell))
-            
-            # Save the new workbook
-            file_path = os.path.join(temp_dir, filename)
-            new_workbook.save(file_path)
-            
-            # Store file information
-            split_files_info.append({
-                'filename': filename,
-                'company_name': company_name,
-                'pv_number': pv_number,
-                'email': email,
-                'sheet_name': sheet_name,
-                'file_path': file_path
-            })
-        
-        # Create a zip file containing all split files
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for file_info in split_files_info:
-                zip_file.write(file_info['file_path'], file_info['filename'])
+        # A registered mapping is already parsed; no upload needed
+        email_source = None
+        if request.form.get('email_mapping_id'):
+            try:
+                email_source = mappings.resolve('email', request.form['email_mapping_id'])
+            except KeyError as e:
+                return jsonify({'error': e.args[0]}), 404
         
-        zip_buffer.seek(0)
+        # Save uploads to disk - the request body is gone once we return
+        temp_input = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
+        file.save(temp_input.name)
+        temp_input.close()
         
-        # Store zip file temporarily
-        zip_filename = f"pv_split_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-        zip_path = os.path.join(temp_dir, zip_filename)
-        with open(zip_path, 'wb') as f:
-            f.write(zip_buffer.getvalue())
+        if email_source is None and 'email_mapping' in request.files and request.files['email_mapping'].filename != '':
+            temp_email = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
+            request.files['email_mapping'].save(temp_email.name)
+            temp_email.close()
+            email_source = temp_email.name
         
-        # Return file information (without file_path for security)
-        response_data = {
-            'success': True,
-            'files': [{
-                'filename': f['filename'],
-                'company_name': f['company_name'],
-                'pv_number': f['pv_number'],
-                'email': f['email'],
-                'sheet_name': f['sheet_name']
-            } for f in split_files_info],
-            'total_files': len(split_files_info),
-            'zip_filename': zip_filename,
-            'temp_dir': temp_dir  # Full path for backend use
-        }
+        try:
+            job = split_jobs.submit('pv-split', run_pv_split, temp_input.name, email_source, split_mode)
+        except QueueFullError as e:
+            for path in (temp_input.name, email_source):
+                if isinstance(path, str):
+                    os.unlink(path)
+            return jsonify({'error': str(e)}), 503
         
-        return jsonify(response_data)
+        return jsonify({'success': True, 'job_id': job.id, 'status': job.status}), 202
     
     except Exception as e:
         return jsonify({
@@ -236,52 +169,77 @@ def split_excel():
             'type': type(e).__name__
         }), 500
 
-@app.route('/api/download-zip/<path:temp_dir>/<filename>', methods=['GET'])
-def download_zip(temp_dir, filename):
-    """Download the zip file containing all split files"""
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report job status, progress counters and (when done) the result"""
+    job = split_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/mappings', methods=['POST'])
+def register_mapping():
+    """
+    Register an email mapping workbook once (form fields: file, kind=email)
+    Returns its version (201), or the existing version (200) if the same file
+    was registered before; split with email_mapping_id
+    """
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({'error': 'No file uploaded'}), 400
     try:
-        # Reconstruct the full path - temp_dir comes from URL without leading /
-        if not temp_dir.startswith('/'):
-            temp_dir = '/' + temp_dir
-        file_path = os.path.join(temp_dir, filename)
-        
-        if not os.path.exists(file_path):
-            return jsonify({'error': f'File not found: {file_path}'}), 404
-        
-        def cleanup():
-            """Cleanup temporary directory after download"""
-            try:
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
-            except:
-                pass
-        
-        response = send_file(
-            file_path,
+        version, created = mappings.register(request.form.get('kind', 'email'), request.files['file'].filename,
+                                             request.files['file'].read())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'success': True, 'created': created, 'mapping': version}), 201 if created else 200
+
+@app.route('/api/mappings', methods=['GET'])
+def list_mappings():
+    """List registered mapping versions, newest first"""
+    return jsonify({'mappings': mappings.versions()})
+
+@app.route('/api/mappings/<version_id>', methods=['GET'])
+def get_mapping(version_id):
+    """Metadata of one registered mapping version"""
+    version = mappings.version(version_id)
+    if version is None:
+        return jsonify({'error': 'Mapping version not found'}), 404
+    return jsonify(version)
+
+@app.route('/api/download-zip/<artifact_id>/<filename>', methods=['GET'])
+def download_zip(artifact_id, filename):
+    """
+    Stream a zip of all split files, built on the fly from the artifact
+    Optional ?mode=stored|deflated (default stored - .xlsx is already compressed)
+    """
+    try:
+        entries = artifacts.entries(artifact_id)
+        if not entries:
+            return jsonify({'error': f'Split files not found or expired: {artifact_id}'}), 404
+        
+        mode = request.args.get('mode')
+        try:
+            resolve_zip_mode(mode)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return Response(
+            stream_with_context(iter_zip(entries, mode)),
             mimetype='application/zip',
-            as_attachment=True,
-            download_name=filename
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
         )
-        
-        # Schedule cleanup (note: this won't work perfectly in all cases)
-        # For production, consider a background cleanup task
-        
-        return response
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/download-individual/<path:temp_dir>/<filename>', methods=['GET'])
-def download_individual(temp_dir, filename):
+@app.route('/api/download-individual/<artifact_id>/<filename>', methods=['GET'])
+def download_individual(artifact_id, filename):
     """Download an individual split file"""
     try:
-        # Reconstruct the full path - temp_dir comes from URL without leading /
-        if not temp_dir.startswith('/'):
-            temp_dir = '/' + temp_dir
-        file_path = os.path.join(temp_dir, filename)
+        file_path = artifacts.file_path(artifact_id, filename)
         
-        if not os.path.exists(file_path):
-            return jsonify({'error': f'File not found: {file_path}'}), 404
+        if file_path is None or not os.path.exists(file_path):
+            return jsonify({'error': f'File not found: {filename}'}), 404
         
         return send_file(
             file_path,
@@ -341,13 +299,17 @@ Apotek Alpro Finance Team""",
 @app.route('/api/send-emails', methods=['POST'])
 def send_emails():
     """
-    Send emails with file attachments automatically
+    Queue emails with file attachments for automatic sending
     Requires email configuration to be set
+    Returns a job id (202); poll /api/email-jobs/<job_id> for per-recipient status
     """
     try:
         data = request.json
         emails_to_send = data.get('emails', [])
-        temp_dir = data.get('temp_dir', '')
+        artifact_id = data.get('artifact_id', '')
+        
+        if artifacts.directory(artifact_id) is None:
+            return jsonify({'error': 'Split files not found or expired. Please split the file again.'}), 404
         
         # Check if email is configured
         if not EMAIL_CONFIG['sender_email'] or not EMAIL_CONFIG['sender_password']:
@@ -356,94 +318,67 @@ def send_emails():
                 'configured': False
             }), 400
         
-        results = []
-        errors = []
-        
+        # Validate before queueing anything
         for email_data in emails_to_send:
-            try:
-                # Send individual email
-                success = send_single_email(
-                    to_email=email_data['to'],
-                    subject=email_data['subject'],
-                    body=email_data['body'],
-                    files=email_data['files'],
-                    temp_dir=temp_dir
-                )
-                
-                if success:
-                    results.append({
-                        'to': email_data['to'],
-                        'status': 'sent',
-                        'files_count': len(email_data['files'])
-                    })
-                else:
-                    errors.append({
-                        'to': email_data['to'],
-                        'error': 'Failed to send email'
-                    })
-                    
-            except Exception as e:
-                errors.append({
-                    'to': email_data.get('to', 'unknown'),
-                    'error': str(e)
-                })
+            missing = [k for k in ('to', 'subject', 'body') if not email_data.get(k)]
+            if missing:
+                return jsonify({
+                    'error': f"Email to {email_data.get('to', 'unknown')} is missing: {', '.join(missing)}"
+                }), 400
+        
+        # Queue for the background dispatcher (see email_queue.py); re-sent
+        # batches only re-queue emails that previously failed
+        job_id = email_queue.enqueue(artifact_id, emails_to_send)
         
         return jsonify({
-            'success': len(errors) == 0,
-            'sent': len(results),
-            'failed': len(errors),
-            'results': results,
-            'errors': errors
-        })
+            'success': True,
+            'job_id': job_id,
+            'queued': len(emails_to_send)
+        }), 202
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def send_single_email(to_email, subject, body, files, temp_dir):
+@app.route('/api/email-jobs/<job_id>', methods=['GET'])
+def email_job_status(job_id):
+    """Per-recipient status of a queued email batch"""
+    status = email_queue.job_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Email job not found'}), 404
+    return jsonify(status)
+
+def build_email(to_email, subject, body, files, artifact_id):
     """
-    Send a single email with attachments using SMTP
+    Build a single email with attachments (sent by the bulk mailer)
     """
-    try:
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = f"{EMAIL_CONFIG['sender_name']} <{EMAIL_CONFIG['sender_email']}>"
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # Add body
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Reconstruct temp_dir path if needed
-        if not temp_dir.startswith('/'):
-            temp_dir = '/' + temp_dir
-        
-        # Attach files
-        for file_info in files:
-            filename = file_info['filename']
-            file_path = os.path.join(temp_dir, filename)
-            
-            if os.path.exists(file_path):
-                with open(file_path, 'rb') as f:
-                    part = MIMEBase('application', 'octet-stream')
-                    part.set_payload(f.read())
-                    encoders.encode_base64(part)
-                    part.add_header(
-                        'Content-Disposition',
-                        f'attachment; filename= {filename}'
-                    )
-                    msg.attach(part)
-        
-        # Connect to SMTP server and send
-        with smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port']) as server:
-            server.starttls()
-            server.login(EMAIL_CONFIG['sender_email'], EMAIL_CONFIG['sender_password'])
-            server.send_message(msg)
-        
-        return True
-        
-    except Exception as e:
-        print(f"Error sending email to {to_email}: {str(e)}")
-        return False
+    # Create message
+    msg = MIMEMultipart()
+    msg['From'] = f"{EMAIL_CONFIG['sender_name']} <{EMAIL_CONFIG['sender_email']}>"
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    
+    # Add body
+    msg.attach(MIMEText(body, 'plain'))
+    
+    # Attach files (only files recorded in the artifact manifest)
+    for file_info in files:
+        filename = file_info['filename']
+        file_path = artifacts.file_path(artifact_id, filename)
+        
+        if not file_path or not os.path.exists(file_path):
+            # Never send without a listed attachment: the item is recorded as failed
+            raise FileNotFoundError(f'Attachment {filename!r} not found in split {artifact_id}')
+        with open(file_path, 'rb') as f:
+            part = MIMEBase('application', 'octet-stream')
+            part.set_payload(f.read())
+            encoders.encode_base64(part)
+            part.add_header(
+                'Content-Disposition',
+                f'attachment; filename= {filename}'
+            )
+            msg.attach(part)
+    
+    return msg
 
 @app.route('/api/test-email-config', methods=['GET'])
 def test_email_config():
@@ -464,11 +399,15 @@ def test_email_config():
 if __name__ == '__main__':
     print("Starting PV Splitter Service on port 5001...")
     print("Service endpoints:")
-    print("  - POST /api/split-excel - Split Excel file")
-    print("  - GET  /api/download-zip/<temp_dir>/<filename> - Download all files as zip")
-    print("  - GET  /api/download-individual/<temp_dir>/<filename> - Download individual file")
+    print("  - POST /api/split-excel - Queue Excel file for splitting (returns job id)")
+    print("  - GET  /api/jobs/<job_id> - Split job progress and result")
+    print("  - POST /api/mappings - Register an email mapping file once (returns version id)")
+    print("  - GET  /api/mappings - List registered mapping versions")
+    print("  - GET  /api/download-zip/<artifact_id>/<filename> - Download all files as zip")
+    print("  - GET  /api/download-individual/<artifact_id>/<filename> - Download individual file")
     print("  - POST /api/get-email-data - Get email data for Gmail integration")
-    print("  - POST /api/send-emails - Send emails automatically with attachments")
+    print("  - POST /api/send-emails - Queue emails with attachments (returns job id)")
+    print("  - GET  /api/email-jobs/<job_id> - Per-recipient email status")
     print("  - GET  /api/test-email-config - Test email configuration")
     print("  - GET  /health - Health check")
     print("")
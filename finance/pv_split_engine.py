@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+PV split engine for pv-splitter.py
+Reads each sheet's header cells (D9/R9/D12) straight from the package XML
+(xlsx_package.py stops decompressing at row 12), then exports the sheets
+in parallel worker processes. Workers are fresh interpreters running this
+file (`python pv_split_engine.py <upload> <out_dir> <sheet>...`), never forks
+of the multithreaded service and never re-imports of it; each parses the
+saved upload once and exports its share of the sheets, reporting one JSON
+line per written sheet. So a split costs one full openpyxl parse per worker
+and none in the service. Only if some header can't be read at package level
+is the upload parsed here, and the sheets are then exported from that parse.
+
+PV_SPLIT_MODE=package skips openpyxl altogether: each sheet's XML part is
+copied into its own package (see xlsx_package.py), falling back to the
+openpyxl copy for sheets that carry drawings, comments or other parts.
+"""
+
+import json
+import os
+import selectors
+import subprocess
+import sys
+
+import openpyxl
+
+from xlsx_package import UnsupportedSheet, XlsxPackage
+
+SPLIT_MODES = {'openpyxl', 'package'}
+PV_SPLIT_MODE = os.getenv('PV_SPLIT_MODE', 'openpyxl')
+PV_SPLIT_PROCESSES = int(os.getenv('PV_SPLIT_PROCESSES', str(min(4, os.cpu_count() or 1))))
+
+
+def sheet_details(sheet, email_mapping):
+    """
+    Read company (D9), PV number (R9) and email (MappingIndex, else D12) for a
+    sheet and derive its output filename
+    """
+    # Extract company name from D9
+    company_name = sheet['D9'].value
+    if company_name is None:
+        company_name = f"Sheet_{sheet.title}"
+    else:
+        company_name = str(company_name).strip()
+
+    # Extract PV number from R9
+    pv_number = sheet['R9'].value
+    if pv_number is None:
+        pv_number = "NO_PV"
+    else:
+        pv_number = str(pv_number).strip()
+
+    # Get email from mapping file (prioritize) or fallback to D12
+    # exact / whitespace-cleaned / normalized company name (MappingIndex); a
+    # fuzzy hit only comes back as email_match['suggestion'] for the user to confirm
+    email, email_match = email_mapping.lookup(company_name, ' '.join(company_name.split()))
+
+    # Fallback to D12 (legacy support)
+    if not email:
+        d12_value = sheet['D12'].value
+        email = str(d12_value).strip() if d12_value is not None else ""
+        if email:
+            email_match = {'strategy': 'D12', 'key': None, 'score': 0.0}
+
+    # Create safe filename
+    # Replace invalid filename characters (including /)
+    safe_company = "".join(c for c in company_name if c.isalnum() or c in (' ', '-', '_')).strip()
+    safe_pv = "".join(c if (c.isalnum() or c in (' ', '-', '_')) else '-' for c in pv_number).strip()
+
+    return {
+        # Create filename: "CompanyName PV_Number.xlsx"
+        'filename': f"{safe_company} {safe_pv}.xlsx",
+        'company_name': company_name,
+        'pv_number': pv_number,
+        'email': email or "",
+        'email_match': email_match,
+        'sheet_name': sheet.title
+    }
+
+
+def export_sheet(sheet, file_path):
+    """Copy one sheet (values, styles, dimensions, merges) into its own workbook"""
+    # Create a new workbook with only this sheet
+    new_workbook = openpyxl.Workbook()
+    new_workbook.remove(new_workbook.active)  # Remove default sheet
+    new_sheet = new_workbook.create_sheet(sheet.title)
+
+    # Copy all cells with their values, styles, and formatting
+    for row in sheet.iter_rows():
+        for cell in row:
+            new_cell = new_sheet[cell.coordinate]
+            new_cell.value = cell.value
+
+            # Copy cell formatting
+            if cell.has_style:
+                new_cell.font = cell.font.copy()
+                new_cell.border = cell.border.copy()
+                new_cell.fill = cell.fill.copy()
+                new_cell.number_format = cell.number_format
+                new_cell.protection = cell.protection.copy()
+                new_cell.alignment = cell.alignment.copy()
+
+    # Copy column dimensions
+    for col in sheet.column_dimensions:
+        if col in sheet.column_dimensions:
+            new_sheet.column_dimensions[col].width = sheet.column_dimensions[col].width
+
+    # Copy row dimensions
+    for row in sheet.row_dimensions:
+        if row in sheet.row_dimensions:
+            new_sheet.row_dimensions[row].height = sheet.row_dimensions[row].height
+
+    # Copy merged cells
+    for merged_cell in sheet.merged_cells.ranges:
+        new_sheet.merge_cells(str(merged_cell))
+
+    new_workbook.save(file_path)
+    return os.path.getsize(file_path)
+
+
+def _run_workers(input_path, out_dir, details, processes, done):
+    """Export details' sheets across `processes` worker interpreters, calling done(size) per sheet"""
+    workers = []
+    for n in range(processes):
+        args = [arg for info in details[n::processes] for arg in (info['sheet_name'], info['filename'])]
+        workers.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), input_path, out_dir, *args],
+                                        stdout=subprocess.PIPE))
+    selector = selectors.DefaultSelector()
+    try:
+        for worker in workers:
+            selector.register(worker.stdout, selectors.EVENT_READ)
+        open_pipes = len(workers)
+        while open_pipes:
+            for key, _ in selector.select():
+                line = key.fileobj.readline()
+                if not line:
+                    selector.unregister(key.fileobj)
+                    open_pipes -= 1
+                    continue
+                done(json.loads(line)['bytes'])
+    finally:
+        selector.close()
+        for worker in workers:
+            worker.stdout.close()
+            if worker.poll() is None and sys.exc_info()[0] is not None:
+                worker.kill()
+            worker.wait()
+    failed = [worker.returncode for worker in workers if worker.returncode != 0]
+    if failed:
+        raise RuntimeError(f"{len(failed)} sheet export worker(s) failed (exit status {failed[0]})")
+
+
+def _worker_main(input_path, out_dir, *jobs):
+    """Worker entry point: export (sheet_name, filename) pairs from the saved upload"""
+    workbook = openpyxl.load_workbook(input_path)
+    for sheet_name, filename in zip(jobs[::2], jobs[1::2]):
+        size = export_sheet(workbook[sheet_name], os.path.join(out_dir, filename))
+        print(json.dumps({'sheet': sheet_name, 'bytes': size}), flush=True)
+
+
+def _unique_filenames(details):
+    """Two sheets with the same company and PV number must not overwrite each other"""
+    seen = {}
+    for info in details:
+        name = info['filename']
+        count = seen.get(name.lower(), 0) + 1
+        seen[name.lower()] = count
+        if count > 1:
+            info['filename'] = f"{name[:-len('.xlsx')]} ({count}).xlsx"
+
+
+def resolve_split_mode(mode):
+    mode = (mode or PV_SPLIT_MODE).lower()
+    if mode not in SPLIT_MODES:
+        raise ValueError(f"Unknown split mode '{mode}' (expected one of: {', '.join(sorted(SPLIT_MODES))})")
+    return mode
+
+
+class _LazyWorkbook:
+    """openpyxl parse of the upload, made on first use only: workbook[name]"""
+
+    def __init__(self, path):
+        self.path = path
+        self.workbook = None
+
+    def __getitem__(self, name):
+        if self.workbook is None:
+            self.workbook = openpyxl.load_workbook(self.path)
+        return self.workbook[name]
+
+
+def _read_details(package, source, email_mapping):
+    """sheet_details of every sheet, headers read at package level (else from the openpyxl parse)"""
+    details = []
+    for name in package.sheetnames:
+        try:
+            sheet = package.sheet(name)
+        except UnsupportedSheet:
+            sheet = source[name]
+        details.append(sheet_details(sheet, email_mapping))
+    _unique_filenames(details)
+    return details
+
+
+def split_pv_workbook(input_path, out_dir, email_mapping, progress, on_file,
+                      processes=PV_SPLIT_PROCESSES, mode=None):
+    """
+    Split every sheet of `input_path` into its own .xlsx in `out_dir`
+    progress: callback taking counters (sheets_total, sheets_written, bytes_written)
+    on_file(filename): called for each written file, in sheet order
+    mode: 'openpyxl' (default, PV_SPLIT_MODE) or 'package'
+    Returns the per-sheet details in sheet order
+    """
+    if resolve_split_mode(mode) == 'package':
+        return _split_package(input_path, out_dir, email_mapping, progress, on_file)
+
+    source = _LazyWorkbook(input_path)
+    with XlsxPackage(input_path) as package:
+        details = _read_details(package, source, email_mapping)
+    progress(sheets_total=len(details), sheets_written=0, bytes_written=0)
+
+    written = 0
+    bytes_written = 0
+
+    def done(size):
+        nonlocal written, bytes_written
+        written += 1
+        bytes_written += size
+        progress(sheets_written=written, bytes_written=bytes_written)
+
+    # Each worker parses the upload, so a single sheet or process, or an
+    # upload already parsed for its headers, is exported right here
+    if processes <= 1 or len(details) <= 1 or source.workbook is not None:
+        for info in details:
+            done(export_sheet(source[info['sheet_name']], os.path.join(out_dir, info['filename'])))
+            on_file(info['filename'])
+        return details
+
+    _run_workers(input_path, out_dir, details, min(processes, len(details)), done)
+    # Register in sheet order so the ZIP lists files like the source workbook
+    for info in details:
+        on_file(info['filename'])
+    return details
+
+
+def _split_package(input_path, out_dir, email_mapping, progress, on_file):
+    """Package-level split; serial, since each sheet is little more than a zip copy"""
+    # Only parsed if some sheet can't be handled at package level
+    source = _LazyWorkbook(input_path)
+
+    with XlsxPackage(input_path) as package:
+        details = _read_details(package, source, email_mapping)
+        progress(sheets_total=len(details), sheets_written=0, bytes_written=0)
+
+        bytes_written = 0
+        for written, info in enumerate(details, 1):
+            file_path = os.path.join(out_dir, info['filename'])
+            try:
+                package.write_sheet(info['sheet_name'], file_path)
+                size = os.path.getsize(file_path)
+            except UnsupportedSheet as e:
+                print(f"Package split fallback to openpyxl for {e}")
+                size = export_sheet(source[info['sheet_name']], file_path)
+            on_file(info['filename'])
+            bytes_written += size
+            progress(sheets_written=written, bytes_written=bytes_written)
+    return details
+
+
+if __name__ == '__main__':
+    _worker_main(*sys.argv[1:])
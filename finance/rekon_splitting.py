@@ -0,0 +1,640 @@
+#!/usr/bin/env python3
+"""
+Streaming statement splitter behind the /api/rekon-split endpoints.
+Implements the split rules of file-rekonsiliasi-splitter.html (processACMM,
+processBRI, processBCA) without holding the statement in memory: the upload
+is decoded incrementally and read row by row with the csv module (or
+openpyxl's read-only row iterator for .xlsx), and every row is written
+straight to its per-outlet / per-GL output file as soon as it is classified.
+
+Only the Kode Rekon totals for the summary files are kept in memory, so
+memory grows with the number of outlet-days, not with statement rows.
+
+Output files (CSV, one artifact per run):
+  ACMM  ACMM_GL_<gl>.csv            source rows of one GL, Kode Rekon first
+        ACMM_Kode_Rekon_Summary.csv GL / Kode Rekon net, debit, credit
+  BRI   BRI_Detail_<outlet>.csv     Cr rows of one outlet
+        BRI_Kode_Rekon_Summary.csv  per Kode Rekon gross and tx count
+        BRI_Unmatched_MIDs.csv      (only if any)
+  BCA   BCA_Outlet_<outlet>.csv     non-cash and cash rows of one outlet
+        BCA_E-Banking.csv           TRSF E-BANKING rows
+        BCA_Non_Cash.csv / BCA_Cash.csv  per Kode Rekon gross
+        BCA_Unmatched_MIDs.csv      (only if any)
+"""
+
+import csv
+import datetime
+import io
+import os
+import re
+
+import openpyxl
+
+from sales_reconciliation import read_rows
+
+BANKS = ('acmm', 'bri', 'bca')
+
+# Rows held for all output files together before they are appended to disk:
+# bounds memory however large the statement, while each file is opened once
+# per flush instead of once per row
+REKON_SPLIT_BUFFER_ROWS = int(os.getenv('REKON_SPLIT_BUFFER_ROWS', '20000'))
+
+# Rows between progress updates
+PROGRESS_EVERY = 10000
+
+_BRACKETS = re.compile(r'\(([^)]+)\)')
+_ISO_DATE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})')
+_DMY_DATE = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{2,4})')
+_DMY_DATE_ONLY = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{2,4})$')
+_QRIS = re.compile(r'QRIS', re.I)
+_UNSAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]')
+
+ACMM_QR_DC_GL_PREFIXES = ('11201010', '11201013')
+
+BRI_MID = re.compile(r'00(1\d{9})')
+BRI_AMT = re.compile(r'AMT:([\d.,]+)')
+
+BCA_EXCLUDE_EB = ('VISIONET', 'MENSA MEDIKA', 'AIRPAY')
+BCA_MID = re.compile(r'MID\s*:\s*(\d+)', re.I)
+BCA_TGH = re.compile(r'TGH:\s*([\d.,]+)', re.I)
+BCA_QR = re.compile(r'QR\s*:\s*([\d.,]+)', re.I)
+BCA_QR_TYPE = re.compile(r'QR\s*:')
+BCA_TGH_TYPE = re.compile(r'TGH\s*:')
+BCA_CARD = re.compile(r'0?(\d{15})\s*$')
+BCA_TUNAI = re.compile(r'SETORAN TUNAI\s+([A-Z0-9]{6,10})')
+_LEADING_FLOAT = re.compile(r'^\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)')
+_NOT_AMOUNT = re.compile(r'[^\d.,]')
+
+
+# ── reading ────────────────────────────────────────────────────────────────
+
+def clean_cell(value):
+    """cleanCell() of the page: text without wrapping quotes, trimmed."""
+    if type(value) is str and '"' not in value:
+        return value.strip()
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value)
+    if text.startswith('"'):
+        text = text[1:]
+    if text.endswith('"'):
+        text = text[:-1]
+    return text.strip()
+
+
+def iter_csv(stream, encoding='utf-8-sig'):
+    """
+    Rows of a binary CSV stream, decoded and parsed incrementally.
+    Rows whose cells are all empty are skipped, as parseCSV() did.
+    """
+    text = io.TextIOWrapper(stream, encoding=encoding, errors='replace', newline='')
+    try:
+        for row in csv.reader(text):
+            if any(row):
+                yield row
+    finally:
+        text.detach()  # the caller owns the underlying stream
+
+
+def iter_xlsx(path):
+    """Rows of the first sheet of an .xlsx, streamed by openpyxl's read-only reader."""
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            row = ['' if value is None else value for value in row]
+            if any(value != '' for value in row):
+                yield row
+    finally:
+        wb.close()
+
+
+def iter_statement(path):
+    """Statement rows of a saved upload: .csv streamed by the csv module, else .xlsx."""
+    if path.lower().endswith('.csv'):
+        with open(path, 'rb') as f:
+            yield from iter_csv(f)
+    else:
+        yield from iter_xlsx(path)
+
+
+def _cell(row, index):
+    return row[index] if index < len(row) else ''
+
+
+def _date_string(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return clean_cell(value)
+
+
+def _date(y, m, d):
+    try:
+        return datetime.date(y, m, d)
+    except ValueError:
+        return None
+
+
+def rekon_day(date):
+    """(day without padding, 'YYYY-MM-DD') of the day before - statements post a day late."""
+    if date is None:
+        return None
+    date -= datetime.timedelta(days=1)
+    return str(date.day), date.isoformat()
+
+
+def parse_float(text):
+    """parseFloat(): leading number of a string, 0 when there is none."""
+    match = _LEADING_FLOAT.match(text)
+    return float(match.group(1)) if match else 0.0
+
+
+def amount_text(value):
+    """Amount for a CSV cell: plain digits, at most two decimals."""
+    return f'{value:.2f}'.rstrip('0').rstrip('.') if value % 1 else str(int(value))
+
+
+# ── output ─────────────────────────────────────────────────────────────────
+
+class SplitWriters:
+    """
+    CSV output files of one split run, created on the first row routed to
+    them. Rows are buffered per file and appended in one go whenever
+    buffer_rows rows are pending across all files, so a statement with
+    thousands of outlets neither keeps thousands of handles open nor reopens
+    a file for every row.
+    """
+
+    def __init__(self, directory, header, buffer_rows=REKON_SPLIT_BUFFER_ROWS):
+        self.directory = directory
+        self.header = header
+        self.buffer_rows = max(1, buffer_rows)
+        self.rows = {}  # filename -> rows written, in creation order
+        self._pending = {}  # filename -> rows not yet on disk
+        self._pending_count = 0
+
+    def write(self, filename, row):
+        pending = self._pending.get(filename)
+        if pending is None:
+            pending = self._pending[filename] = []
+            if filename not in self.rows:
+                self.rows[filename] = 0
+                pending.append(self.header)
+        pending.append(row)
+        self.rows[filename] += 1
+        self._pending_count += 1
+        if self._pending_count >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        for filename, rows in self._pending.items():
+            with open(os.path.join(self.directory, filename), 'a', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows(rows)
+        self._pending.clear()
+        self._pending_count = 0
+
+    def close(self):
+        self.flush()
+
+
+class FileNames:
+    """
+    Names of the per-code output files of one run (prefix_<code>.csv). Codes
+    are made filesystem-safe; a code whose safe name is already taken by
+    another code (e.g. 'A/B' and 'A_B') gets a _2, _3, ... suffix instead of
+    being merged into the other code's file.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._names = {}  # code -> file name
+        self._taken = set()  # lower-cased names, for case-insensitive filesystems
+
+    def __call__(self, code):
+        name = self._names.get(code)
+        if name is None:
+            base = f"{self.prefix}_{_UNSAFE_NAME.sub('_', str(code))}"
+            name, n = base + '.csv', 1
+            while name.lower() in self._taken:
+                n += 1
+                name = f'{base}_{n}.csv'
+            self._taken.add(name.lower())
+            self._names[code] = name
+        return name
+
+
+def write_csv(directory, filename, header, rows):
+    with open(os.path.join(directory, filename), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return filename
+
+
+def _unmatched_rows(unmatched, note):
+    return [[mid, note(mid)] for mid in sorted(unmatched)]
+
+
+# ── ACMM ───────────────────────────────────────────────────────────────────
+
+def _acmm_day(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return str(value.day)
+    text = clean_cell(value)
+    match = _ISO_DATE.search(text)
+    if match:
+        return str(int(match.group(3)))
+    match = _DMY_DATE.match(text)
+    return str(int(match.group(1))) if match else ''
+
+
+def split_acmm(rows, directory, progress=None):
+    """
+    processACMM(): rows after the 'Tanggal' header go to one file per GL code,
+    and debit / credit totals are summed per (GL, Kode Rekon). Kode Rekon is
+    day + store code from the brackets in the store name, with QR / DC between
+    them for the Piutang Kartu Kredit GLs.
+    """
+    rows = iter(rows)
+    headers = None
+    for row in rows:
+        if clean_cell(_cell(row, 0)) == 'Tanggal':
+            headers = [clean_cell(h) for h in row]
+            break
+    if headers is None:
+        raise ValueError('Cannot find header row. Ensure column A has "Tanggal".')
+    desc_col = next((i for i, h in enumerate(headers) if re.search('description', h, re.I)), 3)
+
+    writers = SplitWriters(directory, ['Kode Rekon'] + headers)
+    file_name = FileNames('ACMM_GL')
+    totals = {}  # gl -> {kode rekon: [debit, credit]}
+    dates = set()
+    count = 0
+    try:
+        for row in rows:
+            if not _cell(row, 0):
+                continue
+            count += 1
+            if progress and count % PROGRESS_EVERY == 0:
+                progress(rows=count)
+            gl = clean_cell(_cell(row, 12))
+            if not gl:
+                continue
+            store = clean_cell(_cell(row, 2))
+            bracket = _BRACKETS.search(store)
+            kode = bracket.group(1) if bracket else clean_cell(_cell(row, 1))
+            day = _acmm_day(_cell(row, 0))
+            if gl.startswith(ACMM_QR_DC_GL_PREFIXES):
+                kode_rekon = day + ('QR' if _QRIS.search(clean_cell(_cell(row, desc_col))) else 'DC') + kode
+            else:
+                kode_rekon = day + kode
+            dates.add(_date_string(_cell(row, 0))[:10])
+
+            kind = clean_cell(_cell(row, 11)).lower()
+            amount = parse_float(clean_cell(_cell(row, 13)).replace(',', ''))
+            sums = totals.setdefault(gl, {}).setdefault(kode_rekon, [0.0, 0.0])
+            if kind == 'debit':
+                sums[0] += amount
+            elif kind == 'credit':
+                sums[1] += amount
+            writers.write(file_name(gl), [kode_rekon, *row])
+    finally:
+        writers.close()
+
+    summary = []
+    for gl in sorted(totals):
+        debit_total = credit_total = 0.0
+        for kode_rekon in sorted(totals[gl]):
+            debit, credit = totals[gl][kode_rekon]
+            summary.append([gl, kode_rekon, amount_text(debit - credit), amount_text(debit), amount_text(credit)])
+            debit_total += debit
+            credit_total += credit
+        summary.append([gl, 'TOTAL', amount_text(debit_total - credit_total),
+                        amount_text(debit_total), amount_text(credit_total)])
+    files = list(writers.rows)
+    files.insert(0, write_csv(directory, 'ACMM_Kode_Rekon_Summary.csv',
+                              ['GL Code', 'Kode Rekon', 'Gross Amount', 'Debit Total', 'Credit Total'], summary))
+    dates = sorted(d for d in dates if d)
+    return {
+        'files': files,
+        'statistics': {
+            'rows': count,
+            'glCodes': sorted(totals),
+            'kodeRekon': len({kr for gl in totals.values() for kr in gl}),
+            'dateRange': [dates[0], dates[-1]] if dates else None,
+        },
+    }
+
+
+# ── BRI ────────────────────────────────────────────────────────────────────
+
+def bri_mid_map(path):
+    """BRI Master MID: column A 10-digit MID -> column B outlet code."""
+    mid_map = {}
+    for row in read_rows(path)[1:]:
+        mid, outcode = clean_cell(_cell(row, 0)), clean_cell(_cell(row, 1))
+        if mid and outcode:
+            mid_map[mid] = outcode
+    return mid_map
+
+
+def _bri_date(value):
+    """parseBRIDate(): ISO or D/M/YYYY (day first)."""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return _date(value.year, value.month, value.day)
+    text = clean_cell(value)
+    match = _ISO_DATE.match(text)
+    if match:
+        return _date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    match = _DMY_DATE.match(text)
+    if match:
+        year = int(match.group(3))
+        return _date(year + 2000 if year < 100 else year, int(match.group(2)), int(match.group(1)))
+    return None
+
+
+def split_bri(rows, mid_map, directory, progress=None):
+    """
+    processBRI(): keeps the 'Cr' rows, finds the outlet from the 10-digit MID
+    in DESK_TRAN, the amount from 'AMT:' (Indonesian format) and the Kode
+    Rekon as (date - 1 day) + QR / DC + outlet, and writes each row to its
+    outlet's detail file.
+    """
+    rows = iter(rows)
+    headers = next(rows, None)
+    if headers is None:
+        raise ValueError('BRI Statement appears empty or invalid.')
+    columns = {clean_cell(h): i for i, h in enumerate(headers)}
+    date_col = columns.get('TGL_TRAN', 2)
+    desk_col = columns.get('DESK_TRAN', 6)
+    sign_col = columns.get('GLSIGN', 11)
+
+    writers = SplitWriters(directory, ['Kode Rekon', 'Outlet Code', 'Date', 'MID', 'Gross Amount', 'Payment Type', 'Description'])
+    file_name = FileNames('BRI_Detail')
+    summary = {}  # kode rekon -> [outlet, date, total, count]
+    unmatched = set()
+    count = cr_count = matched = 0
+    try:
+        for row in rows:
+            count += 1
+            if progress and count % PROGRESS_EVERY == 0:
+                progress(rows=count, cr_rows=cr_count)
+            if len(row) < 2 or clean_cell(_cell(row, sign_col)) != 'Cr':
+                continue
+            cr_count += 1
+            raw_date = _cell(row, date_col)
+            desk = clean_cell(_cell(row, desk_col))
+            day, date = rekon_day(_bri_date(raw_date)) or ('?', _date_string(raw_date))
+
+            mid = BRI_MID.search(desk)
+            mid10 = mid.group(1) if mid else None
+            if mid10 is None:
+                outcode = 'UNKNOWN'
+                unmatched.add('NO_MID')
+            elif mid10 in mid_map:
+                outcode = mid_map[mid10]
+                matched += 1
+            else:
+                outcode = f'UNKNOWN_{mid10}'
+                unmatched.add(mid10)
+
+            amt = BRI_AMT.search(desk)
+            amount = parse_float(amt.group(1).replace('.', '').replace(',', '.', 1)) if amt else 0.0
+            qris = bool(_QRIS.search(desk) or _QRIS.search(clean_cell(_cell(row, 15))))
+            kode_rekon = day + ('QR' if qris else 'DC') + outcode
+
+            entry = summary.get(kode_rekon)
+            if entry is None:
+                entry = summary[kode_rekon] = [outcode, date, 0.0, 0]
+            entry[2] += amount
+            entry[3] += 1
+            writers.write(file_name(outcode),
+                          [kode_rekon, outcode, date, mid10 or 'N/A', amount_text(amount),
+                           'QR' if qris else 'Debit/Credit', desk])
+    finally:
+        writers.close()
+
+    rows_out = [[kr, amount_text(total), outcode, date, n] for kr, (outcode, date, total, n) in sorted(summary.items())]
+    rows_out.append(['TOTAL', amount_text(sum(entry[2] for entry in summary.values())), '', '', cr_count])
+    files = [write_csv(directory, 'BRI_Kode_Rekon_Summary.csv',
+                       ['Kode Rekon', 'Gross Amount', 'Outlet Code', 'Date', 'Tx Count'], rows_out)]
+    files += list(writers.rows)
+    if unmatched:
+        files.append(write_csv(directory, 'BRI_Unmatched_MIDs.csv', ['Unmatched MID', 'Note'],
+                               _unmatched_rows(unmatched, lambda mid: 'MID not found in BRI Master MID file')))
+    dates = sorted({entry[1] for entry in summary.values()})
+    return {
+        'files': files,
+        'statistics': {
+            'rows': count,
+            'crRows': cr_count,
+            'matched': matched,
+            'kodeRekon': len(summary),
+            'outlets': len(writers.rows),
+            'unmatchedMids': sorted(unmatched),
+            'dateRange': [dates[0], dates[-1]] if dates else None,
+        },
+    }
+
+
+# ── BCA ────────────────────────────────────────────────────────────────────
+
+def bca_masters(mid_path, kartu_path):
+    """
+    (MID map, card map): Master MID column C last-7 -> column D outlet, and
+    Kartu Debit column A 15-digit card -> column C outlet.
+    """
+    mid_map = {}
+    for row in read_rows(mid_path)[1:]:
+        last7, outcode = clean_cell(_cell(row, 2)), clean_cell(_cell(row, 3))
+        if last7 and outcode:
+            mid_map[last7] = outcode
+    card_map = {}
+    for row in read_rows(kartu_path)[1:]:
+        card = re.sub(r'\.0*$', '', clean_cell(_cell(row, 0)))
+        outcode = clean_cell(_cell(row, 2))
+        if card and outcode and not outcode.startswith('='):
+            card_map[card] = outcode
+    return mid_map, card_map
+
+
+def _bca_date(value):
+    """
+    toYMD(). Date cells of the .xlsx statement carry day and month swapped
+    (DD/MM entered under an mm-dd-yy format) and are swapped back as the page
+    did; text dates are D/M/YYYY or already ISO.
+    """
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return _date(value.year, value.day, value.month)
+    text = clean_cell(value)
+    match = _ISO_DATE.match(text)
+    if match:
+        return _date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    match = _DMY_DATE_ONLY.match(text)
+    if match:
+        year = match.group(3)
+        return _date(int('20' + year if len(year) == 2 else year), int(match.group(2)), int(match.group(1)))
+    return None
+
+
+def _bca_jumlah(value):
+    """parseJumlah(): None for DB (debit) rows and empty cells."""
+    if isinstance(value, (int, float)):
+        return value if value > 0 else None
+    text = clean_cell(value)
+    if not text or text.upper().endswith('DB'):
+        return None
+    return parse_float(_NOT_AMOUNT.sub('', text).replace(',', ''))
+
+
+def _bca_tgh_qr(desc):
+    match = BCA_TGH.search(desc) or BCA_QR.search(desc)
+    return parse_float(match.group(1).replace(',', '')) if match else 0.0
+
+
+def _bca_pay_type(desc):
+    upper = desc.upper()
+    if BCA_QR_TYPE.search(upper):
+        return 'QR'
+    if 'KR OTOMATIS' in upper and BCA_TGH_TYPE.search(upper):
+        return 'Debit Card'
+    if 'KARTU KREDIT' in upper:
+        return 'Credit Card'
+    return ''
+
+
+def split_bca(rows, mid_map, card_map, directory, progress=None):
+    """
+    processBCA(): after the 'Tanggal' header, non-excluded TRSF E-BANKING rows
+    go to the E-Banking file, MID rows (non cash, QR / DC by description) and
+    SETORAN VIA CDM / SETORAN TUNAI rows (cash) to their outlet's file, with
+    Kode Rekon as (date - 1 day) [+ QR / DC] + outlet. DB rows are skipped.
+    """
+    rows = iter(rows)
+    for row in rows:
+        if 'Tanggal' in clean_cell(_cell(row, 0)):
+            break
+    else:
+        raise ValueError('Cannot find header row (Tanggal Transaksi)')
+
+    outlets = SplitWriters(directory, ['Kode Rekon', 'Outlet Code', 'Category', 'Type', 'Date', 'Gross Amount', 'Description'])
+    # Outlet files get their own prefix so no outlet code can name a summary file
+    file_name = FileNames('BCA_Outlet')
+    eb_file = open(os.path.join(directory, 'BCA_E-Banking.csv'), 'w', newline='', encoding='utf-8')
+    eb = csv.writer(eb_file)
+    eb.writerow(['Tanggal', 'Description', 'Gross Amount'])
+    non_cash = {}  # kode rekon -> [outlet, date, gross]
+    cash = {}  # kode rekon -> [outlet, date, type, gross]
+    unmatched = set()
+    eb_total = 0.0
+    count = counts_mid = counts_eb = counts_setoran = 0
+    try:
+        for row in rows:
+            raw_date = _cell(row, 0)
+            desc = clean_cell(_cell(row, 1))
+            if not raw_date or not desc:
+                continue
+            count += 1
+            if progress and count % PROGRESS_EVERY == 0:
+                progress(rows=count)
+            gross = _bca_jumlah(_cell(row, 3))
+            if gross is None:
+                continue
+
+            if 'TRSF E-BANKING' in desc:
+                if not any(keyword in desc.upper() for keyword in BCA_EXCLUDE_EB):
+                    date = _bca_date(raw_date)
+                    eb.writerow([date.isoformat() if date else '', desc, amount_text(gross)])
+                    eb_total += gross
+                    counts_eb += 1
+                continue
+
+            day, date = rekon_day(_bca_date(raw_date)) or ('?', '')
+            if 'MID' in desc:
+                mid = BCA_MID.search(desc)
+                mid_text = mid.group(1) if mid else ''
+                last7 = mid_text[-7:]
+                outcode = mid_map.get(last7)
+                if outcode is None:
+                    unmatched.add(last7 or mid_text)
+                    outcode = f'UNKNOWN_{last7}'
+                amount = _bca_tgh_qr(desc) or gross
+                pay_type = _bca_pay_type(desc)
+                kode_rekon = day + ('QR' if pay_type == 'QR' else 'DC') + outcode
+                entry = non_cash.setdefault(kode_rekon, [outcode, date, 0.0])
+                entry[2] += amount
+                outlets.write(file_name(outcode),
+                              [kode_rekon, outcode, 'Non Cash', pay_type, date, amount_text(amount), desc])
+                counts_mid += 1
+                continue
+
+            if 'SETORAN VIA CDM' in desc:
+                card = BCA_CARD.search(desc)
+                outcode = None
+                if card:
+                    outcode = card_map.get(card.group(1))
+                    if outcode is None:
+                        unmatched.add('CDM:' + card.group(1))
+                outcode = outcode or 'UNKNOWN_CDM'
+                kind = 'CDM'
+            elif 'SETORAN TUNAI' in desc:
+                tunai = BCA_TUNAI.search(desc)
+                outcode = tunai.group(1) if tunai else 'UNKNOWN_TUNAI'
+                kind = 'TUNAI'
+            else:
+                continue
+            kode_rekon = day + outcode
+            entry = cash.setdefault(kode_rekon, [outcode, date, kind, 0.0])
+            entry[3] += gross
+            outlets.write(file_name(outcode),
+                          [kode_rekon, outcode, 'Cash', kind, date, amount_text(gross), desc])
+            counts_setoran += 1
+        eb.writerow(['TOTAL', '', amount_text(eb_total)])
+    finally:
+        eb_file.close()
+        outlets.close()
+
+    files = ['BCA_E-Banking.csv']
+    rows_out = [[kr, outcode, amount_text(gross), date] for kr, (outcode, date, gross) in sorted(non_cash.items())]
+    rows_out.append(['TOTAL', '', amount_text(sum(entry[2] for entry in non_cash.values())), ''])
+    files.append(write_csv(directory, 'BCA_Non_Cash.csv', ['Kode Rekon', 'Outlet Code', 'Gross Amount', 'Date'], rows_out))
+    rows_out = [[kr, outcode, kind, amount_text(gross), date] for kr, (outcode, date, kind, gross) in sorted(cash.items())]
+    rows_out.append(['TOTAL', '', '', amount_text(sum(entry[3] for entry in cash.values())), ''])
+    files.append(write_csv(directory, 'BCA_Cash.csv', ['Kode Rekon', 'Outlet Code', 'Type', 'Gross Amount', 'Date'], rows_out))
+    files += list(outlets.rows)
+    if unmatched:
+        files.append(write_csv(directory, 'BCA_Unmatched_MIDs.csv', ['Unmatched MID / Card', 'Note'], _unmatched_rows(
+            unmatched, lambda mid: 'Card number not found in Kartu Debit file' if mid.startswith('CDM:')
+            else 'MID last-7 not found in BCA MID file')))
+    return {
+        'files': files,
+        'statistics': {
+            'rows': count,
+            'eBanking': counts_eb,
+            'nonCash': counts_mid,
+            'setoran': counts_setoran,
+            'kodeRekon': len(non_cash) + len(cash),
+            'outlets': len(outlets.rows),
+            'unmatchedMids': sorted(unmatched),
+        },
+    }
+
+
+def split_statement(bank, paths, directory, progress=None):
+    """
+    Split one bank's statement into `directory`. paths holds 'statement' and
+    the masters the bank needs: 'mid' (BRI, BCA) and 'kartu' (BCA).
+    Returns {'files': [...], 'statistics': {...}}.
+    """
+    rows = iter_statement(paths['statement'])
+    if bank == 'acmm':
+        return split_acmm(rows, directory, progress)
+    if bank == 'bri':
+        return split_bri(rows, bri_mid_map(paths['mid']), directory, progress)
+    if bank == 'bca':
+        mid_map, card_map = bca_masters(paths['mid'], paths['kartu'])
+        return split_bca(rows, mid_map, card_map, directory, progress)
+    raise ValueError(f"Unknown bank '{bank}' (expected one of: {', '.join(BANKS)})")
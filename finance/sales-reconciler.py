@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Sales Reconciliation Backend API
+Reconciles the ACMM transaction summary against BCA / BRI bank statements
+on the server for sales-reconciliation.html, with the page's matching rules
+run over pandas columns instead of row loops in the browser, and pairs daily
+cash sales with their CDM / Setoran Tunai deposits one to one.
+Also splits ACMM / BRI / BCA statements for file-rekonsiliasi-splitter.html
+into per-GL / per-outlet CSV files, streaming the upload row by row.
+"""
+
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
+from flask_cors import CORS
+import json
+import os
+import tempfile
+from split_jobs import JobQueue, QueueFullError
+from artifact_store import ArtifactStore
+from sales_reconciliation import FILES, SALES_RECON_YEAR, reconcile
+from setoran_matching import STRATEGIES, match_files
+from rekon_splitting import BANKS, split_statement
+from zip_stream import iter_zip, resolve_zip_mode
+from upload_cache import upload_cache
+
+app = Flask(__name__)
+CORS(app)
+
+# Reconciliation results (result.json), addressed by run id (ARTIFACT_TTL / ARTIFACT_MAX_BYTES)
+artifacts = ArtifactStore('sales-recon')
+
+# Worker pool for reconciliation jobs (SPLIT_WORKERS / SPLIT_QUEUE_SIZE)
+recon_jobs = JobQueue()
+
+UPLOAD_EXTENSIONS = ('.xlsx', '.xlsm', '.csv')
+
+# Setoran matching inputs (file numbers as in sales_reconciliation.FILES)
+SETORAN_FILES = {1: 'acmm', 2: 'bca', 4: 'kartu_debit', 5: 'cabang'}
+
+# Rekon split inputs per bank: the statement plus the master files it needs
+REKON_SPLIT_FILES = {
+    'acmm': ('statement',),
+    'bri': ('statement', 'mid'),
+    'bca': ('statement', 'mid', 'kartu'),
+}
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint."""
+    return jsonify({'status': 'healthy', 'service': 'Sales Reconciliation API', 'artifacts': artifacts.stats(),
+                    'upload_cache': upload_cache().stats()}), 200
+
+
+def save_upload(file):
+    """Save an uploaded file to a temp path, keeping its extension (.xlsx / .csv)."""
+    extension = os.path.splitext(file.filename)[1].lower()
+    temp = tempfile.NamedTemporaryFile(delete=False, suffix=extension)
+    file.save(temp.name)
+    temp.close()
+    return temp.name
+
+
+def run_reconciliation(job, paths, year):
+    """Job body: reconcile the uploads and keep result.json in a new run directory."""
+    try:
+        result = reconcile(paths, year, progress=job.update)
+    finally:
+        for path in paths.values():
+            os.unlink(path)
+    run_id, directory = artifacts.create()
+    with open(os.path.join(directory, 'result.json'), 'w') as f:
+        json.dump(result, f)
+    artifacts.add_file(run_id, 'result.json')
+    artifacts.commit(run_id)
+    return {
+        'success': True,
+        'run_id': run_id,
+        'statistics': {mode: result[mode]['statistics'] for mode in ('period', 'daily')},
+        'counts': result['counts'],
+        'timings': result['timings'],
+    }
+
+
+@app.route('/api/sales-reconciliation', methods=['POST'])
+def reconcile_sales():
+    """
+    Queue a reconciliation run and return a job id (202).
+    Form fields (.xlsx or .csv): acmm, bca, mid, kartu_debit, cabang, bri,
+    bri_mid, petty_cash - bca or bri is required. Optional: year (for
+    'DD/MM' statement dates, default SALES_RECON_YEAR).
+    Poll /api/jobs/<job_id>; the finished job's result holds run_id, and the
+    full result tabs come from /api/sales-reconciliation/<run_id>.
+    """
+    try:
+        uploads = {number: request.files.get(field) for number, field in FILES.items()}
+        uploads = {number: f for number, f in uploads.items() if f and f.filename}
+        if 2 not in uploads and 6 not in uploads:
+            return jsonify({'error': 'Upload at least one bank statement file (bca or bri)'}), 400
+        for f in uploads.values():
+            if not f.filename.lower().endswith(UPLOAD_EXTENSIONS):
+                return jsonify({'error': f"Unsupported file type: {f.filename} (expected .xlsx or .csv)"}), 400
+        try:
+            year = int(request.form.get('year') or SALES_RECON_YEAR)
+        except ValueError:
+            return jsonify({'error': 'year must be an integer'}), 400
+
+        # Save uploaded files temporarily - the request body is gone once we return
+        paths = {number: save_upload(f) for number, f in uploads.items()}
+
+        try:
+            job = recon_jobs.submit('sales-recon', run_reconciliation, paths, year)
+        except QueueFullError as e:
+            for path in paths.values():
+                os.unlink(path)
+            return jsonify({'error': str(e)}), 503
+
+        return jsonify({'success': True, 'job_id': job.id, 'status': job.status}), 202
+
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"Error in reconcile_sales: {error_trace}")
+        return jsonify({'error': str(e), 'trace': error_trace}), 500
+
+
+def run_setoran_matching(job, paths, year, options):
+    """Job body: match daily cash sales to deposits and keep setoran.json in a new run directory."""
+    try:
+        result = match_files(paths, year, progress=job.update, **options)
+    finally:
+        for path in paths.values():
+            os.unlink(path)
+    run_id, directory = artifacts.create()
+    with open(os.path.join(directory, 'setoran.json'), 'w') as f:
+        json.dump(result, f)
+    artifacts.add_file(run_id, 'setoran.json')
+    artifacts.commit(run_id)
+    return {'success': True, 'run_id': run_id, 'statistics': result['statistics']}
+
+
+def setoran_options():
+    """window / lag / tolerance / strategy / cdm_rounding form fields, validated."""
+    try:
+        options = {
+            'window': int(request.form.get('window', '1')),
+            'lag': int(request.form.get('lag', '1')),
+            'tolerance': float(request.form.get('tolerance', '0')),
+        }
+    except ValueError:
+        raise ValueError('window and lag must be integers, tolerance a number')
+    if options['window'] < 0 or options['window'] > 31 or options['tolerance'] < 0:
+        raise ValueError('window must be 0-31 days and tolerance must not be negative')
+    options['strategy'] = request.form.get('strategy', 'greedy')
+    if options['strategy'] not in STRATEGIES:
+        raise ValueError(f"Unknown strategy '{options['strategy']}' (expected one of: {', '.join(STRATEGIES)})")
+    options['cdm_rounding'] = request.form.get('cdm_rounding', 'true').lower() not in ('0', 'false', 'no')
+    return options
+
+
+@app.route('/api/setoran-matching', methods=['POST'])
+def match_setoran():
+    """
+    Queue a setoran matching run and return a job id (202).
+    Form fields: acmm and bca (required), kartu_debit and cabang (outlet
+    lookups for CDM / Setoran Tunai), .xlsx or .csv. Options: window (+-days
+    around the expected deposit day, default 1), lag (days from sales to
+    deposit, default 1), tolerance (rupiah, default 0), strategy
+    (greedy | optimal), cdm_rounding (compare CDM with sales rounded down
+    to 50rb, default true), year.
+    Poll /api/jobs/<job_id>; matches come from /api/setoran-matching/<run_id>.
+    """
+    try:
+        uploads = {number: request.files.get(field) for number, field in SETORAN_FILES.items()}
+        uploads = {number: f for number, f in uploads.items() if f and f.filename}
+        if 1 not in uploads or 2 not in uploads:
+            return jsonify({'error': 'Upload the ACMM transaction summary (acmm) and BCA statement (bca)'}), 400
+        for f in uploads.values():
+            if not f.filename.lower().endswith(UPLOAD_EXTENSIONS):
+                return jsonify({'error': f"Unsupported file type: {f.filename} (expected .xlsx or .csv)"}), 400
+        try:
+            options = setoran_options()
+            year = int(request.form.get('year') or SALES_RECON_YEAR)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Save uploaded files temporarily - the request body is gone once we return
+        paths = {number: save_upload(f) for number, f in uploads.items()}
+
+        try:
+            job = recon_jobs.submit('setoran-match', run_setoran_matching, paths, year, options)
+        except QueueFullError as e:
+            for path in paths.values():
+                os.unlink(path)
+            return jsonify({'error': str(e)}), 503
+
+        return jsonify({'success': True, 'job_id': job.id, 'status': job.status}), 202
+
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"Error in match_setoran: {error_trace}")
+        return jsonify({'error': str(e), 'trace': error_trace}), 500
+
+
+@app.route('/api/setoran-matching/<run_id>', methods=['GET'])
+def setoran_result(run_id):
+    """Matches, unmatched sales days, unmatched deposits and statistics of a run."""
+    path = artifacts.file_path(run_id, 'setoran.json')
+    if path is None:
+        return jsonify({'error': 'Run not found'}), 404
+    return send_file(path, mimetype='application/json')
+
+
+def run_rekon_split(job, bank, paths):
+    """Job body: split the statement into per-GL / per-outlet CSV files of a new run."""
+    run_id, directory = artifacts.create()
+    try:
+        result = split_statement(bank, paths, directory, progress=job.update)
+    finally:
+        for path in paths.values():
+            os.unlink(path)
+    for filename in result['files']:
+        artifacts.add_file(run_id, filename)
+    artifacts.commit(run_id)
+    return {'success': True, 'run_id': run_id, 'bank': bank, **result}
+
+
+@app.route('/api/rekon-split/<bank>', methods=['POST'])
+def rekon_split(bank):
+    """
+    Queue a statement split and return a job id (202).
+    bank: acmm | bri | bca. Form fields: statement (.csv streamed row by row,
+    or .xlsx), plus mid (BRI / BCA Master MID) and kartu (BCA Kartu Debit).
+    Poll /api/jobs/<job_id>; the finished job lists the files, downloadable
+    one by one from /api/rekon-split/<run_id>/<filename> or all together
+    from /api/rekon-split/<run_id>/zip.
+    """
+    try:
+        if bank not in REKON_SPLIT_FILES:
+            return jsonify({'error': f"Unknown bank '{bank}' (expected one of: {', '.join(BANKS)})"}), 404
+        uploads = {field: request.files.get(field) for field in REKON_SPLIT_FILES[bank]}
+        missing = [field for field, f in uploads.items() if not f or not f.filename]
+        if missing:
+            return jsonify({'error': f"Missing file(s): {', '.join(missing)}"}), 400
+        for f in uploads.values():
+            if not f.filename.lower().endswith(UPLOAD_EXTENSIONS):
+                return jsonify({'error': f"Unsupported file type: {f.filename} (expected .xlsx or .csv)"}), 400
+
+        # Multipart parts are spooled to disk by werkzeug and copied in chunks,
+        # so the statement is never held in memory on the way to the job
+        paths = {field: save_upload(f) for field, f in uploads.items()}
+
+        try:
+            job = recon_jobs.submit('rekon-split', run_rekon_split, bank, paths)
+        except QueueFullError as e:
+            for path in paths.values():
+                os.unlink(path)
+            return jsonify({'error': str(e)}), 503
+
+        return jsonify({'success': True, 'job_id': job.id, 'status': job.status}), 202
+
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"Error in rekon_split: {error_trace}")
+        return jsonify({'error': str(e), 'trace': error_trace}), 500
+
+
+@app.route('/api/rekon-split/<run_id>/zip', methods=['GET'])
+def rekon_split_zip(run_id):
+    """
+    Stream a zip of all split files of a run, built on the fly.
+    Optional ?mode=stored|deflated (default SPLIT_ZIP_MODE).
+    """
+    entries = artifacts.entries(run_id, '.csv')
+    if not entries:
+        return jsonify({'error': f'Split files not found or expired: {run_id}'}), 404
+    mode = request.args.get('mode')
+    try:
+        resolve_zip_mode(mode)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(
+        stream_with_context(iter_zip(entries, mode)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="Rekon_Split_{run_id[:8]}.zip"'}
+    )
+
+
+@app.route('/api/rekon-split/<run_id>/<filename>', methods=['GET'])
+def rekon_split_file(run_id, filename):
+    """Download one split file of a run."""
+    path = artifacts.file_path(run_id, filename)
+    if path is None or not os.path.exists(path):
+        return jsonify({'error': f'File not found: {filename}'}), 404
+    return send_file(path, mimetype='text/csv', as_attachment=True, download_name=filename)
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report job status, progress counters and (when done) the result."""
+    job = recon_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@app.route('/api/sales-reconciliation/<run_id>', methods=['GET'])
+def run_result(run_id):
+    """
+    Result tabs of a run: period / daily (cash, nonCash, grandTotal, bcaOnly,
+    briOnly, statistics), pettyCash and exceptions.
+    """
+    path = artifacts.file_path(run_id, 'result.json')
+    if path is None:
+        return jsonify({'error': 'Run not found'}), 404
+    return send_file(path, mimetype='application/json')
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Sales Reconciliation API Server Starting...")
+    print("=" * 60)
+    print("Endpoints:")
+    print("  POST /api/sales-reconciliation - Queue ACMM + bank statements for reconciliation (returns job id)")
+    print("  GET  /api/jobs/<job_id> - Reconciliation job progress and result")
+    print("  GET  /api/sales-reconciliation/<run_id> - Period / daily result tabs, petty cash, exceptions")
+    print("  POST /api/setoran-matching - Queue ACMM + BCA for cash deposit matching (returns job id)")
+    print("  GET  /api/setoran-matching/<run_id> - Matched / unmatched sales days and deposits")
+    print("  POST /api/rekon-split/<bank> - Queue an ACMM / BRI / BCA statement split (returns job id)")
+    print("  GET  /api/rekon-split/<run_id>/zip - All split CSV files as a zip")
+    print("  GET  /api/rekon-split/<run_id>/<filename> - One split CSV file")
+    print("  GET  /health - Health check")
+    print("=" * 60)
+    app.run(host='0.0.0.0', port=5004, debug=True)
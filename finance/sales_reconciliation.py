@@ -0,0 +1,813 @@
+#!/usr/bin/env python3
+"""
+Sales reconciliation engine behind sales-reconciler.py.
+Implements the rules of sales-reconciliation.html (buildMasterLookups,
+pivotTransactionSummary, aggregateBCAByWeek, aggregateBRIByWeek,
+matchWeeklyData, separateResultsByBank) on pandas columns instead of
+per-row loops: amounts and outlet keys are parsed with precompiled regexes
+over whole columns, totals come from groupby, and statuses from joins.
+
+Uploads are numbered as on the page:
+  1 Transaction Summary ACMM   2 BCA statement     3 Master MID Outlet
+  4 Master Kartu Debit Outlet  5 Master BCA Cabang 6 BRI statement
+  7 BRI master MID             8 Petty Cash template (not used for matching)
+
+reconcile() returns the page's result tabs for both modes:
+  {'period': {...}, 'daily': {...}, 'pettyCash': [...], 'exceptions': [...]}
+where each mode holds cash / nonCash / grandTotal, bcaOnly / briOnly and
+statistics, with the same fields and statuses the browser produced.
+"""
+
+import csv
+import datetime
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from upload_cache import load_upload
+
+# Year for 'DD/MM' statement dates (the page hard-codes 2026)
+SALES_RECON_YEAR = int(os.getenv('SALES_RECON_YEAR', '2026'))
+
+FILES = {
+    1: 'acmm', 2: 'bca', 3: 'mid', 4: 'kartu_debit',
+    5: 'cabang', 6: 'bri', 7: 'bri_mid', 8: 'petty_cash',
+}
+MODES = ('period', 'daily')
+
+VALID_COA_ACCOUNTS = {
+    '11201010 - PIUTANG KARTU KREDIT - BCA',
+    '11201013 - PIUTANG KARTU KREDIT - BRI',
+    '11201100 - PIUTANG PENJUALAN CASH',
+}
+CASH_TYPES = ('CDM', 'SETORAN_TUNAI')
+NON_CASH_TYPES = ('CREDITCARD', 'DEBITCARD', 'QRIS')
+PETTY_CASH_KEYWORDS = ('PETTY', 'KAS KECIL', 'REIMB', 'ADVANCE', 'TOP UP')
+
+_EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+_DAY_MONTH = re.compile(r'^(\d+)/(\d+)$')
+_LEADING_FLOAT = re.compile(r'^\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)')
+_BCA_SKIP = re.compile(r'BI-FAST|TRSF E-BANKING|BYR')
+_OUTLET_IN_PARENS = re.compile(r'\(([^)]+)\)')
+_CR_SUFFIX = re.compile(r'\s*CR\s*$', re.I)
+_NOT_NUMERIC = re.compile(r'[^0-9.-]')
+_NON_DIGITS = re.compile(r'\D')
+_CDM_CARD = re.compile(r'SETORAN VIA CDM.*?(\d{12,})', re.I)
+_CREDIT_CARD_MID = re.compile(r'KARTU KREDIT.*?MID:(\d+)', re.I)
+_DEBIT_CARD_MID = re.compile(r'KR OTOMATIS.*?MID\s*:\s*(\d+)', re.I)
+_FLAZZ = re.compile(r'FLAZZ\s+(\d+)', re.I)
+_MID = re.compile(r'MID\s*:\s*(\d+)', re.I)
+_SALES = re.compile(r'\*SALES\*\s*:\s*([\d,]+\.?\d*)', re.I)
+_PAYMENT = re.compile(r'\*[^*]+\*\s*:\s*([\d,]+\.?\d*)')
+_TGH = re.compile(r'TGH\s*:\s*([\d,]+\.?\d*)', re.I)
+_QR = re.compile(r'QR\s*:\s*([\d,]+\.?\d*)', re.I)
+_BRI_AMT = re.compile(r'AMT:([\d.,]+)')
+_BRI_MID = re.compile(r'\b(\d{12})\b')
+_NOT_ALNUM = re.compile(r'[^A-Za-z0-9]')
+
+
+# ── reading ────────────────────────────────────────────────────────────────
+
+def read_rows(path):
+    """All rows of the first sheet (.xlsx, from the shared upload cache) or of a .csv file, as lists."""
+    if path.lower().endswith('.csv'):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            return list(csv.reader(f))
+    return load_upload(path).sheet(0).rows()
+
+
+def read_table(path):
+    """to_frame(read_rows(path)); .xlsx tables are built straight from the cached columns."""
+    if path.lower().endswith('.csv'):
+        return to_frame(read_rows(path))
+    columns = load_upload(path).sheet(0).columns()
+    frame = pd.DataFrame({j: values[1:] for j, values in enumerate(columns)}, dtype=object)
+    frame.index = pd.RangeIndex(1, len(frame) + 1)
+    return frame
+
+
+def to_frame(rows):
+    """Data rows (header dropped) as an object DataFrame with integer column labels."""
+    frame = pd.DataFrame(rows[1:], dtype=object)
+    frame.index = pd.RangeIndex(1, len(frame) + 1)  # row numbers as on the sheet (header = 0)
+    return frame
+
+
+def column(frame, index):
+    if index in frame.columns:
+        return frame[index]
+    return pd.Series([None] * len(frame), index=frame.index, dtype=object)
+
+
+def _js_string(value):
+    """String(value) as the page saw it: '' for empty, integral floats without '.0'."""
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        if value != value:
+            return ''
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+def per_unique(function):
+    """
+    Apply a column function to the distinct values only and broadcast back:
+    statement columns (dates, codes, descriptions of recurring settlements)
+    repeat heavily, so this does the string work once per value.
+    """
+    def wrapper(series, *args):
+        codes, uniques = pd.factorize(series.astype(object), use_na_sentinel=False)
+        values = function(pd.Series(uniques, dtype=object), *args)
+        return pd.Series(values.to_numpy().take(codes), index=series.index, dtype=values.dtype)
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+@per_unique
+def text(series):
+    return pd.Series([_js_string(v) for v in series], index=series.index, dtype=object)
+
+
+def parse_float(series):
+    """parseFloat(value) || 0 over a column: leading number of strings, numbers as-is."""
+    numbers = pd.to_numeric(series, errors='coerce')
+    retry = numbers.isna() & series.notna()
+    if retry.any():
+        leading = text(series[retry]).str.extract(_LEADING_FLOAT, expand=False)
+        numbers[retry] = pd.to_numeric(leading, errors='coerce')
+    return numbers.fillna(0.0).astype(float)
+
+
+def _id_number(series):
+    """'1.335.700,00' -> 1335700.0 (dots are thousands, first comma is the decimal point)."""
+    cleaned = series.str.replace('.', '', regex=False).str.replace(',', '.', n=1, regex=False)
+    return parse_float(cleaned)
+
+
+@per_unique
+def parse_dates(series, year=SALES_RECON_YEAR):
+    """parseDate over a column: datetimes, Excel serials, 'DD/MM' (in `year`) and other date strings."""
+    result = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    kinds = series.map(type)
+    is_date = kinds.isin((datetime.datetime, datetime.date, pd.Timestamp))
+    if is_date.any():
+        result[is_date] = pd.to_datetime(series[is_date])
+    is_number = kinds.isin((int, float)) & ~kinds.eq(bool)
+    if is_number.any():
+        days = series[is_number].astype(float)
+        result[is_number] = _EXCEL_EPOCH + pd.to_timedelta(days, unit='D')
+    is_text = kinds.eq(str)
+    if is_text.any():
+        strings = series[is_text].str.strip()
+        parts = strings.str.extract(_DAY_MONTH)
+        day_month = parts[0].notna()
+        if day_month.any():
+            result[parts.index[day_month]] = pd.to_datetime(
+                pd.DataFrame({'year': year, 'month': parts.loc[day_month, 1].astype(int),
+                              'day': parts.loc[day_month, 0].astype(int)}), errors='coerce')
+        other = strings[~day_month & strings.ne('')]
+        if len(other):
+            result[other.index] = pd.to_datetime(other, errors='coerce', format='mixed')
+    return result.dt.normalize()
+
+
+@per_unique
+def format_dates(dates):
+    """formatDate: 'DD/MM'"""
+    return pd.to_datetime(dates).dt.strftime('%d/%m').fillna('').astype(object)
+
+
+def last_digits(series, n):
+    """extractLastDigits over a column of strings."""
+    return series.fillna('').astype(str).str.replace(_NON_DIGITS, '', regex=True).str[-n:]
+
+
+def round_down_50k(values):
+    return np.floor(np.asarray(values, dtype=float) / 50000) * 50000
+
+
+def format_idr(amounts):
+    """toLocaleString('id-ID', 2 decimals): 1234567.8 -> '1.234.567,80'"""
+    return [f'{a:,.2f}'.replace(',', '_').replace('.', ',').replace('_', '.') for a in amounts]
+
+
+def cents(values):
+    return np.round(np.asarray(values, dtype=float) * 100).astype(np.int64)
+
+
+# ── master lookups ─────────────────────────────────────────────────────────
+
+def _mapping(keys, values):
+    """dict of key -> value for non-empty pairs; later rows win, like Map.set."""
+    pairs = pd.DataFrame({'key': keys, 'value': values})
+    pairs = pairs[pairs['key'].ne('') & pairs['value'].ne('')]
+    return dict(zip(pairs['key'], pairs['value']))
+
+
+def build_lookups(tables):
+    """buildMasterLookups: kartuDebit / mid / cabang / briMid dicts."""
+    lookups = {'kartuDebit': {}, 'mid': {}, 'cabang': {}, 'briMid': {}}
+    if tables.get(4) is not None:
+        frame = tables[4]
+        lookups['kartuDebit'] = _mapping(last_digits(text(column(frame, 5)), 12), text(column(frame, 6)))
+    if tables.get(3) is not None:
+        frame = tables[3]
+        lookups['mid'] = _mapping(last_digits(text(column(frame, 3)), 7), text(column(frame, 4)))
+    if tables.get(5) is not None:
+        frame = tables[5]
+        a, b, c, d = (text(column(frame, i)) for i in range(4))
+        # Cabang code in column A, else B, else C; outlet in the next column
+        key = a.where(a.ne(''), b.where(b.ne(''), c))
+        value = b.where(a.ne(''), c.where(b.ne(''), d))
+        lookups['cabang'] = _mapping(key.str.strip(), value.str.strip())
+    if tables.get(7) is not None:
+        frame = tables[7]
+        mid = text(column(frame, 0)).str.strip()
+        outlet = text(column(frame, 1)).str.strip()
+        mapping = {}
+        # Statements use 12-digit MIDs (001999XXXXXX), the master often 10 digits
+        padded = mid.str.len().eq(10) & ~mid.str.startswith('00')
+        for m, o, pad in zip(mid, outlet, padded):
+            if m and o:
+                mapping[m] = o
+                if pad:
+                    mapping['00' + m] = o
+        lookups['briMid'] = mapping
+    return lookups
+
+
+# ── ACMM ───────────────────────────────────────────────────────────────────
+
+def acmm_rows(frame, year=SALES_RECON_YEAR):
+    """
+    Transaction summary rows that count for reconciliation: date, outletCode,
+    paymentMethod, bankName, debitAmount, creditAmount.
+    """
+    columns = ['date', 'outletCode', 'paymentMethod', 'bankName', 'debitAmount', 'creditAmount']
+    if frame is None or frame.empty:
+        return pd.DataFrame(columns=columns)
+    dates = parse_dates(column(frame, 0), year)
+    store = text(column(frame, 2))
+    outlet = store.str.extract(_OUTLET_IN_PARENS, expand=False)
+    method = text(column(frame, 5))
+    bank = text(column(frame, 7)).str.strip().str.upper()
+    debit_credit = text(column(frame, 11)).str.strip().str.upper()
+    coa = text(column(frame, 12)).str.strip()
+    amount = parse_float(column(frame, 13))
+
+    keep = dates.notna() & store.ne('') & outlet.notna() & coa.isin(VALID_COA_ACCOUNTS) & method.ne('SALES')
+    # CASH has no bank in column H; it is deposited to BCA (CDM / Setoran)
+    bank = bank.mask(method.eq('CASH') & bank.isin(('', 'NAN', 'UNDEFINED')), 'BCA')
+    return pd.DataFrame({
+        'date': dates, 'outletCode': outlet, 'paymentMethod': method, 'bankName': bank,
+        'debitAmount': amount.where(debit_credit.eq('DEBIT'), 0.0),
+        'creditAmount': amount.where(debit_credit.eq('CREDIT'), 0.0),
+    })[keep]
+
+
+def pivot_acmm(rows):
+    """
+    pivotTransactionSummary + aggregateACMMByWeek: net amount (DEBIT - CREDIT)
+    per outlet, payment method and bank of acmm_rows(), in first-seen order.
+    """
+    columns = ['outletCode', 'paymentMethod', 'bankName', 'debitAmount', 'creditAmount', 'amount', 'count']
+    if rows.empty:
+        return pd.DataFrame(columns=columns)
+    pivot = rows.groupby(['outletCode', 'paymentMethod', 'bankName'], sort=False).agg(
+        debitAmount=('debitAmount', 'sum'), creditAmount=('creditAmount', 'sum'),
+        count=('debitAmount', 'size')).reset_index()
+    pivot['amount'] = pivot['debitAmount'] - pivot['creditAmount']
+    return pivot[columns]
+
+
+def daily_cash(rows):
+    """Net CASH sales per outlet and sales date (the amounts deposited via CDM / Setoran)."""
+    cash = rows[(rows['paymentMethod'] == 'CASH') & (rows['bankName'] == 'BCA')]
+    daily = cash.groupby(['outletCode', 'date'], sort=True).agg(
+        debitAmount=('debitAmount', 'sum'), creditAmount=('creditAmount', 'sum')).reset_index()
+    daily['amount'] = daily['debitAmount'] - daily['creditAmount']
+    return daily[['outletCode', 'date', 'amount']]
+
+
+# ── BCA ────────────────────────────────────────────────────────────────────
+
+def _description_amounts(description):
+    """parseBCAAmountFromDescription for QRIS / card rows: *SALES*, sum of *TYPE*:x, TGH:, QR:"""
+    def number(match):
+        return pd.to_numeric(match.str.replace(',', '', regex=False), errors='coerce')
+
+    sales = number(description.str.extract(_SALES, expand=False))
+    payments = description.str.extractall(_PAYMENT)
+    if len(payments):
+        payment_sum = number(payments[0]).groupby(level=0).sum().reindex(description.index, fill_value=0.0)
+    else:
+        payment_sum = pd.Series(0.0, index=description.index)
+    tgh = number(description.str.extract(_TGH, expand=False))
+    qr = number(description.str.extract(_QR, expand=False))
+    return pd.Series(np.select(
+        [sales.notna(), payment_sum > 0, tgh.notna(), qr.notna()],
+        [sales.fillna(0.0), payment_sum, tgh.fillna(0.0), qr.fillna(0.0)], 0.0), index=description.index)
+
+
+def parse_bca(frame, lookups, year=SALES_RECON_YEAR):
+    """
+    BCA statement rows with a known outlet: date ('DD/MM'), day (datetime),
+    outletCode, transactionType, amount, reference (aggregateBCAByWeek before
+    the mode-specific rules).
+    """
+    columns = ['row', 'date', 'day', 'outletCode', 'transactionType', 'amount', 'reference']
+    if frame is None or frame.empty:
+        return pd.DataFrame(columns=columns)
+    dates = parse_dates(column(frame, 0), year)
+    description = text(column(frame, 1))
+    keep = dates.notna() & description.ne('') & ~description.str.contains(_BCA_SKIP, regex=True)
+    frame, dates, description = frame[keep], dates[keep], description[keep]
+    cabang = text(column(frame, 2)).str.strip()
+
+    kind = pd.Series(np.select(
+        [description.str.contains('SETORAN VIA CDM', regex=False),
+         description.str.contains('KARTU KREDIT', regex=False),
+         description.str.contains('QR :', regex=False),
+         description.str.contains('KR OTOMATIS', regex=False),
+         description.str.contains('SETORAN TUNAI', regex=False)],
+        ['CDM', 'CREDITCARD', 'QRIS', 'DEBITCARD', 'SETORAN_TUNAI'], 'OTHER'), index=description.index)
+
+    # CDM / Setoran amounts from column D (Jumlah), card / QRIS amounts from the description
+    amount = pd.Series(0.0, index=description.index)
+    cash = kind.isin(CASH_TYPES)
+    column_d = text(column(frame, 3)).str.strip().str.replace(_CR_SUFFIX, '', regex=True)
+    amount[cash] = parse_float(column_d[cash].str.replace(_NOT_NUMERIC, '', regex=True))
+    cards = kind.isin(NON_CASH_TYPES)
+    if cards.any():
+        amount[cards] = _description_amounts(description[cards])
+
+    def extract(pattern, rows):
+        """First group of `pattern` on the rows of one transaction type ('' elsewhere)."""
+        found = pd.Series('', index=description.index, dtype=object)
+        if rows.any():
+            found[rows] = description[rows].str.extract(pattern, expand=False).fillna('')
+        return found
+
+    cdm_card = extract(_CDM_CARD, kind.eq('CDM')).str[-12:]
+    mid = extract(_MID, cards)
+    debit_card = kind.eq('DEBITCARD')
+    debit_mid = extract(_DEBIT_CARD_MID, debit_card)
+    flazz = extract(_FLAZZ, debit_card & debit_mid.eq(''))
+    card_mid = pd.Series(np.select(
+        [kind.eq('CREDITCARD'), kind.eq('QRIS'), debit_card],
+        [extract(_CREDIT_CARD_MID, kind.eq('CREDITCARD')), mid, debit_mid.where(debit_mid.ne(''), flazz)], ''),
+        index=description.index).str[-7:]
+    outlet = pd.Series(np.select(
+        [kind.eq('CDM'), kind.eq('SETORAN_TUNAI'), cards],
+        [cdm_card.map(lookups['kartuDebit']), cabang.map(lookups['cabang']), card_mid.map(lookups['mid'])],
+        None), index=description.index)
+    reference = pd.Series(np.select(
+        [kind.eq('CDM'), cards, kind.eq('SETORAN_TUNAI')], [cdm_card, mid.str[-7:], cabang], ''),
+        index=description.index)
+
+    parsed = pd.DataFrame({'row': description.index, 'date': format_dates(dates), 'day': dates, 'outletCode': outlet,
+                           'transactionType': kind, 'amount': amount, 'reference': reference})
+    return parsed[outlet.notna()].reset_index(drop=True)[columns]
+
+
+def bca_for_mode(parsed, mode):
+    """Daily mode: manual bank-in (Setoran Tunai) excluded, CDM rounded down to 50rb."""
+    if mode != 'daily' or parsed.empty:
+        return parsed
+    daily = parsed[parsed['transactionType'].ne('SETORAN_TUNAI')].copy()
+    cdm = daily['transactionType'].eq('CDM')
+    daily.loc[cdm, 'amount'] = round_down_50k(daily.loc[cdm, 'amount'])
+    return daily
+
+
+# ── BRI ────────────────────────────────────────────────────────────────────
+
+def parse_bri(frame, lookups, year=SALES_RECON_YEAR):
+    """
+    aggregateBRIByWeek: (transactions, petty cash list, exceptions list).
+    Exceptions and petty cash keep statement order.
+    """
+    columns = ['row', 'date', 'outletCode', 'transactionType', 'amount', 'reference']
+    if frame is None or frame.empty:
+        return pd.DataFrame(columns=columns), [], []
+    dates = parse_dates(column(frame, 2), year)
+    description = text(column(frame, 6))
+    keep = dates.notna() & description.ne('')
+    frame, dates, description = frame[keep], dates[keep], description[keep]
+    credit = parse_float(column(frame, 9))
+    debit = parse_float(column(frame, 8))
+    tlbds1 = text(column(frame, 16))
+    tlbds2 = text(column(frame, 17))
+    upper = description.str.upper()
+    details = description.str[:100]
+
+    amount = _id_number(tlbds1.str.extract(_BRI_AMT, expand=False).fillna(''))
+    amount = amount.where(amount != 0, credit)
+    kind = pd.Series(np.select(
+        [upper.str.contains('QRIS', regex=False),
+         upper.str.contains('OFFUS', regex=False) | upper.str.contains('ONUS', regex=False),
+         upper.str.contains('CREDIT|KREDIT|VISA|MASTER|JCB|AMEX', regex=True)],
+        ['QRIS', 'DEBITCARD', 'CREDITCARD'], ''), index=description.index)
+    mid = description.str.extract(_BRI_MID, expand=False).fillna(tlbds2.str.extract(_BRI_MID, expand=False))
+    outlet = mid.map(lookups['briMid'])
+    store = outlet.fillna('').astype(str).str.replace(_NOT_ALNUM, '', regex=True)
+
+    is_debit = debit > 0
+    is_credit = ~is_debit & (credit > 0)
+    petty = is_credit & (amount < 500000) & upper.str.contains(
+        '|'.join(re.escape(k) for k in PETTY_CASH_KEYWORDS), regex=True)
+    candidate = is_credit & ~petty
+    outcome = pd.Series(np.select(
+        [is_debit,
+         candidate & kind.eq(''),
+         candidate & mid.isna(),
+         candidate & outlet.isna(),
+         candidate & store.eq(''),
+         candidate],
+        ['DEBIT_TRANSACTION', 'UNKNOWN_TRANSACTION_TYPE', 'EMPTY_MID', 'UNKNOWN_MID', 'INVALID_STORE_CODE', 'OK'],
+        ''), index=description.index)
+
+    iso_dates = dates.dt.strftime('%Y-%m-%d')
+    reasons = {
+        'DEBIT_TRANSACTION': pd.Series('Bank fee/debit transaction excluded per MOM', index=description.index),
+        'UNKNOWN_TRANSACTION_TYPE': pd.Series('Could not determine transaction type', index=description.index),
+        'EMPTY_MID': pd.Series('No MID found in transaction', index=description.index),
+        'UNKNOWN_MID': 'MID ' + mid.fillna('') + ' not in master list',
+        'INVALID_STORE_CODE': pd.Series('Invalid store code: INVALID_CHARS', index=description.index),
+    }
+    exceptions = []
+    for row in outcome[outcome.ne('OK') & outcome.ne('')].index:
+        kind_of = outcome[row]
+        exceptions.append({
+            'type': kind_of,
+            'bank': 'BRI',
+            'date': iso_dates[row],
+            'amount': float(debit[row] if kind_of == 'DEBIT_TRANSACTION' else amount[row]),
+            'reason': reasons[kind_of][row],
+            'details': f"Outlet: {outlet[row]}, {description[row][:50]}" if kind_of == 'INVALID_STORE_CODE'
+            else details[row],
+        })
+    petty_cash = [{'date': iso_dates[row], 'description': description[row], 'amount': float(amount[row]),
+                   'tlbds1': tlbds1[row], 'tlbds2': tlbds2[row]} for row in petty[petty].index]
+
+    ok = outcome.eq('OK')
+    parsed = pd.DataFrame({'row': description.index, 'date': format_dates(dates), 'outletCode': outlet,
+                           'transactionType': kind, 'amount': amount, 'reference': mid.fillna('')})
+    return parsed[ok].reset_index(drop=True)[columns], petty_cash, exceptions
+
+
+# ── matching ───────────────────────────────────────────────────────────────
+
+class BankTotals:
+    """Per (outlet, type) totals, counts and detail lines of one bank's transactions."""
+
+    def __init__(self, transactions):
+        self.transactions = transactions
+        if transactions.empty:
+            self.groups = pd.DataFrame(columns=['outletCode', 'transactionType', 'total', 'count'])
+            self.lines = {}
+            self._by_outlet = {}
+            return
+        self.groups = transactions.groupby(['outletCode', 'transactionType'], sort=False).agg(
+            total=('amount', 'sum'), count=('amount', 'size')).reset_index()
+        body = (transactions['date'] + ' | Rp ' + pd.Series(format_idr(transactions['amount']),
+                                                             index=transactions.index)
+                + ' | Ref: ' + transactions['reference'])
+        number = transactions.groupby(['outletCode', 'transactionType'], sort=False).cumcount() + 1
+        label = transactions['transactionType'].replace('SETORAN_TUNAI', 'SETORAN')
+        lines = '[' + label + ' ' + number.astype(str) + '] ' + body
+        self.lines = lines.groupby([transactions['outletCode'], transactions['transactionType']],
+                                   sort=False).agg(list).to_dict()
+        self._by_outlet = {}
+        for outlet, kind, total, count in self.groups.itertuples(index=False):
+            self._by_outlet.setdefault(outlet, []).append((kind, total, count))
+
+    def outlets(self):
+        return list(dict.fromkeys(self.groups['outletCode']))
+
+    def entries(self, outlet):
+        """[(type, total, count)] of an outlet, in first-seen order."""
+        return self._by_outlet.get(outlet, [])
+
+    def total(self, outlet, kind):
+        for entry_kind, total, count in self.entries(outlet):
+            if entry_kind == kind:
+                return total, count
+        return None
+
+    def detail_lines(self, outlet, kinds):
+        lines = []
+        for kind in kinds:
+            lines += self.lines.get((outlet, kind), [])
+        return lines
+
+
+def _rate(matched, total):
+    return f'{matched / total * 100:.1f}' if total else 0
+
+
+def _first_exact(cash_transactions, targets):
+    """
+    Join cash transactions to per-outlet target amounts on (outlet, amount in
+    cents); the first CDM, else Setoran, transaction that equals the target.
+    Returns {outlet: transaction index}.
+    """
+    if cash_transactions.empty or targets.empty:
+        return {}
+    txns = cash_transactions.assign(cents=cents(cash_transactions['amount']),
+                                    rank=cash_transactions['transactionType'].ne('CDM').astype(int),
+                                    position=np.arange(len(cash_transactions)))
+    wanted = pd.DataFrame({'outletCode': targets.index, 'cents': cents(targets.values)})
+    hits = txns.merge(wanted, on=['outletCode', 'cents']).sort_values(['rank', 'position'])
+    first = hits.drop_duplicates('outletCode')
+    return dict(zip(first['outletCode'], first['position']))
+
+
+def match(acmm, bca, bri, mode):
+    """
+    matchWeeklyData: CASH, NON-CASH total and GRAND TOTAL results per outlet.
+    acmm: pivot_acmm frame; bca / bri: BankTotals (bri None without a BRI statement).
+    """
+    daily = mode == 'daily'
+    acmm_outlets = list(dict.fromkeys(acmm['outletCode']))
+    outlets = list(dict.fromkeys(acmm_outlets + bca.outlets() + (bri.outlets() if bri else [])))
+    acmm_rows = {}
+    for row in acmm.itertuples(index=False):
+        acmm_rows.setdefault(row.outletCode, []).append(row)
+
+    # CASH: ACMM CASH|BCA vs CDM + Setoran; exact single-transaction matches found by join
+    cash_txns = bca.transactions[bca.transactions['transactionType'].isin(CASH_TYPES)].reset_index(drop=True) \
+        if not bca.transactions.empty else bca.transactions
+    acmm_cash = acmm[(acmm['paymentMethod'] == 'CASH') & (acmm['bankName'] == 'BCA')].set_index('outletCode')['amount']
+    bca_cash = pd.Series({o: sum(t for k, t, _ in bca.entries(o) if k in CASH_TYPES) for o in outlets}, dtype=float)
+    both = acmm_cash[(acmm_cash > 0) & (bca_cash.reindex(acmm_cash.index, fill_value=0) > 0)]
+    exact = _first_exact(cash_txns, both)
+    rounded_exact = {}
+    if daily:
+        rest = both[~both.index.isin(list(exact))]
+        rounded_exact = _first_exact(cash_txns, pd.Series(round_down_50k(rest.values), index=rest.index))
+
+    cash_results = []
+    for outlet in outlets:
+        acmm_total = float(acmm_cash.get(outlet, 0.0))
+        acmm_methods = [f'CASH: {acmm_total:.2f}'] if outlet in acmm_cash.index else []
+        bca_total = 0.0
+        breakdown = []
+        for kind, label in (('CDM', 'CDM'), ('SETORAN_TUNAI', 'SETORAN')):
+            entry = bca.total(outlet, kind)
+            if entry:
+                bca_total += entry[0]
+                breakdown.append(f'{label}: {entry[0]:.2f} ({entry[1]} txns)')
+        if not (acmm_total > 0 or bca_total > 0):
+            continue
+        difference = bca_total - acmm_total
+        status, fraud, sisa_alert, matched = 'UNMATCHED', False, False, None
+        if acmm_total > 0 and bca_total > 0:
+            position = exact.get(outlet)
+            if position is None and daily:
+                position = rounded_exact.get(outlet)
+            if position is not None:
+                status, sisa_alert, matched = 'MATCHED_WITH_SISA', True, position
+            elif not daily:
+                status = 'MATCHED' if abs(difference) <= 500 else 'AMOUNT_MISMATCH'
+            else:
+                status = 'MATCHED' if cents([bca_total])[0] == cents(round_down_50k([acmm_total]))[0] else 'FRAUD_ALERT'
+                fraud = status == 'FRAUD_ALERT'
+            if daily and outlet not in exact and abs(difference) > 5000000:
+                status, fraud, sisa_alert = 'FRAUD_ALERT', True, False
+        elif acmm_total == 0:
+            status = 'NO_ACMM_DATA'
+        elif bca_total == 0:
+            status = 'NO_BCA_DATA'
+            fraud = daily and acmm_total > 500000
+
+        details = bca.detail_lines(outlet, CASH_TYPES)
+        sisa_info = None
+        if sisa_alert:
+            mine = cash_txns[cash_txns['outletCode'] == outlet]
+            mine = pd.concat([mine[mine['transactionType'] == 'CDM'], mine[mine['transactionType'] == 'SETORAN_TUNAI']])
+            hit = cash_txns.loc[matched]
+            sisa = mine.drop(index=matched)
+            sisa_total = float(sisa['amount'].sum())
+            sisa_list = [{'type': 'CDM' if k == 'CDM' else 'SETORAN', 'date': d, 'amount': float(a), 'reference': r}
+                         for k, d, a, r in zip(sisa['transactionType'], sisa['date'], sisa['amount'], sisa['reference'])]
+            if sisa_list:
+                hit_type = 'CDM' if hit['transactionType'] == 'CDM' else 'SETORAN'
+                details = [f"✅ MATCHED: [{hit_type}] {hit['date']} | Rp {format_idr([hit['amount']])[0]} | Ref: {hit['reference']}",
+                           '', f'⚠️ SISA TRANSACTIONS (Total: Rp {format_idr([sisa_total])[0]})']
+                details += [f"   [{s['type']} {i}] {s['date']} | Rp {idr} | Ref: {s['reference']}"
+                            for i, (s, idr) in enumerate(zip(sisa_list, format_idr([s['amount'] for s in sisa_list])), 1)]
+            sisa_info = {'matchedAmount': float(hit['amount']), 'sisaCount': len(sisa_list),
+                         'sisaTotal': sisa_total, 'sisaTransactions': sisa_list}
+
+        cash_results.append({
+            'weekKey': 'ALL', 'weekLabel': 'All Dates', 'weekStart': '', 'weekEnd': '',
+            'outletCode': outlet, 'category': 'CASH', 'bank': 'BCA',
+            'bcaTotal': bca_total, 'acmmTotal': acmm_total, 'difference': difference,
+            'status': status, 'fraudAlert': fraud, 'sisaAlert': sisa_alert, 'matchingMode': mode,
+            'acmmBreakdown': '; '.join(acmm_methods), 'bcaBreakdown': '; '.join(breakdown),
+            'transactionDetails': '\n'.join(details), 'sisaInfo': sisa_info,
+        })
+
+    # NON-CASH: ACMM card / QRIS per bank vs BCA + BRI card / QRIS
+    non_cash_results = []
+    for outlet in outlets:
+        acmm_bank = {'BCA': [0.0, []], 'BRI': [0.0, []]}
+        for row in acmm_rows.get(outlet, []):
+            if row.paymentMethod != 'CASH' and row.bankName in acmm_bank:
+                acmm_bank[row.bankName][0] += row.amount
+                acmm_bank[row.bankName][1].append(f'{row.paymentMethod}: {row.amount:.2f}')
+        acmm_total = acmm_bank['BCA'][0] + acmm_bank['BRI'][0]
+        acmm_methods = [f'{bank}: {", ".join(methods)}' for bank, (_, methods) in acmm_bank.items() if methods]
+
+        bank_totals = {}
+        breakdown = []
+        details = []
+        for name, totals in (('BCA', bca), ('BRI', bri)):
+            total = 0.0
+            parts = []
+            if totals is not None:
+                for kind in NON_CASH_TYPES:
+                    entry = totals.total(outlet, kind)
+                    if entry:
+                        total += entry[0]
+                        parts.append(f'{kind}: {entry[0]:.2f} ({entry[1]} txns)')
+                lines = totals.detail_lines(outlet, NON_CASH_TYPES)
+                if lines:
+                    details += [f'=== {name} Transactions ==='] + lines
+            bank_totals[name] = total
+            if parts:
+                breakdown.append(f'{name}: {", ".join(parts)}')
+        bank_total = bank_totals['BCA'] + bank_totals['BRI']
+        if not (acmm_total > 0 or bank_total > 0):
+            continue
+        difference = bank_total - acmm_total
+        status, fraud = 'UNMATCHED', False
+        if acmm_total > 0 and bank_total > 0:
+            if not daily:
+                status = 'MATCHED' if abs(difference) <= 500 else 'AMOUNT_MISMATCH'
+            else:
+                status = 'MATCHED' if abs(difference) <= 10 else 'FRAUD_ALERT'
+                fraud = status == 'FRAUD_ALERT'
+        elif acmm_total == 0:
+            status = 'NO_ACMM_DATA'
+            fraud = daily and bank_total > 100000
+        elif bank_total == 0:
+            status = 'NO_BANK_DATA'
+            fraud = daily and acmm_total > 100000
+
+        non_cash_results.append({
+            'weekKey': 'ALL', 'weekLabel': 'All Dates', 'weekStart': '', 'weekEnd': '',
+            'outletCode': outlet, 'category': 'NON-CASH', 'transactionType': 'TOTAL', 'bank': 'BCA+BRI',
+            'bcaTotal': bank_total, 'acmmTotal': acmm_total, 'difference': difference,
+            'status': status, 'fraudAlert': fraud, 'matchingMode': mode,
+            'acmmBreakdown': '; '.join(acmm_methods), 'bcaBreakdown': ' | '.join(breakdown),
+            'transactionDetails': '\n'.join(details),
+            'acmmBCATotal': acmm_bank['BCA'][0], 'acmmBRITotal': acmm_bank['BRI'][0],
+            'acmmBCABreakdown': ', '.join(acmm_bank['BCA'][1]), 'acmmBRIBreakdown': ', '.join(acmm_bank['BRI'][1]),
+            'bcaBankTotal': bank_totals['BCA'], 'briBankTotal': bank_totals['BRI'],
+        })
+
+    # GRAND TOTAL: every ACMM method vs every bank transaction type
+    grand_results = []
+    for outlet in outlets:
+        rows = acmm_rows.get(outlet, [])
+        acmm_total = float(sum(r.amount for r in rows))
+        acmm_methods = [f'{r.bankName}-{r.paymentMethod}: {r.amount:.2f}' for r in rows]
+        bank_total = 0.0
+        breakdown = []
+        for name, totals in (('BCA', bca), ('BRI', bri)):
+            entries = totals.entries(outlet) if totals is not None else []
+            bank_total += sum(t for _, t, _ in entries)
+            if entries:
+                breakdown.append(f'{name}: {", ".join(f"{k}: {t:.2f}" for k, t, _ in entries)}')
+        if not (acmm_total > 0 or bank_total > 0):
+            continue
+        difference = bank_total - acmm_total
+        if acmm_total > 0 and bank_total > 0:
+            status = 'MATCHED' if abs(difference) <= 500 else 'AMOUNT_MISMATCH'
+        elif acmm_total == 0:
+            status = 'NO_ACMM_DATA'
+        elif bank_total == 0:
+            status = 'NO_BANK_DATA'
+        else:
+            status = 'UNMATCHED'
+        grand_results.append({
+            'weekKey': 'ALL', 'weekLabel': 'All Dates', 'weekStart': '', 'weekEnd': '',
+            'outletCode': outlet, 'category': 'GRAND_TOTAL', 'transactionType': 'ALL', 'bank': 'BCA+BRI',
+            'bcaTotal': bank_total, 'acmmTotal': acmm_total, 'difference': difference, 'status': status,
+            'acmmBreakdown': '; '.join(acmm_methods), 'bcaBreakdown': ' | '.join(breakdown),
+        })
+
+    cash_matched = sum(r['status'] == 'MATCHED' for r in cash_results)
+    non_cash_matched = sum(r['status'] == 'MATCHED' for r in non_cash_results)
+    grand_matched = sum(r['status'] == 'MATCHED' for r in grand_results)
+    statistics = {
+        'cashTotal': len(cash_results), 'cashMatched': cash_matched,
+        'cashMatchRate': _rate(cash_matched, len(cash_results)),
+        'nonCashTotalCount': len(non_cash_results), 'nonCashTotalMatched': non_cash_matched,
+        'nonCashTotalMatchRate': _rate(non_cash_matched, len(non_cash_results)),
+        'grandTotalCount': len(grand_results), 'grandTotalMatched': grand_matched,
+        'grandTotalMatchRate': _rate(grand_matched, len(grand_results)),
+    }
+    return cash_results, non_cash_results, grand_results, statistics
+
+
+def separate_by_bank(cash_results, non_cash_results, grand_results, bca, bri):
+    """separateResultsByBank: BCA-only and BRI-only views of the NON-CASH totals."""
+    bca_only = {'cash': list(cash_results), 'nonCash': [], 'grandTotal': []}
+    bri_only = {'cash': [], 'nonCash': [], 'grandTotal': []}
+    for result in non_cash_results:
+        outlet = result['outletCode']
+        for name, totals, acmm_total, acmm_breakdown, bank_total, view, missing in (
+                ('BCA', bca, result['acmmBCATotal'], result['acmmBCABreakdown'], result['bcaBankTotal'],
+                 bca_only, 'NO_BCA_DATA'),
+                ('BRI', bri, result['acmmBRITotal'], result['acmmBRIBreakdown'], result['briBankTotal'],
+                 bri_only, 'NO_BRI_DATA')):
+            if totals is None or not (acmm_total > 0 or bank_total > 0):
+                continue
+            parts = []
+            for kind in NON_CASH_TYPES:
+                entry = totals.total(outlet, kind)
+                if entry:
+                    parts.append(f'{kind}: {entry[0]:.2f} ({entry[1]} txns)')
+            difference = bank_total - acmm_total
+            if acmm_total > 0 and bank_total > 0:
+                status = 'MATCHED' if abs(difference) <= 500 else 'AMOUNT_MISMATCH'
+            elif acmm_total == 0:
+                status = 'NO_ACMM_DATA'
+            elif bank_total == 0:
+                status = missing
+            else:
+                status = 'UNMATCHED'
+            view['nonCash'].append({
+                'weekKey': 'ALL', 'weekLabel': 'All Dates', 'outletCode': outlet,
+                'category': 'NON-CASH', 'bank': name,
+                'bcaTotal': bank_total, 'acmmTotal': acmm_total, 'difference': difference, 'status': status,
+                'acmmBreakdown': f'{name}: {acmm_breakdown}' if acmm_breakdown else '',
+                'bcaBreakdown': '; '.join(parts),
+                'transactionDetails': '\n'.join(totals.detail_lines(outlet, NON_CASH_TYPES)),
+            })
+    for result in grand_results:
+        bca_only['grandTotal'].append(dict(result, bank='BCA+BRI'))
+        bri_only['grandTotal'].append(dict(result, bank='BCA+BRI'))
+    return bca_only, bri_only
+
+
+def reconcile(paths, year=SALES_RECON_YEAR, progress=None):
+    """
+    Run both matching modes over the uploaded files.
+    paths: {file number (1-8): path}; a BCA (2) or BRI (6) statement is required.
+    progress: callback taking stage=... counters.
+    """
+    if progress is None:
+        progress = lambda **counters: None
+    if 2 not in paths and 6 not in paths:
+        raise ValueError('Upload at least one bank statement file (BCA or BRI)')
+    timings = {}
+    started = time.time()
+
+    progress(stage='reading')
+    tables = {number: read_table(path) for number, path in paths.items() if number != 8}
+    timings['read_seconds'] = round(time.time() - started, 3)
+    mark = time.time()
+
+    progress(stage='parsing', rows={FILES[n]: len(t) for n, t in tables.items()})
+    lookups = build_lookups(tables)
+    acmm = pivot_acmm(acmm_rows(tables.get(1), year))
+    bca_parsed = parse_bca(tables.get(2), lookups, year)
+    bri_parsed, petty_cash, exceptions = parse_bri(tables.get(6), lookups, year) if 6 in tables \
+        else (None, [], [])
+    bri = BankTotals(bri_parsed) if bri_parsed is not None else None
+    timings['parse_seconds'] = round(time.time() - mark, 3)
+    mark = time.time()
+
+    result = {}
+    for mode in MODES:
+        progress(stage=f'matching_{mode}')
+        bca = BankTotals(bca_for_mode(bca_parsed, mode))
+        cash, non_cash, grand, statistics = match(acmm, bca, bri, mode)
+        bca_only, bri_only = separate_by_bank(cash, non_cash, grand, bca, bri)
+        result[mode] = {'cash': cash, 'nonCash': non_cash, 'grandTotal': grand,
+                        'bcaOnly': bca_only, 'briOnly': bri_only, 'statistics': statistics}
+    timings['match_seconds'] = round(time.time() - mark, 3)
+    timings['total_seconds'] = round(time.time() - started, 3)
+
+    result.update({
+        'pettyCash': petty_cash,
+        'exceptions': exceptions,
+        'counts': {
+            'rows': {FILES[n]: len(t) for n, t in tables.items()},
+            'acmm_pivots': len(acmm),
+            'bca_transactions': len(bca_parsed),
+            'bri_transactions': len(bri_parsed) if bri_parsed is not None else 0,
+            'lookups': {name: len(mapping) for name, mapping in lookups.items()},
+        },
+        'timings': timings,
+    })
+    return result
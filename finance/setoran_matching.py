@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Cash deposit (setoran) matching for the sales reconciliation service.
+
+Pairs each outlet's daily CASH sales from the ACMM transaction summary with
+the BCA deposits that banked them (SETORAN VIA CDM / SETORAN TUNAI), one to
+one. A deposit normally lands the day after the sales (subtractOneDay /
+crDayMinusOne in the pages), so a sales day D looks for deposits on
+D + lag, within +-window days and +-tolerance rupiah. CDM deposits are
+compared with the sales rounded down to 50rb (the machine takes notes only),
+Setoran Tunai with the full amount.
+
+Deposits are kept in a DepositIndex: one int64 key per deposit packing
+(outlet, day, amount in cents), sorted once, so the candidates of every sales
+day are found with np.searchsorted range queries for all days at once
+instead of scanning the statement per deposit. Candidate pairs are then
+assigned:
+
+  greedy   closest amount first, then closest day (O(P log P) for P pairs)
+  optimal  most matches, then least total amount / day difference, solved
+           per connected group of candidates (a group rarely spans more
+           than a few days of one outlet)
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from sales_reconciliation import (CASH_TYPES, SALES_RECON_YEAR, acmm_rows, build_lookups, daily_cash,
+                                  parse_bca, read_table)
+
+STRATEGIES = ('greedy', 'optimal')
+
+# Candidate groups above this many sales days + deposits are assigned greedily
+OPTIMAL_MAX_GROUP = 400
+
+# Key layout: bucket (outlet, day) in the high bits, amount in cents in the low 40 bits
+_AMOUNT_BITS = 40
+_MAX_CENTS = (1 << _AMOUNT_BITS) - 1
+_MAX_BUCKETS = 1 << (63 - _AMOUNT_BITS)
+
+
+def _day_numbers(dates):
+    return pd.to_datetime(dates).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def _cents(amounts):
+    return np.round(np.asarray(amounts, dtype=float) * 100).astype(np.int64)
+
+
+class DepositIndex:
+    """
+    Deposits sorted by (outlet, day, amount). query() returns every
+    (sales day, deposit) pair whose deposit is of the same outlet, within
+    +-window days of the wanted day and +-tolerance of the wanted amount.
+    """
+
+    def __init__(self, outlet_ids, days, cents, first_day, day_span):
+        self.first_day = first_day
+        self.day_span = day_span
+        if (np.asarray(cents) > _MAX_CENTS).any():
+            raise ValueError('Deposit amount too large for the deposit index')
+        buckets = np.asarray(outlet_ids, dtype=np.int64) * day_span + (np.asarray(days) - first_day)
+        keys = (buckets << _AMOUNT_BITS) | np.clip(cents, 0, None)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def query(self, outlet_ids, days, target_cents, window, tolerance_cents):
+        """(query positions, deposit positions, day offsets) of all candidate pairs."""
+        outlet_ids = np.asarray(outlet_ids, dtype=np.int64)
+        low = np.clip(np.asarray(target_cents) - tolerance_cents, 0, _MAX_CENTS)
+        high = np.clip(np.asarray(target_cents) + tolerance_cents, 0, _MAX_CENTS)
+        queries, deposits, offsets = [], [], []
+        for offset in range(-window, window + 1):
+            day = np.asarray(days) + offset - self.first_day
+            valid = np.flatnonzero((day >= 0) & (day < self.day_span) & (high >= low))
+            if not len(valid):
+                continue
+            bucket = (outlet_ids[valid] * self.day_span + day[valid]) << _AMOUNT_BITS
+            start = np.searchsorted(self.keys, bucket | low[valid], side='left')
+            stop = np.searchsorted(self.keys, bucket | high[valid], side='right')
+            counts = stop - start
+            total = int(counts.sum())
+            if not total:
+                continue
+            # Expand each [start, stop) range into one row per candidate
+            query = np.repeat(valid, counts)
+            first = np.repeat(start - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+            queries.append(query)
+            deposits.append(self.order[first + np.arange(total)])
+            offsets.append(np.full(total, offset))
+        if not queries:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        return np.concatenate(queries), np.concatenate(deposits), np.concatenate(offsets)
+
+
+def candidate_pairs(expected, deposits, window=1, lag=1, tolerance=0.0, cdm_rounding=True):
+    """
+    All admissible (sales day, deposit) pairs.
+    expected: DataFrame outletCode, date, amount (daily CASH sales).
+    deposits: DataFrame outletCode, day, transactionType, amount.
+    Returns a DataFrame with columns expected, deposit (row positions),
+    target, difference (cents) and dayOffset.
+    """
+    columns = ['expected', 'deposit', 'target', 'difference', 'dayOffset']
+    if expected.empty or deposits.empty:
+        return pd.DataFrame({c: np.zeros(0, dtype=np.int64) for c in columns})
+    codes, outlets = pd.factorize(pd.concat([expected['outletCode'], deposits['outletCode']], ignore_index=True))
+    expected_outlets, deposit_outlets = codes[:len(expected)], codes[len(expected):]
+    sales_days = _day_numbers(expected['date'])
+    deposit_days = _day_numbers(deposits['day'])
+    first_day = int(deposit_days.min())
+    day_span = int(deposit_days.max()) - first_day + 1
+    if len(outlets) * day_span > _MAX_BUCKETS:
+        raise ValueError('Statement period too long for the deposit index')
+
+    gross = _cents(expected['amount'])
+    rounded = _cents(np.floor(np.asarray(expected['amount'], dtype=float) / 50000) * 50000)
+    deposit_cents = _cents(deposits['amount'])
+    is_cdm = (deposits['transactionType'] == 'CDM').to_numpy()
+    tolerance_cents = int(round(tolerance * 100))
+
+    frames = []
+    for kind_mask, targets in ((is_cdm, rounded if cdm_rounding else gross), (~is_cdm, gross)):
+        rows = np.flatnonzero(kind_mask)
+        if not len(rows):
+            continue
+        index = DepositIndex(deposit_outlets[rows], deposit_days[rows], deposit_cents[rows], first_day, day_span)
+        queries, found, offsets = index.query(expected_outlets, sales_days + lag, targets, window, tolerance_cents)
+        found = rows[found]
+        frames.append(pd.DataFrame({
+            'expected': queries, 'deposit': found, 'target': targets[queries],
+            'difference': deposit_cents[found] - targets[queries], 'dayOffset': offsets,
+        }))
+    if not frames:
+        return pd.DataFrame({c: np.zeros(0, dtype=np.int64) for c in columns})
+    return pd.concat(frames, ignore_index=True)[columns]
+
+
+def _greedy(pairs, order=None):
+    """Take pairs cheapest first while both ends are free; returns chosen pair positions."""
+    if order is None:
+        order = np.lexsort((pairs['deposit'].to_numpy(), pairs['expected'].to_numpy(),
+                            np.abs(pairs['dayOffset'].to_numpy()), np.abs(pairs['difference'].to_numpy())))
+    expected = pairs['expected'].to_numpy()
+    deposits = pairs['deposit'].to_numpy()
+    used_expected, used_deposits, chosen = set(), set(), []
+    for position in order:
+        e, d = expected[position], deposits[position]
+        if e in used_expected or d in used_deposits:
+            continue
+        used_expected.add(e)
+        used_deposits.add(d)
+        chosen.append(position)
+    return np.asarray(chosen, dtype=np.int64)
+
+
+def min_cost_assignment(cost):
+    """
+    Rows -> distinct columns minimising the total cost (shortest augmenting
+    paths with potentials, O(n^2 m)); requires n <= m. Returns the column of each row.
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)  # row (1-based) assigned to each column, 0 = free
+    way = np.zeros(m + 1, dtype=np.int64)
+    for row in range(1, n + 1):
+        owner[0] = row
+        column = 0
+        best = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current = owner[column]
+            reduced = cost[current - 1] - u[current] - v[1:]
+            free = ~used[1:]
+            better = free & (reduced < best[1:])
+            best[1:][better] = reduced[better]
+            way[1:][better] = column
+            candidates = np.where(free, best[1:], np.inf)
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            best[~used] -= delta
+            column = next_column
+            if owner[column] == 0:
+                break
+        while column:
+            previous = way[column]
+            owner[column] = owner[previous]
+            column = previous
+    assignment = np.full(n, -1, dtype=np.int64)
+    for column in range(1, m + 1):
+        if owner[column]:
+            assignment[owner[column] - 1] = column - 1
+    return assignment
+
+
+def _groups(expected, deposits):
+    """Connected group of each candidate pair (union-find over sales days and deposits)."""
+    offset = int(expected.max()) + 1
+    parent = list(range(offset + int(deposits.max()) + 1))
+
+    def find(node):
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for e, d in zip(expected.tolist(), (deposits + offset).tolist()):
+        a, b = find(e), find(d)
+        if a != b:
+            parent[a] = b
+    return np.fromiter((find(e) for e in expected.tolist()), dtype=np.int64, count=len(expected))
+
+
+def _optimal(pairs, window):
+    """Most matches, then least (amount difference, day difference), per candidate group."""
+    if pairs.empty:
+        return np.zeros(0, dtype=np.int64), 0
+    expected = pairs['expected'].to_numpy()
+    deposits = pairs['deposit'].to_numpy()
+    weight = np.abs(pairs['difference'].to_numpy()).astype(float) * (window + 1) \
+        + np.abs(pairs['dayOffset'].to_numpy())
+    groups = _groups(expected, deposits)
+    order = np.argsort(groups, kind='stable')
+    bounds = np.flatnonzero(np.diff(groups[order])) + 1
+    sizes = np.diff(np.concatenate(([0], bounds, [len(order)])))
+
+    # A group with a single candidate pair is its own answer
+    chosen = [order[np.concatenate(([0], bounds))[sizes == 1]]]
+    fallback = 0
+    for positions in np.split(order, bounds):
+        if len(positions) == 1:
+            continue
+        rows, row_ids = np.unique(expected[positions], return_inverse=True)
+        cols, col_ids = np.unique(deposits[positions], return_inverse=True)
+        if len(rows) + len(cols) > OPTIMAL_MAX_GROUP:
+            chosen.append(positions[_greedy(pairs.iloc[positions])])
+            fallback += 1
+            continue
+        if len(rows) > len(cols):
+            rows, cols, row_ids, col_ids = cols, rows, col_ids, row_ids
+        # Missing edges cost more than every real edge together, so the number of matches comes first
+        cost = np.full((len(rows), len(cols)), weight[positions].sum() + 1)
+        pair_at = np.full((len(rows), len(cols)), -1, dtype=np.int64)
+        cost[row_ids, col_ids] = weight[positions]
+        pair_at[row_ids, col_ids] = positions
+        picked = pair_at[np.arange(len(rows)), min_cost_assignment(cost)]
+        chosen.append(picked[picked >= 0])
+    return np.concatenate(chosen), fallback
+
+
+def match_deposits(expected, deposits, window=1, lag=1, tolerance=0.0, strategy='greedy', cdm_rounding=True):
+    """
+    One-to-one assignment of daily CASH sales to BCA cash deposits.
+    expected: DataFrame outletCode, date, amount; deposits: DataFrame
+    outletCode, day, date, transactionType, amount, reference (parse_bca rows).
+    Returns {'matches': [...], 'unmatchedSales': [...], 'unmatchedDeposits': [...], 'statistics': {...}}.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy '{strategy}' (expected one of: {', '.join(STRATEGIES)})")
+    if window < 0 or tolerance < 0:
+        raise ValueError('window and tolerance must not be negative')
+    started = time.time()
+    expected = expected.reset_index(drop=True)
+    deposits = deposits.reset_index(drop=True)
+    pairs = candidate_pairs(expected, deposits, window, lag, tolerance, cdm_rounding)
+    indexed = time.time()
+    fallback = 0
+    if strategy == 'greedy':
+        chosen = _greedy(pairs)
+    else:
+        chosen, fallback = _optimal(pairs, window)
+    picked = pairs.iloc[np.sort(chosen)] if len(chosen) else pairs.iloc[:0]
+    picked = picked.sort_values(['expected', 'deposit'])
+
+    sales = expected.iloc[picked['expected'].to_numpy()]
+    banked = deposits.iloc[picked['deposit'].to_numpy()]
+    sales_dates = pd.to_datetime(sales['date']).dt.strftime('%Y-%m-%d').to_numpy()
+    deposit_dates = pd.to_datetime(banked['day']).dt.strftime('%Y-%m-%d').to_numpy()
+    matches = [{
+        'outletCode': outlet, 'salesDate': sales_date, 'salesAmount': float(amount),
+        'expectedDeposit': target / 100, 'depositDate': deposit_date,
+        'depositType': 'CDM' if kind == 'CDM' else 'SETORAN', 'depositAmount': float(deposit_amount),
+        'reference': reference, 'difference': difference / 100, 'dayOffset': int(offset),
+    } for outlet, sales_date, amount, target, deposit_date, kind, deposit_amount, reference, difference, offset in zip(
+        sales['outletCode'], sales_dates, sales['amount'], picked['target'], deposit_dates,
+        banked['transactionType'], banked['amount'], banked['reference'], picked['difference'], picked['dayOffset'])]
+
+    open_sales = expected.drop(index=picked['expected'].to_numpy())
+    open_deposits = deposits.drop(index=picked['deposit'].to_numpy())
+    unmatched_sales = [{'outletCode': o, 'salesDate': d, 'salesAmount': float(a)} for o, d, a in zip(
+        open_sales['outletCode'], pd.to_datetime(open_sales['date']).dt.strftime('%Y-%m-%d'), open_sales['amount'])]
+    unmatched_deposits = [{
+        'outletCode': o, 'depositDate': d, 'depositType': 'CDM' if k == 'CDM' else 'SETORAN',
+        'depositAmount': float(a), 'reference': r,
+    } for o, d, k, a, r in zip(open_deposits['outletCode'], pd.to_datetime(open_deposits['day']).dt.strftime('%Y-%m-%d'),
+                               open_deposits['transactionType'], open_deposits['amount'], open_deposits['reference'])]
+
+    finished = time.time()
+    return {
+        'matches': matches,
+        'unmatchedSales': unmatched_sales,
+        'unmatchedDeposits': unmatched_deposits,
+        'statistics': {
+            'sales': len(expected), 'deposits': len(deposits), 'candidates': len(pairs),
+            'matched': len(matches),
+            'matchRate': f'{len(matches) / len(expected) * 100:.1f}' if len(expected) else 0,
+            'strategy': strategy, 'window': window, 'lag': lag, 'tolerance': tolerance,
+            'cdmRounding': cdm_rounding, 'greedyFallbackGroups': fallback,
+            'index_seconds': round(indexed - started, 3),
+            'assign_seconds': round(finished - indexed, 3),
+        },
+    }
+
+
+def match_files(paths, year=SALES_RECON_YEAR, progress=None, **options):
+    """
+    match_deposits() over uploaded files, numbered as in sales_reconciliation:
+    1 ACMM transaction summary and 2 BCA statement are required; 4 Master
+    Kartu Debit and 5 Master BCA Cabang resolve CDM / Setoran outlets.
+    options: window, lag, tolerance, strategy, cdm_rounding.
+    """
+    if progress is None:
+        progress = lambda **counters: None
+    if 1 not in paths or 2 not in paths:
+        raise ValueError('Upload the ACMM transaction summary and the BCA statement')
+    progress(stage='reading')
+    tables = {number: read_table(path) for number, path in paths.items()}
+    progress(stage='parsing', rows={number: len(table) for number, table in tables.items()})
+    lookups = build_lookups(tables)
+    expected = daily_cash(acmm_rows(tables[1], year))
+    bca = parse_bca(tables[2], lookups, year)
+    deposits = bca[bca['transactionType'].isin(CASH_TYPES)]
+    progress(stage='matching', sales=len(expected), deposits=len(deposits))
+    return match_deposits(expected, deposits, **options)
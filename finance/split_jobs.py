@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Background job queue shared by the finance splitter backends.
+Uploads are saved inside the request, then the heavy parsing / splitting
+runs on a small worker pool so the HTTP request returns a job id right
+away and the client polls /api/jobs/<id> for progress and the result.
+"""
+
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+SPLIT_WORKERS = int(os.getenv('SPLIT_WORKERS', '2'))
+SPLIT_QUEUE_SIZE = int(os.getenv('SPLIT_QUEUE_SIZE', '20'))
+# Finished jobs kept for polling; the oldest are forgotten beyond this
+SPLIT_JOBS_KEPT = int(os.getenv('SPLIT_JOBS_KEPT', '200'))
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class Job:
+    """A unit of work plus the progress counters the client polls."""
+
+    def __init__(self, kind, func, args):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.status = 'queued'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def update(self, **counters):
+        """Set progress counters (e.g. rows_read=120, files_written=3)."""
+        with self._lock:
+            self.progress.update(counters)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'progress': dict(self.progress),
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+
+
+class JobQueue:
+    """
+    Fixed pool of worker threads draining a bounded FIFO.
+    `workers` caps how many jobs run at once, `max_queued` how many may wait.
+    """
+
+    def __init__(self, workers=SPLIT_WORKERS, max_queued=SPLIT_QUEUE_SIZE, keep=SPLIT_JOBS_KEPT):
+        self.keep = keep
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._finished = []
+        self._lock = threading.Lock()
+        for i in range(workers):
+            t = threading.Thread(target=self._worker, name=f'split-worker-{i}', daemon=True)
+            t.start()
+
+    def submit(self, kind, func, *args):
+        """
+        Queue `func(job, *args)`; its return value becomes the job result.
+        Raises QueueFullError if the queue is at capacity.
+        """
+        job = Job(kind, func, args)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFullError(f'Too many jobs queued (limit {self._queue.maxsize}), try again shortly')
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for j in self._jobs.values() if j.status == 'running')
+        return {'queued': self._queue.qsize(), 'running': running}
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with job._lock:
+                job.status = 'running'
+                job.started_at = time.time()
+            try:
+                result = job.func(job, *job.args)
+                with job._lock:
+                    job.result = result
+                    job.status = 'done'
+            except Exception as e:
+                print(f"Error in {job.kind} job {job.id}: {traceback.format_exc()}")
+                with job._lock:
+                    job.error = str(e)
+                    job.status = 'error'
+            finally:
+                with job._lock:
+                    job.finished_at = time.time()
+                    # Drop references to the work so uploads can be collected
+                    job.func = job.args = None
+                self._retire(job)
+                self._queue.task_done()
+
+    def _retire(self, job):
+        with self._lock:
+            self._finished.append(job.id)
+            while len(self._finished) > self.keep:
+                self._jobs.pop(self._finished.pop(0), None)
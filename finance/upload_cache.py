@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Columnar cache of parsed .xlsx uploads, shared by the finance backends.
+An upload is parsed once and stored under UPLOAD_CACHE_ROOT/<sha256 of the
+file>/ as plain .npy arrays; any later upload with the same content - a
+re-run with another matching mode, a re-split after fixing a mapping, the
+same statement sent to another service - loads those arrays with
+np.load(mmap_mode='r') instead of parsing the workbook again.
+
+Per sheet, cells are stored column-major:
+  s<i>_tags.npy     uint8 (rows, cols): cell type (TAG_*)
+  s<i>_numbers.npy  float64 (rows, cols): the number, date as microseconds
+                    or days, or the index into the string table
+  s<i>_styles.npy   int32 (rows, cols): workbook style id (styled entries only)
+plus strings.npy / string_offsets.npy (every distinct string once, as one
+UTF-8 blob). Styled entries (<sha256>-styled/) are for splitters that copy
+cells into new workbooks: they keep formulas as written instead of their
+cached results, and add styles.json (style id -> font, border, fill,
+protection and alignment as SpreadsheetML XML, plus the number_format), so
+loading an entry never unpickles anything found on disk.
+
+Entries are written to a temp directory and renamed into place, so services
+in separate processes can fill the same cache concurrently. The oldest
+entries are evicted while the cache exceeds UPLOAD_CACHE_MAX_BYTES.
+UPLOAD_CACHE_ROOT is created private (0700) and refused if another user
+owns it, since its default lives in the shared temp directory.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import openpyxl
+from openpyxl.styles import Alignment, Border, Font, Protection
+from openpyxl.styles.fills import Fill
+from openpyxl.xml.functions import fromstring, tostring
+
+UPLOAD_CACHE_ROOT = os.getenv('UPLOAD_CACHE_ROOT', os.path.join(tempfile.gettempdir(), 'alpro-finance-upload-cache'))
+UPLOAD_CACHE_MAX_BYTES = int(os.getenv('UPLOAD_CACHE_MAX_BYTES', str(1024 ** 3)))
+UPLOAD_CACHE_OPEN = int(os.getenv('UPLOAD_CACHE_OPEN', '8'))  # loaded entries kept per process
+
+CACHE_EXTENSIONS = ('.xlsx', '.xlsm')
+
+TAG_EMPTY, TAG_STRING, TAG_INT, TAG_FLOAT, TAG_BOOL, TAG_BIGINT, TAG_DATETIME, TAG_DATE, TAG_TIME, TAG_TIMEDELTA = range(10)
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_DATE = _EPOCH.date()
+_MAX_EXACT_INT = 2 ** 53
+_CHUNK_SIZE = 1024 * 1024
+ROW_BLOCK = 10000
+
+
+def file_digest(path):
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _style_xml(style):
+    """(font, border, fill, number_format, protection, alignment) as JSON-safe XML strings."""
+    font, border, fill, number_format, protection, alignment = style
+    xml = [tostring(part.to_tree()).decode() for part in (font, border, fill, protection, alignment)]
+    return xml[:3] + [number_format] + xml[3:]
+
+
+def _style_from_xml(parts):
+    font, border, fill, number_format, protection, alignment = parts
+    return (Font.from_tree(fromstring(font)), Border.from_tree(fromstring(border)),
+            Fill.from_tree(fromstring(fill)), number_format,
+            Protection.from_tree(fromstring(protection)), Alignment.from_tree(fromstring(alignment)))
+
+
+def private_root(root):
+    """Create `root` readable by this user only; refuse one someone else owns (or a symlink)."""
+    os.makedirs(root, mode=0o700, exist_ok=True)
+    info = os.lstat(root)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise RuntimeError(f'Upload cache {root} is not a directory owned by this user; '
+                           f'set UPLOAD_CACHE_ROOT to a private directory')
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(root, 0o700)
+    return root
+
+
+def _microseconds(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+# ── encoding ───────────────────────────────────────────────────────────────
+
+class _SheetEncoder:
+    """
+    Packs one sheet's cells into column-major arrays as rows arrive: every
+    ROW_BLOCK rows are encoded into small numpy blocks, so at most one block
+    of rows is held as Python objects, whatever the size of the sheet.
+    """
+
+    def __init__(self, strings, block=ROW_BLOCK):
+        self.strings = strings  # shared str -> index table of the workbook
+        self.block = block
+        self.pending = []  # rows of the current block: (tags, numbers, styles) lists
+        self.blocks = []   # packed (tags, numbers, styles) arrays, in row order
+
+    def add(self, values, style_ids=None):
+        tags, numbers = [], []
+        for value in values:
+            tag, number = self._encode(value)
+            tags.append(tag)
+            numbers.append(number)
+        self.pending.append((tags, numbers, style_ids))
+        if len(self.pending) >= self.block:
+            self._flush()
+
+    def _string(self, text):
+        index = self.strings.get(text)
+        if index is None:
+            index = self.strings[text] = len(self.strings)
+        return index
+
+    def _encode(self, value):
+        if value is None:
+            return TAG_EMPTY, 0.0
+        if isinstance(value, str):
+            return TAG_STRING, self._string(value)
+        if isinstance(value, bool):
+            return TAG_BOOL, float(value)
+        if isinstance(value, int):
+            if -_MAX_EXACT_INT <= value <= _MAX_EXACT_INT:
+                return TAG_INT, float(value)
+            return TAG_BIGINT, self._string(str(value))
+        if isinstance(value, float):
+            return TAG_FLOAT, value
+        if isinstance(value, datetime.datetime):
+            return TAG_DATETIME, float(_microseconds(value.replace(tzinfo=None) - _EPOCH))
+        if isinstance(value, datetime.date):
+            return TAG_DATE, float((value - _EPOCH_DATE).days)
+        if isinstance(value, datetime.time):
+            return TAG_TIME, float(_microseconds(datetime.timedelta(
+                hours=value.hour, minutes=value.minute, seconds=value.second, microseconds=value.microsecond)))
+        if isinstance(value, datetime.timedelta):
+            return TAG_TIMEDELTA, float(_microseconds(value))
+        return TAG_STRING, self._string(str(value))
+
+    def _flush(self):
+        rows, self.pending = self.pending, []
+        if not rows:
+            return
+        width = max(len(tags) for tags, _, _ in rows)
+        tags = np.zeros((len(rows), width), dtype=np.uint8)
+        numbers = np.zeros((len(rows), width), dtype=np.float64)
+        styled = any(row_styles is not None for _, _, row_styles in rows)
+        styles = np.zeros((len(rows), width), dtype=np.int32) if styled else None
+        for r, (row_tags, row_numbers, row_styles) in enumerate(rows):
+            tags[r, :len(row_tags)] = row_tags
+            numbers[r, :len(row_numbers)] = row_numbers
+            if row_styles is not None:
+                styles[r, :len(row_styles)] = row_styles
+        self.blocks.append((tags, numbers, styles))
+
+    def arrays(self):
+        """(tags, numbers, styles) of the whole sheet; blocks are released as they are copied in."""
+        self._flush()
+        height = sum(tags.shape[0] for tags, _, _ in self.blocks)
+        width = max((tags.shape[1] for tags, _, _ in self.blocks), default=0)
+        shape = (height, width)
+        tags = np.zeros(shape, dtype=np.uint8, order='F')
+        numbers = np.zeros(shape, dtype=np.float64, order='F')
+        styles = np.zeros(shape, dtype=np.int32, order='F')
+        row = 0
+        self.blocks.reverse()
+        while self.blocks:
+            block_tags, block_numbers, block_styles = self.blocks.pop()
+            rows, cols = block_tags.shape
+            tags[row:row + rows, :cols] = block_tags
+            numbers[row:row + rows, :cols] = block_numbers
+            if block_styles is not None:
+                styles[row:row + rows, :cols] = block_styles
+            row += rows
+        return tags, numbers, styles
+
+
+def parse_workbook(path, directory, styles=False):
+    """
+    Parse every sheet of an .xlsx with openpyxl's read-only reader and write
+    the cache arrays into `directory`. Returns the entry's meta dict.
+    """
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=not styles)
+    strings = {}
+    sheets = []
+    style_table = {}
+    try:
+        for i, ws in enumerate(wb.worksheets):
+            encoder = _SheetEncoder(strings)
+            if styles:
+                for row in ws.iter_rows():
+                    style_ids = [getattr(cell, '_style_id', 0) for cell in row]
+                    for cell, style_id in zip(row, style_ids):
+                        if style_id and style_id not in style_table:
+                            style_table[style_id] = _style_xml((cell.font, cell.border, cell.fill, cell.number_format,
+                                                                cell.protection, cell.alignment))
+                    encoder.add([cell.value for cell in row], style_ids)
+            else:
+                for row in ws.iter_rows(values_only=True):
+                    encoder.add(row)
+            tags, numbers, style_ids = encoder.arrays()
+            np.save(os.path.join(directory, f's{i}_tags.npy'), tags)
+            np.save(os.path.join(directory, f's{i}_numbers.npy'), numbers)
+            if styles:
+                np.save(os.path.join(directory, f's{i}_styles.npy'), style_ids)
+            sheets.append({'title': ws.title, 'rows': tags.shape[0], 'cols': tags.shape[1]})
+        active = wb.worksheets.index(wb.active) if wb.active in wb.worksheets else 0
+    finally:
+        wb.close()
+
+    # One growing UTF-8 blob rather than a list of every encoded string
+    count = len(strings)
+    blob = bytearray()
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    for i, text in enumerate(strings, 1):
+        blob += text.encode('utf-8', 'surrogatepass')
+        offsets[i] = len(blob)
+    strings.clear()
+    np.save(os.path.join(directory, 'strings.npy'), np.frombuffer(blob, dtype=np.uint8))
+    np.save(os.path.join(directory, 'string_offsets.npy'), offsets)
+    if styles:
+        with open(os.path.join(directory, 'styles.json'), 'w') as f:
+            json.dump(style_table, f)
+    return {'sheets': sheets, 'active': active, 'styles': styles, 'strings': count}
+
+
+# ── decoding ───────────────────────────────────────────────────────────────
+
+def _decode(strings, tags, numbers):
+    """Object array of cell values from parallel tag / number vectors, one numpy pass per type."""
+    out = np.full(len(tags), None, dtype=object)
+    for tag in np.unique(tags).tolist():
+        if tag == TAG_EMPTY:
+            continue
+        mask = tags == tag
+        values = numbers[mask]
+        if tag == TAG_FLOAT:
+            out[mask] = values.tolist()
+            continue
+        if tag == TAG_STRING:
+            out[mask] = strings[values.astype(np.int64)]
+            continue
+        if tag == TAG_BOOL:
+            out[mask] = (values != 0).tolist()
+            continue
+        values = values.astype(np.int64).tolist()
+        if tag == TAG_INT:
+            decoded = values
+        elif tag == TAG_BIGINT:
+            decoded = [int(strings[v]) for v in values]
+        elif tag == TAG_DATETIME:
+            decoded = [_EPOCH + datetime.timedelta(microseconds=v) for v in values]
+        elif tag == TAG_DATE:
+            decoded = [_EPOCH_DATE + datetime.timedelta(days=v) for v in values]
+        elif tag == TAG_TIME:
+            decoded = [(datetime.datetime.min + datetime.timedelta(microseconds=v)).time() for v in values]
+        else:
+            decoded = [datetime.timedelta(microseconds=v) for v in values]
+        out[mask] = decoded
+    return out
+
+
+class CachedSheet:
+    """One sheet of a cached upload; arrays are memory-mapped until decoded."""
+
+    def __init__(self, upload, index, meta):
+        self.upload = upload
+        self.title = meta['title']
+        self.max_row = meta['rows']
+        self.max_column = meta['cols']
+        self.tags = upload._array(f's{index}_tags.npy')
+        self.numbers = upload._array(f's{index}_numbers.npy')
+        self.style_ids = upload._array(f's{index}_styles.npy') if upload.styled else None
+
+    def column(self, index):
+        """Cell values of one column (0-based) as an object array, as openpyxl returned them."""
+        if index >= self.max_column:
+            return np.full(self.max_row, None, dtype=object)
+        return _decode(self.upload.strings, np.asarray(self.tags[:, index]), np.asarray(self.numbers[:, index]))
+
+    def columns(self):
+        return [self.column(j) for j in range(self.max_column)]
+
+    def iter_rows(self, block=ROW_BLOCK):
+        """Rows as lists of values, decoded `block` rows at a time from the mapped arrays."""
+        for start in range(0, self.max_row, block):
+            stop = min(start + block, self.max_row)
+            if not self.max_column:
+                yield from ([] for _ in range(start, stop))
+                continue
+            columns = [_decode(self.upload.strings, np.asarray(self.tags[start:stop, j]),
+                               np.asarray(self.numbers[start:stop, j])) for j in range(self.max_column)]
+            for row in zip(*columns):
+                yield list(row)
+
+    def rows(self):
+        """All rows (iter_rows(values_only=True) of the parsed sheet)."""
+        return list(self.iter_rows())
+
+    def cell(self, row, column):
+        """Value at a 1-based (row, column), like ws.cell(row, column).value."""
+        if row > self.max_row or column > self.max_column:
+            return None
+        r, c = row - 1, column - 1
+        return _decode(self.upload.strings, self.tags[r, c:c + 1], self.numbers[r, c:c + 1])[0]
+
+    def style(self, row, column):
+        """(font, border, fill, number_format, protection, alignment) of a 1-based cell, or None if unstyled."""
+        if self.style_ids is None or row > self.max_row or column > self.max_column:
+            return None
+        return self.upload.style_table.get(int(self.style_ids[row - 1, column - 1]))
+
+
+class CachedUpload:
+    """A cache entry: sheets in workbook order, the string table and (if styled) the style table."""
+
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.styled = meta['styles']
+        self.sheetnames = [sheet['title'] for sheet in meta['sheets']]
+        self._meta = meta
+        blob = np.load(os.path.join(directory, 'strings.npy'))
+        offsets = np.load(os.path.join(directory, 'string_offsets.npy'))
+        data = blob.tobytes()
+        self.strings = np.empty(len(offsets) - 1, dtype=object)
+        self.strings[:] = [data[a:b].decode('utf-8', 'surrogatepass')
+                           for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+        self.style_table = {}
+        if self.styled:
+            with open(os.path.join(directory, 'styles.json')) as f:
+                self.style_table = {int(style_id): _style_from_xml(parts) for style_id, parts in json.load(f).items()}
+        self._sheets = {}
+
+    def _array(self, name):
+        return np.load(os.path.join(self.directory, name), mmap_mode='r')
+
+    def sheet(self, key=0):
+        """Sheet by index or title."""
+        index = self.sheetnames.index(key) if isinstance(key, str) else key
+        if index not in self._sheets:
+            self._sheets[index] = CachedSheet(self, index, self._meta['sheets'][index])
+        return self._sheets[index]
+
+    @property
+    def active(self):
+        return self.sheet(self._meta['active'])
+
+
+# ── cache ──────────────────────────────────────────────────────────────────
+
+class UploadCache:
+    """
+    Directory of parsed uploads keyed by content hash. load() returns the
+    cached entry, parsing the file on a miss.
+    """
+
+    def __init__(self, root=UPLOAD_CACHE_ROOT, max_bytes=UPLOAD_CACHE_MAX_BYTES, max_open=UPLOAD_CACHE_OPEN):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._open = OrderedDict()  # entry name -> CachedUpload, least recent first
+        self.hits = 0
+        self.misses = 0
+        private_root(self.root)
+
+    def load(self, path, styles=False):
+        """CachedUpload for an .xlsx, parsed at most once per distinct content (and styles flag)."""
+        # -styled2: older -styled entries held pickled styles; they are never read and age out
+        name = file_digest(path) + ('-styled2' if styles else '')
+        upload = self._cached(name)
+        with self._lock:
+            if upload is not None:
+                self.hits += 1
+                return upload
+            self.misses += 1
+
+        staging = os.path.join(self.root, f'.tmp-{uuid.uuid4().hex}')
+        os.makedirs(staging)
+        try:
+            meta = parse_workbook(path, staging, styles=styles)
+            meta['created_at'] = time.time()
+            with open(os.path.join(staging, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            try:
+                os.rename(staging, os.path.join(self.root, name))
+            except OSError:
+                pass  # another process stored the same upload first
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.sweep(keep=name)
+        return self._cached(name)
+
+    def _cached(self, name):
+        with self._lock:
+            upload = self._open.get(name)
+            if upload is not None:
+                self._open.move_to_end(name)
+                return upload
+        directory = os.path.join(self.root, name)
+        try:
+            with open(os.path.join(directory, 'meta.json')) as f:
+                meta = json.load(f)
+            upload = CachedUpload(directory, meta)
+            os.utime(os.path.join(directory, 'meta.json'))  # recency for eviction
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._open[name] = upload
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return upload
+
+    def entries(self):
+        """(entry name, bytes, last used) of the stored entries, oldest first."""
+        entries = []
+        for name in os.listdir(self.root):
+            directory = os.path.join(self.root, name)
+            if name.startswith('.') or not os.path.isdir(directory):
+                continue
+            try:
+                used = os.path.getmtime(os.path.join(directory, 'meta.json'))
+                size = sum(entry.stat().st_size for entry in os.scandir(directory))
+            except OSError:
+                continue
+            entries.append((name, size, used))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def sweep(self, keep=None):
+        """Evict least recently used entries while the cache is over max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for name, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            with self._lock:
+                self._open.pop(name, None)
+            total -= size
+
+    def stats(self):
+        entries = self.entries()
+        with self._lock:
+            return {
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def upload_cache():
+    """The process-wide UploadCache (UPLOAD_CACHE_ROOT), created on first use."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = UploadCache()
+        return _default
+
+
+def load_upload(path, styles=False):
+    """Parsed .xlsx from the shared cache; see UploadCache.load."""
+    return upload_cache().load(path, styles=styles)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Check that the package-level PV split produces the same sheets as the
+openpyxl copy: header details (D9/R9/D12), cell values, styles, number
+formats, column widths, row heights and merged ranges.
+
+Usage: python verify_pv_package_split.py [workbook.xlsx ...]
+(defaults to the sample workbooks in this folder)
+"""
+
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import openpyxl
+
+from mapping_index import MappingIndex
+from pv_split_engine import export_sheet, sheet_details
+from xlsx_package import UnsupportedSheet, XlsxPackage
+
+STYLE_ATTRS = ('font', 'border', 'fill', 'number_format', 'protection', 'alignment')
+
+
+def compare_sheets(expected, actual):
+    """List of differences between two loaded worksheets"""
+    problems = []
+    coordinates = {c.coordinate for row in expected.iter_rows() for c in row}
+    coordinates |= {c.coordinate for row in actual.iter_rows() for c in row}
+    for coordinate in sorted(coordinates):
+        a, b = expected[coordinate], actual[coordinate]
+        if a.value != b.value:
+            problems.append(f"{coordinate}: value {a.value!r} != {b.value!r}")
+        for attr in STYLE_ATTRS:
+            # Style proxies don't compare equal across workbooks; their reprs list every field
+            if repr(getattr(a, attr)) != repr(getattr(b, attr)):
+                problems.append(f"{coordinate}: {attr} differs")
+    for key, dim in expected.column_dimensions.items():
+        if dim.width != actual.column_dimensions[key].width:
+            problems.append(f"column {key}: width {dim.width} != {actual.column_dimensions[key].width}")
+    for key, dim in expected.row_dimensions.items():
+        if dim.height != actual.row_dimensions[key].height:
+            problems.append(f"row {key}: height {dim.height} != {actual.row_dimensions[key].height}")
+    if {str(r) for r in expected.merged_cells.ranges} != {str(r) for r in actual.merged_cells.ranges}:
+        problems.append("merged cells differ")
+    return problems
+
+
+def verify(path, out_dir):
+    print(f"\n📄 {os.path.basename(path)}")
+    workbook = openpyxl.load_workbook(path)
+    failures = 0
+    with XlsxPackage(path) as package:
+        for name in workbook.sheetnames:
+            try:
+                package_details = sheet_details(package.sheet(name), MappingIndex())
+                reference = os.path.join(out_dir, 'openpyxl.xlsx')
+                candidate = os.path.join(out_dir, 'package.xlsx')
+                started = time.time()
+                export_sheet(workbook[name], reference)
+                openpyxl_time = time.time() - started
+                started = time.time()
+                package.write_sheet(name, candidate)
+                package_time = time.time() - started
+            except UnsupportedSheet as e:
+                print(f"   ⏭️  {name}: falls back to openpyxl ({e})")
+                continue
+
+            problems = []
+            expected_details = sheet_details(workbook[name], MappingIndex())
+            if package_details != expected_details:
+                problems.append(f"header details {package_details} != {expected_details}")
+            problems += compare_sheets(openpyxl.load_workbook(reference)[name],
+                                       openpyxl.load_workbook(candidate)[name])
+            if problems:
+                failures += 1
+                print(f"   ❌ {name}: {len(problems)} differences")
+                for problem in problems[:10]:
+                    print(f"      {problem}")
+            else:
+                print(f"   ✅ {name}: identical "
+                      f"(openpyxl {openpyxl_time:.2f}s / {os.path.getsize(reference):,} B, "
+                      f"package {package_time:.2f}s / {os.path.getsize(candidate):,} B)")
+    return failures
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(here, 'sample_*.xlsx')))
+    failures = 0
+    with tempfile.TemporaryDirectory() as out_dir:
+        for path in paths:
+            failures += verify(path, out_dir)
+    print(f"\n{'❌' if failures else '✅'} {failures} sheet(s) with differences")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
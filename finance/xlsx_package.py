@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Package-level sheet extraction for the PV splitter.
+An .xlsx file is a zip of XML parts. A PV sheet only needs its own worksheet
+part, the shared strings it uses and the styles, so this copies those parts
+byte-for-byte into a new one-sheet package (with a pruned, renumbered
+shared-strings table) instead of rebuilding every cell through openpyxl.
+Header cells (D9/R9/D12) are read by scanning only the top of the sheet XML.
+
+Sheets carrying parts this does not transplant (drawings, comments, tables,
+pivot tables...) raise UnsupportedSheet so the caller can fall back to the
+openpyxl copy.
+"""
+
+import html
+import posixpath
+import re
+import zipfile
+from collections import namedtuple
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+SHEET_CT = 'application/vnd.openxmlformats-officedocument.spreadsheetml'
+
+# Sheet relationships that can be carried over as-is
+PORTABLE_SHEET_RELS = ('/hyperlink', '/printerSettings')
+
+CHUNK_SIZE = 64 * 1024
+
+Cell = namedtuple('Cell', 'value')
+
+_ATTR = re.compile(rb'([\w:.-]+)\s*=\s*"([^"]*)"')
+_RELATIONSHIP = re.compile(rb'<Relationship\b([^>]*?)/?>')
+_SHEET = re.compile(rb'<sheet\b([^>]*?)/?>')
+_DEFINED_NAME = re.compile(rb'<definedName\b([^>]*)>(.*?)</definedName>', re.S)
+_WORKBOOK_PR = re.compile(rb'<workbookPr\b[^>]*?/>')
+_SHARED_ITEM = re.compile(rb'<si\b[^>]*?(?:/>|>.*?</si>)', re.S)
+_PHONETIC = re.compile(rb'<rPh\b.*?</rPh>', re.S)
+_TEXT = re.compile(rb'<t(?:\s[^>]*[^/])?>(.*?)</t>', re.S)
+_VALUE = re.compile(rb'<v(?:\s[^>]*)?>(.*?)</v>', re.S)
+_FORMULA = re.compile(rb'<f\b([^>]*?)(?:/>|>(.*?)</f>)', re.S)
+_INLINE = re.compile(rb'<is>(.*?)</is>', re.S)
+_CELL = re.compile(rb'<c(\s[^>]*?)?(?:/>|>(.*?)</c>)', re.S)
+_ROW = re.compile(rb'<row\b([^>]*?)/?>')
+_ROOT = re.compile(rb'<(\w+:)?worksheet\b')
+# <c ... t="s" ...><v>N</v>: a shared-string cell and its index
+_SHARED_CELL = re.compile(rb'(<c\s[^>]*?\bt="s"[^>]*>\s*<v>)(\d+)(</v>)')
+_SHEET_REF = re.compile(r"('(?:[^']|'')+'|[^\s'!=(),:;+\-*/&^<>{}\[\]\"]+)!")
+_NUM_FMT = re.compile(rb'<numFmt\b([^>]*?)/?>')
+_CELL_XFS = re.compile(rb'<cellXfs\b[^>]*>(.*?)</cellXfs>', re.S)
+_XF = re.compile(rb'<xf\b([^>]*?)/?>')
+
+
+class UnsupportedSheet(Exception):
+    """The sheet can't be extracted at package level; use the openpyxl copy."""
+
+
+def _attrs(raw):
+    return {k.decode(): html.unescape(v.decode('utf-8')) for k, v in _ATTR.findall(raw or b'')}
+
+
+def _rel_id(attrs):
+    """The r:id attribute, whatever prefix the workbook bound the namespace to."""
+    for key, value in attrs.items():
+        if key.endswith(':id'):
+            return value
+    return None
+
+
+def _xml_text(raw):
+    return html.unescape(raw.decode('utf-8'))
+
+
+def _quote(value):
+    return html.escape(value, quote=True)
+
+
+def _resolve(base_part, target):
+    """Resolve a relationship target relative to the part that owns it."""
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_part), target))
+
+
+def _rels_part(part):
+    return posixpath.join(posixpath.dirname(part), '_rels', posixpath.basename(part) + '.rels')
+
+
+def _unquote_sheet(ref):
+    if ref.startswith("'"):
+        return ref[1:-1].replace("''", "'")
+    return ref
+
+
+class XlsxPackage:
+    """
+    Read-only view of an .xlsx package.
+      package.sheetnames           sheet names in workbook order
+      package.sheet(name)          header-cell lookup: sheet['D9'].value
+      package.write_sheet(name, path)
+    """
+
+    def __init__(self, path):
+        self.zf = zipfile.ZipFile(path)
+        self.names = set(self.zf.namelist())
+        root_rels = self._rels('')
+        main = [r for r in root_rels if r['Type'].endswith('/officeDocument')]
+        if not main:
+            raise ValueError('Not an Excel workbook (no officeDocument relationship)')
+        self.workbook_part = _resolve('', main[0]['Target'])
+        workbook_xml = self.zf.read(self.workbook_part)
+
+        rels = {r['Id']: r for r in self._rels(self.workbook_part)}
+        self.styles_part = self._part_of_type(rels, '/styles')
+        self.theme_part = self._part_of_type(rels, '/theme')
+        self.shared_strings_part = self._part_of_type(rels, '/sharedStrings')
+
+        self._sheets = {}
+        self.sheetnames = []
+        for index, match in enumerate(_SHEET.finditer(workbook_xml)):
+            attrs = _attrs(match.group(1))
+            rel = rels.get(_rel_id(attrs), {})
+            self._sheets[attrs['name']] = {
+                'index': index,
+                'part': _resolve(self.workbook_part, rel['Target']) if rel else None,
+                'type': rel.get('Type', ''),
+            }
+            self.sheetnames.append(attrs['name'])
+
+        pr = _WORKBOOK_PR.search(workbook_xml)
+        self.workbook_pr = pr.group(0) if pr else b''
+        date1904 = _attrs(self.workbook_pr).get('date1904', '').lower() in ('1', 'true')
+        self.epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+        self.defined_names = [(_attrs(m.group(1)), m.group(0)) for m in _DEFINED_NAME.finditer(workbook_xml)]
+
+        self._shared = None
+        self._date_styles = None
+
+    def close(self):
+        self.zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ── header-cell lookup ──────────────────────────────────────────────────
+
+    def sheet(self, name):
+        """A lookup object for a few header cells: sheet['D9'].value, sheet.title."""
+        return PackageSheet(self, name)
+
+    def read_cells(self, name, coordinates):
+        """
+        Values of the given cells as openpyxl would load them, reading the
+        sheet XML only up to the last row asked for.
+        """
+        part = self._worksheet_part(name)
+        wanted = {c: coordinate_to_tuple(c) for c in coordinates}
+        last_row = max(row for row, _ in wanted.values())
+
+        head = self._read_head(part, last_row)
+        root = _ROOT.search(head)
+        if root is None or root.group(1):
+            raise UnsupportedSheet(f'{name}: prefixed worksheet XML')
+
+        values = {}
+        for match in _CELL.finditer(head):
+            attrs = _attrs(match.group(1))
+            if 'r' not in attrs:
+                raise UnsupportedSheet(f'{name}: cells without references')
+            if attrs['r'] in wanted:
+                values[attrs['r']] = self._cell_value(attrs, match.group(2) or b'')
+        return {c: values.get(c) for c in coordinates}
+
+    def _read_head(self, part, last_row):
+        """Decompress the sheet until a row past `last_row` (or the end of the data)."""
+        buf = b''
+        scanned = 0
+        with self.zf.open(part) as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    return buf
+                buf += chunk
+                # Re-scan a little behind in case a tag straddled the chunk edge
+                for match in _ROW.finditer(buf, max(0, scanned - 256)):
+                    row = _attrs(match.group(1)).get('r')
+                    if row is None:
+                        raise UnsupportedSheet(f'{part}: rows without numbers')
+                    if int(row) > last_row:
+                        return buf[:match.start()]
+                scanned = len(buf)
+                end = buf.find(b'</sheetData>')
+                if end != -1:
+                    return buf[:end]
+
+    def _cell_value(self, attrs, inner):
+        data_type = attrs.get('t', 'n')
+        formula = _FORMULA.search(inner)
+        if formula is not None:
+            # openpyxl (data_only=False) returns the formula text
+            f_attrs = _attrs(formula.group(1))
+            if f_attrs.get('t') in ('shared', 'array'):
+                raise UnsupportedSheet(f"{attrs['r']}: {f_attrs['t']} formula")
+            return '=' + _xml_text(formula.group(2) or b'')
+
+        if data_type == 'inlineStr':
+            inline = _INLINE.search(inner)
+            return self._text(inline.group(1)) if inline else None
+
+        value = _VALUE.search(inner)
+        value = _xml_text(value.group(1)) if value else None
+        if not value:
+            return None
+        if data_type == 's':
+            return self._shared_text(int(value))
+        if data_type == 'b':
+            return bool(int(value))
+        if data_type == 'd':
+            return from_ISO8601(value)
+        if data_type in ('str', 'e'):
+            return value
+
+        number = float(value) if ('.' in value or 'E' in value or 'e' in value) else int(value)
+        style = int(attrs.get('s', 0) or 0)
+        date_styles, timedelta_styles = self._date_style_ids()
+        if style in date_styles:
+            try:
+                return from_excel(number, self.epoch, timedelta=style in timedelta_styles)
+            except (OverflowError, ValueError):
+                return '#VALUE!'
+        return number
+
+    def _text(self, item):
+        """Plain text of an <si>/<is> item: its runs, minus phonetic hints."""
+        item = _PHONETIC.sub(b'', item)
+        return ''.join(_xml_text(t) for t in _TEXT.findall(item)).replace('x005F_', '')
+
+    def _shared_text(self, index):
+        return self._text(self._shared_items()[index])
+
+    def _shared_items(self):
+        if self._shared is None:
+            if self.shared_strings_part:
+                self._shared = _SHARED_ITEM.findall(self.zf.read(self.shared_strings_part))
+            else:
+                self._shared = []
+        return self._shared
+
+    def _date_style_ids(self):
+        """cellXfs indices whose number format is a date (and the subset that are durations)."""
+        if self._date_styles is None:
+            dates, durations = set(), set()
+            if self.styles_part:
+                styles = self.zf.read(self.styles_part)
+                formats = dict(BUILTIN_FORMATS)
+                for match in _NUM_FMT.finditer(styles):
+                    attrs = _attrs(match.group(1))
+                    formats[int(attrs['numFmtId'])] = attrs.get('formatCode', '')
+                xfs = _CELL_XFS.search(styles)
+                for index, match in enumerate(_XF.finditer(xfs.group(1) if xfs else b'')):
+                    code = formats.get(int(_attrs(match.group(1)).get('numFmtId', 0)), '')
+                    if is_date_format(code):
+                        dates.add(index)
+                        if is_timedelta_format(code):
+                            durations.add(index)
+            self._date_styles = (dates, durations)
+        return self._date_styles
+
+    # ── export ──────────────────────────────────────────────────────────────
+
+    def write_sheet(self, name, file_path):
+        """
+        Write `name` as a one-sheet .xlsx: the worksheet XML unchanged apart
+        from renumbered shared-string indices, plus styles and theme.
+        """
+        part = self._worksheet_part(name)
+        sheet_rels, extra_parts = self._portable_sheet_rels(name, part)
+        sheet_xml = self.zf.read(part)
+        root = _ROOT.search(sheet_xml)
+        if root is None or root.group(1):
+            raise UnsupportedSheet(f'{name}: prefixed worksheet XML')
+
+        # Keep only the shared strings this sheet uses, numbered by first use
+        items = self._shared_items()
+        remap = {}
+        uses = 0
+
+        def renumber(match):
+            nonlocal uses
+            uses += 1
+            old = int(match.group(2))
+            if old not in remap:
+                remap[old] = len(remap)
+            return match.group(1) + str(remap[old]).encode() + match.group(3)
+
+        sheet_xml = _SHARED_CELL.sub(renumber, sheet_xml)
+        used = sorted(remap, key=remap.get)
+        shared_xml = b''.join([
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n',
+            f'<sst xmlns="{MAIN_NS}" count="{uses}" uniqueCount="{len(used)}">'.encode(),
+            *(items[i] for i in used),
+            b'</sst>',
+        ])
+
+        workbook_rels = [('rId1', REL_NS + '/worksheet', 'worksheets/sheet1.xml')]
+        if self.styles_part:
+            workbook_rels.append(('rId2', REL_NS + '/styles', 'styles.xml'))
+        if self.theme_part:
+            workbook_rels.append(('rId3', REL_NS + '/theme', 'theme/theme1.xml'))
+        workbook_rels.append(('rId4', REL_NS + '/sharedStrings', 'sharedStrings.xml'))
+
+        overrides = [
+            ('/xl/workbook.xml', SHEET_CT + '.sheet.main+xml'),
+            ('/xl/worksheets/sheet1.xml', SHEET_CT + '.worksheet+xml'),
+            ('/xl/sharedStrings.xml', SHEET_CT + '.sharedStrings+xml'),
+        ]
+        if self.styles_part:
+            overrides.append(('/xl/styles.xml', SHEET_CT + '.styles+xml'))
+        if self.theme_part:
+            overrides.append(('/xl/theme/theme1.xml', 'application/vnd.openxmlformats-officedocument.theme+xml'))
+
+        with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED) as out:
+            out.writestr('[Content_Types].xml', _content_types(overrides, bool(extra_parts)))
+            out.writestr('_rels/.rels', _relationships(
+                [('rId1', REL_NS + '/officeDocument', 'xl/workbook.xml')]))
+            out.writestr('xl/workbook.xml', self._workbook_xml(name))
+            out.writestr('xl/_rels/workbook.xml.rels', _relationships(workbook_rels))
+            out.writestr('xl/worksheets/sheet1.xml', sheet_xml)
+            if sheet_rels is not None:
+                out.writestr('xl/worksheets/_rels/sheet1.xml.rels', sheet_rels)
+            for source, target in extra_parts:
+                out.writestr(target, self.zf.read(source))
+            if self.styles_part:
+                out.writestr('xl/styles.xml', self.zf.read(self.styles_part))
+            if self.theme_part:
+                out.writestr('xl/theme/theme1.xml', self.zf.read(self.theme_part))
+            out.writestr('xl/sharedStrings.xml', shared_xml)
+
+    def _workbook_xml(self, name):
+        """Workbook part for a single sheet, keeping defined names that only refer to it."""
+        index = self._sheets[name]['index']
+        names = []
+        for attrs, raw in self.defined_names:
+            if 'localSheetId' in attrs:
+                if attrs['localSheetId'] != str(index):
+                    continue
+                raw = re.sub(rb'localSheetId="\d+"', b'localSheetId="0"', raw, count=1)
+            else:
+                text = _xml_text(_DEFINED_NAME.match(raw).group(2))
+                if any(_unquote_sheet(ref) != name for ref in _SHEET_REF.findall(text)):
+                    continue
+            names.append(raw)
+
+        return b''.join([
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n',
+            f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'.encode(),
+            self.workbook_pr,
+            b'<bookViews><workbookView activeTab="0"/></bookViews>',
+            f'<sheets><sheet name="{_quote(name)}" sheetId="1" r:id="rId1"/></sheets>'.encode(),
+            b'<definedNames>' + b''.join(names) + b'</definedNames>' if names else b'',
+            # Cached values are kept for viewers; Excel recalculates on open
+            b'<calcPr calcId="0" fullCalcOnLoad="1"/>',
+            b'</workbook>',
+        ])
+
+    def _portable_sheet_rels(self, name, part):
+        """
+        The sheet's own relationships, if all of them can be copied over:
+        returns (rels XML or None, [(source part, target part)]).
+        """
+        rels_part = _rels_part(part)
+        if rels_part not in self.names:
+            return None, []
+        rels = self._rels(part)
+        extra_parts = []
+        for rel in rels:
+            if not rel['Type'].endswith(PORTABLE_SHEET_RELS):
+                raise UnsupportedSheet(f"{name}: has {rel['Type'].rsplit('/', 1)[-1]} part")
+            if rel.get('TargetMode') == 'External':
+                continue
+            source = _resolve(part, rel['Target'])
+            target = f'xl/printerSettings/printerSettings{len(extra_parts) + 1}.bin'
+            extra_parts.append((source, target))
+            rel['Target'] = '../' + target[len('xl/'):]
+        return _relationships([(r['Id'], r['Type'], r['Target'], r.get('TargetMode')) for r in rels]), extra_parts
+
+    # ── internals ───────────────────────────────────────────────────────────
+
+    def _worksheet_part(self, name):
+        sheet = self._sheets[name]
+        if not sheet['type'].endswith('/worksheet') or sheet['part'] not in self.names:
+            raise UnsupportedSheet(f'{name}: not a worksheet')
+        return sheet['part']
+
+    def _rels(self, part):
+        path = _rels_part(part) if part else '_rels/.rels'
+        if path not in self.names:
+            return []
+        return [_attrs(m.group(1)) for m in _RELATIONSHIP.finditer(self.zf.read(path))]
+
+    def _part_of_type(self, rels, suffix):
+        for rel in rels.values():
+            if rel['Type'].endswith(suffix):
+                part = _resolve(self.workbook_part, rel['Target'])
+                return part if part in self.names else None
+        return None
+
+
+class PackageSheet:
+    """Duck-types the bits of an openpyxl worksheet that sheet_details uses."""
+
+    def __init__(self, package, name):
+        self.package = package
+        self.title = name
+        self._values = package.read_cells(name, ('D9', 'R9', 'D12'))
+
+    def __getitem__(self, coordinate):
+        if coordinate not in self._values:
+            self._values.update(self.package.read_cells(self.title, (coordinate,)))
+        return Cell(self._values[coordinate])
+
+
+def _relationships(rels):
+    out = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n',
+           f'<Relationships xmlns="{PKG_REL_NS}">']
+    for rel in rels:
+        rel_id, rel_type, target = rel[:3]
+        mode = rel[3] if len(rel) > 3 and rel[3] else None
+        out.append(f'<Relationship Id="{_quote(rel_id)}" Type="{_quote(rel_type)}" Target="{_quote(target)}"'
+                   + (f' TargetMode="{_quote(mode)}"' if mode else '') + '/>')
+    out.append('</Relationships>')
+    return ''.join(out).encode('utf-8')
+
+
+def _content_types(overrides, printer_settings):
+    out = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n',
+           '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">',
+           '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>',
+           '<Default Extension="xml" ContentType="application/xml"/>']
+    if printer_settings:
+        out.append('<Default Extension="bin" '
+                   'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.printerSettings"/>')
+    for part, content_type in overrides:
+        out.append(f'<Override PartName="{part}" ContentType="{content_type}"/>')
+    out.append('</Types>')
+    return ''.join(out).encode('utf-8')
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+ZIP helpers shared by the finance splitter backends.
+Builds archives on the fly from the split files already saved on disk and
+streams them chunk by chunk to the HTTP client, so the archive is never
+held in memory or written next to the split files.
+"""
+
+import os
+import zipfile
+
+# .xlsx files are already deflated zip packages - recompressing them costs
+# CPU time for almost no size gain, so STORED is the default mode.
+ZIP_MODES = {
+    'stored': zipfile.ZIP_STORED,
+    'deflated': zipfile.ZIP_DEFLATED,
+}
+DEFAULT_ZIP_MODE = os.getenv('SPLIT_ZIP_MODE', 'stored')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def resolve_zip_mode(mode=None):
+    """Map a mode name ('stored' / 'deflated') to a zipfile constant."""
+    mode = (mode or DEFAULT_ZIP_MODE).strip().lower()
+    if mode not in ZIP_MODES:
+        raise ValueError(f"Unknown zip mode '{mode}' (expected one of: {', '.join(ZIP_MODES)})")
+    return ZIP_MODES[mode]
+
+
+class _ChunkSink:
+    """
+    Write-only, non-seekable file object that collects what ZipFile writes
+    so the generator can hand it to the client and forget it.
+    zipfile falls back to data descriptors when the target cannot seek.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def iter_zip(entries, mode=None):
+    """
+    Yield a ZIP archive of `entries` ([(arcname, path), ...]) as byte chunks.
+    Memory use is bounded by CHUNK_SIZE regardless of archive size.
+    """
+    compression = resolve_zip_mode(mode)
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression) as zf:
+        for arcname, path in entries:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = compression
+            with open(path, 'rb') as src, zf.open(info, 'w') as dst:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    # Central directory is written on close
+    yield from sink.drain()
+
@@ -6,12 +6,26 @@ by carrying the last-seen value forward to sub-rows that share the same
 live session date block (Day A / Date B are also merged and carried forward).
 
 Also includes /api/aria-chat — secure AI proxy for ARIA chatbot.
+Pages and assets go through static_assets (compressed variants, ETag /
+Last-Modified + 304, sendfile, per-path Cache-Control).
+/api/events pushes source refreshes to open dashboards (event_stream).
+?bust= goes through BUSTS (per-IP token bucket + minimum interval per
+source) and refetches only the named source; /api/admin/invalidate drops
+cache entries by name or pattern. Every cache is a BoundedCache (LRU by
+bytes, stats on /api/cache-stats). TikTok rows are held as column arrays
+(TikTokRows); ?format=columnar sends them that way.
 """
 import http.server
 import socketserver
-import os, sys, json, re, time
+import os, sys, json, re, time, gzip, threading, hmac, fnmatch
 import urllib.request, urllib.parse
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from static_assets import StaticAssets, accepted_encodings
+from event_stream import EventHub, chunk, sse_message
+from bounded_cache import BoundedCache
 
 # ── ARIA AI Proxy Config ──────────────────────────────────────────────────────
 ARIA_API_ENDPOINT = 'https://www.genspark.ai/api/llm_proxy/v1/chat/completions'
@@ -19,22 +33,186 @@ ARIA_API_ENDPOINT = 'https://www.genspark.ai/api/llm_proxy/v1/chat/completions'
 ARIA_API_KEY = os.environ.get('GSK_TOKEN', '')
 
 SHEET_ID = '1VE4yznBlIAfLUP50tkF6IAOlNbFm2vhyPs0Jv5aJ-6U'
-CACHE = {'data': None, 'ts': 0}
+MB = 1024 * 1024
+# 'tiktok-data' → {'data': payload, 'ts': timestamp}
+CACHE = BoundedCache('tiktok-data', int(os.environ.get('TIKTOK_CACHE_BYTES', 64 * MB)))
 CACHE_TTL = 300  # 5 min
+# sheet name → {'data': gviz, 'ts': timestamp}; kept as a stale fallback
+TIKTOK_SHEETS = BoundedCache('tiktok-sheets', int(os.environ.get('TIKTOK_SHEETS_BYTES', 64 * MB)))
+
+# /api/admin/invalidate is disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
 
 # ── helpers ───────────────────────────────────────────────────────────────
-def fetch_gviz(sheet_name):
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one: the first caller
+    runs fn, the rest wait for and share its result (or exception)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as ex:
+            call['error'] = ex
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['done'].set()
+
+# Upstream refreshes in flight (TikTok data, KOS sheets, /api/sheet)
+FLIGHTS = SingleFlight()
+
+class BustLimiter:
+    """
+    Gate for client cache busts (?bust=). A bust is allowed when the source
+    was not refreshed in the last `min_interval` seconds (by anyone) and the
+    caller's IP still has a token; each IP gets `burst` tokens, refilled at
+    `per_minute`. A refused bust is served from cache. Both tables are
+    bounded (max_ips / max_sources), since sources carry client-chosen
+    sheet names and queries.
+    """
+
+    def __init__(self, per_minute, burst, min_interval, max_ips=10000, max_sources=10000):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.min_interval = min_interval
+        self.max_ips = max_ips
+        self.max_sources = max_sources
+        self.lock = threading.Lock()
+        self.buckets = {}   # ip → [tokens, ts]
+        self.last = {}      # source → time of the last allowed bust, oldest first
+
+    def allow(self, ip, source, refreshed=0):
+        now = time.time()
+        with self.lock:
+            if now - max(self.last.get(source, 0), refreshed) < self.min_interval:
+                return False
+            tokens, ts = self.buckets.get(ip, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - ts) * self.rate)
+            if tokens < 1:
+                self.buckets[ip] = [tokens, now]
+                return False
+            if len(self.buckets) >= self.max_ips and ip not in self.buckets:
+                # Forget IPs whose bucket has refilled; they start full anyway
+                full = now - (self.burst / self.rate)
+                self.buckets = {k: v for k, v in self.buckets.items() if v[1] > full}
+            self.buckets[ip] = [tokens - 1, now]
+            self.last.pop(source, None)
+            self.last[source] = now
+            # Oldest first: drop busts too old to gate anything, then any past the cap
+            while self.last:
+                oldest = next(iter(self.last))
+                if now - self.last[oldest] < self.min_interval and len(self.last) <= self.max_sources:
+                    break
+                del self.last[oldest]
+            return True
+
+BUSTS = BustLimiter(per_minute=float(os.environ.get('BUST_PER_MINUTE', 2)),
+                    burst=float(os.environ.get('BUST_BURST', 3)),
+                    min_interval=float(os.environ.get('BUST_MIN_INTERVAL', 30)))
+
+# /api/events subscribers; every refresh that changes a source publishes
+# {topic}: {'version': ...} (topics: tiktok-data, kos-seeding, sheet)
+EVENTS = EventHub()
+
+def col_index(letter):
+    """'A' → 0, 'O' → 14, 'AA' → 26"""
+    n = 0
+    for ch in letter.upper():
+        n = n * 26 + ord(ch) - 64
+    return n - 1
+
+def col_letter(index):
+    """0 → 'A', 14 → 'O', 26 → 'AA' (inverse of col_index)"""
+    letter = ''
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letter = chr(65 + rem) + letter
+    return letter
+
+class GvizQuery:
+    """
+    What a parser reads from a sheet, compiled into a gviz `tq` query so
+    Google only sends those columns and rows:
+
+      columns   'A:F,H:M,O' — letters / ranges the parser indexes
+      keep_any  letters; a row is sent when any of them is non-empty
+                (rows where all are empty must be ones the parser skips)
+
+    expand() puts the returned cells back at their sheet positions, so
+    parsers keep indexing cells by column number.
+    """
+
+    def __init__(self, columns, keep_any=()):
+        self.columns = []
+        for part in columns.split(','):
+            first, _, last = part.strip().upper().partition(':')
+            self.columns += [col_letter(i) for i in range(col_index(first), col_index(last or first) + 1)]
+        self.keep_any = [c.upper() for c in keep_any]
+
+    def tq(self):
+        query = 'select ' + ', '.join(self.columns)
+        if self.keep_any:
+            query += ' where ' + ' or '.join(f'{c} is not null' for c in self.keep_any)
+        return query
+
+    def expand(self, gviz):
+        positions = [col_index(c) for c in self.columns]
+        width = max(positions) + 1
+        def place(items):
+            full = [None] * width
+            for i, item in zip(positions, items):
+                full[i] = item
+            return full
+        table = gviz.get('table') or {}
+        if 'cols' in table:
+            table['cols'] = [c or {'label': ''} for c in place(table['cols'])]
+        for row in table.get('rows', []):
+            row['c'] = place(row.get('c') or [])
+        return gviz
+
+def fetch_gviz(sheet_name, query=None):
+    """
+    gviz JSON of a TikTok sheet. With a GvizQuery the select/where runs
+    upstream; if Google rejects the query (e.g. a renamed column layout),
+    the whole sheet is fetched instead.
+    """
     url = (f'https://docs.google.com/spreadsheets/d/{SHEET_ID}'
            f'/gviz/tq?tqx=out:json&sheet={urllib.parse.quote(sheet_name)}')
+    if query is not None:
+        url += '&tq=' + urllib.parse.quote(query.tq())
     req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
     try:
         with urllib.request.urlopen(req, timeout=20) as r:
             text = r.read().decode('utf-8')
         s = text.find('{'); e = text.rfind('}') + 1
-        return json.loads(text[s:e])
+        gviz = json.loads(text[s:e])
     except Exception as ex:
         print(f'  [WARN] fetch "{sheet_name}": {ex}', file=sys.stderr)
         return None
+    if query is None:
+        return gviz
+    if gviz.get('status') == 'error' or 'table' not in gviz:
+        print(f'  [WARN] tq rejected for "{sheet_name}" ({gviz.get("errors")}), fetching whole sheet',
+              file=sys.stderr)
+        return fetch_gviz(sheet_name)
+    return query.expand(gviz)
 
 def cv(cells, idx):
     """Return cell value or None."""
@@ -110,6 +288,9 @@ def fmt_time(v):
     return s
 
 # ── Dashboard sheet parser ────────────────────────────────────────────────
+# Month (A) + the 7 totals; rows without a month are skipped
+DASHBOARD_QUERY = GvizQuery('A:H', keep_any='A')
+
 def parse_dashboard(gviz):
     out = []
     if not gviz or 'table' not in gviz: return out
@@ -129,7 +310,97 @@ def parse_dashboard(gviz):
         })
     return out
 
+# ── Compact TikTok rows ───────────────────────────────────────────────────
+# Row dicts as served (plus '_dup': True on duplicate sheets); 'sheet' is
+# the same for a whole month, so TikTokRows keeps it once per block.
+TIKTOK_FIELDS = ('sheet', 'day', 'date', 'time', 'platform', 'theme', 'title', 'sku', 'duration',
+                 'views', 'likes', 'comments', 'followers', 'gmv')
+TIKTOK_COLUMNS = TIKTOK_FIELDS[1:]
+TIKTOK_COUNTS = {'views', 'likes', 'comments', 'followers'}
+# pgmv's int 0 for a blank / unparsable GMV, held in the float column as NaN
+# so it is still served as 0, not 0.0
+GMV_MISSING = float('nan')
+
+def served_gmv(v):
+    return 0 if v != v else v
+
+class TikTokRows:
+    """
+    One month sheet's sessions as column arrays instead of a dict per row:
+    strings interned (day / platform / theme / title repeat down a sheet),
+    counts in array('q'), GMV in array('d') (GMV_MISSING for a missing one,
+    served as int 0 like the row dicts had it). A duplicate sheet is another
+    block over the same columns (relabel), not a copy. Row dicts are only
+    built when a response needs them (row / rows).
+    """
+    __slots__ = ('sheet', 'dup', 'columns')
+
+    def __init__(self, sheet, columns=None, dup=False):
+        self.sheet = sheet
+        self.dup = dup
+        self.columns = columns if columns is not None else {
+            f: array('q') if f in TIKTOK_COUNTS else array('d') if f == 'gmv' else [] for f in TIKTOK_COLUMNS}
+
+    def append(self, *values):
+        """One session, values in TIKTOK_COLUMNS order."""
+        *values, gmv = values
+        for column, value in zip(self.columns.values(), values):
+            column.append(sys.intern(value) if isinstance(value, str) else value)
+        self.columns['gmv'].append(GMV_MISSING if isinstance(gmv, int) else gmv)
+
+    def __len__(self):
+        return len(self.columns['date'])
+
+    def relabel(self, sheet):
+        """The same sessions under another sheet name, flagged _dup (shares the columns)."""
+        return TikTokRows(sheet, self.columns, dup=True)
+
+    def values(self, i):
+        *values, gmv = (column[i] for column in self.columns.values())
+        return (self.sheet, self.dup, *values, served_gmv(gmv))
+
+    def row(self, i):
+        row = {'sheet': self.sheet}
+        for field, column in self.columns.items():
+            row[field] = column[i]
+        row['gmv'] = served_gmv(row['gmv'])
+        if self.dup:
+            row['_dup'] = True
+        return row
+
+    def rows(self):
+        return [self.row(i) for i in range(len(self))]
+
+def json_default(o):
+    """json.dumps hook: TikTokRows go out as the usual list of row dicts."""
+    if isinstance(o, TikTokRows):
+        return o.rows()
+    raise TypeError(f'{type(o).__name__} is not JSON serializable')
+
+def tiktok_columnar(data):
+    """
+    ?format=columnar: the payload with every month as column arrays, field
+    names once in 'fields'; a duplicate sheet only names the month it repeats.
+    """
+    months, first = [], {}
+    for month in data['months']:
+        block = month['rows']
+        entry = {'month': month['month'], 'dup': block.dup, 'rows': len(block)}
+        if id(block.columns) in first:
+            entry['dup_of'] = first[id(block.columns)]
+        else:
+            first[id(block.columns)] = month['month']
+            entry['columns'] = [list(map(served_gmv, column)) if field == 'gmv' else list(column)
+                                for field, column in block.columns.items()]
+        months.append(entry)
+    return {**data, 'format': 'columnar', 'fields': list(TIKTOK_COLUMNS), 'months': months}
+
 # ── Month sheet parser — with merged-cell carry-forward ───────────────────
+# Everything but Brief (G) and EngRate (N). A row is only needed when it
+# carries a forward-filled field (A, B, E, F) or a metric the engagement
+# check below reads (J, K, L, O); anything else is skipped by the parser.
+MONTH_SHEET_QUERY = GvizQuery('A:F,H:M,O', keep_any='ABEFJKLO')
+
 def parse_month_sheet(gviz, sheet_name):
     """
     Column mapping (0-based):
@@ -141,9 +412,9 @@ def parse_month_sheet(gviz, sheet_name):
     Merged cells: Day, Date, Title (and sometimes Theme) only appear
     in the first sub-row of each session block; subsequent sub-rows
     for 17:00 and 19:00 have blank values in those columns.
-    We carry them forward.
+    We carry them forward. Returns a TikTokRows block.
     """
-    out = []
+    out = TikTokRows(sheet_name)
     if not gviz or 'table' not in gviz: return out
     raw = gviz['table'].get('rows', [])
 
@@ -183,32 +454,61 @@ def parse_month_sheet(gviz, sheet_name):
         time_str = fmt_time(str(cv(cells, 2) or ''))
         platform = str(cv(cells, 3) or 'Tiktok').strip()
 
-        out.append({
-            'sheet':    sheet_name,
-            'day':      last_day,
-            'date':     last_date,
-            'time':     time_str,
-            'platform': platform,
-            'theme':    last_theme,
-            'title':    last_title,   # ← now properly carries forward
-            'sku':      sku,
-            'duration': duration,
-            'views':    int(views),
-            'likes':    int(likes),
-            'comments': int(comments),
-            'followers':int(followers),
-            'gmv':      gmv,
-        })
+        out.append(
+            last_day,
+            last_date,
+            time_str,
+            platform,
+            last_theme,
+            last_title,   # ← now properly carries forward
+            sku,
+            duration,
+            int(views),
+            int(likes),
+            int(comments),
+            int(followers),
+            gmv,
+        )
     return out
 
 # ── Main data builder ──────────────────────────────────────────────────────
-def build_tiktok_data(bust=False):
+def build_tiktok_data(bust=None):
+    """TikTok payload; `bust` is a sheet name (or '*' for all) to refetch first, see invalidate_tiktok."""
+    if bust:
+        invalidate_tiktok(bust)
+    now = time.time()
+    fresh = lambda entry: (now - entry['ts']) < CACHE_TTL
+    cached = CACHE.get('tiktok-data', fresh)
+    if cached and fresh(cached):
+        return cached['data']
+    # Concurrent requests (or busts) share one refresh
+    return FLIGHTS.do('tiktok-data', refresh_tiktok_data)
+
+def invalidate_tiktok(pattern='*'):
+    """Expire the TikTok sheets matching `pattern` (and the payload built from them); returns their names."""
+    names = [n for n in TIKTOK_SHEETS if fnmatch.fnmatchcase(n, pattern)]
+    for name in names:
+        expire(TIKTOK_SHEETS, name)
+    if names or pattern == '*':
+        expire(CACHE, 'tiktok-data')
+    return names
+
+def fetch_tiktok_sheet(sheet_name, query, now):
+    """gviz of one TikTok sheet, refetched once it is CACHE_TTL old; the last good copy if Google fails."""
+    fresh = lambda entry: (now - entry['ts']) < CACHE_TTL
+    cached = TIKTOK_SHEETS.get(sheet_name, fresh)
+    if cached and fresh(cached):
+        return cached['data']
+    gviz = fetch_gviz(sheet_name, query)
+    if gviz is None:
+        return cached['data'] if cached else None
+    TIKTOK_SHEETS.put(sheet_name, {'data': gviz, 'ts': now})
+    return gviz
+
+def refresh_tiktok_data():
     now = time.time()
-    if not bust and CACHE['data'] and (now - CACHE['ts']) < CACHE_TTL:
-        return CACHE['data']
-
     print('  [API] Fetching fresh data…', file=sys.stderr)
-    dash_gviz = fetch_gviz('Dashboard')
+    dash_gviz = fetch_tiktok_sheet('Dashboard', DASHBOARD_QUERY, now)
     dashboard = parse_dashboard(dash_gviz)
 
     active_sheets = [r['month'] for r in dashboard if r['lives'] > 0 or r['views'] > 0]
@@ -216,19 +516,18 @@ def build_tiktok_data(bust=False):
         active_sheets = ['Februari 2026', 'Maret 2026']
 
     month_data = []
-    seen_fps = set()
+    seen_fps = {}   # fingerprint → first TikTokRows with it
 
     for sname in active_sheets:
-        gviz = fetch_gviz(sname)
+        gviz = fetch_tiktok_sheet(sname, MONTH_SHEET_QUERY, now)
         rows = parse_month_sheet(gviz, sname)
-        fp   = (rows[0]['date'] + str(rows[0]['views'])) if rows else '__empty__'
+        fp   = (rows.columns['date'][0] + str(rows.columns['views'][0])) if len(rows) else '__empty__'
 
         if fp in seen_fps and fp != '__empty__':
             # Duplicate sheet — relabel rows for monthly LB but mark _dup for yearly
-            relabeled = [{**r, 'sheet': sname, '_dup': True} for r in rows]
-            month_data.append({'month': sname, 'rows': relabeled})
+            month_data.append({'month': sname, 'rows': seen_fps[fp].relabel(sname)})
         else:
-            seen_fps.add(fp)
+            seen_fps[fp] = rows
             month_data.append({'month': sname, 'rows': rows})
 
     # Detect current month from today's date
@@ -252,17 +551,114 @@ def build_tiktok_data(bust=False):
         'months':        month_data,
         'current_month': cur,
     }
-    CACHE['data'] = data
-    CACHE['ts']   = now
+    with TIKTOK_LOCK:
+        record_tiktok_version(data)
+        CACHE.put('tiktok-data', {'data': data, 'ts': now})
     return data
 
+# ── TikTok data versions (/api/tiktok-data?since=<version>) ───────────────
+# Every refresh that changes anything gets a new version (ms timestamp, so
+# versions keep increasing across restarts) and the set of row keys it
+# inserted / updated / deleted. A client at a version still in the history
+# gets only the rows that changed since; anyone older gets the full payload.
+TIKTOK_HISTORY_MAX = int(os.environ.get('TIKTOK_HISTORY_MAX', 50))
+TIKTOK_LOCK = threading.Lock()
+TIKTOK_VERSIONS = {
+    'version': 0,
+    'rows':    {},      # row key → (TikTokRows, index) of the current version
+    'meta':    None,    # (dashboard, month order, current month) of the current version
+    'history': deque(maxlen=TIKTOK_HISTORY_MAX),   # (version, previous version, {key: op})
+}
+
+def tiktok_row_keys(months):
+    """{(sheet, date, time, sku, n): (TikTokRows, i)}; n numbers repeats of the same slot within a sheet."""
+    keyed = {}
+    for month in months:
+        block = month['rows']
+        dates, times, skus = block.columns['date'], block.columns['time'], block.columns['sku']
+        for i in range(len(block)):
+            key = (block.sheet, dates[i], times[i], skus[i], 0)
+            while key in keyed:
+                key = key[:4] + (key[4] + 1,)
+            keyed[key] = (block, i)
+    return keyed
+
+def record_tiktok_version(data):
+    """Diff a fresh payload against the current version; new version if anything changed (TIKTOK_LOCK held)."""
+    rows = tiktok_row_keys(data['months'])
+    old = TIKTOK_VERSIONS['rows']
+    ops = {}
+    for key, (block, i) in rows.items():
+        if key not in old:
+            ops[key] = 'inserted'
+        elif old[key][0].values(old[key][1]) != block.values(i):
+            ops[key] = 'updated'
+    for key in old.keys() - rows.keys():
+        ops[key] = 'deleted'
+    meta = (data['dashboard'], [m['month'] for m in data['months']], data['current_month'])
+    previous = TIKTOK_VERSIONS['version']
+    if ops or meta != TIKTOK_VERSIONS['meta'] or not previous:
+        version = max(previous + 1, int(time.time() * 1000))
+        TIKTOK_VERSIONS['history'].append((version, previous, ops))
+        TIKTOK_VERSIONS.update(version=version, rows=rows, meta=meta)
+        print(f'  [API] TikTok data v{version}: {len(ops)} rows changed', file=sys.stderr)
+        EVENTS.publish('tiktok-data', {'version': version, 'changed': len(ops)}, event_id=version)
+    else:
+        # Same rows: point at the new blocks so the old ones can be freed
+        TIKTOK_VERSIONS['rows'] = rows
+    data['version'] = TIKTOK_VERSIONS['version']
+
+def tiktok_delta(since):
+    """
+    Rows changed between version `since` and the current one:
+    {version, since, full: False, inserted/updated: [{key, row}], deleted: [key], ...}
+    or None when `since` is unknown or older than the history (send the full payload).
+    """
+    with TIKTOK_LOCK:
+        cached = CACHE.peek('tiktok-data')
+        version, rows = TIKTOK_VERSIONS['version'], TIKTOK_VERSIONS['rows']
+        entries = [e for e in TIKTOK_VERSIONS['history'] if e[0] > since]
+    if cached is None or since != version and (not entries or entries[0][1] != since):
+        return None
+    data = cached['data']
+    first, last = {}, {}
+    for _, _, ops in entries:
+        for key, op in ops.items():
+            first.setdefault(key, op)
+            last[key] = op
+    inserted, updated, deleted = [], [], []
+    for key, op in last.items():
+        existed, exists = first[key] != 'inserted', op != 'deleted'
+        if exists:
+            block, i = rows[key]
+            (updated if existed else inserted).append({'key': list(key), 'row': block.row(i)})
+        elif existed:
+            deleted.append(list(key))
+    return {
+        'version':       version,
+        'since':         since,
+        'full':          False,
+        'generated_at':  data['generated_at'],
+        'dashboard':     data['dashboard'],
+        'month_order':   [m['month'] for m in data['months']],
+        'current_month': data['current_month'],
+        'inserted':      inserted,
+        'updated':       updated,
+        'deleted':       deleted,
+    }
+
 # ── HTTP Handler ──────────────────────────────────────────────────────────
 KOS_SHEET_ID = '1klstE9eWYuCJ67jzU0X_hgDTYQGz2M6E56qTN-KmWVA'
-KOS_CACHE = {}   # sheet_name → {'data': csv_text, 'ts': timestamp}
+# sheet_name → {'data': csv_text, 'ts': timestamp}; names are client input, so
+# "no such sheet" entries (data None) get their own small budget
+KOS_CACHE = BoundedCache('kos-seeding-csv', int(os.environ.get('KOS_CACHE_BYTES', 16 * MB)),
+                         negative_bytes=int(os.environ.get('KOS_CACHE_NEGATIVE_BYTES', 64 * 1024)),
+                         sizeof=lambda entry: sys.getsizeof(entry['data']),
+                         negative=lambda entry: entry['data'] is None)
 KOS_CACHE_TTL = 180  # 3 min
 
 # Use the gviz/tq JSON endpoint to list actual sheet names
-KOS_SHEETS_CACHE = {'names': None, 'ts': 0}
+KOS_SHEETS_CACHE = BoundedCache('kos-seeding-sheets', 64 * 1024)   # 'names' → {'data': [names], 'ts'}
 
 MONTH_NAMES = [
     'Januari','Februari','Maret','April','Mei','Juni',
@@ -282,8 +678,10 @@ def fetch_kos_sheet_names():
     server-side requests.
     """
     now = time.time()
-    if KOS_SHEETS_CACHE['names'] is not None and (now - KOS_SHEETS_CACHE['ts']) < KOS_CACHE_TTL:
-        return KOS_SHEETS_CACHE['names']
+    fresh = lambda entry: (now - entry['ts']) < KOS_CACHE_TTL
+    cached = KOS_SHEETS_CACHE.get('names', fresh)
+    if cached and fresh(cached):
+        return cached['data']
 
     # ── Strategy 1: try HTML parsing (fast, but Google may block) ────────────
     url = f'https://docs.google.com/spreadsheets/d/{KOS_SHEET_ID}/edit'
@@ -299,8 +697,7 @@ def fetch_kos_sheet_names():
                 found.append(n)
                 seen.add(n)
         if found:
-            KOS_SHEETS_CACHE['names'] = found
-            KOS_SHEETS_CACHE['ts'] = now
+            KOS_SHEETS_CACHE.put('names', {'data': found, 'ts': now})
             print(f'  [KOS] Sheet names via HTML: {found}', file=sys.stderr)
             return found
     except Exception as ex:
@@ -315,8 +712,7 @@ def fetch_kos_sheet_names():
         if csv_text is not None:
             found.append(m)
 
-    KOS_SHEETS_CACHE['names'] = found
-    KOS_SHEETS_CACHE['ts'] = now
+    KOS_SHEETS_CACHE.put('names', {'data': found, 'ts': now})
     print(f'  [KOS] Sheet names via probe: {found}', file=sys.stderr)
     return found
 
@@ -331,11 +727,16 @@ def fetch_kos_csv(sheet_name, bust_cache=False):
     """
     now = time.time()
     if not bust_cache:
-        cached = KOS_CACHE.get(sheet_name)
-        if cached and (now - cached['ts']) < KOS_CACHE_TTL:
+        fresh = lambda entry: (now - entry['ts']) < KOS_CACHE_TTL
+        cached = KOS_CACHE.get(sheet_name, fresh)
+        if cached and fresh(cached):
             # None cached means the sheet was confirmed absent
             return cached['data']
+    return FLIGHTS.do(('kos', sheet_name), lambda: download_kos_csv(sheet_name))
 
+def download_kos_csv(sheet_name):
+    """Fetch one KOS month as CSV and cache the result (None = sheet absent); see fetch_kos_csv."""
+    now = time.time()
     url = (f'https://docs.google.com/spreadsheets/d/{KOS_SHEET_ID}'
            f'/gviz/tq?tqx=out:csv&sheet={urllib.parse.quote(sheet_name)}')
     req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
@@ -346,7 +747,7 @@ def fetch_kos_csv(sheet_name, bust_cache=False):
         # Reject HTML error pages or empty responses
         stripped = text.strip()
         if stripped.startswith('<!') or stripped == '':
-            KOS_CACHE[sheet_name] = {'data': None, 'ts': now}
+            KOS_CACHE.put(sheet_name, {'data': None, 'ts': now})
             return None
 
         # ── KEY CHECK ──────────────────────────────────────────────────────────
@@ -361,11 +762,14 @@ def fetch_kos_csv(sheet_name, bust_cache=False):
             print(f'  [KOS] "{sheet_name}" not found in header → sheet does not exist',
                   file=sys.stderr)
             # Cache the negative result so we don't keep hitting Google
-            KOS_CACHE[sheet_name] = {'data': None, 'ts': now}
+            KOS_CACHE.put(sheet_name, {'data': None, 'ts': now})
             return None
 
-        KOS_CACHE[sheet_name] = {'data': text, 'ts': now}
+        previous = KOS_CACHE.peek(sheet_name)
+        KOS_CACHE.put(sheet_name, {'data': text, 'ts': now})
         print(f'  [KOS] "{sheet_name}" fetched OK ({len(text)} bytes)', file=sys.stderr)
+        if previous is None or previous['data'] != text:
+            EVENTS.publish('kos-seeding', {'sheet': sheet_name, 'version': int(now * 1000)})
         return text
 
     except Exception as ex:
@@ -373,34 +777,416 @@ def fetch_kos_csv(sheet_name, bust_cache=False):
         return None
 
 
+# ── Generic Google Sheets proxy (/api/sheet) ──────────────────────────────
+# Dashboards fetch their sheets through here instead of from every browser:
+# one upstream fetch per (sheet, tab, format) per SHEET_PROXY_TTL, shared by
+# all users, single-flight on a miss, gzip computed once per fetch.
+SHEET_PROXY_IDS = {
+    SHEET_ID,                                         # tiktok-performance
+    '1klstE9eWYuCJ67jzU0X_hgDTYQGz2M6E56qTN-KmWVA',   # kos-seeding
+    '1hG0LYjAGubpoFceMr2yOqj8NCcmA7L05khOfivrE3aw',   # index: VM
+    '1ucXoo9EbOHyVNyztS42nryDM405nl-208CZiLwD_cOc',   # index
+    '1dxhpR1ujnQc0eQw90qBAe20Z27eGrKCsbNHmOPBsn9Q',   # index: checklist
+    '1bGNbGDT4WDnwAsx58gKGvsG9yYFBmfD-',              # index: rank item
+    '1yHmOzLTp7uzjgoKASHbiLdwXcGske0bDc81Ur5vrdIs',   # index, am-performance-tracker
+    '1nTSZFKFZRt1owO-hKUk2lkzvlGxcyrBTC47yDTiu1YQ',   # index
+    '1oU2uCC1WokxCFZAW8pKeb4osZC-ktIwB-TvlyvpRZ6s',   # index: PSH project
+    '1Ugwz970wMUVirLsl6K-7qOLoFqZWq-fr',              # index: warehouse pareto
+    '18QxvJrdARXHuGOeLoqA11x0o4Vy_AIkwdqW0-cgqJMs',   # pillar-tracker
+    '1Mr42a0pG4fQGsxTj77FmaTapE4_utQJ8mXO4DRYU2i0',   # loss-sales / price-comparison tracker
+    '16wYhLLLDNq6d8Tc9inWcz_0yig1XkV-AuHBxyd01AzM',   # instagram-performance
+} | {i.strip() for i in os.environ.get('SHEET_PROXY_IDS', '').split(',') if i.strip()}
+SHEET_PROXY_TTL = int(os.environ.get('SHEET_PROXY_TTL', 120))
+# (id, gid, sheet, format, tq) → {'body', 'gzip', 'type', 'ts'}
+SHEET_CACHE = BoundedCache('sheet', int(os.environ.get('SHEET_CACHE_BYTES', 64 * MB)),
+                           sizeof=lambda entry: len(entry['body']) + len(entry['gzip']))
+
+SHEET_TYPES = {'csv': 'text/csv; charset=utf-8', 'json': 'application/json; charset=utf-8'}
+
+class SheetError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def sheet_url(sheet_id, gid, sheet, fmt, tq=''):
+    """Upstream URL: export?format=csv for a gid, gviz/tq for a sheet name, a query or JSON."""
+    base = f'https://docs.google.com/spreadsheets/d/{sheet_id}'
+    if fmt == 'csv' and not sheet and not tq:
+        return f'{base}/export?format=csv' + (f'&gid={gid}' if gid else '')
+    url = f'{base}/gviz/tq?tqx=out:{fmt}'
+    if sheet:
+        url += f'&sheet={urllib.parse.quote(sheet)}'
+    elif gid:
+        url += f'&gid={gid}'
+    if tq:
+        url += f'&tq={urllib.parse.quote(tq)}'
+    return url
+
+def download_sheet(key):
+    sheet_id, gid, sheet, fmt, tq = key
+    url = sheet_url(sheet_id, gid, sheet, fmt, tq)
+    req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+    try:
+        with urllib.request.urlopen(req, timeout=20) as r:
+            body = r.read()
+            upstream_type = r.headers.get('Content-Type', '')
+    except urllib.error.HTTPError as e:
+        raise SheetError(e.code if e.code < 500 else 502, f'Upstream returned {e.code}')
+    except Exception as ex:
+        raise SheetError(502, f'Upstream fetch failed: {ex}')
+    # Private / missing sheets answer with a Google sign-in page
+    if upstream_type.startswith('text/html') or body.lstrip()[:2] == b'<!':
+        raise SheetError(404, 'Sheet not found or not shared publicly')
+    entry = {'body': body, 'gzip': gzip.compress(body, 6), 'type': SHEET_TYPES[fmt], 'ts': time.time()}
+    previous = SHEET_CACHE.peek(key)
+    SHEET_CACHE.put(key, entry)
+    if previous is None or previous['body'] != body:
+        EVENTS.publish('sheet', {'id': sheet_id, 'gid': gid, 'sheet': sheet, 'format': fmt, 'tq': tq,
+                                 'version': int(entry['ts'] * 1000)})
+    print(f'  [SHEET] {sheet_id[:8]}… gid={gid} sheet={sheet!r} {fmt}: {len(body)} bytes', file=sys.stderr)
+    return entry
+
+def fetch_sheet(sheet_id, gid='', sheet='', fmt='csv', tq=''):
+    """
+    Cached sheet for /api/sheet: {'body', 'gzip', 'type', 'ts'}.
+    Raises SheetError (status, message) for bad / disallowed requests and
+    upstream failures; a stale copy is served instead when one exists.
+    """
+    if sheet_id not in SHEET_PROXY_IDS:
+        raise SheetError(403, 'Sheet id not allowed')
+    if fmt not in SHEET_TYPES:
+        raise SheetError(400, 'format must be csv or json')
+    if gid and not gid.isdigit():
+        raise SheetError(400, 'gid must be numeric')
+    if len(sheet) > 100:
+        raise SheetError(400, 'sheet name too long')
+    if len(tq) > 500:
+        raise SheetError(400, 'tq query too long')
+    key = (sheet_id, gid, sheet, fmt, tq)
+    fresh = lambda entry: (time.time() - entry['ts']) < SHEET_PROXY_TTL
+    cached = SHEET_CACHE.get(key, fresh)
+    if cached and fresh(cached):
+        return cached
+    try:
+        return FLIGHTS.do(('sheet',) + key, lambda: download_sheet(key))
+    except SheetError:
+        if cached:
+            return cached
+        raise
+
+
+# ── Invalidation (/api/admin/invalidate, ?bust=) ──────────────────────────
+# Sources are expired by name or fnmatch pattern; the next read refetches
+# only what was expired. TikTok and /api/sheet entries stay as the stale
+# fallback; KOS months are dropped (their fetch has no fallback).
+def expire(cache, key):
+    """Mark a {'ts', ...} entry as due for a refetch, keeping it as the stale copy."""
+    entry = cache.peek(key)
+    if entry is not None:
+        entry['ts'] = 0
+
+def invalidate_kos(pattern='*'):
+    names = [n for n in KOS_CACHE if fnmatch.fnmatchcase(n, pattern)]
+    for name in names:
+        KOS_CACHE.pop(name, None)
+    return names
+
+def invalidate_kos_sheet_names(pattern='*'):
+    """The month list is one entry: only a '*' pattern expires it."""
+    if pattern != '*':
+        return []
+    expire(KOS_SHEETS_CACHE, 'names')
+    return list((KOS_SHEETS_CACHE.peek('names') or {'data': []})['data'])
+
+def invalidate_sheets(pattern='*'):
+    """/api/sheet entries whose id, or id/tab (tab = sheet name or gid), matches."""
+    labels = []
+    for key in SHEET_CACHE:
+        sheet_id, gid, sheet = key[:3]
+        label = f'{sheet_id}/{sheet or gid}'
+        if fnmatch.fnmatchcase(sheet_id, pattern) or fnmatch.fnmatchcase(label, pattern):
+            expire(SHEET_CACHE, key)
+            labels.append(label + (f' [{key[3]}{" tq" if key[4] else ""}]'))
+    return labels
+
+CACHES = (CACHE, TIKTOK_SHEETS, KOS_CACHE, KOS_SHEETS_CACHE, SHEET_CACHE)
+
+INVALIDATORS = {
+    'tiktok-data':        invalidate_tiktok,
+    'kos-seeding-csv':    invalidate_kos,
+    'kos-seeding-sheets': invalidate_kos_sheet_names,
+    'sheet':              invalidate_sheets,
+}
+
+
+# ── Batched sources (/api/batch) ──────────────────────────────────────────
+# One request resolves several sources concurrently against the caches
+# above, e.g. the KOS sheet list + every month + TikTok data in one round trip.
+BATCH_MAX_ITEMS = 20
+BATCH_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get('BATCH_WORKERS', 8)),
+                                thread_name_prefix='batch')
+
+def batch_item(item):
+    """(status, body) of one batch entry; body is JSON data, or text for CSV sources."""
+    source = item.get('source')
+    if source == 'tiktok-data':
+        data = build_tiktok_data()
+        return 200, tiktok_columnar(data) if item.get('format') == 'columnar' else data
+    if source == 'kos-seeding-sheets':
+        return 200, {'sheets': fetch_kos_sheet_names() or []}
+    if source == 'kos-seeding-csv':
+        sheet_name = str(item.get('sheet') or '').strip()
+        if not sheet_name:
+            return 400, {'error': 'Missing sheet parameter'}
+        csv_text = fetch_kos_csv(sheet_name)
+        if csv_text is None:
+            return 404, {'error': 'Sheet not found'}
+        return 200, csv_text
+    if source == 'sheet':
+        arg = lambda name: str(item.get(name) or '').strip()
+        try:
+            entry = fetch_sheet(arg('id'), arg('gid'), arg('sheet'), arg('format') or 'csv', arg('tq'))
+        except SheetError as e:
+            return e.status, {'error': str(e)}
+        return 200, entry['body'].decode('utf-8', 'replace')
+    return 400, {'error': f'Unknown source: {source!r}'}
+
+def resolve_batch(items):
+    """Run every entry on BATCH_POOL; one result per entry, in order, each with its own status."""
+    def timed(item):
+        started = time.time()
+        try:
+            status, body = batch_item(item)
+        except Exception as ex:
+            status, body = 500, {'error': str(ex)}
+        return status, body, round((time.time() - started) * 1000, 1)
+    futures = [BATCH_POOL.submit(timed, item) for item in items]
+    results = []
+    for i, (item, future) in enumerate(zip(items, futures)):
+        status, body, ms = future.result()
+        results.append({'key': item.get('key', i), 'source': item.get('source'),
+                        'status': status, 'ms': ms, 'body': body})
+    return results
+
+
+# ── Background refresh while dashboards listen on /api/events ─────────────
+# Subscribers stop polling, so the TikTok data is refreshed here once its
+# TTL runs out (publishing a version event if it changed).
+REFRESHER = {'thread': None}
+
+def refresh_while_subscribed():
+    while True:
+        time.sleep(CACHE_TTL)
+        if not EVENTS.stats()['clients']:
+            continue
+        try:
+            build_tiktok_data()
+        except Exception as ex:
+            print(f'  [EVENTS] background refresh failed: {ex}', file=sys.stderr)
+
+def start_refresher():
+    with TIKTOK_LOCK:
+        if REFRESHER['thread'] is None:
+            REFRESHER['thread'] = threading.Thread(target=refresh_while_subscribed, name='refresher', daemon=True)
+            REFRESHER['thread'].start()
+
+
+# gzip/brotli variants + validators of served files (warmed in __main__)
+STATIC_ASSETS = StaticAssets()
+
+
+# Persistent connections: idle connections are closed after KEEPALIVE_TIMEOUT
+# seconds, and every connection after KEEPALIVE_MAX_REQUESTS requests
+KEEPALIVE_TIMEOUT = float(os.environ.get('KEEPALIVE_TIMEOUT', 15))
+KEEPALIVE_MAX_REQUESTS = int(os.environ.get('KEEPALIVE_MAX_REQUESTS', 100))
+
+# API responses at least this large are gzipped when the client accepts it
+API_GZIP_MIN = 1024
+
+
 class Handler(http.server.SimpleHTTPRequestHandler):
+    # HTTP/1.1 keep-alive: every response must carry Content-Length (or be
+    # chunked) so the client knows where it ends
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+    # Headers and body are separate writes; without TCP_NODELAY the body waits
+    # on the client's delayed ACK (~40 ms) once the connection stays open
+    disable_nagle_algorithm = True
+
+    # Cache-Control of the response being built; static files set their own,
+    # API responses keep the no-store default
+    cache_policy = None
+
+    def setup(self):
+        super().setup()
+        self.requests_served = 0
+
+    def handle_one_request(self):
+        self.requests_served += 1
+        super().handle_one_request()
+
     def end_headers(self):
-        self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+        self.send_header('Cache-Control', self.cache_policy or 'no-cache, no-store, must-revalidate')
+        self.cache_policy = None
         self.send_header('Access-Control-Allow-Origin', '*')
+        if self.requests_served >= KEEPALIVE_MAX_REQUESTS:
+            self.send_header('Connection', 'close')
+        elif not self.close_connection:
+            self.send_header('Keep-Alive', f'timeout={KEEPALIVE_TIMEOUT:g}, '
+                                           f'max={KEEPALIVE_MAX_REQUESTS - self.requests_served}')
         super().end_headers()
 
+    def _send_body(self, status, body, content_type='application/json', gzipped=None):
+        """
+        Send a complete response with its Content-Length (keeps the connection
+        usable). Bodies of API_GZIP_MIN bytes or more are gzipped for clients
+        that accept it; pass `gzipped` when a compressed copy is cached.
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        compress = len(body) >= API_GZIP_MIN
+        if compress and 'gzip' in accepted_encodings(self.headers.get('Accept-Encoding')):
+            body = gzipped if gzipped is not None else gzip.compress(body, 6)
+            encoding = 'gzip'
+        else:
+            encoding = None
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if compress:
+            self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _read_body(self):
+        """The request body; always read in full so the next request on the connection parses."""
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length > 0 else b''
+
+    def _serve_static(self, head=False):
+        """Files via STATIC_ASSETS; directory listings, redirects and 404s via SimpleHTTPRequestHandler."""
+        url_path = urllib.parse.urlsplit(self.path).path
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and url_path.endswith('/'):
+            path = os.path.join(path, 'index.html')
+        if not STATIC_ASSETS.serve(self, path, url_path, head=head):
+            if head:
+                super().do_HEAD()
+            else:
+                super().do_GET()
+
+    def do_HEAD(self):
+        self._serve_static(head=True)
+
     def do_OPTIONS(self):
         """Handle CORS preflight for ARIA chat API."""
         self.send_response(204)
-        self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
         self.end_headers()
 
     def do_POST(self):
-        """Handle POST requests — specifically /api/aria-chat."""
+        """Handle POST requests — /api/aria-chat, /api/batch and /api/admin/invalidate."""
         if self.path.startswith('/api/aria-chat'):
             self._handle_aria_chat()
+        elif self.path == '/api/batch':
+            self._handle_batch()
+        elif self.path == '/api/admin/invalidate':
+            self._handle_invalidate()
         else:
-            self.send_response(404)
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
+            self._read_body()
+            self._send_body(404, b'')
+
+    def _bust(self, source, qs, refreshed=0):
+        """True if the request asks for ?bust and this client may bust `source` now (BUSTS)."""
+        if 'bust' not in qs:
+            return False
+        if not BUSTS.allow(self.client_address[0], source, refreshed):
+            print(f'  [BUST] {source} from {self.client_address[0]}: limited, serving cache', file=sys.stderr)
+            return False
+        return True
+
+    def _handle_invalidate(self):
+        """
+        Admin: {"source": "tiktok-data" | "kos-seeding-csv" | "kos-seeding-sheets" | "sheet" | "*",
+                "pattern": "<name or fnmatch pattern>"} with Authorization: Bearer <ADMIN_TOKEN>.
+        Answers {"invalidated": {source: [names]}}.
+        """
+        raw = self._read_body()
+        token = self.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not ADMIN_TOKEN:
+            self._send_body(403, json.dumps({'error': 'Admin API disabled (ADMIN_TOKEN not set)'}))
+            return
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            self._send_body(401, json.dumps({'error': 'Bad admin token'}))
+            return
+        try:
+            payload = json.loads(raw or b'{}')
+            source, pattern = payload.get('source', '*'), str(payload.get('pattern') or '*')
+        except (ValueError, AttributeError):
+            self._send_body(400, json.dumps({'error': 'Body must be a JSON object'}))
+            return
+        if source != '*' and source not in INVALIDATORS:
+            self._send_body(400, json.dumps({'error': f'Unknown source: {source!r}',
+                                             'sources': sorted(INVALIDATORS)}))
+            return
+        done = {name: fn(pattern) for name, fn in INVALIDATORS.items() if source in ('*', name)}
+        print(f'  [ADMIN] invalidate {source} {pattern!r}: {sum(map(len, done.values()))} entries',
+              file=sys.stderr)
+        self._send_body(200, json.dumps({'invalidated': done}, ensure_ascii=False),
+                        'application/json; charset=utf-8')
+
+    def _handle_events(self):
+        """
+        SSE stream: ?topics=tiktok-data,kos-seeding,sheet (default all).
+        Starts with a `versions` event (current TikTok version); then one event
+        per refresh that changed a source. The socket is handed to EVENTS, so
+        this handler thread returns immediately.
+        """
+        qs = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        topics = {t for t in qs.get('topics', [''])[0].split(',') if t} or None
+        if EVENTS.full():
+            self._send_body(503, json.dumps({'error': 'Too many event subscribers'}))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.close_connection = True
+        self.end_headers()
+        self.wfile.flush()
+        first = chunk(b'retry: 5000\n\n' + sse_message('versions', {'tiktok-data': TIKTOK_VERSIONS['version']}))
+        EVENTS.subscribe(self.connection, topics, first)
+        start_refresher()
+
+    def _handle_batch(self):
+        """
+        POST {"requests": [{"key": "...", "source": "tiktok-data" (+ format=columnar) | "kos-seeding-sheets"
+        | "kos-seeding-csv" (+ sheet) | "sheet" (+ id, gid/sheet, format, tq)}, ...]}
+        → {"results": [{"key", "source", "status", "ms", "body"}, ...]} (gzipped);
+        key defaults to the entry's index. A failing entry only fails its own result.
+        """
+        try:
+            items = json.loads(self._read_body() or b'{}').get('requests')
+        except (ValueError, AttributeError):
+            items = None
+        if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+            self._send_body(400, json.dumps({'error': 'Body must be {"requests": [{"source": ...}, ...]}'}))
+            return
+        if len(items) > BATCH_MAX_ITEMS:
+            self._send_body(400, json.dumps({'error': f'At most {BATCH_MAX_ITEMS} requests per batch'}))
+            return
+        results = resolve_batch(items)
+        self._send_body(200, json.dumps({'results': results}, ensure_ascii=False, default=json_default),
+                        'application/json; charset=utf-8')
 
     def _handle_aria_chat(self):
         """Secure AI proxy — forwards chat request to OpenAI-compatible API."""
         try:
-            length = int(self.headers.get('Content-Length', 0))
-            body_bytes = self.rfile.read(length)
+            body_bytes = self._read_body()
             payload = json.loads(body_bytes)
 
             # Always use the server-side GSK_TOKEN — never trust client-provided keys
@@ -410,11 +1196,7 @@ class Handler(http.server.SimpleHTTPRequestHandler):
             api_key = ARIA_API_KEY
 
             if not api_key:
-                self.send_response(401)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'No API key configured'}).encode())
+                self._send_body(401, json.dumps({'error': 'No API key configured'}))
                 return
 
             # Force safe model — only Genspark-supported models allowed
@@ -445,41 +1227,41 @@ class Handler(http.server.SimpleHTTPRequestHandler):
                 resp_body = resp.read()
                 resp_status = resp.getcode()
 
-            self.send_response(resp_status)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(resp_body)
+            self._send_body(resp_status, resp_body, 'application/json; charset=utf-8')
             print(f'  [ARIA] Chat request proxied OK ({len(resp_body)} bytes)', file=sys.stderr)
 
         except urllib.error.HTTPError as e:
             err_body = e.read()
-            self.send_response(e.code)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(err_body)
+            self._send_body(e.code, err_body)
             print(f'  [ARIA] API error {e.code}: {err_body[:200]}', file=sys.stderr)
         except Exception as ex:
             print(f'  [ARIA] Proxy error: {ex}', file=sys.stderr)
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(ex)}).encode())
+            self._send_body(500, json.dumps({'error': str(ex)}))
 
     def do_GET(self):
         if self.path.startswith('/api/tiktok-data'):
-            bust = 'bust=' in self.path
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.end_headers()
+            # ?since=<version> → only the rows changed since that version (see tiktok_delta)
+            # ?format=columnar → months as column arrays (see tiktok_columnar)
+            # ?bust=<sheet name> refetches that sheet, any other value every sheet (rate limited)
+            qs = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query, keep_blank_values=True)
+            since = qs.get('since', [''])[0]
+            bust = qs.get('bust', [''])[0]
+            entry = TIKTOK_SHEETS.peek(bust) if bust else None
+            bust = bust if entry else '*'
+            refreshed = (entry or CACHE.peek('tiktok-data') or {'ts': 0})['ts']
+            if not self._bust(('tiktok-data', bust), qs, refreshed):
+                bust = None
             try:
                 data = build_tiktok_data(bust=bust)
-                self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+                delta = tiktok_delta(int(since)) if since.isdigit() else None
+                if delta is None and since:
+                    data = {**data, 'full': True}
+                if delta is None and qs.get('format', [''])[0] == 'columnar':
+                    data = tiktok_columnar(data)
+                body = json.dumps(delta or data, ensure_ascii=False, default=json_default)
             except Exception as e:
-                err = json.dumps({'error': str(e)}).encode()
-                self.wfile.write(err)
+                body = json.dumps({'error': str(e)})
+            self._send_body(200, body, 'application/json; charset=utf-8')
 
         elif self.path == '/api/aria-config':
             # Serve AI config securely (key is obfuscated, not raw)
@@ -490,16 +1272,32 @@ class Handler(http.server.SimpleHTTPRequestHandler):
             seed = 0x5A
             encoded = ''.join(chr(ord(c) ^ (seed + i % 7)) for i, c in enumerate(key))
             b64 = base64.b64encode(encoded.encode('latin-1')).decode()
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({
+            self._send_body(200, json.dumps({
                 'c': b64,
                 's': seed,
                 'b': base_url,
                 'm': 'gpt-5-mini',
-            }).encode())
+            }))
+
+        elif self.path.startswith('/api/sheet?') or self.path == '/api/sheet':
+            # Cached proxy: ?id=<sheet id>&gid=<tab gid> | &sheet=<tab name>&format=csv|json[&tq=<gviz query>]
+            qs = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            arg = lambda name: qs.get(name, [''])[0].strip()
+            try:
+                entry = fetch_sheet(arg('id'), arg('gid'), arg('sheet'), arg('format') or 'csv', arg('tq'))
+            except SheetError as e:
+                self._send_body(e.status, json.dumps({'error': str(e)}))
+                return
+            self.cache_policy = f'public, max-age={SHEET_PROXY_TTL // 2}'
+            self._send_body(200, entry['body'], entry['type'], gzipped=entry['gzip'])
+
+        elif self.path.startswith('/api/events'):
+            self._handle_events()
+
+        elif self.path == '/api/cache-stats':
+            stats = {cache.name: cache.stats() for cache in CACHES}
+            stats.update(static=STATIC_ASSETS.stats(), events=EVENTS.stats())
+            self._send_body(200, json.dumps(stats))
 
         elif self.path == '/favicon.ico':
             self.send_response(204)
@@ -507,56 +1305,55 @@ class Handler(http.server.SimpleHTTPRequestHandler):
 
         elif self.path.startswith('/api/kos-seeding-sheets'):
             # Returns JSON list of real sheet names that exist in the spreadsheet.
-            # Pass ?bust=1 to force-refresh the sheet-names cache.
-            parsed_path = urllib.parse.urlparse(self.path)
-            bust = 'bust' in urllib.parse.parse_qs(parsed_path.query)
-            if bust:
-                KOS_SHEETS_CACHE['names'] = None
-                KOS_SHEETS_CACHE['ts'] = 0
-                # Also clear CSV cache for all months so stale entries are evicted
-                KOS_CACHE.clear()
+            # Pass ?bust=1 to force-refresh the sheet-names cache (months keep their own TTL).
+            qs = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query, keep_blank_values=True)
+            cached = KOS_SHEETS_CACHE.peek('names')
+            if self._bust('kos-seeding-sheets', qs, refreshed=cached['ts'] if cached else 0):
+                invalidate_kos_sheet_names()
             names = fetch_kos_sheet_names()
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(json.dumps({'sheets': names or []}).encode('utf-8'))
+            self._send_body(200, json.dumps({'sheets': names or []}), 'application/json; charset=utf-8')
 
         elif self.path.startswith('/api/kos-seeding-csv'):
             # Extract ?sheet=SheetName&bust=1 from query string
             parsed_path = urllib.parse.urlparse(self.path)
-            qs = urllib.parse.parse_qs(parsed_path.query)
+            qs = urllib.parse.parse_qs(parsed_path.query, keep_blank_values=True)
             sheet_name = qs.get('sheet', [''])[0].strip()
-            bust_cache = 'bust' in qs
             if not sheet_name:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(b'{"error":"Missing sheet parameter"}')
+                self._send_body(400, b'{"error":"Missing sheet parameter"}')
                 return
+            cached = KOS_CACHE.peek(sheet_name)
+            bust_cache = self._bust(('kos-seeding-csv', sheet_name), qs, refreshed=cached['ts'] if cached else 0)
             csv_text = fetch_kos_csv(sheet_name, bust_cache=bust_cache)
             if csv_text is None:
-                self.send_response(404)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(b'{"error":"Sheet not found"}')
+                self._send_body(404, b'{"error":"Sheet not found"}')
                 return
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/csv; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(csv_text.encode('utf-8'))
+            self._send_body(200, csv_text, 'text/csv; charset=utf-8')
 
         else:
-            super().do_GET()
+            self._serve_static()
 
     def log_message(self, fmt, *args):
         sys.stdout.write(f'{self.log_date_time_string()} - {fmt % args}\n')
         sys.stdout.flush()
 
+
+class Server(socketserver.ThreadingTCPServer):
+    """One thread per connection, so an idle keep-alive connection never blocks the others."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def shutdown_request(self, request):
+        # Event streams outlive their handler thread; EVENTS closes them
+        if request in EVENTS:
+            return
+        super().shutdown_request(request)
+
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
     os.chdir('/home/user/webapp')
-    socketserver.TCPServer.allow_reuse_address = True
-    with socketserver.TCPServer(('', port), Handler) as httpd:
+    STATIC_ASSETS.warm(os.getcwd())
+    with Server(('', port), Handler) as httpd:
         print(f'Server running at http://localhost:{port}')
         sys.stdout.flush()
         httpd.serve_forever()
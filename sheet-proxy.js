@@ -0,0 +1,64 @@
+/**
+ * Google Sheets via server.py's /api/sheet proxy
+ *
+ * Dashboards keep their docs.google.com URLs; this script rewrites
+ * `fetch()` calls for /export?format=csv and /gviz/tq (out:csv / out:json,
+ * tq= queries included) to the cached same-origin proxy, so every user
+ * viewing a sheet shares one upstream fetch per TTL. Cache-busters
+ * (&timestamp=, &t=) are dropped.
+ *
+ * If the proxy is not there (e.g. the page is served from GitHub Pages) or
+ * refuses the sheet, the original URL is fetched instead; a missing proxy
+ * is remembered for the rest of the session.
+ */
+(function () {
+    if (!window.fetch || location.protocol.indexOf('http') !== 0) return;
+
+    var SHEET_URL = /^https:\/\/docs\.google\.com\/spreadsheets\/d\/([\w-]+)\/(export|gviz\/tq)\?(.*)$/;
+    var UNAVAILABLE_KEY = 'sheetProxyUnavailable';
+    var nativeFetch = window.fetch.bind(window);
+
+    function proxyUnavailable() {
+        try { return sessionStorage.getItem(UNAVAILABLE_KEY) === '1'; } catch (e) { return false; }
+    }
+
+    function markUnavailable() {
+        try { sessionStorage.setItem(UNAVAILABLE_KEY, '1'); } catch (e) { /* private mode */ }
+    }
+
+    function proxyUrl(url) {
+        var m = SHEET_URL.exec(url);
+        if (!m) return null;
+        var params = new URLSearchParams(m[3]);
+        var format;
+        if (m[2] === 'export') {
+            if (params.get('format') !== 'csv') return null;
+            format = 'csv';
+        } else {
+            var tqx = params.get('tqx') || 'out:json';
+            format = tqx.indexOf('out:csv') !== -1 ? 'csv' : tqx.indexOf('out:json') !== -1 ? 'json' : null;
+            if (!format) return null;
+        }
+        var query = new URLSearchParams({ id: m[1], format: format });
+        if (params.get('gid')) query.set('gid', params.get('gid'));
+        if (params.get('sheet')) query.set('sheet', params.get('sheet'));
+        if (params.get('tq')) query.set('tq', params.get('tq'));
+        return '/api/sheet?' + query.toString();
+    }
+
+    window.fetch = function (input, init) {
+        var url = typeof input === 'string' ? input : (input && input.url);
+        var method = (init && init.method) || 'GET';
+        var proxied = method.toUpperCase() === 'GET' && url && !proxyUnavailable() && proxyUrl(String(url));
+        if (!proxied) return nativeFetch(input, init);
+
+        return nativeFetch(proxied, init).then(function (res) {
+            if (res.ok) return res;
+            // The proxy answers errors as JSON; anything else means there is no proxy
+            if ((res.headers.get('Content-Type') || '').indexOf('application/json') === -1) markUnavailable();
+            return nativeFetch(input, init);
+        }, function () {
+            return nativeFetch(input, init);
+        });
+    };
+})();
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Static-asset layer for server.py.
+
+Files are served with validators and a per-path cache policy instead of
+SimpleHTTPRequestHandler's plain copy:
+
+  - gzip (and brotli, when the `brotli` package is installed) variants of
+    text assets are compressed once, kept in memory and re-validated
+    against the file's mtime/size on every request; warm() builds them for
+    the whole tree at startup
+  - ETag / Last-Modified on every file, 304 for If-None-Match /
+    If-Modified-Since
+  - uncompressed bodies of STATIC_SENDFILE_MIN bytes or more go out with
+    socket.sendfile (os.sendfile) instead of being copied through Python
+  - Cache-Control from CACHE_POLICIES: immutable for content-hashed file
+    names, revalidate (no-cache + validators) for HTML and everything else
+"""
+
+import email.utils
+import gzip
+import mimetypes
+import os
+import re
+import shutil
+import sys
+
+from bounded_cache import BoundedCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Only text types are worth compressing; images / fonts are already compressed
+COMPRESSIBLE = re.compile(r'^(text/|application/(javascript|json|xml|manifest\+json)|image/svg\+xml)')
+COMPRESS_MIN = int(os.environ.get('STATIC_COMPRESS_MIN', 1024))
+CACHE_MAX_BYTES = int(os.environ.get('STATIC_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+SENDFILE_MIN = int(os.environ.get('STATIC_SENDFILE_MIN', 64 * 1024))
+
+# First match wins: (path regex, Cache-Control); anything else, HTML included, is 'no-cache'.
+# A content hash is 8+ hex digits with at least one letter, so date-stamped
+# names (report-20241201.html) are not taken for hashed ones.
+CACHE_POLICIES = [
+    (re.compile(r'[.-](?=[0-9a-f]*[a-f])[0-9a-f]{8,}\.[a-z0-9]+$', re.I), 'public, max-age=31536000, immutable'),
+]
+
+# Trees warm() does not walk (not served to dashboards)
+WARM_SKIP = {'.git', 'node_modules', 'android', '__pycache__'}
+
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+def cache_policy(url_path):
+    for pattern, policy in CACHE_POLICIES:
+        if pattern.search(url_path):
+            return policy
+    return 'no-cache'
+
+
+def accepted_encodings(header):
+    """Content codings a client accepts (q > 0), from its Accept-Encoding header."""
+    accepted = set()
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = re.search(r'q\s*=\s*([\d.]+)', params)
+        if name and (not q or float(q.group(1)) > 0):
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class Asset:
+    """Validators and compressed variants of one file at one (mtime, size)."""
+    __slots__ = ('path', 'stamp', 'size', 'mtime', 'content_type', 'etag', 'last_modified', 'variants')
+
+    def __init__(self, path, st, content_type):
+        self.path = path
+        self.stamp = (st.st_mtime_ns, st.st_size)
+        self.size = st.st_size
+        self.mtime = int(st.st_mtime)
+        self.content_type = content_type
+        self.etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        self.last_modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+        self.variants = {}
+
+    @property
+    def compressed_bytes(self):
+        return sum(len(body) for body in self.variants.values())
+
+    def variant_etag(self, encoding):
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+    def not_modified(self, headers):
+        """True when the request's validators still match (If-None-Match wins over If-Modified-Since)."""
+        inm = headers.get('If-None-Match')
+        if inm is not None:
+            if inm.strip() == '*':
+                return True
+            base = self.etag[1:-1]
+            for tag in inm.split(','):
+                tag = tag.strip().removeprefix('W/').strip('"')
+                if tag == base or tag.startswith(base + '-'):
+                    return True
+            return False
+        ims = headers.get('If-Modified-Since')
+        if ims:
+            try:
+                since = email.utils.parsedate_to_datetime(ims)
+            except (TypeError, ValueError):
+                return False
+            return since is not None and self.mtime <= since.timestamp()
+        return False
+
+
+class StaticAssets:
+    """Process-wide cache of Asset entries, keyed by absolute path, bounded by CACHE_MAX_BYTES of variants."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.entries = BoundedCache('static', max_bytes, sizeof=lambda asset: asset.compressed_bytes)
+
+    def get(self, path, guess_type=None):
+        """Current Asset of a regular file (compressing it on a miss or after it changed), or None."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        asset = self.entries.get(path, fresh=lambda cached: cached.stamp == stamp)
+        if asset is not None and asset.stamp == stamp:
+            return asset
+        content_type = (guess_type or (lambda p: mimetypes.guess_type(p)[0]))(path) or 'application/octet-stream'
+        asset = Asset(path, st, content_type)
+        if st.st_size >= COMPRESS_MIN and COMPRESSIBLE.match(content_type):
+            with open(path, 'rb') as f:
+                body = f.read()
+            asset.variants['gzip'] = gzip.compress(body, 9, mtime=0)
+            if brotli:
+                asset.variants['br'] = brotli.compress(body, quality=11)
+        self.entries.put(path, asset)
+        return asset
+
+    def warm(self, root, guess_type=None):
+        """Build the variants of every file under `root` up front, so first page loads aren't compressing."""
+        count = 0
+        for directory, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if d not in WARM_SKIP and not d.startswith('.')]
+            for name in files:
+                if self.get(os.path.join(directory, name), guess_type) is not None:
+                    count += 1
+        stats = self.entries.stats()
+        print(f'  [STATIC] {count} files, {stats["entries"]} cached, '
+              f'{stats["bytes"] / 1024 ** 2:.1f} MB of {"/".join(ENCODINGS)} variants', file=sys.stderr)
+        return count
+
+    def stats(self):
+        return {**self.entries.stats(), 'encodings': list(ENCODINGS)}
+
+    def serve(self, handler, path, url_path, head=False):
+        """
+        Answer a GET/HEAD for the file at `path` on a BaseHTTPRequestHandler.
+        Returns False when `path` is not a regular file (caller falls back).
+        """
+        asset = self.get(path, handler.guess_type)
+        if asset is None:
+            return False
+        encoding = None
+        if asset.variants:
+            accepted = accepted_encodings(handler.headers.get('Accept-Encoding'))
+            encoding = next((e for e in ENCODINGS if e in accepted and e in asset.variants), None)
+        handler.cache_policy = cache_policy(url_path)
+
+        if asset.not_modified(handler.headers):
+            handler.send_response(304)
+            self._validators(handler, asset, encoding)
+            handler.end_headers()
+            return True
+
+        body = asset.variants.get(encoding)
+        handler.send_response(200)
+        handler.send_header('Content-Type', asset.content_type)
+        handler.send_header('Content-Length', str(len(body) if body is not None else asset.size))
+        if encoding:
+            handler.send_header('Content-Encoding', encoding)
+        self._validators(handler, asset, encoding)
+        handler.end_headers()
+        if head:
+            return True
+        if body is not None:
+            handler.wfile.write(body)
+            return True
+        with open(path, 'rb') as f:
+            if asset.size >= SENDFILE_MIN and hasattr(os, 'sendfile'):
+                handler.wfile.flush()
+                handler.connection.sendfile(f, 0, asset.size)
+            else:
+                shutil.copyfileobj(f, handler.wfile)
+        return True
+
+    @staticmethod
+    def _validators(handler, asset, encoding):
+        handler.send_header('ETag', asset.variant_etag(encoding))
+        handler.send_header('Last-Modified', asset.last_modified)
+        if asset.variants:
+            handler.send_header('Vary', 'Accept-Encoding')